@@ -65,21 +65,26 @@ class ChatAdmin(admin.ModelAdmin):
     fieldsets = (
         (
             'Usuário 1', {
-                'fields': ('user1', 'user1_view', 'user1_exit_chat_date'),
+                'fields': ('user1', 'user1_view', 'user1_exit_chat_date', 'user1_last_read_seq'),
             },
         ),
         (
           'Usuário 2', {
-                'fields': ('user2', 'user2_view', 'user2_exit_chat_date'),
+                'fields': ('user2', 'user2_view', 'user2_exit_chat_date', 'user2_last_read_seq'),
+            },
+        ),
+        (
+          'Mensagens', {
+                'fields': ('last_message_seq',),
             },
         ),
     )
 
     def get_form(self, request, obj=None, **kwargs):
         if obj is None:
-            self.readonly_fields = ()
+            self.readonly_fields = ('user1_last_read_seq', 'user2_last_read_seq', 'last_message_seq')
         else:
-            self.readonly_fields = ('user1', 'user2') 
+            self.readonly_fields = ('user1', 'user2', 'user1_last_read_seq', 'user2_last_read_seq', 'last_message_seq') 
         return super().get_form(request, obj, **kwargs)
 
     def user1_exit_chat(self, obj):
@@ -103,19 +108,19 @@ class ChatAdmin(admin.ModelAdmin):
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     search_fields = ('chat__user1__email', 'chat__user2__email')
-    list_display = ('chat', 'visualized', 'message', 'message_date', 'id')
-    list_filter = ('visualized', 'message__message_type')
+    list_display = ('chat', 'seq', 'message', 'message_date', 'id')
+    list_filter = ('message__message_type',)
     fieldsets = (
         'Mensagem', {
-            'fields': ('chat', 'message', 'visualized',),
+            'fields': ('chat', 'message', 'seq',),
         },
     ),
 
     def get_form(self, request, obj=None, **kwargs):
         if obj is None:
-            self.readonly_fields = ()
+            self.readonly_fields = ('seq',)
         else:
-            self.readonly_fields = ('chat', 'message') 
+            self.readonly_fields = ('chat', 'message', 'seq') 
         return super().get_form(request, obj, **kwargs)
 
     form = ChatMessageAdminForm
@@ -124,12 +129,4 @@ class ChatMessageAdmin(admin.ModelAdmin):
         return obj.message.date
     message_date.short_description = 'Data'
 
-    def change_visualized_value_selected(self, request, obj):
-        for o in obj.all():
-            o.visualized = not o.visualized
-            o.save()
-    change_visualized_value_selected.short_description = 'Alterar visualização das mensagens selecionadas'
-
-    actions = ['change_visualized_value_selected']
-
 
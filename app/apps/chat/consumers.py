@@ -1,48 +1,26 @@
-from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
-from django.template.defaultfilters import truncatechars
 from django.utils import dateformat, timezone
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
-import json
-
-from apps.chat.templatetags.custom_tags import is_user_attribute_visible
-from apps.utils import date_is_today, date_is_yesterday, get_chat_dict
-from .models import Chat, ChatMessage, TextMessage, ImageMessage
+import functools, json
+
+from apps.utils import date_is_today, invalidate_navbar_state
+from apps.event_log import EventLogConsumerMixin
+from apps.loaders import load_chat
+from apps.metrics import MetricsConsumerMixin
+from apps.tracing import TracingConsumerMixin
+from apps.query_inspector import QueryInspectorConsumerMixin
+from apps.traffic import TrafficRecorderConsumerMixin
+from .models import Chat
+from .views import get_client_id, is_user_connected_in_chat
+from .ratelimit import check_message_rate_limit
 
 User = get_user_model()
 
 
-@database_sync_to_async
-def get_TextMessage(id):
-    '''
-    Function to get a text message from the database
-    '''
-
-    qs = TextMessage.objects.filter(id=id)
-    if qs.exists():
-        obj = qs.select_related('author').get(id=id)
-    else:
-        obj = None
-    return obj
-
-
-@database_sync_to_async
-def get_ImageMessage(id):
-    '''
-    Function to get an image message from the database
-    '''
-
-    qs = ImageMessage.objects.filter(id=id)
-    if qs.exists():
-        obj = qs.select_related('author').get(id=id)
-    else:
-        obj = None
-    return obj
-
-
 @database_sync_to_async
 def set_UserInChat(user, chat_id):
     '''
@@ -65,6 +43,8 @@ def set_UserInChat(user, chat_id):
 
     # update the user in chat
     User.objects.filter(id=user.id).update(in_chat=user_in_chat)
+    # the chats the user is in are not counted in the navbar state
+    invalidate_navbar_state(user)
 
 
 @database_sync_to_async
@@ -90,48 +70,116 @@ def set_UserOutChat(user, chat_id):
     else:
         # if the user is in a chat, update the user in chat
         User.objects.filter(id=user.id).update(in_chat=user_in_chat)
+    invalidate_navbar_state(user)
 
 
 @database_sync_to_async
-def get_AnotherUserChatAttributeVisibility(request_user, message_author, attribute):
+def create_ChatMessage(chat_id, author, message_type, text, client_id):
     '''
-    Function to get the visibility of any user attribute to another user
+    Function to create a new message in a chat
     '''
 
-    return is_user_attribute_visible(
-        request_user=request_user, 
-        message_author=message_author, 
-        attribute=attribute
+    # get the chat again, so the chat users visualization is up to date
+    chat = Chat.objects.select_related('user1', 'user2').get(id=chat_id)
+    another_user = chat.get_another_user(author)
+    # if the another user is connected in the chat, the message is read by him too
+    return chat.new_message(
+        author=author,
+        message_type=message_type,
+        text=text,
+        mark_as_read=is_user_connected_in_chat(another_user.id, str(chat.id)),
+        client_id=client_id,
     )
 
 
-@database_sync_to_async
-def get_ChatDict(chat, user):
-    '''
-    Function to get a chat dict
-    '''
-
-    return get_chat_dict(chat, user)
-
 
-@database_sync_to_async
-def get_Chat(id):
-    '''
-    Function to get a chat from the database
+class SendMessageConsumerMixin:
     '''
+    Mixin of the consumers that receive the text messages sent by the user (ChatConsumer and GroupChatConsumer)
 
-    qs = Chat.objects.filter(id=id)
-    if qs.exists():
-        obj = qs.select_related('user1', 'user2').get(id=id)
-    else:
-        obj = None
-    return obj
-
-
+    Notes:
+        - The messages are sent by the client as {'type': 'send_message', 'client_id': <uuid>, 'text': <text>}
+          and answered with an ack (the message was created or already existed) or a nack (the message is invalid).
+        - A message resent with the client id (idempotency key) of a stored message is acknowledged again, without taking a token of the rate limit.
+        - If the user sent too many messages, the nack has the seconds to wait before sending the message again (retry_after).
+    '''
 
-class ChatsConsumer(AsyncWebsocketConsumer):
+    async def receive_message(self, text_data, rate_limit_id, get_message_by_client_id, create_message, message_id_key, not_found_error):
+        '''
+        Receive a message sent by the user, create it and answer it with an ack or a nack
+
+        Parameters:
+            text_data (str): The frame sent by the client
+            rate_limit_id (str|uuid): The id of the chat or group, for the rate limit of the messages of the user in it
+            get_message_by_client_id (callable): Coroutine function (client_id) that returns the stored message with the client id, or None
+            create_message (callable): Coroutine function (message_type, text, client_id) that creates the message if it does not exist
+                and returns it with whether it was created
+            message_id_key (str): The key of the id of the message in the ack
+            not_found_error (str): The error of the nack if the chat or group was removed while the user was connected
+        '''
+
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get('type') != 'send_message':
+            await self.send_nack(None, 'Mensagem inválida.')
+            return
+
+        # the idempotency key is required, so a message resent after a reconnect is not duplicated
+        client_id = get_client_id(data.get('client_id'))
+        if client_id is None:
+            await self.send_nack(data.get('client_id'), 'Id do cliente inválido.')
+            return
+
+        message = await get_message_by_client_id(client_id)
+        created = False
+        if message is None:
+            # verify if the user can send a new message (rate limit), otherwise tell him when he can send it again
+            retry_after = await sync_to_async(check_message_rate_limit, thread_sensitive=False)(self.user.id, rate_limit_id)
+            if retry_after > 0:
+                await self.send_nack(str(client_id), 'Muitas mensagens enviadas, aguarde para enviar novamente.', retry_after=retry_after)
+                return
+
+            try:
+                message, created = await create_message(data.get('message_type', 'T'), data.get('text'), client_id)
+            except ValidationError as error:
+                await self.send_nack(str(client_id), error.messages[0])
+                return
+            except ObjectDoesNotExist:
+                # the chat or group was removed while the user was connected
+                await self.send_nack(str(client_id), not_found_error)
+                return
+
+        # acknowledge the message, the message itself is sent by the signal of the message
+        await self.send(text_data=json.dumps({
+            'client_id': str(client_id),
+            message_id_key: message.message_id,
+            'seq': message.seq,
+            'created': created,
+            'type': 'ack'
+        }))
+
+
+    async def send_nack(self, client_id, error, retry_after=None):
+        # send the reason the message was not created to the user (and when he can send it again, if it was rate limited)
+        await self.send(text_data=json.dumps({
+            'client_id': client_id,
+            'error': error,
+            'retry_after': retry_after,
+            'type': 'nack'
+        }))
+
+
+
+class ChatsConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, EventLogConsumerMixin, AsyncWebsocketConsumer):
     '''
     Consumer to send messages to user chat list
+
+    Notes:
+        - The events missed since the resume token (?resume=<event_id>) are replayed on connect.
+        - The preview of the message and the template of a new chat are rendered once by the chat message signal,
+          so the consumers of the user (one per tab or device) only send them.
     '''
 
     async def connect(self):
@@ -141,6 +189,8 @@ class ChatsConsumer(AsyncWebsocketConsumer):
             self.group_name = f"user_{self.user.id}_messages"
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             await self.accept()
+            # replay the events missed while the client was disconnected
+            await self.replay_missed_events()
         else:
             await self.close()
 
@@ -154,14 +204,7 @@ class ChatsConsumer(AsyncWebsocketConsumer):
     async def send_message_create(self, event):
         # if the user is authenticated, send the message to the user chat list
         if hasattr(self, 'user') and self.user.is_authenticated:
-            chat_id = event['chat_id']
-            chat_message_author = event['chat_message_author']
-            chat_message_type = event['chat_message_type']
-            chat_unviewed_messages_count = event['chat_unviewed_messages_count']
             chat_message_date = event['chat_message_date']
-            chat_message_id = event['chat_message_id']
-            new_chat = event['new_chat']
-            chat = await get_Chat(chat_id)
 
             # if the message date is today, format the date to 'H:i', otherwise format the date to 'd/m/Y'
             if date_is_today(chat_message_date):
@@ -170,121 +213,87 @@ class ChatsConsumer(AsyncWebsocketConsumer):
             else:
                 chat_message_date = dateformat.format(chat_message_date, 'd/m/Y')
 
-            match chat_message_type:
-                case 'T':
-                    # If the message is a text message, get the message text and truncate it to 50 characters
-                    chat_message = await get_TextMessage(chat_message_id)
-                    chat_message = truncatechars(chat_message.text, 50)
-                case 'I':
-                    # If the message is an image message, set the message text to 'Foto'
-                    chat_message = 'Foto'
-                case 'V':
-                    # If the message is a video message, set the message text to 'Video'
-                    chat_message = 'Video'
-                case 'A':
-                    # If the message is an audio message, set the message text to 'Audio'
-                    chat_message = 'Audio'
-
-            template = None
-            if new_chat:
-                online_visibility = await get_AnotherUserChatAttributeVisibility(
-                    request_user=self.user,
-                    message_author=chat.get_another_user(self.user),
-                    attribute="online"
-                )
-                photo_visibility = await get_AnotherUserChatAttributeVisibility(
-                    request_user=self.user,
-                    message_author=chat.get_another_user(self.user),
-                    attribute="photo"
-                )
-                chat_dict = await get_ChatDict(chat, self.user)
-
-                template = render_to_string(
-                    'chat/chat_list_partial.html', 
-                    {'chat_dict': chat_dict, 'online_visibility': online_visibility, 'photo_visibility': photo_visibility}
-                )
-
-            # send the message to the user chat list
+            # send the message to the user chat list, the content and the template of a new chat are rendered by the chat message signal
             await self.send(text_data=json.dumps({
-                'chat_id': chat_id,
-                'chat_message_content': chat_message,
+                'chat_id': event['chat_id'],
+                'chat_message_content': event['chat_message_content'],
                 'chat_message_date': chat_message_date,
-                'chat_unviewed_messages_count': chat_unviewed_messages_count,
-                'chat_message_author': chat_message_author,
-                'type': 'create' if new_chat else 'update',
-                'template': template
+                'chat_unviewed_messages_count': event['chat_unviewed_messages_count'],
+                'chat_message_author': event['chat_message_author'],
+                'chat_message_seq': event.get('chat_message_seq'),
+                'type': 'create' if event['new_chat'] else 'update',
+                'template': event['template'],
+                'event_id': event.get('event_id'),
             }))
 
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, EventLogConsumerMixin, SendMessageConsumerMixin, AsyncWebsocketConsumer):
     '''
-    Consumer to send messages to user chat
+    Consumer to send messages to user chat and receive the messages sent by the user
+
+    Notes:
+        - The events missed since the resume token (?resume=<event_id>) are replayed on connect.
+        - The message send or received template of the user is rendered once by the chat message signal, the consumer only sends it.
+        - The text messages sent by the user are received by the SendMessageConsumerMixin.
+        - The connection is refused if the chat does not exist or the user is not in the chat.
     '''
 
     async def connect(self):
         self.user = self.scope['user']
-        # if the user is authenticated, add the user to the group and accept the connection
+        self.chat = None
+        # if the user is authenticated and is in the chat, add the user to the group and accept the connection
         if self.user and self.user.is_authenticated:
             self.chat_id = self.scope['url_route']['kwargs']['chat_id']
-            self.chat = await get_Chat(self.chat_id)
-            self.group_name = f'user_{self.user.id}_chat_{self.chat_id}'
-            await self.channel_layer.group_add(self.group_name, self.channel_name)
-            # set the user in chat
-            await set_UserInChat(self.user, str(self.chat_id))
-            await self.accept()
-        else:
+            chat = await load_chat(self.chat_id)
+            if chat is not None and self.user.id in (chat.user1_id, chat.user2_id):
+                self.chat = chat
+        if self.chat is None:
             await self.close()
+            return
+
+        self.group_name = f'user_{self.user.id}_chat_{self.chat_id}'
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # set the user in chat
+        await set_UserInChat(self.user, str(self.chat_id))
+        await self.accept()
+        # replay the events missed while the client was disconnected
+        await self.replay_missed_events()
 
 
     async def disconnect(self, close_code):
-        # if the user is authenticated, remove the user from the group and set the user out chat
-        if hasattr(self, 'user') and self.user and self.user.is_authenticated:
+        # if the user is connected in the chat, remove the user from the group and set the user out chat
+        if getattr(self, 'chat', None) is not None:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
             # set the user out chat
             await set_UserOutChat(self.user, str(self.chat_id))
 
 
+    async def receive(self, text_data=None, bytes_data=None):
+        if getattr(self, 'chat', None) is None:
+            return
+
+        # only text messages are sent through the websocket, the images are sent by the new_chat_message view
+        await self.receive_message(
+            text_data,
+            rate_limit_id=self.chat_id,
+            get_message_by_client_id=self.chat.aget_message_by_client_id,
+            create_message=functools.partial(create_ChatMessage, self.chat_id, self.user),
+            message_id_key='chat_message_id',
+            not_found_error='Chat não encontrado.',
+        )
+
+
     async def send_message_create(self, event):
         if hasattr(self, 'user') and self.user.is_authenticated:
-            chat_id = event['chat_id']
-            chat_message_id = event['chat_message_id']
-            chat_message_type = event['chat_message_type']
-            chat_message_is_author = event['chat_message_is_author']
-
-            match chat_message_type:
-                case 'T':
-                    # If the message is a text message, get the message
-                    chat_message = await get_TextMessage(chat_message_id)
-                case 'I':
-                    # If the message is an image message, get the message
-                    chat_message = await get_ImageMessage(chat_message_id)
-                case 'V':
-                    # If the message is a video message, get the message
-                    chat_message = None
-                case 'A':
-                    # If the message is an audio message, get the message
-                    chat_message = None
-
-            template = None
-            # if the message is from the user, render the message send template, otherwise render the message received template
-            if chat_message_is_author:
-                template = render_to_string('chat/message_send.html', {'message': chat_message})
-            else:
-                # get the visibility of the user attribute 'online' of the message author
-                visibility = await get_AnotherUserChatAttributeVisibility(
-                    request_user=self.user,
-                    message_author=self.chat.get_another_user(self.user),
-                    attribute="online"
-                )
-                template = render_to_string('chat/message_received.html', {'message': chat_message, 'visibility':visibility})
-
-            # send the message to the user chat
+            # send the message to the user chat, the message send or received template is rendered by the chat message signal
             await self.send(text_data=json.dumps({
-                'chat_id': chat_id,
-                'chat_message_id': chat_message_id,
-                'chat_message_type': chat_message_type,
-                'chat_message_is_author': chat_message_is_author,
-                'template': template,
+                'chat_id': event['chat_id'],
+                'chat_message_id': event['chat_message_id'],
+                'chat_message_type': event['chat_message_type'],
+                'chat_message_is_author': event['chat_message_is_author'],
+                'seq': event['chat_message_seq'],
+                'template': event['template'],
+                'event_id': event.get('event_id'),
                 'type':'create'
-            }))
\ No newline at end of file
+            }))
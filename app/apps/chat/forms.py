@@ -13,7 +13,7 @@ class ChatMessageAdminForm(forms.ModelForm):
         labels = {
             'chat': 'Chat',
             'message': 'Mensagem',
-            'visualized': 'Visualizada',
+            'seq': 'Sequência',
             'date': 'Data',
         }
 
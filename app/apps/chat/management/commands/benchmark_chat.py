@@ -0,0 +1,249 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import json, math, statistics, subprocess, time
+
+from apps.chat.models import Chat, ChatMessage
+from apps.utils import get_chat_dict, user_has_unviewed_chat_messages
+
+User = get_user_model()
+
+BENCHMARKS = [
+    'get_chat_dict',
+    'chat_get_messages',
+    'get_chat_messages_first_page',
+    'get_chat_messages_deep_page',
+    'chats',
+    'new_chat_message',
+    'user_has_unviewed_chat_messages',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+
+class Command(BaseCommand):
+    '''
+    Command to measure the read and write paths of the chats against the current database (e.g. generated by seed_load).
+
+    Each benchmark runs --warmup times, then its queries are counted once and its time is measured --iterations times.
+    The results (percentiles in milliseconds and queries) are printed with the size of the database and the git commit,
+    and appended as JSON lines to --output, so the commits and the sizes of the database can be compared.
+
+    Notes:
+        - The subjects are the chat with the most messages and the user with the most chats.
+        - The views are requested with the test client, through all the middlewares but the debug toolbar (with DEBUG=True
+          the queries are still logged, so run it with DEBUG=False to compare the times).
+        - The queries are counted by an execute wrapper of all the database connections, the async views make them in other threads.
+        - The messages of new_chat_message are created inside a transaction that is rolled back, so the database is not changed,
+          and the rate limit of the messages is disabled meanwhile. The fan-out of the signal is sent on commit,
+          so its callbacks are run after each request and measured with it.
+    '''
+
+    help = 'Measure the chat read and write paths against the current database and output machine-readable results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--benchmarks',
+            nargs='+',
+            choices=BENCHMARKS,
+            default=BENCHMARKS,
+            help='Benchmarks to run (default: all).',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Amount of measured runs of each benchmark (default: 20).',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Amount of runs of each benchmark before measuring it (default: 2).',
+        )
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Label of the results (e.g. the name of the dataset).',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='File where the results are appended as JSON lines.',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON lines instead of a table.',
+        )
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING('DEBUG está ativo, os resultados incluem o custo do modo de desenvolvimento.'))
+
+        self.chat = Chat.objects.select_related('user1', 'user2').order_by('-last_message_seq').first()
+        self.user = User.objects.annotate(
+            amount_of_chats=Count('user1_chats', distinct=True) + Count('user2_chats', distinct=True)
+        ).order_by('-amount_of_chats').first()
+        if self.chat is None or self.chat.last_message_seq == 0:
+            raise CommandError('O banco de dados não tem mensagens, gere os dados com o comando seed_load.')
+
+        self.client = Client()
+        dataset = {
+            'users': User.objects.count(),
+            'chats': Chat.objects.count(),
+            'messages': ChatMessage.objects.count(),
+            'chat_messages': self.chat.last_message_seq,
+            'user_chats': self.user.amount_of_chats,
+        }
+        context = {
+            'label': options['label'],
+            'commit': self.get_commit(),
+            'date': timezone.now().isoformat(),
+            'dataset': dataset,
+        }
+
+        if not options['json']:
+            self.stdout.write(
+                f'Usuários: {dataset["users"]} | chats: {dataset["chats"]} | mensagens: {dataset["messages"]} | '
+                f'mensagens do chat: {dataset["chat_messages"]} | chats do usuário: {dataset["user_chats"]}'
+            )
+            self.stdout.write(f'{"benchmark":<32} {"queries":>8} {"média":>9} {"p50":>9} {"p95":>9} {"máx":>9}')
+
+        self.queries = 0
+        connection_created.connect(self.add_query_counter)
+        for connection in connections.all(initialized_only=True):
+            self.add_query_counter(connection)
+        no_toolbar = {'SHOW_TOOLBAR_CALLBACK': lambda request: False}
+
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], DEBUG_TOOLBAR_CONFIG=no_toolbar):
+                for name in options['benchmarks']:
+                    queries, times = getattr(self, f'benchmark_{name}')(options['iterations'], options['warmup'])
+                    result = {**context, 'benchmark': name, 'iterations': len(times), 'queries': queries, **self.get_stats(times)}
+                    self.write_result(result, options)
+        finally:
+            connection_created.disconnect(self.add_query_counter)
+            for connection in connections.all(initialized_only=True):
+                if self.count_query in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(self.count_query)
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def add_query_counter(self, connection, **kwargs):
+        if self.count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.count_query)
+
+    def get_commit(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            ).stdout.strip()
+        except OSError:
+            commit = ''
+        return commit or None
+
+    def get_stats(self, times):
+        times = sorted(time * 1000 for time in times)
+        percentile = lambda p: times[min(len(times) - 1, math.ceil(len(times) * p) - 1)]
+        return {
+            'mean_ms': round(statistics.mean(times), 3),
+            'p50_ms': round(percentile(0.5), 3),
+            'p95_ms': round(percentile(0.95), 3),
+            'min_ms': round(times[0], 3),
+            'max_ms': round(times[-1], 3),
+        }
+
+    def write_result(self, result, options):
+        line = json.dumps(result)
+        if options['output']:
+            with open(options['output'], 'a') as file:
+                file.write(line + '\n')
+        if options['json']:
+            self.stdout.write(line)
+        else:
+            self.stdout.write(
+                f'{result["benchmark"]:<32} {result["queries"]:>8} {result["mean_ms"]:>9.2f} '
+                f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} {result["max_ms"]:>9.2f}'
+            )
+
+    def measure(self, function, iterations, warmup):
+        '''
+        Run a function --warmup times, count its queries once and measure its time --iterations times
+
+        Returns:
+            tuple: The amount of queries and the times (seconds) of the runs
+        '''
+
+        for _ in range(warmup):
+            function()
+        queries_before = self.queries
+        function()
+        queries = self.queries - queries_before
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return queries, times
+
+    def request(self, method, path, expected_status, **kwargs):
+        response = getattr(self.client, method)(path, **kwargs)
+        if response.status_code != expected_status:
+            raise CommandError(f'{method.upper()} {path} retornou {response.status_code}.')
+        return response
+
+    def benchmark_get_chat_dict(self, iterations, warmup):
+        return self.measure(lambda: get_chat_dict(self.chat, self.chat.user1), iterations, warmup)
+
+    def benchmark_chat_get_messages(self, iterations, warmup):
+        return self.measure(lambda: self.chat.get_messages(limit=settings.MESSAGES_PAGINATION), iterations, warmup)
+
+    def benchmark_get_chat_messages_first_page(self, iterations, warmup):
+        self.client.force_login(self.chat.user1)
+        path = reverse('chat:get_chat_messages', kwargs={'id': self.chat.id})
+        return self.measure(lambda: self.request('get', path, 200), iterations, warmup)
+
+    def benchmark_get_chat_messages_deep_page(self, iterations, warmup):
+        self.client.force_login(self.chat.user1)
+        path = reverse('chat:get_chat_messages', kwargs={'id': self.chat.id})
+        # The oldest page, loaded with the before cursor
+        return self.measure(lambda: self.request('get', path, 200, data={'before': settings.MESSAGES_PAGINATION + 1}), iterations, warmup)
+
+    def benchmark_chats(self, iterations, warmup):
+        self.client.force_login(self.user)
+        return self.measure(lambda: self.request('get', reverse('chat:chats'), 200), iterations, warmup)
+
+    def benchmark_new_chat_message(self, iterations, warmup):
+        self.client.force_login(self.chat.user1)
+        path = reverse('chat:new_chat_message', kwargs={'id': self.chat.id})
+        rate_limits = {scope: {'rate': 10 ** 9, 'capacity': 10 ** 9} for scope in settings.CHAT_MESSAGES_RATE_LIMITS}
+
+        def send_message():
+            # Run the on_commit callbacks (the signal fan-out) of the message, the transaction is rolled back
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                self.request('post', path, 204, data={'message_type': 'T', 'text': 'Mensagem de benchmark'})
+
+        result = None
+        try:
+            with transaction.atomic(), override_settings(CHAT_MESSAGES_RATE_LIMITS=rate_limits):
+                result = self.measure(send_message, iterations, warmup)
+                raise Rollback()
+        except Rollback:
+            pass
+        return result
+
+    def benchmark_user_has_unviewed_chat_messages(self, iterations, warmup):
+        return self.measure(lambda: user_has_unviewed_chat_messages(self.user), iterations, warmup)
@@ -0,0 +1,360 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.utils.crypto import get_random_string
+from django.utils import timezone
+from importlib import import_module
+
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from urllib.parse import urlencode
+import asyncio, json, math, re, statistics, time, uuid
+
+from apps.chat.models import Chat
+from apps.group_chat.models import GroupChat
+from apps.notification.models import Notification
+from apps.traffic import CLIENT_ID_MARKER
+
+User = get_user_model()
+
+# The tokens of the entities in the recorded paths and parameters, e.g. {chat:3f2a9c01d4e5}
+TOKEN_PATTERN = re.compile(r'\{(\w+):([0-9a-f]{12})\}')
+
+
+
+class EntityMapper:
+    '''
+    Mapper of the anonymized entities of a recording to the entities of the local database
+
+    Notes:
+        - The chats and groups are mapped in the order they appear in the recording, to the local ones with the most messages.
+        - The users of the recording are mapped to the local users with the prefix, to a participant of the first chat or group they use
+          (so they have access to it), or to the next local user.
+        - The notifications are mapped to the pending notifications received by the user, the video calls are not mapped.
+    '''
+
+    def __init__(self, users_prefix):
+        self.users = list(User.objects.filter(username__startswith=users_prefix).order_by('id'))
+        if len(self.users) < 2:
+            raise CommandError(f'São necessários pelo menos 2 usuários com o prefixo "{users_prefix}", gere os dados com o comando seed_load.')
+        self.users_by_id = {user.id: user for user in self.users}
+        self.chats = Chat.objects.filter(
+            user1__username__startswith=users_prefix, user2__username__startswith=users_prefix
+        ).order_by('-last_message_seq').iterator()
+        self.groups = GroupChat.objects.filter(
+            memberships__user__username__startswith=users_prefix
+        ).distinct().order_by('-last_message_seq').iterator()
+        self.entities = {}
+        self.actors = {}
+        self.used_notifications = set()
+        self.next_user = 0
+
+    def get_free_user(self, candidate_ids=None):
+        bound_ids = {user.id for user in self.actors.values() if user is not None}
+        if candidate_ids is not None:
+            candidates = [self.users_by_id[user_id] for user_id in candidate_ids if user_id in self.users_by_id]
+            return next((user for user in candidates if user.id not in bound_ids), candidates[0] if candidates else None)
+        free_users = [user for user in self.users if user.id not in bound_ids]
+        if free_users:
+            return free_users[0]
+        # more users in the recording than in the database, they are reused
+        self.next_user = (self.next_user + 1) % len(self.users)
+        return self.users[self.next_user]
+
+    def map_actor(self, token, tokens=()):
+        '''
+        Map the user of an event, to a participant of the chat or group of the event if the user was not mapped yet
+        '''
+
+        if token is None:
+            return None
+        if token not in self.actors:
+            candidate_ids = None
+            for kind, token_id in tokens:
+                entity = self.map_entity(kind, token_id)
+                if isinstance(entity, Chat):
+                    candidate_ids = [entity.user1_id, entity.user2_id]
+                elif isinstance(entity, GroupChat):
+                    candidate_ids = list(entity.memberships.values_list('user_id', flat=True))
+            self.actors[token] = self.get_free_user(candidate_ids)
+        return self.actors[token]
+
+    def map_entity(self, kind, token_id, actor=None):
+        key = (kind, token_id)
+        if key not in self.entities:
+            if kind == 'chat':
+                self.entities[key] = next(self.chats, None)
+            elif kind == 'group':
+                self.entities[key] = next(self.groups, None)
+            elif kind in ('user', 'user_email'):
+                self.entities[key] = self.get_free_user()
+            elif kind == 'notification' and actor is not None:
+                notification = Notification.objects.filter(receiver=actor, status='P').exclude(id__in=self.used_notifications).first()
+                if notification is not None:
+                    self.used_notifications.add(notification.id)
+                self.entities[key] = notification
+            else:
+                return None
+        return self.entities[key]
+
+    def replace_tokens(self, value, actor):
+        '''
+        Replace the tokens of a path or parameter by the local entities
+
+        Returns:
+            str|None: The value, None if it has an entity that could not be mapped
+        '''
+
+        missing = False
+
+        def replace(match):
+            nonlocal missing
+            kind, token_id = match.groups()
+            entity = self.map_entity(kind, token_id, actor)
+            if entity is None:
+                missing = True
+                return ''
+            if kind == 'user':
+                return entity.slug
+            if kind == 'user_email':
+                return entity.email
+            return str(entity.id)
+
+        value = TOKEN_PATTERN.sub(replace, value).replace(CLIENT_ID_MARKER, str(uuid.uuid4()))
+        return None if missing else value
+
+
+
+class Command(BaseCommand):
+    '''
+    Command to replay a recording of the traffic of the users (apps.traffic) against the local application (telezap_django/asgi.py).
+
+    The HTTP requests and the websocket connections and frames are sent at the recorded times (scaled by --speed) to the ASGI application
+    in this process, with the users and entities of the recording mapped to the local database (e.g. generated by seed_load),
+    then the latency and the errors are printed by view (HTTP) and websocket path, and appended as JSON lines to --output.
+
+    Notes:
+        - The users are authenticated with sessions created for them, the requests send the CSRF token.
+        - The events whose entities could not be mapped (e.g. a notification that is not pending in the local database) are skipped.
+        - The websocket frames are sent without waiting for the responses, their latency is not measured.
+    '''
+
+    help = 'Replay a recording of the HTTP requests and websocket frames of the users against the local ASGI application.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='File of the recording (settings.TRAFFIC_RECORDING_FILE).')
+        parser.add_argument(
+            '--speed',
+            type=float,
+            default=1.0,
+            help='Speed of the replay, e.g. 2 replays it twice as fast and 0 as fast as possible (default: 1).',
+        )
+        parser.add_argument(
+            '--users-prefix',
+            default='seed',
+            help='Prefix of the usernames of the local users (default: seed).',
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Host of the requests, it must be in ALLOWED_HOSTS (default: localhost).',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=10,
+            help='Seconds to wait for each response (default: 10).',
+        )
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Label of the results.',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='File where the results are appended as JSON lines.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file']) as file:
+                events = sorted((json.loads(line) for line in file if line.strip()), key=lambda event: event['time'])
+        except OSError as error:
+            raise CommandError(f'Não foi possível ler a gravação: {error}.')
+        if not events:
+            raise CommandError('A gravação não tem eventos.')
+
+        self.host = options['host'].encode()
+        self.timeout = options['timeout']
+        actions, skipped = self.plan(events, EntityMapper(options['users_prefix']))
+        self.stdout.write(f'Eventos: {len(events)} | reproduzidos: {len(actions)} | ignorados: {skipped}')
+
+        # the application is imported after the settings, as the ASGI server does
+        application = import_module('telezap_django.asgi').application
+        start = time.perf_counter()
+        results = asyncio.run(self.replay(application, actions, options['speed']))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Duração: {elapsed:.2f}s (gravação: {events[-1]["time"] - events[0]["time"]:.2f}s)')
+        self.write_results(results, options)
+
+    def get_session_headers(self, user, sessions):
+        '''
+        Get the headers of the requests of a user: the session cookie (created once per user) and the CSRF token
+        '''
+
+        if user is None:
+            return [(b'host', self.host)]
+        if user.id not in sessions:
+            session = import_module(settings.SESSION_ENGINE).SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.save()
+            sessions[user.id] = (session.session_key, get_random_string(32))
+        session_key, csrf_token = sessions[user.id]
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}'
+        return [(b'host', self.host), (b'cookie', cookie.encode()), (b'x-csrftoken', csrf_token.encode())]
+
+    def plan(self, events, mapper):
+        '''
+        Map the events of the recording to the local database
+
+        Returns:
+            tuple: The actions to replay (with their time since the start of the recording) and the amount of events skipped
+        '''
+
+        actions = []
+        skipped = 0
+        sessions = {}
+        connections = {}
+        start = events[0]['time']
+        for event in events:
+            action = {'at': event['time'] - start, 'kind': event['kind']}
+            if event['kind'] == 'websocket.receive' or event['kind'] == 'websocket.disconnect':
+                if event['connection'] not in connections:
+                    skipped += 1
+                    continue
+                action['connection'] = event['connection']
+                action['name'] = connections[event['connection']]
+                if event['kind'] == 'websocket.receive':
+                    action['text'] = json.dumps(event['frame']).replace(CLIENT_ID_MARKER, str(uuid.uuid4()))
+                actions.append(action)
+                continue
+
+            actor = mapper.map_actor(event['user'], TOKEN_PATTERN.findall(event['path']))
+            path = mapper.replace_tokens(event['path'], actor)
+            if path is None:
+                skipped += 1
+                continue
+            action['headers'] = self.get_session_headers(actor, sessions)
+
+            if event['kind'] == 'websocket.connect':
+                action['connection'] = event['connection']
+                action['path'] = path
+                action['name'] = TOKEN_PATTERN.sub(r'{\1}', event['path'])
+                connections[event['connection']] = action['name']
+            else:
+                parameters = {}
+                for source in ('query', 'data'):
+                    values = {key: [mapper.replace_tokens(value, actor) for value in values] for key, values in event[source].items()}
+                    if any(value is None for key_values in values.values() for value in key_values):
+                        parameters = None
+                        break
+                    parameters[source] = values
+                if parameters is None:
+                    skipped += 1
+                    continue
+                action['name'] = event['view']
+                action['method'] = event['method']
+                action['path'] = f'{path}?{urlencode(parameters["query"], doseq=True)}' if parameters['query'] else path
+                action['body'] = urlencode(parameters['data'], doseq=True).encode()
+                if event['method'] == 'POST':
+                    action['headers'] = action['headers'] + [(b'content-type', b'application/x-www-form-urlencoded')]
+            actions.append(action)
+        return actions, skipped
+
+    async def replay(self, application, actions, speed):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = []
+
+        async def wait_until(at):
+            if speed > 0:
+                await asyncio.sleep(max(0, start + at / speed - loop.time()))
+
+        async def request(action):
+            await wait_until(action['at'])
+            requested_at = time.perf_counter()
+            try:
+                communicator = HttpCommunicator(application, action['method'], action['path'], body=action['body'], headers=action['headers'])
+                response = await communicator.get_response(timeout=self.timeout)
+                error = response['status'] >= 400
+            except Exception:
+                error = True
+            results.append({'kind': 'http', 'name': action['name'], 'latency': time.perf_counter() - requested_at, 'error': error})
+
+        async def connection(connection_actions):
+            communicator = None
+            for action in connection_actions:
+                await wait_until(action['at'])
+                if action['kind'] == 'websocket.connect':
+                    connected_at = time.perf_counter()
+                    communicator = WebsocketCommunicator(application, action['path'], headers=action['headers'])
+                    try:
+                        connected, _ = await communicator.connect(timeout=self.timeout)
+                    except Exception:
+                        connected = False
+                    results.append({'kind': 'websocket.connect', 'name': action['name'], 'latency': time.perf_counter() - connected_at, 'error': not connected})
+                    if not connected:
+                        return
+                elif action['kind'] == 'websocket.receive':
+                    await communicator.send_to(text_data=action['text'])
+                    results.append({'kind': 'websocket.receive', 'name': action['name'], 'latency': None, 'error': False})
+                else:
+                    await communicator.disconnect(timeout=self.timeout)
+                    communicator = None
+            # the recording ended before the connection was closed
+            if communicator is not None:
+                await communicator.disconnect(timeout=self.timeout)
+
+        connections = {}
+        tasks = []
+        for action in actions:
+            if action['kind'] == 'http':
+                tasks.append(request(action))
+            else:
+                connections.setdefault(action['connection'], []).append(action)
+        tasks += [connection(connection_actions) for connection_actions in connections.values()]
+        await asyncio.gather(*tasks)
+        return results
+
+    def write_results(self, results, options):
+        self.stdout.write(f'{"tipo":<18} {"nome":<40} {"eventos":>8} {"erros":>6} {"p50":>9} {"p95":>9} {"máx":>9}')
+        groups = {}
+        for result in results:
+            groups.setdefault((result['kind'], result['name']), []).append(result)
+
+        for (kind, name), group in sorted(groups.items()):
+            latencies = sorted(result['latency'] * 1000 for result in group if result['latency'] is not None)
+            percentile = lambda p: latencies[min(len(latencies) - 1, math.ceil(len(latencies) * p) - 1)] if latencies else None
+            summary = {
+                'label': options['label'],
+                'date': timezone.now().isoformat(),
+                'speed': options['speed'],
+                'kind': kind,
+                'name': name,
+                'events': len(group),
+                'errors': sum(result['error'] for result in group),
+                'mean_ms': round(statistics.mean(latencies), 3) if latencies else None,
+                'p50_ms': round(percentile(0.5), 3) if latencies else None,
+                'p95_ms': round(percentile(0.95), 3) if latencies else None,
+                'max_ms': round(latencies[-1], 3) if latencies else None,
+            }
+            if options['output']:
+                with open(options['output'], 'a') as file:
+                    file.write(json.dumps(summary) + '\n')
+            format_ms = lambda value: f'{value:>9.2f}' if value is not None else f'{"-":>9}'
+            self.stdout.write(
+                f'{kind:<18} {name:<40} {summary["events"]:>8} {summary["errors"]:>6} '
+                f'{format_ms(summary["p50_ms"])} {format_ms(summary["p95_ms"])} {format_ms(summary["max_ms"])}'
+            )
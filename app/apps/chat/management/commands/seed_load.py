@@ -0,0 +1,227 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from PIL import Image
+from itertools import accumulate
+import io, random, time
+
+from apps.chat.models import Chat, ChatMessage, Message, TextMessage, ImageMessage
+from apps.notification.models import Notification, FriendshipRequest
+
+User = get_user_model()
+
+# The image shared by the image messages and the photo shared by the users created by the command
+SEED_IMAGE_PATH = 'user_chat_media/images/seed_load.png'
+SEED_PHOTO_PATH = 'user_profiles_photos/seed_load.png'
+
+
+
+class Command(BaseCommand):
+    '''
+    Command to generate a synthetic dataset (users, friendships, chats, text and image messages and friendship requests) to benchmark the project.
+
+    Notes:
+        - The objects are created with chunked bulk_creates, so the signals (channel layer, cache) are not sent.
+        - The activity is skewed (Zipf distribution, --skew): a few users and chats have most of the friendships, chats and messages.
+        - The messages of the multi-table inherited models (TextMessage, ImageMessage, FriendshipRequest) are created by bulk_creating
+          the parent rows and inserting the child rows with a single executemany per chunk (bulk_create does not support them).
+        - Each friendship has a chat, as when a friendship request is accepted (the chat list has the chats of the friends).
+        - The sequence numbers and the read watermarks of the chats are kept consistent with the messages created.
+        - The dates of the messages and notifications are the creation date (auto_now_add).
+        - Every user has the password --password and the same photo (the templates need a photo). The usernames start with --prefix, so it can be run again with another prefix.
+    '''
+
+    help = 'Generate a synthetic dataset (users, friendships, chats, messages and notifications) with chunked bulk_creates to benchmark the project.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Amount of users (default: 1000).')
+        parser.add_argument('--friends', type=int, default=10, help='Average amount of friends (and chats) per user (default: 10).')
+        parser.add_argument('--messages', type=int, default=100000, help='Amount of chat messages (default: 100000).')
+        parser.add_argument('--image-ratio', type=float, default=0.05, help='Fraction of image messages (default: 0.05).')
+        parser.add_argument('--notifications', type=int, default=5000, help='Amount of friendship requests (default: 5000).')
+        parser.add_argument('--skew', type=float, default=1.0, help='Exponent of the Zipf distribution of the activity, 0 is uniform (default: 1.0).')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Amount of objects created per bulk_create (default: 5000).')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the usernames (default: seed).')
+        parser.add_argument('--password', default='Seed@123', help='Password of the users (default: Seed@123).')
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the random generator, to generate the same dataset again.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('São necessários pelo menos 2 usuários.')
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f'Já existem usuários com o prefixo "{options["prefix"]}", use outro --prefix.')
+
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.chunk_size = options['chunk_size']
+
+        user_ids = self.timed('usuários criados', self.create_users, options['users'], options['prefix'], options['password'])
+        pairs = self.timed('amizades criadas', self.create_friendships, user_ids, options['users'] * options['friends'] // 2)
+        chats = self.timed('chats criados', self.create_chats, pairs)
+        self.timed('mensagens criadas', self.create_messages, chats, options['messages'], options['image_ratio'])
+        self.timed('notificações criadas', self.create_notifications, user_ids, options['notifications'])
+
+    def timed(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        amount = result if isinstance(result, int) else len(result)
+        self.stdout.write(self.style.SUCCESS(f'{amount} {name} em {time.perf_counter() - start:.1f}s.'))
+        return result
+
+    def get_cum_weights(self, amount):
+        # Zipf distribution: the item of rank r has the weight 1 / r^skew
+        return list(accumulate(1 / rank ** self.skew for rank in range(1, amount + 1)))
+
+    def chunks(self, amount):
+        for start in range(0, amount, self.chunk_size):
+            yield min(self.chunk_size, amount - start)
+
+    def get_pairs(self, ids, amount):
+        '''
+        Get unique pairs of different ids, the first one chosen by the skewed activity and the second one at random
+        '''
+
+        amount = min(amount, len(ids) * (len(ids) - 1) // 2)
+        cum_weights = self.get_cum_weights(len(ids))
+        pairs = set()
+        while len(pairs) < amount:
+            for first in self.random.choices(ids, cum_weights=cum_weights, k=amount - len(pairs)):
+                second = self.random.choice(ids)
+                if first != second:
+                    pairs.add((min(first, second), max(first, second)))
+        pairs = list(pairs)
+        self.random.shuffle(pairs)
+        return pairs
+
+    def insert_children(self, model, parent_ids, values):
+        '''
+        Insert the child rows of a multi-table inherited model (its parent rows are already created)
+        '''
+
+        fields = [model._meta.pk] + [model._meta.get_field(name) for name in values]
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})',
+                [(parent_id, *(value(index) for value in values.values())) for index, parent_id in enumerate(parent_ids)],
+            )
+
+    def save_image(self, path, color):
+        if not default_storage.exists(path):
+            image = io.BytesIO()
+            Image.new('RGB', (64, 64), color).save(image, 'PNG')
+            default_storage.save(path, ContentFile(image.getvalue()))
+
+    def create_users(self, amount, prefix, password):
+        self.save_image(SEED_PHOTO_PATH, 'gray')
+        # The password is hashed once, the hash is slow on purpose
+        password = make_password(password)
+        user_ids = []
+        index = 0
+        for size in self.chunks(amount):
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{prefix}{index + offset}',
+                    slug=f'{prefix}{index + offset}',
+                    email=f'{prefix}{index + offset}@example.com',
+                    password=password,
+                    photo=SEED_PHOTO_PATH,
+                )
+                for offset in range(size)
+            ])
+            user_ids += [user.id for user in users]
+            index += size
+        # The most active users are spread over the ids
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def create_friendships(self, user_ids, amount):
+        Friendship = User.friends.through
+        pairs = self.get_pairs(user_ids, amount)
+        for start in range(0, len(pairs), self.chunk_size):
+            # The friendship is symmetrical, so there is a row for each direction
+            Friendship.objects.bulk_create([
+                Friendship(from_user_id=from_user_id, to_user_id=to_user_id)
+                for user1_id, user2_id in pairs[start:start + self.chunk_size]
+                for from_user_id, to_user_id in ((user1_id, user2_id), (user2_id, user1_id))
+            ], ignore_conflicts=True)
+        return pairs
+
+    def create_chats(self, pairs):
+        chats = []
+        for start in range(0, len(pairs), self.chunk_size):
+            chats += Chat.objects.bulk_create([
+                Chat(user1_id=user1_id, user2_id=user2_id)
+                for user1_id, user2_id in pairs[start:start + self.chunk_size]
+            ])
+        return chats
+
+    def create_messages(self, chats, amount, image_ratio):
+        if not chats:
+            return 0
+        if image_ratio > 0:
+            self.save_image(SEED_IMAGE_PATH, 'blue')
+
+        # The sequence number of the last message of each chat and of the last message of each user in the chat (read by the author)
+        last_seqs = {chat.id: 0 for chat in chats}
+        author_seqs = {}
+        cum_weights = self.get_cum_weights(len(chats))
+        for size in self.chunks(amount):
+            with transaction.atomic():
+                chunk_chats = self.random.choices(chats, cum_weights=cum_weights, k=size)
+                authors = [self.random.choice((chat.user1_id, chat.user2_id)) for chat in chunk_chats]
+                is_image = [self.random.random() < image_ratio for _ in range(size)]
+                messages = Message.objects.bulk_create([
+                    Message(author_id=author_id, message_type='I' if image else 'T')
+                    for author_id, image in zip(authors, is_image)
+                ])
+
+                text_ids = [message.id for message, image in zip(messages, is_image) if not image]
+                image_ids = [message.id for message, image in zip(messages, is_image) if image]
+                self.insert_children(TextMessage, text_ids, {'text': lambda index: f'Mensagem {index}'})
+                self.insert_children(ImageMessage, image_ids, {'image': lambda index: SEED_IMAGE_PATH})
+
+                chat_messages = []
+                for chat, author_id, message in zip(chunk_chats, authors, messages):
+                    last_seqs[chat.id] += 1
+                    author_seqs[(chat.id, author_id)] = last_seqs[chat.id]
+                    chat_messages.append(ChatMessage(chat_id=chat.id, message_id=message.id, seq=last_seqs[chat.id]))
+                ChatMessage.objects.bulk_create(chat_messages)
+
+        # Most of the chats are read, the another ones have unviewed messages (after the last message of the user)
+        for chat in chats:
+            chat.last_message_seq = last_seqs[chat.id]
+            chat.user1_last_read_seq = self.get_last_read_seq(chat, chat.user1_id, last_seqs, author_seqs)
+            chat.user2_last_read_seq = self.get_last_read_seq(chat, chat.user2_id, last_seqs, author_seqs)
+        Chat.objects.bulk_update(chats, ['last_message_seq', 'user1_last_read_seq', 'user2_last_read_seq'], batch_size=self.chunk_size)
+        return amount
+
+    def get_last_read_seq(self, chat, user_id, last_seqs, author_seqs):
+        last_seq = last_seqs[chat.id]
+        if self.random.random() < 0.8:
+            return last_seq
+        return self.random.randint(author_seqs.get((chat.id, user_id), 0), last_seq)
+
+    def create_notifications(self, user_ids, amount):
+        cum_weights = self.get_cum_weights(len(user_ids))
+        for size in self.chunks(amount):
+            with transaction.atomic():
+                notifications = []
+                for receiver_id in self.random.choices(user_ids, cum_weights=cum_weights, k=size):
+                    author_id = self.random.choice(user_ids)
+                    while author_id == receiver_id:
+                        author_id = self.random.choice(user_ids)
+                    status = self.random.choices(('P', 'A', 'R'), weights=(3, 5, 2))[0]
+                    notifications.append(Notification(author_id=author_id, receiver_id=receiver_id, status=status))
+                notifications = Notification.objects.bulk_create(notifications)
+                self.insert_children(
+                    FriendshipRequest,
+                    [notification.id for notification in notifications],
+                    {'notification_type': lambda index: 'A'},
+                )
+        return amount
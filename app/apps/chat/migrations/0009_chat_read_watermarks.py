@@ -0,0 +1,97 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+# The amount of rows written by each bulk UPDATE of the backfill
+BATCH_SIZE = 1000
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    '''
+    Number the messages of each chat by date and move the watermark of each user
+    to the message before the first message of the another user not visualized,
+    but not before the last message sent by the user.
+
+    Notes:
+        - The messages and the chats are written with bulk_update, in batches of BATCH_SIZE rows, instead of one UPDATE per message.
+    '''
+
+    Chat = apps.get_model('chat', 'Chat')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+
+    numbered_chat_messages = []
+    chats = []
+    for chat in Chat.objects.all().iterator():
+        chat_messages = list(
+            ChatMessage.objects.filter(chat=chat).order_by('message__date', 'id').values_list('id', 'message__author_id', 'visualized')
+        )
+        last_read_seq = {chat.user1_id: len(chat_messages), chat.user2_id: len(chat_messages)}
+        last_sent_seq = {chat.user1_id: 0, chat.user2_id: 0}
+        for seq, (chat_message_id, author_id, visualized) in enumerate(chat_messages, start=1):
+            numbered_chat_messages.append(ChatMessage(id=chat_message_id, seq=seq))
+            last_sent_seq[author_id] = seq
+            reader_id = chat.user2_id if author_id == chat.user1_id else chat.user1_id
+            if not visualized and last_read_seq[reader_id] >= seq:
+                last_read_seq[reader_id] = seq - 1
+
+        # The user read the chat until his last message when he sent it
+        chat.last_message_seq = len(chat_messages)
+        chat.user1_last_read_seq = max(last_read_seq[chat.user1_id], last_sent_seq[chat.user1_id])
+        chat.user2_last_read_seq = max(last_read_seq[chat.user2_id], last_sent_seq[chat.user2_id])
+        chats.append(chat)
+
+        if len(numbered_chat_messages) >= BATCH_SIZE:
+            ChatMessage.objects.bulk_update(numbered_chat_messages, ['seq'], batch_size=BATCH_SIZE)
+            numbered_chat_messages = []
+        if len(chats) >= BATCH_SIZE:
+            Chat.objects.bulk_update(chats, ['last_message_seq', 'user1_last_read_seq', 'user2_last_read_seq'], batch_size=BATCH_SIZE)
+            chats = []
+
+    ChatMessage.objects.bulk_update(numbered_chat_messages, ['seq'], batch_size=BATCH_SIZE)
+    Chat.objects.bulk_update(chats, ['last_message_seq', 'user1_last_read_seq', 'user2_last_read_seq'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chat_user1_exit_chat_date_chat_user2_exit_chat_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_seq',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='user1_last_read_seq',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida pelo usuário 1'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='user2_last_read_seq',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida pelo usuário 2'),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='seq',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência'),
+        ),
+        migrations.AlterField(
+            model_name='chat',
+            name='user1_exit_chat_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última data de remoção do chat do usuário 1'),
+        ),
+        migrations.AlterField(
+            model_name='chat',
+            name='user2_exit_chat_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última data de remoção do chat do usuário 2'),
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='visualized',
+        ),
+    ]
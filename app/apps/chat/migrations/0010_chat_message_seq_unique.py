@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-19 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chat_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('chat', 'seq'), name='chat_message_seq_unique'),
+        ),
+    ]
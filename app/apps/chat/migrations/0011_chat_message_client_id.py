@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_chat_message_seq_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='Id do cliente'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('chat', 'client_id'), name='chat_message_client_id_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_chat_message_client_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagemessage',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='user_chat_media/images/', verbose_name='Imagem'),
+        ),
+    ]
@@ -1,5 +1,5 @@
-from django.db import models
-from django.db.models import Case, When, CharField, Value
+from django.db import models, transaction, IntegrityError
+from django.db.models import Case, When, CharField, Value, F
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
@@ -53,7 +53,7 @@ class TextMessage(Message):
 
 
 class ImageMessage(Message):
-    image = models.ImageField(upload_to=f'user_chat_media/images/', blank=False, null=False, verbose_name='Imagem')
+    image = models.ImageField(upload_to=f'user_chat_media/images/', blank=False, null=False, db_index=True, verbose_name='Imagem')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -68,16 +68,38 @@ class ImageMessage(Message):
 class ChatMessage(models.Model):
     chat = models.ForeignKey('Chat', on_delete=models.CASCADE, verbose_name='Chat')
     message = models.ForeignKey(Message, on_delete=models.CASCADE, verbose_name='Mensagem')
-    visualized = models.BooleanField(default=False, verbose_name='Visualizada')
+    seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência')
+    client_id = models.UUIDField(blank=True, null=True, editable=False, verbose_name='Id do cliente')
 
     class Meta:
         verbose_name = "Mensagem de Chat"
         verbose_name_plural = "Mensagens de Chats"
         unique_together = ('chat', 'message')
+        constraints = [
+            # The sequence numbers of a chat are unique (and the index is used to order and paginate the messages)
+            models.UniqueConstraint(fields=['chat', 'seq'], name='chat_message_seq_unique'),
+            # The idempotency key generated by the client, so a message sent again (e.g. after a reconnect) is not duplicated
+            models.UniqueConstraint(fields=['chat', 'client_id'], name='chat_message_client_id_unique'),
+        ]
 
     def __str__(self):
         return f'{self.message.author.email} - ({self.message.get_message_type_display()}) -> {self.chat}'
 
+    def save(self, *args, mark_as_read=False, **kwargs):
+        '''
+        Save the chat message, allocating the next sequence number of the chat to a new message.
+
+        Parameters:
+            mark_as_read (bool): Mark the new message as read by the another user of the chat too (e.g. if he is connected in the chat)
+        '''
+
+        if self._state.adding and not self.seq:
+            with transaction.atomic():
+                self.seq = self.chat.allocate_message_seq(self.message.author, mark_as_read=mark_as_read)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
     def is_author(self, user):
         return self.message.author == user
 
@@ -105,6 +127,10 @@ class Chat(models.Model):
     user1_exit_chat_date = models.DateTimeField(blank=True, null=True, verbose_name='Última data de remoção do chat do usuário 1')
     user2_exit_chat_date = models.DateTimeField(blank=True, null=True, verbose_name='Última data de remoção do chat do usuário 2')
 
+    last_message_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem')
+    user1_last_read_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida pelo usuário 1')
+    user2_last_read_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida pelo usuário 2')
+
     class Meta:
         verbose_name = "Chat"
         verbose_name_plural = "Chats"
@@ -135,37 +161,210 @@ class Chat(models.Model):
             raise ValidationError('O usuário não pertence ao chat.')
 
     
-    def update_messages_visualization(self, user):
-        if self.user1 == user or self.user2 == user:
-            ChatMessage.objects.filter(chat=self, visualized=False).exclude(message__author=user).update(visualized=True)
+    def get_last_read_seq_field(self, user):
+        if self.user1_id == user.id:
+            return 'user1_last_read_seq'
+        elif self.user2_id == user.id:
+            return 'user2_last_read_seq'
         else:
             raise ValidationError('O usuário não pertence ao chat.')
 
-    def get_messages(self, init_messsages_date=None):
+
+    def get_last_read_seq(self, user):
+        return getattr(self, self.get_last_read_seq_field(user))
+
+
+    def allocate_message_seq(self, author, mark_as_read=False):
+        '''
+        Allocate the next message sequence number of the chat with a single UPDATE.
+
+        The author has read his own message, so his watermark is moved to the new sequence number too,
+        as the watermark of the another user if mark_as_read is True.
+
+        Parameters:
+            author (User): The author of the new message
+            mark_as_read (bool): Move the watermark of the another user to the new sequence number too
+
+        Returns:
+            int: The sequence number of the new message
+        '''
+
+        last_read_seq_fields = [self.get_last_read_seq_field(author)]
+        if mark_as_read:
+            last_read_seq_fields.append(self.get_last_read_seq_field(self.get_another_user(author)))
+
+        updates = {field: F('last_message_seq') + 1 for field in last_read_seq_fields}
+        Chat.objects.filter(pk=self.pk).update(last_message_seq=F('last_message_seq') + 1, **updates)
+        self.refresh_from_db(fields=['last_message_seq', 'user1_last_read_seq', 'user2_last_read_seq'])
+        return self.last_message_seq
+
+
+    def get_message_by_client_id(self, client_id):
+        '''
+        Get the message of the chat sent with an idempotency key.
+
+        Parameters:
+            client_id (uuid): The idempotency key generated by the client
+
+        Returns:
+            ChatMessage|None: The chat message, or None if no message was sent with the idempotency key
+        '''
+
+        return ChatMessage.objects.filter(chat=self, client_id=client_id).first()
+
+
+    async def aget_message_by_client_id(self, client_id):
+        '''
+        Async version of get_message_by_client_id.
+        '''
+
+        return await ChatMessage.objects.filter(chat=self, client_id=client_id).afirst()
+
+
+    def new_message(self, author, message_type, text=None, image=None, mark_as_read=False, client_id=None):
+        '''
+        Create a new message of the author in the chat.
+
+        Parameters:
+            author (User): The author of the message
+            message_type (str): The type of the message ('T', 'I', 'A' or 'V')
+            text (str|None): The text of a text message
+            image (File|None): The image of an image message
+            mark_as_read (bool): Mark the new message as read by the another user of the chat too (e.g. if he is connected in the chat)
+            client_id (uuid|None): The idempotency key generated by the client
+
+        Returns:
+            tuple: The chat message and True if it was created, False if a message with the same client_id already exists
+
+        Raises:
+            ValidationError: If the author is not in the chat, the message type is invalid or the message is empty
+        '''
+
+        if self.user1_id != author.id and self.user2_id != author.id:
+            raise ValidationError('Você não tem permissão para enviar mensagens neste chat.')
+
+        # If the message was already sent with the same idempotency key, return it
+        if client_id is not None:
+            chat_message = self.get_message_by_client_id(client_id)
+            if chat_message is not None:
+                return chat_message, False
+
+        match message_type:
+            case 'T':
+                if not isinstance(text, str) or not text.strip():
+                    raise ValidationError('A mensagem não pode ser vazia.')
+                message = TextMessage(author=author, text=text)
+            case 'I':
+                if not image:
+                    raise ValidationError('A imagem não pode ser vazia.')
+                message = ImageMessage(author=author, image=image)
+            case 'A':
+                message = TextMessage(author=author, text='Áudio')
+            case 'V':
+                message = TextMessage(author=author, text='Vídeo')
+            case _:
+                raise ValidationError('Tipo de mensagem inválido.')
+
+        try:
+            with transaction.atomic():
+                message.save()
+                chat_message = ChatMessage(chat=self, message=message, client_id=client_id)
+                chat_message.save(mark_as_read=mark_as_read)
+        except IntegrityError:
+            # The same message was sent concurrently, so the message of the first request is returned
+            if client_id is None:
+                raise
+            return ChatMessage.objects.get(chat=self, client_id=client_id), False
+
+        return chat_message, True
+
+
+    def update_messages_visualization(self, user):
+        from apps.utils import invalidate_navbar_state
+        # Move the watermark of the user to the last message of the chat (a single row UPDATE)
+        last_read_seq_field = self.get_last_read_seq_field(user)
+        Chat.objects.filter(pk=self.pk).update(**{last_read_seq_field: F('last_message_seq')})
+        setattr(self, last_read_seq_field, self.last_message_seq)
+        invalidate_navbar_state(user)
+
+
+    async def aupdate_messages_visualization(self, user):
+        from apps.utils import ainvalidate_navbar_state
+        last_read_seq_field = self.get_last_read_seq_field(user)
+        await Chat.objects.filter(pk=self.pk).aupdate(**{last_read_seq_field: F('last_message_seq')})
+        setattr(self, last_read_seq_field, self.last_message_seq)
+        await ainvalidate_navbar_state(user)
+
+    def _get_messages_queryset(self, init_messsages_date=None, before_seq=None, after_seq=None, limit=None):
         messages = ChatMessage.objects.filter(
             chat=self
-        ).order_by('-message__date')
+        )
         if init_messsages_date:
             messages = messages.exclude(message__date__lt=init_messsages_date)
+        if before_seq is not None:
+            messages = messages.filter(seq__lt=before_seq)
+        if after_seq is not None:
+            messages = messages.filter(seq__gt=after_seq)
+
+        # The messages after a sequence number are the next ones, so the oldest are taken first
+        if after_seq is not None and limit is not None:
+            messages = messages.order_by('seq')[:limit]
+        else:
+            messages = messages.order_by('-seq')
+            if limit is not None:
+                messages = messages[:limit]
+        return self._annotate_queryset(messages)
 
-        if messages.exists():
-            annotated_messages = self._annotate_queryset(messages)
+
+    def _get_messages_from_chat_messages(self, chat_messages, reverse=False):
+        if reverse:
+            chat_messages.reverse()
+
+        if chat_messages:
             aux = []
-            for msg in annotated_messages:
+            for msg in chat_messages:
                 if msg.message_type == 'T':
-                    aux.append(msg.message.textmessage)
+                    message = msg.message.textmessage
                 elif msg.message_type == 'I':
-                    aux.append(msg.message.imagemessage)
-                elif msg.message_type == 'A':
-                    pass
-                elif msg.message_type == 'V':
-                    pass
+                    message = msg.message.imagemessage
                 else:
-                    pass
+                    continue
+                message.seq = msg.seq
+                aux.append(message)
             return aux
         return None
 
 
+    def get_messages(self, init_messsages_date=None, before_seq=None, after_seq=None, limit=None):
+        '''
+        Get the messages of the chat, newest first.
+
+        Parameters:
+            init_messsages_date (datetime|None): Ignore the messages before this date
+            before_seq (int|None): Get only the messages before this sequence number
+            after_seq (int|None): Get only the messages after this sequence number (the oldest ones first if limit is passed)
+            limit (int|None): The maximum amount of messages
+
+        Returns:
+            list|None: The text/image messages (with the seq attribute of the chat message), None if there are no messages
+        '''
+
+        messages = self._get_messages_queryset(init_messsages_date, before_seq, after_seq, limit)
+        return self._get_messages_from_chat_messages(list(messages), reverse=after_seq is not None and limit is not None)
+
+
+    async def aget_messages(self, init_messsages_date=None, before_seq=None, after_seq=None, limit=None):
+        '''
+        Async version of get_messages, the messages and their authors are fetched in a single query.
+        '''
+
+        messages = self._get_messages_queryset(init_messsages_date, before_seq, after_seq, limit).select_related(
+            'message__textmessage__author', 'message__imagemessage__author'
+        )
+        chat_messages = [msg async for msg in messages]
+        return self._get_messages_from_chat_messages(chat_messages, reverse=after_seq is not None and limit is not None)
+
+
     def get_last_message(self, date=False, init_messsages_date=None):
         if self.get_amount_of_messages(init_messsages_date=init_messsages_date) == 0:
             return None
@@ -173,11 +372,11 @@ class Chat(models.Model):
         if init_messsages_date:
             message_id, message_type, message_date = ChatMessage.objects.filter(
                 chat=self
-            ).exclude(message__date__lt=init_messsages_date).values_list('message__id', 'message__message_type', 'message__date').last()
+            ).exclude(message__date__lt=init_messsages_date).order_by('seq').values_list('message__id', 'message__message_type', 'message__date').last()
         else:
             message_id, message_type, message_date = ChatMessage.objects.filter(
                 chat=self
-            ).values_list('message__id', 'message__message_type', 'message__date').last()
+            ).order_by('seq').values_list('message__id', 'message__message_type', 'message__date').last()
         
         
         
@@ -199,32 +398,73 @@ class Chat(models.Model):
             return message
 
 
+    async def aget_last_message(self, date=False, init_messsages_date=None):
+        '''
+        Async version of get_last_message, without counting the messages first.
+        '''
+
+        chat_messages = ChatMessage.objects.filter(chat=self)
+        if init_messsages_date:
+            chat_messages = chat_messages.exclude(message__date__lt=init_messsages_date)
+        last_message = await chat_messages.order_by('seq').values_list('message__id', 'message__message_type', 'message__date').alast()
+        if last_message is None:
+            return None
+
+        message_id, message_type, message_date = last_message
+        match message_type:
+            case 'T':
+                message = await TextMessage.objects.select_related('author').aget(id=message_id)
+            case 'I':
+                message = await ImageMessage.objects.select_related('author').aget(id=message_id)
+            case _:
+                message = None
+
+        if date:
+            return message, message_date
+        else:
+            return message
+
+
     def get_first_unviewed_message(self, user):
-        try:
-            message_id, message_type, message_date = ChatMessage.objects.filter(
-                chat=self, 
-                visualized=False
-            ).exclude(message__author=user).values_list(
-                'message__id', 'message__message_type', 'message__date'
-            ).first()
-            return message_id
-        except:
+        last_read_seq = self.get_last_read_seq(user)
+        if last_read_seq >= self.last_message_seq:
             return None
+        # The first message of the another user after the watermark of the user
+        return ChatMessage.objects.filter(
+            chat=self,
+            seq__gt=last_read_seq
+        ).exclude(message__author=user).order_by('seq').values_list('message__id', flat=True).first()
+
+
+    async def aget_first_unviewed_message(self, user):
+        last_read_seq = self.get_last_read_seq(user)
+        if last_read_seq >= self.last_message_seq:
+            return None
+        return await ChatMessage.objects.filter(
+            chat=self,
+            seq__gt=last_read_seq
+        ).exclude(message__author=user).order_by('seq').values_list('message__id', flat=True).afirst()
 
 
     def have_unviewed_message(self, user):
-        return ChatMessage.objects.filter(chat=self, visualized=False).exclude(message__author=user).exists()
+        return self.get_amount_of_unviewed_messages(user) > 0
 
 
     def get_amount_of_unviewed_messages(self, user, init_messsages_date=None):
-        if init_messsages_date:
-            return ChatMessage.objects.filter(chat=self, visualized=False).exclude(message__author=user).exclude(message__date__lt=init_messsages_date).count()
-        else:
-            return ChatMessage.objects.filter(chat=self, visualized=False).exclude(message__author=user).count()
+        # The messages before the exit chat date are already read (the watermark is moved when the user removes the chat),
+        # so init_messsages_date does not change the amount of unviewed messages
+        return max(0, self.last_message_seq - self.get_last_read_seq(user))
 
 
     def get_amount_of_messages(self, init_messsages_date=None):
         if init_messsages_date:
             return ChatMessage.objects.filter(chat=self).exclude(message__date__lt=init_messsages_date).count()
         else:
-            return ChatMessage.objects.filter(chat=self).count()
\ No newline at end of file
+            return ChatMessage.objects.filter(chat=self).count()
+
+
+    async def aget_amount_of_messages(self, init_messsages_date=None):
+        if init_messsages_date:
+            return await ChatMessage.objects.filter(chat=self).exclude(message__date__lt=init_messsages_date).acount()
+        else:
+            return await ChatMessage.objects.filter(chat=self).acount()
@@ -0,0 +1,187 @@
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.conf import settings
+
+import logging, threading, time
+
+try:
+    from redis.exceptions import RedisError
+except ImportError: # The shared cache is not redis (e.g. the local memory cache of the development)
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+# Errors of the shared cache that make the rate limit use the local buckets
+CACHE_ERRORS = (OSError, RedisError)
+
+# Script to take a token of each bucket (a hash with its tokens and updated_at) atomically in redis,
+# only if all the buckets have a token (the same algorithm of _take_token)
+# KEYS: the keys of the buckets | ARGV: now, then the rate and the capacity of each bucket
+# Returns: '0' if the tokens were taken, otherwise the seconds until all the buckets have a token
+TAKE_TOKEN_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local retry_after = 0
+for index, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[index * 2])
+    local capacity = tonumber(ARGV[index * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated_at')
+    tokens[index] = capacity
+    if bucket[1] then
+        tokens[index] = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    retry_after = math.max(retry_after, (1 - tokens[index]) / rate)
+end
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+for index, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[index * 2])
+    local capacity = tonumber(ARGV[index * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(tokens[index] - 1), 'updated_at', tostring(now))
+    -- a bucket is full again after capacity / rate seconds, so it can expire
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+# The buckets of the caches that are not redis are updated by one thread at a time
+# (the local memory cache of the development is per process, so it is atomic)
+_cache_buckets_lock = threading.Lock()
+
+# Buckets used while the shared cache is unavailable (per process)
+LOCAL_BUCKETS_MAX_LENGTH = 10000
+_local_buckets = {}
+_local_buckets_lock = threading.Lock()
+
+
+def get_rate_limit_keys(user_id, chat_id):
+    '''
+    Function to get the cache keys of the token buckets of the messages sent by a user
+
+    Parameters:
+        user_id (int): The id of the user
+        chat_id (str|uuid): The id of the chat
+
+    Returns:
+        dict: The cache key of each bucket ('user' for all the chats of the user, 'chat' for the chat)
+    '''
+
+    return {
+        'user': f"chat_rate_limit_{user_id}",
+        'chat': f"chat_rate_limit_{user_id}_{chat_id}",
+    }
+
+
+def _refill(bucket, limit, now):
+    '''
+    Function to get the tokens of a bucket refilled until now
+
+    Parameters:
+        bucket (dict|None): The bucket (tokens and updated_at), None if the bucket is full
+        limit (dict): The rate (tokens per second) and capacity of the bucket
+        now (float): The current timestamp
+
+    Returns:
+        float: The tokens of the bucket
+    '''
+
+    if bucket is None:
+        return limit['capacity']
+    elapsed = max(0, now - bucket['updated_at'])
+    return min(limit['capacity'], bucket['tokens'] + elapsed * limit['rate'])
+
+
+def _take_token(get_buckets, set_buckets, keys, limits, now):
+    '''
+    Function to take a token of each bucket, only if all the buckets have a token
+
+    Returns:
+        float: 0 if the tokens were taken, otherwise the seconds until all the buckets have a token
+    '''
+
+    buckets = get_buckets(list(keys.values()))
+    tokens = {name: _refill(buckets.get(key), limits[name], now) for name, key in keys.items()}
+
+    retry_after = max(
+        (1 - tokens[name]) / limits[name]['rate'] for name in keys
+    )
+    if retry_after > 0:
+        return retry_after
+
+    set_buckets({
+        key: {'tokens': tokens[name] - 1, 'updated_at': now} for name, key in keys.items()
+    }, limits)
+    return 0
+
+
+def _take_redis_token(keys, limits, now):
+    '''
+    Function to take a token of each bucket of the shared redis cache, atomically (TAKE_TOKEN_SCRIPT)
+
+    Returns:
+        float: 0 if the tokens were taken, otherwise the seconds until all the buckets have a token
+    '''
+
+    names = list(keys)
+    redis_keys = [cache.make_and_validate_key(keys[name]) for name in names]
+    # the buckets of a user are in the same redis server (the client of the first key)
+    client = cache._cache.get_client(redis_keys[0], write=True)
+    arguments = [now]
+    for name in names:
+        arguments += [limits[name]['rate'], limits[name]['capacity']]
+    return float(client.eval(TAKE_TOKEN_SCRIPT, len(redis_keys), *redis_keys, *arguments))
+
+
+def _get_cache_buckets(keys):
+    return cache.get_many(keys)
+
+
+def _set_cache_buckets(buckets, limits):
+    # A bucket is full again after capacity / rate seconds, so it can expire
+    timeout = max(limit['capacity'] / limit['rate'] for limit in limits.values())
+    cache.set_many(buckets, timeout=int(timeout) + 1)
+
+
+def _get_local_buckets(keys):
+    return {key: _local_buckets[key] for key in keys if key in _local_buckets}
+
+
+def _set_local_buckets(buckets, limits):
+    # Keep the local buckets bounded while the shared cache is unavailable
+    if len(_local_buckets) >= LOCAL_BUCKETS_MAX_LENGTH:
+        _local_buckets.clear()
+    _local_buckets.update(buckets)
+
+
+def check_message_rate_limit(user_id, chat_id):
+    '''
+    Function to take a token of the buckets of the messages sent by a user (token bucket)
+
+    Parameters:
+        user_id (int): The id of the user
+        chat_id (str|uuid): The id of the chat
+
+    Returns:
+        float: 0 if the user can send the message, otherwise the seconds the user must wait before sending it again (retry after)
+
+    Notes:
+        - The user has a bucket for all his chats and a bucket per chat (settings.CHAT_MESSAGES_RATE_LIMITS).
+        - The buckets are kept in the shared cache, so the limit is the same in all the processes.
+        - The tokens are taken atomically, without waiting for a lock: by a script in redis, and under a lock of the process
+          in the local memory cache, so concurrent requests can not take the same token.
+        - If the shared cache is unavailable, the buckets are kept in the memory of the process.
+    '''
+
+    keys = get_rate_limit_keys(user_id, chat_id)
+    limits = settings.CHAT_MESSAGES_RATE_LIMITS
+    now = time.time()
+    try:
+        if isinstance(caches['default'], RedisCache):
+            return _take_redis_token(keys, limits, now)
+        with _cache_buckets_lock:
+            return _take_token(_get_cache_buckets, _set_cache_buckets, keys, limits, now)
+    except CACHE_ERRORS as error:
+        logger.warning('Cache unavailable (%r), using the local rate limit buckets.', error)
+        with _local_buckets_lock:
+            return _take_token(_get_local_buckets, _set_local_buckets, keys, limits, now)
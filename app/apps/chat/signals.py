@@ -1,9 +1,12 @@
+from django.db import transaction
 from django.db.models import signals
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from .models import ImageMessage, TextMessage, Chat, ChatMessage
+from apps.utils import invalidate_navbar_state, get_navbar_state
+from apps.event_log import send_user_event
+from apps.tracing import start_span
+from apps.rendering import get_message_template, get_chat_list_template, get_message_preview
 
 
 @receiver(signals.post_delete, sender=ImageMessage)
@@ -32,13 +35,36 @@ def image_message_post_update(sender, instance, **kwargs):
             pass
 
 
+@receiver(signals.post_save, sender=Chat)
+def chat_post_save(sender, instance, **kwargs):
+    '''
+    Signal to invalidate the navbar state of the chat users when the chat is updated
+    '''
+
+    invalidate_navbar_state(instance.user1_id, instance.user2_id)
+
+
 @receiver(signals.post_save, sender=ChatMessage)
 def chat_message_post_save(sender, instance, **kwargs):
     '''
     Signal to send message to chat
+
+    Notes:
+        - The message is sent when the transaction that created it is committed, so the clients can fetch it (?after=) as soon as
+          they receive it, and a message rolled back is never sent nor appended to the event log.
     '''
 
-    channel_layer = get_channel_layer()
+    transaction.on_commit(lambda: send_chat_message(instance))
+
+
+def send_chat_message(instance):
+    '''
+    Function to send a chat message to the chat lists, chats and navbars of the users of the chat
+    '''
+
+    # The new message changes the unviewed messages of the chat users
+    invalidate_navbar_state(instance.chat.user1_id, instance.chat.user2_id)
+
     send_type = "send_message_create"
 
     user1 = instance.message.author
@@ -49,99 +75,112 @@ def chat_message_post_save(sender, instance, **kwargs):
     else:
         new_chat_user1 = not instance.chat.user2_view
         new_chat_user2 = not instance.chat.user1_view
-    
+
+    # Render the message once for each user, the consumers of the user (one per tab or device) only send it
+    message = instance.get_message()
+    message_type = instance.message.message_type
+    message_preview = get_message_preview(message, message_type)
+    with start_span('render', attributes={'render.function': 'get_message_template'}):
+        message_templates = {
+            user.id: str(get_message_template(user, message)) if message is not None else None
+            for user in (user1, user2)
+        }
 
     # Send message to user1 chat list
-    async_to_sync(
-        channel_layer.group_send
-    )(
-        f"user_{user1.id}_messages", 
+    send_user_event(
+        user1.id,
+        f"user_{user1.id}_messages",
         {
             "type": send_type, 
             "chat_id": str(instance.chat.id),
             "chat_message_id": instance.message.id,
             "chat_message_author": instance.message.author.username,
-            "chat_message_type": instance.message.message_type,
+            "chat_message_type": message_type,
             "chat_unviewed_messages_count": instance.chat.get_amount_of_unviewed_messages(user1),
             "chat_message_date": instance.message.date,
+            "chat_message_seq": instance.seq,
+            "chat_message_content": message_preview,
             "new_chat": new_chat_user1,
+            # the chat is rendered only when it is new in the chat list of the user
+            "template": get_chat_list_template(user1, instance.chat) if new_chat_user1 else None,
         }
     )
     # Send message to user1 chat
-    async_to_sync(
-        channel_layer.group_send
-    )(
-        f"user_{user1.id}_chat_{str(instance.chat.id)}", 
+    send_user_event(
+        user1.id,
+        f"user_{user1.id}_chat_{str(instance.chat.id)}",
         {
             "type": send_type,
             "chat_id": str(instance.chat.id),
             "chat_message_id": instance.message.id,
-            "chat_message_type": instance.message.message_type,
+            "chat_message_type": message_type,
             "chat_message_is_author": instance.is_author(user1),
+            "chat_message_seq": instance.seq,
+            "template": message_templates[user1.id],
         }
     )
 
 
     # Send message to user2 chat list
-    async_to_sync(
-        channel_layer.group_send
-    )(
-        f"user_{user2.id}_messages", 
+    send_user_event(
+        user2.id,
+        f"user_{user2.id}_messages",
         {
             "type": send_type, 
             "chat_id": str(instance.chat.id),
             "chat_message_id": instance.message.id,
             "chat_message_author": instance.message.author.username,
-            "chat_message_type": instance.message.message_type,
+            "chat_message_type": message_type,
             "chat_unviewed_messages_count": instance.chat.get_amount_of_unviewed_messages(user2),
             "chat_message_date": instance.message.date,
+            "chat_message_seq": instance.seq,
+            "chat_message_content": message_preview,
             "new_chat": new_chat_user2,
+            # the chat is rendered only when it is new in the chat list of the user
+            "template": get_chat_list_template(user2, instance.chat) if new_chat_user2 else None,
         }
     )
     # Send message to user2 chat
-    async_to_sync(
-        channel_layer.group_send
-    )(
-        f"user_{user2.id}_chat_{str(instance.chat.id)}", 
+    send_user_event(
+        user2.id,
+        f"user_{user2.id}_chat_{str(instance.chat.id)}",
         {
             "type": send_type,
             "chat_id": str(instance.chat.id),
             "chat_message_id": instance.message.id,
-            "chat_message_type": instance.message.message_type,
+            "chat_message_type": message_type,
             "chat_message_is_author": instance.is_author(user2),
+            "chat_message_seq": instance.seq,
+            "template": message_templates[user2.id],
         }
     )
 
 
     if instance.chat.user1 == user1 and instance.chat.user2_view == False:
         instance.chat.user2_view = True
-        instance.chat.save()
+        instance.chat.save(update_fields=['user2_view'])
     elif instance.chat.user2 == user1 and instance.chat.user1_view == False:
         instance.chat.user1_view = True
-        instance.chat.save()
-
+        instance.chat.save(update_fields=['user1_view'])
 
-    has_unviewed_messages = ChatMessage.objects.filter(chat=instance.chat, visualized=False).exists()
 
     # Send message to user1 navbar
     if instance.chat.user1_view:
-        async_to_sync(
-            channel_layer.group_send
-        )(
-            f"user_{user1.id}_navbar", 
+        send_user_event(
+            user1.id,
+            f"user_{user1.id}_navbar",
             {
                 "type": "navbar_chat_unviewed_messages",
-                "value": has_unviewed_messages,
+                "value": get_navbar_state(user1)['has_unviewed_chat_messages'],
             }
         )
     # Send message to user2 navbar
     if instance.chat.user2_view:
-        async_to_sync(
-            channel_layer.group_send
-        )(
-            f"user_{user2.id}_navbar", 
+        send_user_event(
+            user2.id,
+            f"user_{user2.id}_navbar",
             {
                 "type": "navbar_chat_unviewed_messages",
-                "value": has_unviewed_messages,
+                "value": get_navbar_state(user2)['has_unviewed_chat_messages'],
             }
         )
\ No newline at end of file
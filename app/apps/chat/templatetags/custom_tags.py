@@ -63,11 +63,12 @@ def is_user_attribute_visible(**kwargs):
     
     is_friend = user_request in message_author.friends.all()
 
-    if len(message_author.config_online_visibility.split("'")) > 1:
-        config_online_visibility = message_author.config_online_visibility.split("'")[1]
-        config_status_visibility = message_author.config_status_visibility.split("'")[1]
-        config_email_visibility = message_author.config_email_visibility.split("'")[1]
-        config_photo_visibility = message_author.config_photo_visibility.split("'")[1]
+    # the default config is the choice tuple until the user is loaded again from the database
+    if len(str(message_author.config_online_visibility).split("'")) > 1:
+        config_online_visibility = str(message_author.config_online_visibility).split("'")[1]
+        config_status_visibility = str(message_author.config_status_visibility).split("'")[1]
+        config_email_visibility = str(message_author.config_email_visibility).split("'")[1]
+        config_photo_visibility = str(message_author.config_photo_visibility).split("'")[1]
     else:
         config_online_visibility = message_author.config_online_visibility
         config_status_visibility = message_author.config_status_visibility
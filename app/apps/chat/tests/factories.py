@@ -40,7 +40,6 @@ class ChatMessageTextFactory(factory.django.DjangoModelFactory):
 
     chat = factory.SubFactory(ChatFactory)
     message = factory.SubFactory(TextMessageFactory)
-    visualized = False
 
 
 
@@ -49,5 +48,4 @@ class ChatMessageImageFactory(factory.django.DjangoModelFactory):
         model = ChatMessage
 
     chat = factory.SubFactory(ChatFactory)
-    message = factory.SubFactory(ImageMessageFactory)
-    visualized = False
\ No newline at end of file
+    message = factory.SubFactory(ImageMessageFactory)
\ No newline at end of file
@@ -0,0 +1,442 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync
+from unittest import mock
+import asyncio
+import uuid
+
+from .factories import (
+    UserFactory,
+    TextMessageFactory,
+    ChatFactory,
+    ChatMessageTextFactory,
+)
+from apps.chat.models import ChatMessage
+from apps.chat.consumers import ChatConsumer, ChatsConsumer
+from apps.chat import signals as chat_signals
+from apps.loaders import load_chat, load_text_message, load_image_message
+from apps.event_log import append_event, get_missed_events, get_last_event_id, send_user_event, get_event_log_event_key, get_event_log_group_key
+from telezap_django.consumers import NavBarConsumer
+
+
+class EventLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='user1', password='User1@123')
+        self.user2 = UserFactory(username='user2', password='User2@123')
+
+
+    def test_missed_events_of_group(self):
+        '''
+        Description:
+            This test verifies that the missed events are got in order and filtered by the group.
+
+        Pre-conditions:
+            - Events of two groups of the same user in the event log.
+
+        Post-conditions:
+            - The event ids must be sequential per user.
+            - Only the events of the group sent after the resume id must be returned, oldest first.
+        '''
+
+        navbar_group = f"user_{self.user1.id}_navbar"
+        messages_group = f"user_{self.user1.id}_messages"
+        append_event(self.user1.id, navbar_group, {'type': 'navbar_chat_unviewed_messages', 'value': True})
+        append_event(self.user1.id, messages_group, {'type': 'send_message_create'})
+        append_event(self.user1.id, navbar_group, {'type': 'navbar_chat_unviewed_messages', 'value': False})
+
+        self.assertEqual(get_last_event_id(self.user1.id), 3)
+        self.assertEqual(get_last_event_id(self.user2.id), 0)
+
+        events = get_missed_events(self.user1.id, 0, navbar_group)
+        self.assertEqual([event['event_id'] for event in events], [1, 3])
+        self.assertEqual([event['value'] for event in events], [True, False])
+        self.assertEqual(get_missed_events(self.user1.id, 1, navbar_group)[0]['event_id'], 3)
+        self.assertEqual(get_missed_events(self.user1.id, 3, navbar_group), [])
+
+
+    @override_settings(EVENT_LOG_MAX_LENGTH=2)
+    def test_missed_events_trimmed(self):
+        '''
+        Description:
+            This test verifies that the event log is bounded and that a resume id out of the log requires a resync.
+
+        Pre-conditions:
+            - More events in the event log than settings.EVENT_LOG_MAX_LENGTH.
+
+        Post-conditions:
+            - A resume id before the bounded log must return None.
+            - A resume id after the last event id must return None.
+            - A resume id inside the bounded log must return the missed events.
+        '''
+
+        group = f"user_{self.user1.id}_navbar"
+        for value in (True, False, True, False):
+            append_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': value})
+
+        self.assertIsNone(get_missed_events(self.user1.id, 0, group))
+        self.assertIsNone(get_missed_events(self.user1.id, 1, group))
+        self.assertIsNone(get_missed_events(self.user1.id, 5, group))
+        self.assertEqual([event['event_id'] for event in get_missed_events(self.user1.id, 2, group)], [3, 4])
+
+
+    def test_missed_events_expired_per_group(self):
+        '''
+        Description:
+            This test verifies that the expiry of the events of the other groups of the user does not require a resync.
+
+        Pre-conditions:
+            - The client received the last event of its group, then the events of another group were appended to the event log.
+            - All these events expired.
+
+        Post-conditions:
+            - A resume id of the group without events after it must return no events.
+            - A resume id of the group must return the new events of the group, while they are in the event log.
+            - A resume id of the group must return None if a new event of the group expired.
+        '''
+
+        navbar_group = f"user_{self.user1.id}_navbar"
+        messages_group = f"user_{self.user1.id}_messages"
+        append_event(self.user1.id, navbar_group, {'type': 'navbar_chat_unviewed_messages', 'value': True})
+        append_event(self.user1.id, messages_group, {'type': 'send_message_create'})
+        append_event(self.user1.id, messages_group, {'type': 'send_message_create'})
+        cache.delete_many([get_event_log_event_key(self.user1.id, event_id) for event_id in (1, 2, 3)])
+
+        self.assertEqual(get_missed_events(self.user1.id, 1, navbar_group), [])
+
+        append_event(self.user1.id, navbar_group, {'type': 'navbar_chat_unviewed_messages', 'value': False})
+        self.assertEqual([event['event_id'] for event in get_missed_events(self.user1.id, 1, navbar_group)], [4])
+
+        cache.delete(get_event_log_event_key(self.user1.id, 4))
+        self.assertIsNone(get_missed_events(self.user1.id, 1, navbar_group))
+
+
+    def test_missed_events_concurrent_appends(self):
+        '''
+        Description:
+            This test verifies that the missed events are got when concurrent appends left the last id of the group at an older event.
+
+        Pre-conditions:
+            - Two events of a group appended at once: both read the same previous event and the older one set the last id of the group last.
+
+        Post-conditions:
+            - A resume id of the older event must return the newer event.
+            - A resume id before both events must return both events, oldest first.
+            - A resume id before the older event must return None if the older event expired.
+        '''
+
+        group = f"user_{self.user1.id}_navbar"
+        append_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': True})
+        append_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': False})
+        append_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': True})
+
+        # the newer event read the same previous event as the older one, which set the last id of the group after it
+        newer_key = get_event_log_event_key(self.user1.id, 3)
+        cache.set(newer_key, {**cache.get(newer_key), 'previous': 1})
+        cache.set(get_event_log_group_key(self.user1.id, group), 2, timeout=None)
+
+        self.assertEqual([event['event_id'] for event in get_missed_events(self.user1.id, 2, group)], [3])
+        self.assertEqual([event['event_id'] for event in get_missed_events(self.user1.id, 0, group)], [1, 2, 3])
+
+        cache.delete(get_event_log_event_key(self.user1.id, 2))
+        self.assertIsNone(get_missed_events(self.user1.id, 1, group))
+
+
+    def test_chat_message_events_logged(self):
+        '''
+        Description:
+            This test verifies that the events of a new chat message are appended to the event log of both chat users.
+
+        Pre-conditions:
+            - A chat between two users.
+
+        Post-conditions:
+            - The chat list and chat events of the message must be in the event log of both users.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        with self.captureOnCommitCallbacks(execute=True):
+            chat_message = ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user1))
+
+        for user in (self.user1, self.user2):
+            chat_list_events = get_missed_events(user.id, 0, f"user_{user.id}_messages")
+            chat_events = get_missed_events(user.id, 0, f"user_{user.id}_chat_{chat.id}")
+            self.assertEqual(len(chat_list_events), 1)
+            self.assertEqual(chat_list_events[0]['chat_message_id'], chat_message.message.id)
+            self.assertEqual(len(chat_events), 1)
+            self.assertEqual(chat_events[0]['chat_message_seq'], chat_message.seq)
+
+
+    def test_chat_message_events_rendered_once(self):
+        '''
+        Description:
+            This test verifies that the templates of a new chat message are rendered once by the producer and only sent by the consumers.
+
+        Pre-conditions:
+            - A chat between two users and a chat list consumer of the receiver resuming the event log.
+
+        Post-conditions:
+            - The message must be rendered once per user, the author gets the message send template and the receiver the message received template.
+            - The chat list events must have the preview of the message.
+            - The chat list consumer must send the event without querying the database.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        with mock.patch.object(chat_signals, 'get_message_template', wraps=chat_signals.get_message_template) as get_message_template:
+            with self.captureOnCommitCallbacks(execute=True):
+                ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user1, text='Olá'))
+
+        author_event = get_missed_events(self.user1.id, 0, f"user_{self.user1.id}_chat_{chat.id}")[0]
+        receiver_event = get_missed_events(self.user2.id, 0, f"user_{self.user2.id}_chat_{chat.id}")[0]
+        self.assertEqual(get_message_template.call_count, 2)
+        self.assertIn('Olá', author_event['template'])
+        self.assertNotIn('another-user-profile-btn', author_event['template'])
+        self.assertIn('another-user-profile-btn', receiver_event['template'])
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(ChatsConsumer.as_asgi(), '/ws/chats/?resume=0')
+            communicator.scope['user'] = self.user2
+            await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        with CaptureQueriesContext(connection) as queries:
+            message = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(message['chat_message_content'], 'Olá')
+        self.assertEqual(message['type'], 'update')
+        self.assertIsNone(message['template'])
+
+
+    def test_navbar_consumer_replays_missed_events(self):
+        '''
+        Description:
+            This test verifies that the navbar consumer replays the events missed since the resume token on connect.
+
+        Pre-conditions:
+            - Two navbar events sent while the user was disconnected, after the resume token.
+
+        Post-conditions:
+            - Only the events after the resume token must be replayed, with their event ids.
+        '''
+
+        group = f"user_{self.user1.id}_navbar"
+        send_user_event(self.user1.id, group, {'type': 'navbar_notification_pending_notifications', 'value': True})
+        send_user_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': True})
+        send_user_event(self.user1.id, group, {'type': 'navbar_chat_unviewed_messages', 'value': False})
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(NavBarConsumer.as_asgi(), '/ws/navbar/?resume=1')
+            communicator.scope['user'] = self.user1
+            connected, _ = await communicator.connect()
+            messages = [await communicator.receive_json_from(), await communicator.receive_json_from()]
+            nothing_else = await communicator.receive_nothing()
+            await communicator.disconnect()
+            return connected, messages, nothing_else
+
+        connected, messages, nothing_else = async_to_sync(connect_and_receive)()
+
+        self.assertTrue(connected)
+        self.assertTrue(nothing_else)
+        self.assertEqual(messages, [
+            {'type': 'navbar_chat_unviewed_messages', 'value': True, 'event_id': 2},
+            {'type': 'navbar_chat_unviewed_messages', 'value': False, 'event_id': 3},
+        ])
+
+
+class LoadersTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory(username='loader_user1')
+        self.user2 = UserFactory(username='loader_user2')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+        self.text_message = TextMessageFactory(author=self.user1)
+
+
+    def test_loaders_single_query(self):
+        '''
+        Description:
+            This test verifies that the loaders of the consumers get an object with a single query.
+
+        Pre-conditions:
+            - A chat and a text message.
+
+        Post-conditions:
+            - Each load must make one query, with the related users loaded in it.
+            - An object that does not exist must be loaded as None with one query.
+        '''
+
+        async def load():
+            chat = await load_chat(self.chat.id)
+            text_message = await load_text_message(self.text_message.id)
+            missing_message = await load_image_message(self.text_message.id)
+            return chat, text_message, missing_message
+
+        with CaptureQueriesContext(connection) as queries:
+            chat, text_message, missing_message = async_to_sync(load)()
+            usernames = [chat.user1.username, chat.user2.username, text_message.author.username]
+
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(usernames, ['loader_user1', 'loader_user2', 'loader_user1'])
+        self.assertIsNone(missing_message)
+
+
+    def test_loaders_coalesce_concurrent_loads(self):
+        '''
+        Description:
+            This test verifies that concurrent loads of the same object trigger one fetch.
+
+        Pre-conditions:
+            - A chat loaded by many handlers at the same time.
+
+        Post-conditions:
+            - The concurrent loads of the chat must make one query and get the same object.
+            - A load after the concurrent loads are finished must get the chat again.
+        '''
+
+        async def load():
+            chats = await asyncio.gather(*[load_chat(self.chat.id) for _ in range(10)])
+            return chats, await load_chat(self.chat.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            chats, chat = async_to_sync(load)()
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(len({id(concurrent_chat) for concurrent_chat in chats}), 1)
+        self.assertEqual(chat, self.chat)
+        self.assertIsNot(chat, chats[0])
+
+
+class ChatConsumerReceiveTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='user1', password='User1@123')
+        self.user2 = UserFactory(username='user2', password='User2@123')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+
+
+    def send_messages(self, messages):
+        async def connect_and_send():
+            communicator = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), f'/ws/chat/{self.chat.id}/'
+            )
+            communicator.scope['user'] = self.user1
+            communicator.scope['url_route'] = {'kwargs': {'chat_id': self.chat.id}}
+            await communicator.connect()
+            replies = []
+            for message in messages:
+                await communicator.send_json_to(message)
+                # skip the messages sent to the chat by the chat message signal
+                reply = await communicator.receive_json_from()
+                while reply['type'] == 'create':
+                    reply = await communicator.receive_json_from()
+                replies.append(reply)
+            await communicator.disconnect()
+            return replies
+
+        return async_to_sync(connect_and_send)()
+
+
+    def test_send_message_ack_and_idempotency(self):
+        '''
+        Description:
+            This test verifies that a text message sent through the chat websocket is created once and acknowledged.
+
+        Pre-conditions:
+            - A user connected in a chat sends the same message (same client_id) twice.
+
+        Post-conditions:
+            - Both sends must be acknowledged with the same sequence number.
+            - Only the first send must create the message.
+        '''
+
+        client_id = str(uuid.uuid4())
+        message = {'type': 'send_message', 'client_id': client_id, 'message_type': 'T', 'text': 'Hello'}
+        first_reply, second_reply = self.send_messages([message, message])
+
+        self.assertEqual(first_reply['type'], 'ack')
+        self.assertEqual(first_reply['client_id'], client_id)
+        self.assertTrue(first_reply['created'])
+        self.assertEqual(second_reply['type'], 'ack')
+        self.assertFalse(second_reply['created'])
+        self.assertEqual(first_reply['seq'], second_reply['seq'])
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat).count(), 1)
+
+
+    def test_send_message_nack(self):
+        '''
+        Description:
+            This test verifies that an invalid message sent through the chat websocket is refused with a nack.
+
+        Pre-conditions:
+            - A user connected in a chat sends an empty message and a message without client_id.
+
+        Post-conditions:
+            - Both sends must be refused with a nack and the reason.
+            - No message must be created.
+        '''
+
+        client_id = str(uuid.uuid4())
+        empty_reply, no_client_id_reply = self.send_messages([
+            {'type': 'send_message', 'client_id': client_id, 'message_type': 'T', 'text': ' '},
+            {'type': 'send_message', 'message_type': 'T', 'text': 'Hello'},
+        ])
+
+        self.assertEqual(empty_reply, {'client_id': client_id, 'error': 'A mensagem não pode ser vazia.', 'retry_after': None, 'type': 'nack'})
+        self.assertEqual(no_client_id_reply['type'], 'nack')
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat).count(), 0)
+
+
+    def test_send_message_not_text_nack(self):
+        '''
+        Description:
+            This test verifies that a message with a text that is not a string is refused with a nack, without closing the connection.
+
+        Pre-conditions:
+            - A user connected in a chat sends a message with a number as text, then a valid message.
+
+        Post-conditions:
+            - The first send must be refused with a nack.
+            - The second send must be acknowledged, in the same connection.
+        '''
+
+        invalid_reply, valid_reply = self.send_messages([
+            {'type': 'send_message', 'client_id': str(uuid.uuid4()), 'message_type': 'T', 'text': 5},
+            {'type': 'send_message', 'client_id': str(uuid.uuid4()), 'message_type': 'T', 'text': 'Hello'},
+        ])
+
+        self.assertEqual(invalid_reply['type'], 'nack')
+        self.assertEqual(invalid_reply['error'], 'A mensagem não pode ser vazia.')
+        self.assertEqual(valid_reply['type'], 'ack')
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat).count(), 1)
+
+
+    def test_connect_refused_out_of_chat(self):
+        '''
+        Description:
+            This test verifies that the chat websocket refuses the users that are not in the chat and the chats that do not exist.
+
+        Pre-conditions:
+            - A user that is not in the chat connects to it.
+            - A user connects to a chat that does not exist.
+
+        Post-conditions:
+            - Both connections must be refused.
+        '''
+
+        user3 = UserFactory(username='user3', password='User3@123')
+
+        async def connect(user, chat_id):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{chat_id}/')
+            communicator.scope['user'] = user
+            communicator.scope['url_route'] = {'kwargs': {'chat_id': chat_id}}
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)(user3, self.chat.id))
+        self.assertFalse(async_to_sync(connect)(self.user1, uuid.uuid4()))
@@ -0,0 +1,117 @@
+from django.test import TestCase
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync, sync_to_async
+from prometheus_client import REGISTRY
+
+from .factories import UserFactory, ChatFactory
+from apps.chat.consumers import ChatsConsumer
+from apps.event_log import send_user_event
+from apps.metrics import install_metrics, instrument_group_send
+
+
+def get_sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        install_metrics()
+        self.user1 = UserFactory(username='metrics_user1', password='User1@123')
+        self.user2 = UserFactory(username='metrics_user2', password='User2@123')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+
+
+    def test_http_request_metrics(self):
+        '''
+        Description:
+            This test verifies that the latency and the database queries of the HTTP requests are recorded by view name.
+
+        Pre-conditions:
+            - User is logged in.
+
+        Post-conditions:
+            - The request to the async get_chat_messages view must be recorded with its latency and its queries (made in the threads of the ORM).
+            - The metrics endpoint must return the metrics in the Prometheus text format.
+        '''
+
+        labels = {'view': 'chat:get_chat_messages'}
+        requests_before = get_sample('telezap_http_request_duration_seconds_count', {**labels, 'method': 'GET', 'status': '200'})
+        queries_before = get_sample('telezap_http_request_queries_sum', labels)
+
+        self.client.login(username=self.user1.email, password='User1@123')
+        response = self.client.get(reverse('chat:get_chat_messages', kwargs={'id': self.chat.id}))
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(get_sample('telezap_http_request_duration_seconds_count', {**labels, 'method': 'GET', 'status': '200'}), requests_before + 1)
+        self.assertGreater(get_sample('telezap_http_request_queries_sum', labels), queries_before)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'telezap_http_request_duration_seconds_count{method="GET",status="200",view="chat:get_chat_messages"}', response.content)
+        self.assertIn(b'telezap_websocket_connections', response.content)
+
+
+    def test_websocket_and_channel_layer_metrics(self):
+        '''
+        Description:
+            This test verifies that the websocket connections, the events of the consumers and the group_sends are recorded.
+
+        Pre-conditions:
+            - A user connected to the chat list websocket receives an event.
+            - A channel layer whose group_send fails.
+
+        Post-conditions:
+            - The open connections of the consumer must be increased while it is connected and decreased after it is disconnected.
+            - The events must be counted by consumer method.
+            - The group_send must be recorded, and its failures counted.
+        '''
+
+        consumer_labels = {'consumer': 'ChatsConsumer'}
+        event_labels = {'consumer': 'ChatsConsumer', 'handler': 'send_message_create'}
+        connections_before = get_sample('telezap_websocket_connections', consumer_labels)
+        events_before = get_sample('telezap_websocket_events_total', event_labels)
+        group_sends_before = get_sample('telezap_channel_layer_group_send_duration_seconds_count')
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(ChatsConsumer.as_asgi(), '/ws/chats/')
+            communicator.scope['user'] = self.user1
+            await communicator.connect()
+            connections = get_sample('telezap_websocket_connections', consumer_labels)
+            await sync_to_async(send_user_event)(self.user1.id, f"user_{self.user1.id}_messages", {
+                'type': 'send_message_create',
+                'chat_id': str(self.chat.id),
+                'chat_message_author': self.user2.username,
+                'chat_message_content': 'Olá',
+                'chat_unviewed_messages_count': 1,
+                'chat_message_date': timezone.now(),
+                'new_chat': False,
+                'template': None,
+            })
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connections, message
+
+        connections, message = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(message['chat_message_content'], 'Olá')
+        self.assertEqual(connections, connections_before + 1)
+        self.assertEqual(get_sample('telezap_websocket_connections', consumer_labels), connections_before)
+        self.assertEqual(get_sample('telezap_websocket_events_total', event_labels), events_before + 1)
+        self.assertEqual(get_sample('telezap_channel_layer_group_send_duration_seconds_count'), group_sends_before + 1)
+
+        class FailingChannelLayer:
+            async def group_send(self, group, message):
+                raise ConnectionError()
+
+        channel_layer = FailingChannelLayer()
+        instrument_group_send(channel_layer)
+        failures_before = get_sample('telezap_channel_layer_group_send_failures_total')
+        with self.assertRaises(ConnectionError):
+            async_to_sync(channel_layer.group_send)('group', {'type': 'test'})
+        self.assertEqual(get_sample('telezap_channel_layer_group_send_failures_total'), failures_before + 1)
@@ -1,7 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import transaction
+from django.db.models import Count, Max
+
+from io import StringIO
+import json, tempfile, uuid
 
 from .factories import (
     UserFactory, 
@@ -15,6 +20,8 @@ from .factories import (
     ChatMessage,
     Chat
 )
+from apps.user.models import User
+from apps.notification.models import FriendshipRequest
 
 
 class TextMessageTest(TestCase):
@@ -192,15 +199,20 @@ class ChatTest(TestCase):
             - The Chat model must be correctly defined.
 
         Post-conditions:
-            - The update_messages_visualization method must update the messages of the chat.
+            - The update_messages_visualization method must move the watermark of the user to the last message of the chat with a single query.
         '''
         
         chat = ChatFactory(user1=self.user1, user2=self.user2)
         text_message = TextMessageFactory(author=self.user1)
-        chat_message = ChatMessageTextFactory(chat=chat, message=text_message, visualized=False)
-        chat.update_messages_visualization(self.user2)
-        chat_message.refresh_from_db()
-        self.assertTrue(chat_message.visualized)
+        chat_message = ChatMessageTextFactory(chat=chat, message=text_message)
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 1)
+
+        # Marking the chat as read is a single row write
+        with self.assertNumQueries(1):
+            chat.update_messages_visualization(self.user2)
+        chat.refresh_from_db()
+        self.assertEqual(chat.user2_last_read_seq, chat_message.seq)
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 0)
 
 
     def test_chat_model_update_messages_visualization_method_error(self):
@@ -235,9 +247,9 @@ class ChatTest(TestCase):
         self.assertIsNone(chat.get_messages())
 
         text_message = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message, visualized=False)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message)
         image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=False)
+        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message)
 
         self.assertEqual(chat.get_messages(), [image_message, text_message])
 
@@ -258,9 +270,9 @@ class ChatTest(TestCase):
         self.assertIsNone(chat.get_last_message())
 
         text_message = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message, visualized=False)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message)
         image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=False)
+        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message)
 
         self.assertEqual(chat.get_last_message(), image_message)
 
@@ -281,9 +293,9 @@ class ChatTest(TestCase):
         self.assertIsNone(chat.get_last_message(date=True))
 
         text_message = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message, visualized=False)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message)
         image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=False)
+        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message)
 
         self.assertEqual(chat.get_last_message(date=True), (image_message, chat_message2.message.date))
 
@@ -304,9 +316,9 @@ class ChatTest(TestCase):
         self.assertEqual(chat.get_amount_of_messages(), 0)
 
         text_message = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message, visualized=False)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message)
         image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=False)
+        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message)
 
         self.assertEqual(chat.get_amount_of_messages(), 2)
 
@@ -320,7 +332,7 @@ class ChatTest(TestCase):
             - The Chat model must be correctly defined.
 
         Post-conditions:
-            - The get_amount_of_unviewed_messages method must return the amount of unvisualized messages of the chat.
+            - The get_amount_of_unviewed_messages method must return the amount of messages after the watermark of the user.
         '''
         
         chat = ChatFactory(user1=self.user1, user2=self.user2)
@@ -328,14 +340,19 @@ class ChatTest(TestCase):
         self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 0)
 
         text_message1 = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1, visualized=False)
-        image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=False)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1)
         text_message2 = TextMessageFactory(author=self.user1)
-        chat_message3 = ChatMessageTextFactory(chat=chat, message=text_message2, visualized=True)
+        chat_message2 = ChatMessageTextFactory(chat=chat, message=text_message2)
+
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user1), 0)
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 2)
+
+        # Sending a message moves the watermark of the author to his message
+        image_message = ImageMessageFactory(author=self.user2)
+        chat_message3 = ChatMessageImageFactory(chat=chat, message=image_message)
 
         self.assertEqual(chat.get_amount_of_unviewed_messages(self.user1), 1)
-        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 1)
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 0)
 
 
     def test_chat_model_have_unviewed_nessage(self):
@@ -356,12 +373,13 @@ class ChatTest(TestCase):
         self.assertFalse(chat.have_unviewed_message(self.user2))
 
         text_message1 = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1, visualized=False)
-        image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=True)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1)
 
         self.assertFalse(chat.have_unviewed_message(self.user1))
         self.assertTrue(chat.have_unviewed_message(self.user2))
+
+        chat.update_messages_visualization(self.user2)
+        self.assertFalse(chat.have_unviewed_message(self.user2))
     
 
     def test_chat_model_get_first_unviewed_message(self):
@@ -381,15 +399,55 @@ class ChatTest(TestCase):
         self.assertIsNone(chat.get_first_unviewed_message(self.user2))
 
         text_message1 = TextMessageFactory(author=self.user1)
-        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1, visualized=False)
-        image_message = ImageMessageFactory(author=self.user2)
-        chat_message2 = ChatMessageImageFactory(chat=chat, message=image_message, visualized=True)
+        chat_message1 = ChatMessageTextFactory(chat=chat, message=text_message1)
         text_message2 = TextMessageFactory(author=self.user1)
-        chat_message3 = ChatMessageTextFactory(chat=chat, message=text_message2, visualized=False)
+        chat_message2 = ChatMessageTextFactory(chat=chat, message=text_message2)
 
         self.assertIsNone(chat.get_first_unviewed_message(self.user1))
         self.assertEqual(chat.get_first_unviewed_message(self.user2), text_message1.id)
 
+        chat.update_messages_visualization(self.user2)
+        text_message3 = TextMessageFactory(author=self.user1)
+        chat_message3 = ChatMessageTextFactory(chat=chat, message=text_message3)
+
+        self.assertEqual(chat.get_first_unviewed_message(self.user2), text_message3.id)
+
+
+    def test_chat_model_new_message_method(self):
+        '''
+        Description:
+            Tests the new_message method of the Chat model.
+
+        Pre-conditions:
+            - The Chat model must be correctly defined.
+
+        Post-conditions:
+            - A text message must be created with the next sequence number of the chat.
+            - A message sent again with the same client_id must not be created again.
+            - An empty message, an invalid message type or an author out of the chat must raise a ValidationError.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        client_id = uuid.uuid4()
+
+        chat_message, created = chat.new_message(self.user1, 'T', text='Hello', client_id=client_id)
+        self.assertTrue(created)
+        self.assertEqual(chat_message.seq, 1)
+        self.assertEqual(chat_message.get_message().text, 'Hello')
+
+        same_chat_message, created = chat.new_message(self.user1, 'T', text='Hello', client_id=client_id)
+        self.assertFalse(created)
+        self.assertEqual(same_chat_message.pk, chat_message.pk)
+        self.assertEqual(ChatMessage.objects.filter(chat=chat).count(), 1)
+        self.assertEqual(TextMessage.objects.filter(author=self.user1).count(), 1)
+
+        with self.assertRaises(ValidationError):
+            chat.new_message(self.user1, 'T', text='   ')
+        with self.assertRaises(ValidationError):
+            chat.new_message(self.user1, 'X', text='Hello')
+        with self.assertRaises(ValidationError):
+            chat.new_message(self.user3, 'T', text='Hello')
+        self.assertEqual(ChatMessage.objects.filter(chat=chat).count(), 1)
 
 
 class ChatMessageTest(TestCase):
@@ -467,4 +525,151 @@ class ChatMessageTest(TestCase):
         text_message = TextMessageFactory(author=self.user1)
         chat_message = ChatMessageTextFactory(chat=chat, message=text_message)
         self.assertTrue(chat_message.is_author(self.user1))
-        self.assertFalse(chat_message.is_author(self.user2))
\ No newline at end of file
+        self.assertFalse(chat_message.is_author(self.user2))
+
+
+    def test_chatmessage_model_seq(self):
+        '''
+        Description:
+            Tests the sequence number of the ChatMessage model.
+
+        Pre-conditions:
+            - The ChatMessage model must be correctly defined.
+
+        Post-conditions:
+            - The chat messages must be numbered in the order they are created, per chat.
+            - The last message sequence of the chat must be the sequence of the last message.
+            - The watermark of the author must be moved to his message.
+        '''
+
+        chat1 = ChatFactory(user1=self.user1, user2=self.user2)
+        chat2 = ChatFactory(user1=self.user1, user2=self.user3)
+        chat_message1 = ChatMessageTextFactory(chat=chat1, message=TextMessageFactory(author=self.user1))
+        chat_message2 = ChatMessageTextFactory(chat=chat1, message=TextMessageFactory(author=self.user2))
+        chat_message3 = ChatMessageTextFactory(chat=chat2, message=TextMessageFactory(author=self.user3))
+
+        self.assertEqual([chat_message1.seq, chat_message2.seq, chat_message3.seq], [1, 2, 1])
+        chat1.refresh_from_db()
+        self.assertEqual(chat1.last_message_seq, 2)
+        self.assertEqual(chat1.user1_last_read_seq, 1)
+        self.assertEqual(chat1.user2_last_read_seq, 2)
+
+
+    def test_chatmessage_model_save_mark_as_read(self):
+        '''
+        Description:
+            Tests the save method of the ChatMessage model with mark_as_read=True.
+
+        Pre-conditions:
+            - The ChatMessage model must be correctly defined.
+
+        Post-conditions:
+            - The new message must be read by both users of the chat.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        ChatMessage(chat=chat, message=TextMessageFactory(author=self.user1)).save(mark_as_read=True)
+
+        chat.refresh_from_db()
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user1), 0)
+        self.assertEqual(chat.get_amount_of_unviewed_messages(self.user2), 0)
+
+
+    def test_chatmessage_model_unique_seq(self):
+        '''
+        Description:
+            Tests the unique sequence number per chat of the ChatMessage model.
+
+        Pre-conditions:
+            - The ChatMessage model must be correctly defined.
+
+        Post-conditions:
+            - Two messages of the same chat must not have the same sequence number.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        chat_message = ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user1))
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user1), seq=chat_message.seq)
+
+
+
+class SeedLoadCommandTest(TestCase):
+    def test_seed_load_command(self):
+        '''
+        Description:
+            Tests the seed_load management command.
+
+        Pre-conditions:
+            - The database has no users with the prefix of the command.
+
+        Post-conditions:
+            - The amounts of users, chats, text and image messages and friendship requests must be created.
+            - The sequence numbers and the read watermarks of the chats must be consistent with their messages.
+            - The chats must be between friends.
+            - The users must be able to log in.
+            - The command must print the amounts created.
+        '''
+
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'seed_load', users=20, friends=3, messages=500, image_ratio=0.1,
+                notifications=40, chunk_size=64, prefix='seedtest', seed=1, stdout=out,
+            )
+
+        self.assertEqual(User.objects.filter(username__startswith='seedtest').count(), 20)
+        self.assertEqual(Chat.objects.count(), 30)
+        self.assertEqual(ChatMessage.objects.count(), 500)
+        self.assertEqual(TextMessage.objects.count() + ImageMessage.objects.count(), 500)
+        self.assertGreater(ImageMessage.objects.count(), 0)
+        self.assertEqual(FriendshipRequest.objects.count(), 40)
+        # 30 symmetrical friendships, a row for each direction, each one with a chat
+        self.assertEqual(User.friends.through.objects.count(), 60)
+
+        for chat in Chat.objects.annotate(amount_of_messages=Count('chatmessage'), max_seq=Max('chatmessage__seq')):
+            self.assertEqual(chat.last_message_seq, chat.amount_of_messages)
+            self.assertEqual(chat.max_seq or 0, chat.amount_of_messages)
+            self.assertLessEqual(chat.user1_last_read_seq, chat.last_message_seq)
+            self.assertLessEqual(chat.user2_last_read_seq, chat.last_message_seq)
+            self.assertTrue(User.friends.through.objects.filter(from_user=chat.user1_id, to_user=chat.user2_id).exists())
+
+        self.assertTrue(self.client.login(username='seedtest0@example.com', password='Seed@123'))
+        self.assertIn('500 mensagens criadas', out.getvalue())
+
+
+
+class BenchmarkChatCommandTest(TestCase):
+    def test_benchmark_chat_command(self):
+        '''
+        Description:
+            Tests the benchmark_chat management command.
+
+        Pre-conditions:
+            - The database is seeded with the seed_load command.
+
+        Post-conditions:
+            - Each benchmark must be appended to the output file as a JSON line, with its queries, times and the size of the database.
+            - The messages created by the new_chat_message benchmark must be rolled back.
+        '''
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('seed_load', users=10, friends=2, messages=100, notifications=5, prefix='benchtest', seed=1, stdout=StringIO())
+            output = f'{media_root}/results.jsonl'
+            call_command('benchmark_chat', iterations=2, warmup=0, label='test', output=output, stdout=StringIO(), stderr=StringIO())
+            with open(output) as file:
+                results = {result['benchmark']: result for result in map(json.loads, file)}
+
+        self.assertEqual(set(results), {
+            'get_chat_dict', 'chat_get_messages', 'get_chat_messages_first_page', 'get_chat_messages_deep_page',
+            'chats', 'new_chat_message', 'user_has_unviewed_chat_messages',
+        })
+        for result in results.values():
+            self.assertEqual(result['label'], 'test')
+            self.assertEqual(result['iterations'], 2)
+            self.assertEqual(result['dataset']['messages'], 100)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+        self.assertEqual(ChatMessage.objects.count(), 100)
@@ -0,0 +1,117 @@
+from django.test import TestCase, RequestFactory, override_settings
+from django.http import HttpResponse
+
+from channels.testing import WebsocketCommunicator
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from .factories import UserFactory, ChatFactory
+from apps.chat.models import Chat
+from apps.query_inspector import QueryInspectorConsumerMixin, get_sql_fingerprint, install_query_inspector
+from telezap_django.middlewares.ObservabilityMiddleware import ObservabilityMiddleware
+
+
+def get_chat_users():
+    # N+1: a query per chat to get its first user
+    return [chat.user1.username for chat in Chat.objects.all()]
+
+
+
+class ChatUsersConsumer(QueryInspectorConsumerMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.channel_layer.group_add('query_inspector_test', self.channel_name)
+        await self.accept()
+
+    async def send_chat_users(self, event):
+        await self.send(text_data=','.join(await database_sync_to_async(get_chat_users)()))
+
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_SAMPLE_RATE=1, QUERY_INSPECTOR_REPEATED_QUERIES=3)
+class QueryInspectorTest(TestCase):
+    def setUp(self):
+        install_query_inspector()
+        for i in range(4):
+            ChatFactory(user1=UserFactory(username=f'inspector_user{i}'), user2=UserFactory(username=f'inspector_another_user{i}'))
+
+
+    def test_sql_fingerprint(self):
+        '''
+        Description:
+            This test verifies that the SQL statements that only differ by their values have the same fingerprint.
+
+        Pre-conditions:
+            - SQL statements with different values and amounts of values.
+
+        Post-conditions:
+            - The fingerprints must be equal, without the values.
+        '''
+
+        self.assertEqual(
+            get_sql_fingerprint("SELECT * FROM chat WHERE id IN (%s, %s) AND name = 'a' LIMIT 21"),
+            get_sql_fingerprint("SELECT  *  FROM chat WHERE id IN (%s) AND name = 'it''s' LIMIT 1"),
+        )
+        self.assertEqual(get_sql_fingerprint("SELECT * FROM chat WHERE id = %s LIMIT 21"), 'SELECT * FROM chat WHERE id = ? LIMIT ?')
+
+
+    def test_middleware_logs_repeated_and_slow_queries(self):
+        '''
+        Description:
+            This test verifies that the middleware logs the repeated (N+1) and slow queries of a sampled request.
+
+        Pre-conditions:
+            - A view that makes a query per chat.
+
+        Post-conditions:
+            - The repeated query must be logged once, with the amount of queries, the view and the code that made them.
+            - With the inspector disabled, nothing must be logged.
+        '''
+
+        def view(request):
+            return HttpResponse(','.join(get_chat_users()))
+
+        middleware = ObservabilityMiddleware(view)
+        with self.assertLogs('apps.query_inspector', level='WARNING') as logs:
+            middleware(RequestFactory().get('/chats/'))
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('N+1 in /chats/: 4 identical queries', logs.output[0])
+        self.assertIn('in get_chat_users', logs.output[0])
+
+        with override_settings(QUERY_INSPECTOR_SLOW_QUERY=0), self.assertLogs('apps.query_inspector', level='WARNING') as logs:
+            middleware(RequestFactory().get('/chats/'))
+        self.assertEqual(sum('Slow query in /chats/' in output for output in logs.output), 5)
+
+        with override_settings(QUERY_INSPECTOR_ENABLED=False), self.assertNoLogs('apps.query_inspector'):
+            middleware(RequestFactory().get('/chats/'))
+
+
+    def test_consumer_logs_repeated_queries(self):
+        '''
+        Description:
+            This test verifies that the repeated (N+1) queries of a sampled consumer event are logged with the consumer handler.
+
+        Pre-conditions:
+            - A user connected to a consumer whose handler makes a query per chat.
+
+        Post-conditions:
+            - The repeated query must be logged with the consumer handler and the code that made them.
+        '''
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(ChatUsersConsumer.as_asgi(), '/ws/test/')
+            await communicator.connect()
+            await get_channel_layer().group_send('query_inspector_test', {'type': 'send_chat_users'})
+            text = await communicator.receive_from()
+            await communicator.disconnect()
+            return text
+
+        with self.assertLogs('apps.query_inspector', level='WARNING') as logs:
+            text = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(text, 'inspector_user0,inspector_user1,inspector_user2,inspector_user3')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('N+1 in ChatUsersConsumer.send_chat_users: 4 identical queries', logs.output[0])
+        self.assertIn('in get_chat_users', logs.output[0])
@@ -0,0 +1,172 @@
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.core.cache.backends.redis import RedisCache
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import uuid
+
+from .factories import UserFactory, ChatFactory, ChatMessage
+from apps.chat import ratelimit
+from apps.chat.ratelimit import check_message_rate_limit
+
+
+RATE_LIMITS = {
+    'user': {'rate': 1, 'capacity': 3},
+    'chat': {'rate': 1, 'capacity': 2},
+}
+
+
+@override_settings(CHAT_MESSAGES_RATE_LIMITS=RATE_LIMITS)
+class MessageRateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_buckets.clear()
+        self.password = 'User1@123'
+        self.user1 = UserFactory(username='user1', password=self.password)
+        self.user2 = UserFactory(username='user2', password='User2@123')
+        self.user3 = UserFactory(username='user3', password='User3@123')
+        self.chat1 = ChatFactory(user1=self.user1, user2=self.user2)
+        self.chat2 = ChatFactory(user1=self.user1, user2=self.user3)
+
+
+    def test_token_bucket_per_chat_and_per_user(self):
+        '''
+        Description:
+            This test verifies that the messages of a user are limited per chat and in all his chats.
+
+        Pre-conditions:
+            - A user with two chats, with a capacity of 2 messages per chat and 3 messages in all the chats.
+
+        Post-conditions:
+            - The third message in the same chat must be limited, with the seconds to wait.
+            - The fourth message in all the chats must be limited, even in another chat.
+            - The buckets must be refilled with the time.
+        '''
+
+        with mock.patch('apps.chat.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat1.id), 0)
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat1.id), 0)
+            self.assertAlmostEqual(check_message_rate_limit(self.user1.id, self.chat1.id), 1)
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat2.id), 0)
+            self.assertAlmostEqual(check_message_rate_limit(self.user1.id, self.chat2.id), 1)
+
+        with mock.patch('apps.chat.ratelimit.time.time', return_value=1001.0):
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat2.id), 0)
+
+
+    def test_local_fallback_when_cache_is_unavailable(self):
+        '''
+        Description:
+            This test verifies that the rate limit uses the local buckets if the shared cache is unavailable.
+
+        Pre-conditions:
+            - The shared cache raises an error.
+
+        Post-conditions:
+            - The messages must be limited by the local buckets.
+        '''
+
+        with mock.patch('apps.chat.ratelimit.cache.get_many', side_effect=ConnectionError):
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat1.id), 0)
+            self.assertEqual(check_message_rate_limit(self.user1.id, self.chat1.id), 0)
+            self.assertGreater(check_message_rate_limit(self.user1.id, self.chat1.id), 0)
+
+
+    def test_tokens_taken_atomically(self):
+        '''
+        Description:
+            This test verifies that concurrent messages of a user can not take the same token, without being limited by each other.
+
+        Pre-conditions:
+            - A user sends 10 messages to a chat at the same time, from different threads, with a capacity of 2 messages per chat.
+
+        Post-conditions:
+            - Exactly 2 messages must take a token, the another ones must be limited with the seconds until the bucket is refilled.
+        '''
+
+        with mock.patch('apps.chat.ratelimit.time.time', return_value=1000.0), ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda _: check_message_rate_limit(self.user1.id, self.chat1.id), range(10)))
+
+        self.assertEqual(results.count(0), 2)
+        self.assertTrue(all(result == 0 or result >= 1 for result in results))
+
+
+    def test_redis_script(self):
+        '''
+        Description:
+            This test verifies that the tokens are taken by a script of redis when the shared cache is redis.
+
+        Pre-conditions:
+            - The shared cache is redis, its script takes the tokens.
+
+        Post-conditions:
+            - The script must be run once with the keys of the buckets, the time and the rate and capacity of each bucket.
+            - The result of the script must be returned as the seconds to wait.
+        '''
+
+        redis_cache = mock.Mock(spec=RedisCache)
+        redis_cache.make_and_validate_key.side_effect = lambda key: f':1:{key}'
+        client = redis_cache._cache.get_client.return_value
+        client.eval.return_value = b'0.5'
+        with mock.patch('apps.chat.ratelimit.caches', {'default': redis_cache}), mock.patch('apps.chat.ratelimit.cache', redis_cache), \
+             mock.patch('apps.chat.ratelimit.time.time', return_value=1000.0):
+            retry_after = check_message_rate_limit(self.user1.id, self.chat1.id)
+
+        self.assertEqual(retry_after, 0.5)
+        client.eval.assert_called_once_with(
+            ratelimit.TAKE_TOKEN_SCRIPT, 2,
+            f':1:chat_rate_limit_{self.user1.id}', f':1:chat_rate_limit_{self.user1.id}_{self.chat1.id}',
+            1000.0, 1, 3, 1, 2,
+        )
+
+
+    def test_new_chat_message_view_rate_limited(self):
+        '''
+        Description:
+            This test verifies that the new_chat_message view refuses the messages over the rate limit.
+
+        Pre-conditions:
+            - A logged in user sends more messages to a chat than the capacity of the chat bucket.
+
+        Post-conditions:
+            - The messages over the limit must return status code 429 with the Retry-After header.
+            - The messages over the limit must not be created.
+        '''
+
+        self.client.login(username=self.user1.email, password=self.password)
+        url = reverse('chat:new_chat_message', kwargs={'id': self.chat1.id})
+        for _ in range(2):
+            response = self.client.post(url, data={'message_type': 'T', 'text': 'Hello'})
+            self.assertEqual(response.status_code, 204)
+
+        response = self.client.post(url, data={'message_type': 'T', 'text': 'Hello'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat1).count(), 2)
+
+
+    def test_new_chat_message_view_resend_not_rate_limited(self):
+        '''
+        Description:
+            This test verifies that a message resent with the client id of a stored message does not take a token of the rate limit.
+
+        Pre-conditions:
+            - A logged in user sends as many messages to a chat as the capacity of the chat bucket.
+            - The user resends the first message, with the same client id.
+
+        Post-conditions:
+            - The resent message must return status code 204 and must not be created again.
+        '''
+
+        self.client.login(username=self.user1.email, password=self.password)
+        url = reverse('chat:new_chat_message', kwargs={'id': self.chat1.id})
+        client_ids = [str(uuid.uuid4()) for _ in range(2)]
+        for client_id in client_ids:
+            response = self.client.post(url, data={'message_type': 'T', 'text': 'Hello', 'client_id': client_id})
+            self.assertEqual(response.status_code, 204)
+
+        response = self.client.post(url, data={'message_type': 'T', 'text': 'Hello', 'client_id': client_ids[0]})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat1).count(), 2)
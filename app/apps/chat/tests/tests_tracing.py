@@ -0,0 +1,132 @@
+from django.test import TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync, sync_to_async
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json, os, tempfile, threading
+
+from .factories import UserFactory, ChatFactory
+from apps.chat.consumers import ChatsConsumer
+from apps.tracing import install_tracing, flush_spans, start_span
+
+
+def read_spans(path):
+    flush_spans()
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+
+class TracingTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='tracing_user1', password='User1@123')
+        self.user2 = UserFactory(username='tracing_user2', password='User2@123')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+
+        descriptor, self.traces_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.traces_file)
+
+
+    def test_message_traced_from_request_to_consumer(self):
+        '''
+        Description:
+            This test verifies that a message sent through the new_chat_message view is traced until the consumer of the another user handles it.
+
+        Pre-conditions:
+            - The tracing is enabled, exporting the spans to a file.
+            - The another user is connected to the chat list websocket.
+            - User is logged in and sends a message.
+
+        Post-conditions:
+            - The request, its database queries, the render of the message, the group_sends and the handler of the consumer must be in the same trace.
+            - The span of the handler must be a child of the span of the group_send that sent its message, with the delivery latency.
+            - The trace context must not be sent to the client.
+        '''
+
+        with override_settings(TRACING_ENABLED=True, TRACING_EXPORTER='file', TRACING_FILE=self.traces_file):
+            install_tracing()
+            self.client.login(username=self.user1.email, password='User1@123')
+
+            async def connect_send_and_receive():
+                communicator = WebsocketCommunicator(ChatsConsumer.as_asgi(), '/ws/chats/')
+                communicator.scope['user'] = self.user2
+                await communicator.connect()
+                response = await sync_to_async(self.client.post)(
+                    reverse('chat:new_chat_message', kwargs={'id': self.chat.id}),
+                    data={'message_type': 'T', 'text': 'Olá'},
+                )
+                message = await communicator.receive_json_from()
+                await communicator.disconnect()
+                return response, message
+
+            response, message = async_to_sync(connect_send_and_receive)()
+            spans = read_spans(self.traces_file)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn('trace_context', message)
+
+        request_span = next(span for span in spans if span['name'] == 'POST chat:new_chat_message')
+        self.assertIsNone(request_span['parent_id'])
+        self.assertEqual(request_span['attributes']['http.status_code'], 204)
+        trace = [span for span in spans if span['trace_id'] == request_span['trace_id']]
+        names = {span['name'] for span in trace}
+        self.assertIn('db.query', names)
+        self.assertIn('render', names)
+        self.assertIn('channel_layer.group_send', names)
+
+        handler_span = next(span for span in trace if span['name'] == 'ChatsConsumer.send_message_create')
+        group_send_span = next(span for span in trace if span['span_id'] == handler_span['parent_id'])
+        self.assertEqual(group_send_span['name'], 'channel_layer.group_send')
+        self.assertEqual(group_send_span['attributes']['messaging.destination'], f"user_{self.user2.id}_messages")
+        self.assertGreaterEqual(handler_span['attributes']['messaging.delivery_latency_ms'], 0)
+
+
+    def test_spans_exported_to_otlp_collector(self):
+        '''
+        Description:
+            This test verifies that the spans are exported to an OTLP/HTTP collector.
+
+        Pre-conditions:
+            - The tracing is enabled, exporting the spans to a local collector.
+
+        Post-conditions:
+            - The collector must receive the spans in the OTLP JSON format, with the parent of the child span.
+        '''
+
+        payloads = []
+
+        class CollectorHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payloads.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        collector = HTTPServer(('127.0.0.1', 0), CollectorHandler)
+        threading.Thread(target=collector.serve_forever, daemon=True).start()
+        self.addCleanup(collector.server_close)
+        self.addCleanup(collector.shutdown)
+
+        endpoint = f"http://127.0.0.1:{collector.server_port}/v1/traces"
+        with override_settings(TRACING_ENABLED=True, TRACING_EXPORTER='otlp', TRACING_OTLP_ENDPOINT=endpoint):
+            with start_span('parent') as parent:
+                with start_span('child', attributes={'key': 'value'}):
+                    pass
+            flush_spans()
+
+        spans = {
+            span['name']: span
+            for payload in payloads
+            for span in payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+        }
+        self.assertEqual(spans['child']['traceId'], parent.trace_id)
+        self.assertEqual(spans['child']['parentSpanId'], parent.span_id)
+        self.assertEqual(spans['child']['attributes'], [{'key': 'key', 'value': {'stringValue': 'value'}}])
+        self.assertEqual(spans['parent']['parentSpanId'], '')
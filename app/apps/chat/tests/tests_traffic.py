@@ -0,0 +1,203 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync, sync_to_async
+
+from io import StringIO
+import json, os, tempfile, time, uuid
+
+from .factories import UserFactory, ChatFactory
+from apps.chat.models import ChatMessage
+from apps.chat.routing import websocket_urlpatterns
+from apps.traffic import CLIENT_ID_MARKER, anonymize, anonymize_frame, flush_traffic_recording
+
+
+def read_events(path):
+    flush_traffic_recording()
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+
+class TrafficRecordingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='traffic_user1', password='User1@123')
+        self.user2 = UserFactory(username='traffic_user2', password='User2@123')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+
+        descriptor, self.traffic_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.traffic_file)
+
+
+    def test_traffic_recorded_anonymized(self):
+        '''
+        Description:
+            This test verifies that the HTTP requests and the websocket frames of a user are recorded without the ids, emails and texts of the users.
+
+        Pre-conditions:
+            - The recording is enabled, to a file.
+            - User is logged in, gets the messages of a chat and sends a message through the new_chat_message view and through the chat websocket.
+
+        Post-conditions:
+            - The requests and the websocket events must be recorded in order, with the same tokens for the user and the chat.
+            - The ids of the chat, the emails and the texts must not be in the recording, the client ids must be replaced by a marker.
+        '''
+
+        with override_settings(TRAFFIC_RECORDING_ENABLED=True, TRAFFIC_RECORDING_FILE=self.traffic_file):
+            self.client.login(username=self.user1.email, password='User1@123')
+            self.client.get(reverse('chat:get_chat_messages', kwargs={'id': self.chat.id}), data={'page': 1})
+            self.client.post(
+                reverse('chat:new_chat_message', kwargs={'id': self.chat.id}),
+                data={'message_type': 'T', 'text': 'Segredo', 'client_id': str(uuid.uuid4())},
+            )
+
+            async def connect_and_send():
+                communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.chat.id}/')
+                communicator.scope['user'] = self.user1
+                await communicator.connect()
+                await communicator.send_json_to({'type': 'send_message', 'message_type': 'T', 'text': 'Segredo', 'client_id': str(uuid.uuid4())})
+                await communicator.receive_json_from()
+                await communicator.disconnect()
+
+            async_to_sync(connect_and_send)()
+            events = read_events(self.traffic_file)
+
+        with open(self.traffic_file) as file:
+            recording = file.read()
+        for value in (str(self.chat.id), self.user1.email, self.user1.slug, 'Segredo'):
+            self.assertNotIn(value, recording)
+
+        self.assertEqual(
+            [event.get('view', event['kind']) for event in events],
+            ['chat:get_chat_messages', 'chat:new_chat_message', 'websocket.connect', 'websocket.receive', 'websocket.disconnect'],
+        )
+        chat_token = '{' + anonymize('chat', self.chat.id) + '}'
+        user_token = anonymize('actor', self.user1.id)
+        self.assertEqual(events[0]['path'], f'/chat/{chat_token}/messages/')
+        self.assertEqual(events[0]['query'], {'page': ['1']})
+        self.assertEqual(events[1]['data'], {'message_type': ['T'], 'text': ['xxxxxxx'], 'client_id': [CLIENT_ID_MARKER]})
+        self.assertEqual(events[1]['status'], 204)
+        self.assertEqual(events[2]['path'], f'/ws/chat/{chat_token}/')
+        self.assertEqual({events[0]['user'], events[1]['user'], events[2]['user']}, {user_token})
+        self.assertEqual(events[3]['frame'], {'type': 'send_message', 'message_type': 'T', 'text': 'xxxxxxx', 'client_id': CLIENT_ID_MARKER})
+        self.assertEqual(events[3]['connection'], events[2]['connection'])
+
+
+    def test_traffic_not_recorded_when_disabled(self):
+        '''
+        Description:
+            This test verifies that the requests are not recorded when the recording is disabled.
+
+        Pre-conditions:
+            - The recording is disabled.
+            - User is logged in and gets the messages of a chat.
+
+        Post-conditions:
+            - The recording must be empty.
+        '''
+
+        with override_settings(TRAFFIC_RECORDING_ENABLED=False, TRAFFIC_RECORDING_FILE=self.traffic_file):
+            self.client.login(username=self.user1.email, password='User1@123')
+            self.client.get(reverse('chat:get_chat_messages', kwargs={'id': self.chat.id}), data={'page': 1})
+            flush_traffic_recording()
+
+        self.assertEqual(os.path.getsize(self.traffic_file), 0)
+
+
+    def test_frame_numbers_dropped(self):
+        '''
+        Description:
+            This test verifies that the numbers of a websocket frame (e.g. the ids of the entities) are not recorded, but the safe parameters.
+
+        Pre-conditions:
+            - A frame with the id of a user and of a message (numbers), a list of ids, a page (safe parameter) and a boolean.
+
+        Post-conditions:
+            - The ids must be dropped, the page and the boolean must be kept and the strings must be masked.
+        '''
+
+        frame = anonymize_frame({
+            'type': 'read', 'user_id': self.user1.id, 'message': {'id': 123456, 'text': 'Segredo'},
+            'members': [self.user1.id, self.user2.id], 'page': 2, 'seen': True,
+        })
+
+        self.assertEqual(frame, {'type': 'read', 'message': {'text': 'xxxxxxx'}, 'members': [], 'page': 2, 'seen': True})
+        self.assertIsNone(anonymize_frame(self.user1.id))
+
+
+
+class ReplayTrafficCommandTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='replay_user1', slug='replay_user1')
+        self.user2 = UserFactory(username='replay_user2', slug='replay_user2')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+
+        descriptor, self.traffic_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.traffic_file)
+        descriptor, self.results_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.results_file)
+
+
+    def test_replay_traffic(self):
+        '''
+        Description:
+            This test verifies that a recording of another database is replayed against the application, with its entities mapped to the local ones.
+
+        Pre-conditions:
+            - A recording of a user that gets the messages of a chat, sends a message through the new_chat_message view and another through the chat websocket,
+              and of a request with a notification that does not exist locally.
+            - The local users have the prefix of the replay.
+            - The events are replayed twice as fast (the in-memory test database does not support concurrent writes).
+
+        Post-conditions:
+            - The requests and the frames must be replayed in the chat of the local users, creating the 2 messages.
+            - The request with the notification must be skipped.
+            - The results must be printed and appended to the output file, without errors.
+        '''
+
+        chat_token = '{' + anonymize('chat', uuid.uuid4()) + '}'
+        user = anonymize('actor', 1000)
+        now = time.time()
+        events = [
+            {'time': now, 'kind': 'http', 'user': user, 'method': 'GET', 'view': 'chat:get_chat_messages', 'path': f'/chat/{chat_token}/messages/',
+             'query': {'page': ['1']}, 'data': {}, 'status': 200, 'duration': 0.01},
+            {'time': now + 0.5, 'kind': 'http', 'user': user, 'method': 'POST', 'view': 'chat:new_chat_message', 'path': f'/chat/{chat_token}/message/',
+             'query': {}, 'data': {'message_type': ['T'], 'text': ['xxxxx'], 'client_id': [CLIENT_ID_MARKER]}, 'status': 204, 'duration': 0.01},
+            {'time': now + 1, 'kind': 'http', 'user': user, 'method': 'POST', 'view': 'notification:reply', 'path': '/notificacoes/reply/',
+             'query': {}, 'data': {'notification_id': ['{' + anonymize('notification', 1) + '}'], 'reply': ['A']}, 'status': 200, 'duration': 0.01},
+            {'time': now + 1.5, 'kind': 'websocket.connect', 'connection': 'a1', 'user': user, 'path': f'/ws/chat/{chat_token}/'},
+            {'time': now + 2, 'kind': 'websocket.receive', 'connection': 'a1',
+             'frame': {'type': 'send_message', 'message_type': 'T', 'text': 'xxxxx', 'client_id': CLIENT_ID_MARKER}},
+            {'time': now + 2.5, 'kind': 'websocket.disconnect', 'connection': 'a1'},
+        ]
+        with open(self.traffic_file, 'w') as file:
+            file.writelines(json.dumps(event) + '\n' for event in events)
+
+        with override_settings(CHAT_MESSAGES_RATE_LIMITS={scope: {'rate': 100, 'capacity': 100} for scope in ('user', 'chat')}):
+            stdout = StringIO()
+            call_command(
+                'replay_traffic', self.traffic_file, speed=2, users_prefix='replay_', host='testserver',
+                output=self.results_file, stdout=stdout,
+            )
+
+        self.assertIn('Eventos: 6 | reproduzidos: 5 | ignorados: 1', stdout.getvalue())
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat).count(), 2)
+        with open(self.results_file) as file:
+            results = {(result['kind'], result['name']): result for result in map(json.loads, file)}
+        self.assertEqual(set(results), {
+            ('http', 'chat:get_chat_messages'),
+            ('http', 'chat:new_chat_message'),
+            ('websocket.connect', '/ws/chat/{chat}/'),
+            ('websocket.receive', '/ws/chat/{chat}/'),
+        })
+        self.assertEqual(sum(result['errors'] for result in results.values()), 0)
+        self.assertEqual(results[('websocket.receive', '/ws/chat/{chat}/')]['events'], 1)
@@ -1,11 +1,16 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.messages import get_messages
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from django.contrib.auth import get_user_model
 
 from apps.user.signals import user_logged_out_callback, user_logged_in_callback
+from apps.chat import views
 from .factories import (
     UserFactory, 
     TextMessageFactory, 
@@ -18,8 +23,13 @@ from .factories import (
     ChatMessage,
     Chat
 )
+from apps.group_chat.tests.factories import GroupChatFactory, GroupChatMemberFactory, GroupChatMessage
 from factory.django import ImageField
-import json
+from asgiref.sync import async_to_sync
+from apps.utils import aget_chat_dicts
+import json, asyncio, uuid
+
+User = get_user_model()
 
 
 # Desabilita os signals de login e logout para que os testes não sejam afetados
@@ -218,6 +228,48 @@ class ChatsViewTests(TestCase):
         self.client.logout()
 
 
+    def test_get_chat_list_updates_view(self):
+        '''
+        Description:
+            This test verifies that the chat list updates view returns only the chats that changed since the state of the client
+
+        Pre-conditions:
+            - User is logged in
+            - User has a chat known by the client with its last message, a chat known by the client before its last message and a new chat
+
+        Post-conditions:
+            - The ids of all the visible chats must be returned
+            - Only the chat with a new message and the new chat must be returned, with their templates
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        known_chat = ChatFactory(user1=self.user1, user2=self.user2)
+        ChatMessageTextFactory(chat=known_chat, message=TextMessageFactory(author=self.user2))
+        changed_chat = ChatFactory(user1=self.user3, user2=self.user1)
+        ChatMessageTextFactory(chat=changed_chat, message=TextMessageFactory(author=self.user3))
+        ChatMessageTextFactory(chat=changed_chat, message=TextMessageFactory(author=self.user3, text='Nova mensagem'))
+        user4 = UserFactory(username='test_user4', photo=ImageField())
+        self.addCleanup(user4.photo.delete)
+        new_chat = ChatFactory(user1=self.user1, user2=user4)
+        known_chat.refresh_from_db()
+
+        response = self.client.get(reverse('chat:get_chat_list_updates'), data={
+            'chat': [f'{known_chat.id}:{known_chat.last_message_seq}', f'{changed_chat.id}:1', 'invalid'],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(set(data['chat_ids']), {str(known_chat.id), str(changed_chat.id), str(new_chat.id)})
+        chats = {chat['chat_id']: chat for chat in data['chats']}
+        self.assertEqual(set(chats), {str(changed_chat.id), str(new_chat.id)})
+        self.assertEqual(chats[str(changed_chat.id)]['last_message_seq'], 2)
+        self.assertIn('Nova mensagem', chats[str(changed_chat.id)]['template'])
+        self.assertIn(f'id="chat-{new_chat.id}"', chats[str(new_chat.id)]['template'])
+
+        self.client.logout()
+
+
 
 class ChatViewTest(TestCase):
     def setUp(self):
@@ -347,7 +399,7 @@ class ChatViewTest(TestCase):
 
 
 
-def create_chat_messages(chat, user, num_messages, message_factory, chat_message_factory, visualized=False):
+def create_chat_messages(chat, user, num_messages, message_factory, chat_message_factory, read=False):
     '''
     Function to create chat messages for testing
 
@@ -357,7 +409,7 @@ def create_chat_messages(chat, user, num_messages, message_factory, chat_message
         num_messages: number of messages to create
         message_factory: factory to create the message
         chat_message_factory: factory to create the chat message
-        visualized: if the message is visualized or not
+        read: if the messages are read by the another user of the chat or not
 
     Returns:
         chat_messages: list of ChatMessage objects
@@ -367,9 +419,12 @@ def create_chat_messages(chat, user, num_messages, message_factory, chat_message
 
     for _ in range(num_messages):
         message = message_factory(author=user)
-        chat_message = chat_message_factory(chat=chat, message=message, visualized=visualized)
+        chat_message = chat_message_factory(chat=chat, message=message)
         chat_messages.append(chat_message)
 
+    if read:
+        chat.update_messages_visualization(chat.get_another_user(user))
+
     return chat_messages
 
 class GetChatMessagesViewTest(TestCase):
@@ -425,7 +480,7 @@ class GetChatMessagesViewTest(TestCase):
 
         data = json.loads(response.content)
         self.assertEquals(response.status_code, 200)
-        self.assertEqual(data, {"message_list":None, "has_next":False})
+        self.assertEqual(data, {"message_list":None, "has_next":False, "last_message_seq":0})
 
         self.client.logout()
 
@@ -534,7 +589,7 @@ class GetChatMessagesViewTest(TestCase):
             total_messages, 
             TextMessageFactory, 
             ChatMessageTextFactory,
-            visualized=True
+            read=True
         )
         # Reverse the list to get the most recent messages first
         chat_messages.reverse()
@@ -549,8 +604,9 @@ class GetChatMessagesViewTest(TestCase):
             self.assertIn(chat_messages[i].message.text, data['message_list'][i]['template'])
         self.assertEqual(data['has_next'], True)
 
-        # Second page
-        response = self.client.get(reverse('chat:get_chat_messages', kwargs={'id': chat.id}) + f'?page={2}')
+        # Second page, the messages before the oldest message of the first page
+        oldest_seq = data['message_list'][-1]['seq']
+        response = self.client.get(reverse('chat:get_chat_messages', kwargs={'id': chat.id}) + f'?before={oldest_seq}')
         data = json.loads(response.content)
 
         self.assertEquals(response.status_code, 200)
@@ -605,6 +661,70 @@ class GetChatMessagesViewTest(TestCase):
 
 
 
+    def test_get_chat_messages_view_with_seq_cursors(self):
+        '''
+        Description:
+            This test verifies that the get_chat_messages view works correctly with the before/after sequence number cursors
+
+        Pre-conditions:
+            - User is logged in
+            - User has a chat with more messages than the pagination limit
+
+        Post-conditions:
+            - The before cursor must return the previous messages (newest first) and has_next=True if there are older messages
+            - The after cursor must return the next messages (newest first) and has_next=True if there are newer messages
+            - Each message must have its sequence number
+            - The response must have the sequence number of the last message of the chat
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        total_messages = settings.MESSAGES_PAGINATION * 2 + 5
+        create_chat_messages(chat, self.user2, total_messages, TextMessageFactory, ChatMessageTextFactory)
+        url = reverse('chat:get_chat_messages', kwargs={'id': chat.id})
+
+        response = self.client.get(url + f'?before={total_messages + 1}')
+        data = json.loads(response.content)
+        self.assertEquals(response.status_code, 200)
+        self.assertEqual(
+            [message['seq'] for message in data['message_list']],
+            list(range(total_messages, total_messages - settings.MESSAGES_PAGINATION, -1))
+        )
+        self.assertEqual(data['has_next'], True)
+        self.assertEqual(data['last_message_seq'], total_messages)
+
+        response = self.client.get(url + f'?before={settings.MESSAGES_PAGINATION}')
+        data = json.loads(response.content)
+        self.assertEqual(
+            [message['seq'] for message in data['message_list']],
+            list(range(settings.MESSAGES_PAGINATION - 1, 0, -1))
+        )
+        self.assertEqual(data['has_next'], False)
+
+        response = self.client.get(url + '?after=0')
+        data = json.loads(response.content)
+        self.assertEqual(
+            [message['seq'] for message in data['message_list']],
+            list(range(settings.MESSAGES_PAGINATION, 0, -1))
+        )
+        self.assertEqual(data['has_next'], True)
+
+        response = self.client.get(url + f'?after={total_messages - 3}')
+        data = json.loads(response.content)
+        self.assertEqual(
+            [message['seq'] for message in data['message_list']],
+            [total_messages, total_messages - 1, total_messages - 2]
+        )
+        self.assertEqual(data['has_next'], False)
+
+        response = self.client.get(url + '?after=abc')
+        data = json.loads(response.content)
+        self.assertIsNone(data['message_list'])
+
+        self.client.logout()
+
+
 class NewChatMessageViewTest(TestCase):
     def setUp(self):
         self.user_data = {
@@ -671,6 +791,34 @@ class NewChatMessageViewTest(TestCase):
         self.client.logout()
 
 
+    def test_new_chat_message_view_another_user_connected(self):
+        '''
+        Description:
+            This test verifies that a message sent to a chat the another user is connected in is read by him too
+
+        Pre-conditions:
+            - User is logged in and has a chat
+            - The another user is connected in the chat (set by the ChatConsumer in the database), but not in the channel layer of this process
+
+        Post-conditions:
+            - Return response with status code 204
+            - The watermark of the another user must be moved to the new message
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        User.objects.filter(id=self.user2.id).update(in_chat=f'{uuid.uuid4()}|{chat.id}')
+
+        response = self.client.post(
+            reverse('chat:new_chat_message', kwargs={'id': chat.id}),
+            data={'message_type': 'T', 'text': 'Testing message'},
+        )
+
+        self.assertEqual(response.status_code, 204)
+        chat.refresh_from_db()
+        self.assertEqual(chat.get_last_read_seq(self.user2), chat.last_message_seq)
+
+
     def test_new_chat_message_view_not_logged_in(self):
         '''
         Description:
@@ -773,7 +921,7 @@ class NewChatMessageViewTest(TestCase):
         Post-conditions:
             - Return response with status code 400
             - The chat has no new messages
-            - The chat view contains the message 'Tipo de mensagem inválido.'
+            - The response contains the error 'Tipo de mensagem inválido.'
         '''
 
         self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
@@ -786,9 +934,212 @@ class NewChatMessageViewTest(TestCase):
             follow=True
         )
 
-        self.assertRedirects(response, reverse('chat:chat', kwargs={'id': chat.id}))
-        messages = [msg.message for msg in get_messages(response.wsgi_request)]
-        self.assertIn('Tipo de mensagem inválido.', messages)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Tipo de mensagem inválido.'})
         self.assertEquals(ChatMessage.objects.filter(chat=chat).count(), 0)
 
         self.client.logout()
+
+
+
+class AsyncChatViewsTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory(username='async_user1', photo=ImageField())
+        self.user2 = UserFactory(username='async_user2', photo=ImageField())
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+        create_chat_messages(self.chat, self.user2, 3, TextMessageFactory, ChatMessageTextFactory)
+        self.async_client.force_login(self.user1)
+
+    def tearDown(self):
+        self.user1.photo.delete()
+        self.user2.photo.delete()
+
+
+    async def test_chat_views_with_async_client(self):
+        '''
+        Description:
+            This test verifies that the chat views are async and work with an async client (as under ASGI)
+
+        Pre-conditions:
+            - User is logged in
+            - User has a chat with messages
+
+        Post-conditions:
+            - The chats, chat, get_chat_messages and new_chat_message views must be coroutine functions
+            - The views must answer the async requests without running the ORM in the event loop
+        '''
+
+        for view in (views.chats, views.chat, views.get_chat_messages, views.new_chat_message):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+
+        response = await self.async_client.get(reverse('chat:chats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['chats']), 1)
+        self.assertEqual(response.context['chats'][0]['amount_of_unviewed_messages'], 3)
+
+        response = await self.async_client.get(reverse('chat:chat', kwargs={'id': self.chat.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['another_user'], self.user2)
+
+        response = await self.async_client.get(reverse('chat:get_chat_messages', kwargs={'id': self.chat.id}))
+        data = json.loads(response.content)
+        self.assertEqual([message['seq'] for message in data['message_list']], [3, 2, 1])
+
+        response = await self.async_client.post(
+            reverse('chat:new_chat_message', kwargs={'id': self.chat.id}),
+            data={'message_type': 'T', 'text': 'Olá'}
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(await ChatMessage.objects.filter(chat=self.chat).acount(), 4)
+
+
+    def test_chat_dicts_queries(self):
+        '''
+        Description:
+            This test verifies that the chat dicts of the chat list are got with a fixed amount of queries
+
+        Pre-conditions:
+            - User has a chat with messages, a chat without messages and a chat removed by him before some of its messages
+
+        Post-conditions:
+            - The chat dicts must be got with 2 queries (the chats and the last text messages)
+            - The amount of messages and the last message must only count the messages after the exit chat date of the user
+        '''
+
+        user3 = UserFactory(username='async_user3')
+        user4 = UserFactory(username='async_user4')
+        empty_chat = ChatFactory(user1=self.user1, user2=user3)
+        removed_chat = ChatFactory(user1=user4, user2=self.user1)
+        create_chat_messages(removed_chat, user4, 2, TextMessageFactory, ChatMessageTextFactory)
+        Chat.objects.filter(pk=removed_chat.pk).update(user2_exit_chat_date=timezone.now())
+        last_message = TextMessageFactory(author=user4, text='Depois da remoção')
+        ChatMessageTextFactory(chat=removed_chat, message=last_message)
+
+        chats = Chat.objects.filter(pk__in=[self.chat.pk, empty_chat.pk, removed_chat.pk]).select_related('user1', 'user2')
+        with CaptureQueriesContext(connection) as queries:
+            chat_dicts = {chat_dict['chat'].pk: chat_dict for chat_dict in async_to_sync(aget_chat_dicts)(chats, self.user1)}
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(chat_dicts[self.chat.pk]['amount_of_messages'], 3)
+        self.assertEqual(chat_dicts[self.chat.pk]['last_message'].author, self.user2)
+        self.assertEqual(chat_dicts[empty_chat.pk]['amount_of_messages'], 0)
+        self.assertIsNone(chat_dicts[empty_chat.pk]['last_message'])
+        self.assertEqual(chat_dicts[removed_chat.pk]['amount_of_messages'], 1)
+        self.assertEqual(chat_dicts[removed_chat.pk]['last_message'], last_message)
+        self.assertEqual(chat_dicts[removed_chat.pk]['last_message_date'], last_message.date)
+
+
+
+
+class MediaViewTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory(username='media_user1', password='User1@123')
+        self.user2 = UserFactory(username='media_user2', password='User2@123')
+        self.user3 = UserFactory(username='media_user3', password='User3@123')
+        self.chat = ChatFactory(user1=self.user1, user2=self.user2)
+        self.image_message = ImageMessageFactory(author=self.user1)
+        ChatMessageImageFactory(chat=self.chat, message=self.image_message)
+        self.url = reverse('media', kwargs={'path': self.image_message.image.name})
+
+    def tearDown(self):
+        # delete the image file after the test
+        self.image_message.image.delete()
+
+
+    def test_media_view_chat_participant(self):
+        '''
+        Description:
+            This test verifies that the participants of a chat can get its images, transferred by nginx with X-Accel-Redirect.
+
+        Pre-conditions:
+            - The media files are transferred by nginx.
+            - User is logged in and participates in the chat of the image.
+
+        Post-conditions:
+            - The response must be empty, with the X-Accel-Redirect header to the internal location of the image and its content type.
+            - The response must only be cached by the browser of the user.
+        '''
+
+        self.client.login(username=self.user2.email, password='User2@123')
+        with override_settings(MEDIA_ACCEL_REDIRECT=True):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.image_message.image.name}')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.MEDIA_CACHE_MAX_AGE}', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+
+    def test_media_view_served_by_django(self):
+        '''
+        Description:
+            This test verifies that the images are served by Django when nginx does not transfer the media files (development).
+
+        Pre-conditions:
+            - The media files are not transferred by nginx.
+            - User is logged in and participates in the chat of the image.
+
+        Post-conditions:
+            - The response must have the content of the image, without the X-Accel-Redirect header.
+        '''
+
+        self.client.login(username=self.user1.email, password='User1@123')
+        with override_settings(MEDIA_ACCEL_REDIRECT=False):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Accel-Redirect', response)
+        with self.image_message.image.open('rb') as image:
+            self.assertEqual(b''.join(response.streaming_content), image.read())
+
+
+    def test_media_view_group_member(self):
+        '''
+        Description:
+            This test verifies that the members of a group can get the images sent to it.
+
+        Pre-conditions:
+            - User is logged in, does not participate in the chat of the image but is a member of a group the image was sent to.
+
+        Post-conditions:
+            - The response must have the X-Accel-Redirect header.
+        '''
+
+        group = GroupChatFactory(creator=self.user1)
+        GroupChatMemberFactory(group=group, user=self.user3)
+        GroupChatMessage.objects.create(group=group, message=self.image_message)
+        self.client.login(username=self.user3.email, password='User3@123')
+        with override_settings(MEDIA_ACCEL_REDIRECT=True):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Accel-Redirect', response)
+
+
+    def test_media_view_forbidden(self):
+        '''
+        Description:
+            This test verifies that the images can not be got by the users that do not participate in their chats and groups.
+
+        Pre-conditions:
+            - An anonymous user and a logged in user that does not participate in the chat of the image request it.
+            - The logged in user requests a file out of the media directories.
+
+        Post-conditions:
+            - The anonymous user must be redirected to the login page.
+            - The logged in user must receive a 404 (the existence of the files is not revealed).
+        '''
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+        self.client.login(username=self.user3.email, password='User3@123')
+        with override_settings(MEDIA_ACCEL_REDIRECT=True):
+            for path in (self.image_message.image.name, 'emojis.json', '../telezap_django/settings.py'):
+                response = self.client.get(reverse('media', kwargs={'path': path}))
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn('X-Accel-Redirect', response)
@@ -5,6 +5,7 @@ app_name = 'chat'
 
 urlpatterns = [
     path('', views.chats, name='chats'),
+    path('updates/', views.get_chat_list_updates, name='get_chat_list_updates'),
     path('<uuid:id>/', views.chat, name='chat'),
     path('<uuid:id>/remove/', views.remove_chat, name='remove_chat'),
     path('<uuid:id>/messages/', views.get_chat_messages, name='get_chat_messages'),
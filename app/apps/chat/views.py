@@ -1,28 +1,30 @@
-from django.db.models import Q
+from django.db.models import Q, F
 from django.contrib import messages
 from django.contrib.messages import constants
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404, render
-from django.template.loader import render_to_string
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import dateformat, timezone
 
 from PIL import Image
 from io import BytesIO
-import base64, json
-from apps.chat.templatetags.custom_tags import is_user_attribute_visible
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+import base64, json, uuid, math
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import Chat, ChatMessage, TextMessage, ImageMessage
-from apps.utils import date_is_today, get_all_emojis, get_message_separator, get_chat_dict
+from .ratelimit import check_message_rate_limit
+from apps.utils import date_is_today, get_all_emojis, get_message_separator, aget_chat_dicts, async_login_required
+from apps.rendering import get_message_templates, get_chat_list_template
 
+User = get_user_model()
 
-@login_required
-def chats(request):
+
+@async_login_required
+async def chats(request):
     '''
     View to list all chats of the user.
 
@@ -43,30 +45,104 @@ def chats(request):
             - last_message_date (datetime): The date of the last message of the chat.
             - has_unread_messages (bool): True if the chat has unread messages, False otherwise.
             - last_message_date_is_today (bool): True if the last message date is today, False otherwise.
+
+    Notes:
+        - The view is async, the chats, their users, their amount of messages and their last message ids are fetched with a single query
+          and the last messages with a query per message type (see aget_chat_dicts).
+        - The template is rendered in a thread, as the template tags and the context processors use the sync ORM.
     '''
 
     # Get all visible chats of user 
     chats = Chat.objects.filter(
                 (Q(user1=request.user) & Q(user1_view=True)) | 
                 (Q(user2=request.user) & Q(user2_view=True))
-            )
+            ).select_related('user1', 'user2')
 
-    messages_dicts = []
     # For each chat, create a dictionary with the chat and the another user
-    for chat in chats:
-        # Get the init_messsages_date
-        chat_dict = get_chat_dict(chat, request.user)
-        messages_dicts.append(chat_dict)
+    messages_dicts = await aget_chat_dicts(chats, request.user)
 
     context = {
         'chats': messages_dicts
     }
-    return render(request, 'chat/chat_list.html', context=context)
+    return await sync_to_async(render)(request, 'chat/chat_list.html', context=context)
 
 
+@async_login_required
+async def get_chat_list_updates(request):
+    '''
+    View to get the chats of the chat list of the user that changed since the state of the client.
 
-@login_required
-def get_chat_messages(request, id):
+    Args:
+        request (HttpRequest): The request object.
+
+    Query parameters:
+        chat (str): The state of a chat in the chat list of the client, as <chat id>:<last message seq> (one parameter per chat).
+
+    Returns:
+        JsonResponse: A json response with the ids of the visible chats (chat_ids) and the chats that are new or have new
+        messages (chats), each one with its id (chat_id), the sequence number of its last message (last_message_seq) and its template.
+
+    Notes:
+        - It is called by the chat list when the events missed while it was disconnected are no longer in the event log,
+          instead of reloading the page.
+        - Only the chats that changed are rendered, in a single thread hop.
+    '''
+
+    # Get the last message seq of each chat of the client
+    known_seqs = dict()
+    for chat_state in request.GET.getlist('chat'):
+        chat_id, _, last_message_seq = chat_state.partition(':')
+        try:
+            known_seqs[chat_id] = int(last_message_seq)
+        except ValueError:
+            continue
+
+    chats = Chat.objects.filter(
+                (Q(user1=request.user) & Q(user1_view=True)) | 
+                (Q(user2=request.user) & Q(user2_view=True))
+            ).select_related('user1', 'user2')
+    chat_ids = []
+    changed_chats = []
+    async for chat in chats:
+        chat_ids.append(str(chat.id))
+        if known_seqs.get(str(chat.id)) != chat.last_message_seq:
+            changed_chats.append(chat)
+
+    templates = await sync_to_async(
+        lambda: [get_chat_list_template(request.user, chat) for chat in changed_chats]
+    )()
+    return JsonResponse({
+        'chat_ids': chat_ids,
+        'chats': [
+            {'chat_id': str(chat.id), 'last_message_seq': chat.last_message_seq, 'template': template}
+            for chat, template in zip(changed_chats, templates)
+        ],
+    })
+
+
+
+async def aget_chat_or_404(id):
+    '''
+    Function to get a chat, with its users, using the async ORM.
+
+    Args:
+        id (uuid): The id of the chat.
+
+    Returns:
+        Chat: The chat.
+
+    Raises:
+        Http404: If the chat does not exist.
+    '''
+
+    try:
+        return await Chat.objects.select_related('user1', 'user2').aget(id=id)
+    except Chat.DoesNotExist:
+        raise Http404("No Chat matches the given query.")
+
+
+@async_login_required
+async def get_chat_messages(request, id):
     '''
     View to get the messages of a chat.
 
@@ -77,26 +153,36 @@ def get_chat_messages(request, id):
     Returns:
         JsonResponse: A json response with the messages of the chat.
 
+    Query parameters:
+        - before: Get the messages before this sequence number (cursor to load older messages).
+        - after: Get the messages after this sequence number (cursor to load missed messages, e.g. after a reconnect).
+
     Context:
         message_list (list): A list of dictionaries containing the message and the separator.
         message dictionaries:
             - template (str): The template of the message.
             - separator (str): The separator of the message.
             - is_last_unviewed_message (bool): True if the message is the last unviewed message, False otherwise.
+            - seq (int): The sequence number of the message in the chat.
+        has_next (bool): True if there are older (first load/before) or newer (after) messages to load.
+        last_message_seq (int): The sequence number of the last message of the chat.
     
     Notes:
-        - The messages are paginated.
-        - The messages are ordered by date.
+        - Only settings.MESSAGES_PAGINATION messages are loaded (plus one, to know if there are more and for the separator of the oldest),
+          the client loads the older ones with the before cursor (the sequence number of the oldest message loaded).
+        - The first load (without cursors) has the newest messages, with all the unviewed messages of the user (up to
+          settings.MESSAGES_MAX_FIRST_LOAD) so the first unviewed one is highlighted, and the messages are visualized by the user.
+        - The messages are ordered by sequence number, newest first.
         - The user can only get the messages of a chat if he is in the chat.
+        - The view is async, the messages are fetched with the async ORM and only the templates are rendered in a thread.
     '''
 
     if request.method == 'GET':
-        # Get the chat and the page of the messages
-        chat = get_object_or_404(Chat, id=id)
-        page = request.GET.get("page", 1)
+        # Get the chat
+        chat = await aget_chat_or_404(id)
 
         # Check if the user is in the chat
-        if not chat.user1 == request.user and not chat.user2 == request.user:
+        if not chat.user1_id == request.user.id and not chat.user2_id == request.user.id:
             messages.add_message(request, constants.ERROR, 'Você não tem permissão para receber as mensagens desse chat.')
             return HttpResponseRedirect(reverse('chat:chats'))
         
@@ -104,99 +190,82 @@ def get_chat_messages(request, id):
 
         init_messsages_date = None
         # If the user is the user1 and the user1 has exit the chat, set the init_messsages_date to the user1_exit_chat_date
-        if chat.user1 == request.user and chat.user1_exit_chat_date:
+        if chat.user1_id == request.user.id and chat.user1_exit_chat_date:
             init_messsages_date = chat.user1_exit_chat_date
-        elif chat.user2 == request.user and chat.user2_exit_chat_date:
+        elif chat.user2_id == request.user.id and chat.user2_exit_chat_date:
             init_messsages_date = chat.user2_exit_chat_date
-        # Get the messages of the chat from the init_messsages_date to now
-        messages_list = chat.get_messages(init_messsages_date=init_messsages_date)
 
-        # If the chat has no messages, return a json response with no messages
-        if messages_list is None:
-            return JsonResponse({"message_list":None, "has_next":False})
+        # Get the sequence number cursors
+        try:
+            before_seq = int(request.GET["before"]) if request.GET.get("before") else None
+            after_seq = int(request.GET["after"]) if request.GET.get("after") else None
+        except ValueError:
+            return JsonResponse({"message_list":None, "has_next":False, "last_message_seq":chat.last_message_seq})
+
+        # The first load has the unviewed messages and the message before them, so the first unviewed message is highlighted
+        first_load = before_seq is None and after_seq is None
+        if first_load:
+            amount_of_unviewed_messages = chat.last_message_seq - chat.get_last_read_seq(request.user)
+            messages_per_page = min(max(messages_per_page, amount_of_unviewed_messages + 1), settings.MESSAGES_MAX_FIRST_LOAD)
+
+        # Get one more message than the page to know if there are more messages (and to get the separator of the last one)
+        messages_list = await chat.aget_messages(
+            init_messsages_date=init_messsages_date,
+            before_seq=before_seq,
+            after_seq=after_seq,
+            limit=messages_per_page + 1
+        )
+        if not messages_list:
+            return JsonResponse({"message_list":None, "has_next":False, "last_message_seq":chat.last_message_seq})
+
+        has_next = len(messages_list) > messages_per_page
+        if after_seq is not None:
+            # The newest message is the extra one, the separator of the oldest message is given by the client
+            page_messages = messages_list[-messages_per_page:]
+            separators_messages = page_messages + [None]
+        else:
+            page_messages = messages_list[:messages_per_page]
+            separators_messages = messages_list if has_next else messages_list + [None]
+
+        # The messages of the first load and loaded by the after cursor are visualized by the user
+        last_unviewed_message = None
+        if first_load:
+            last_unviewed_message = await chat.aget_first_unviewed_message(request.user)
+        if first_load or after_seq is not None:
+            await chat.aupdate_messages_visualization(request.user)
+
+        templates = await sync_to_async(get_message_templates)(request.user, page_messages)
+        message_data_list = []
+        for index, msg in enumerate(page_messages):
+            previous_msg = separators_messages[index+1]
+            message_data_list.append({
+                'template': templates[index],
+                'separator': get_message_separator(msg.date, previous_msg.date) if previous_msg is not None else None,
+                # Serves to highlight the last unviewed message
+                'is_last_unviewed_message': last_unviewed_message is not None and last_unviewed_message == msg.id,
+                'seq': msg.seq,
+            })
 
-        # Get the last unviewed message of the chat
-        last_unviewed_message = chat.get_first_unviewed_message(request.user)
-        last_unviewed_message_index = 0
-        # If the user is viewing the first page of the chat, update the messages visualization of the user to visualized
-        if int(page) == 1:
-            chat.update_messages_visualization(request.user)
+        return JsonResponse({"message_list":message_data_list, "has_next":has_next, "last_message_seq":chat.last_message_seq})
 
-        # Create a list of dictionaries with the messages and the separators
-        message_data_list = []
-        for index in range(len(messages_list)):
-            msg = messages_list[index]
-            content = dict()
-
-            # If the message is from the user, render the message_send template, otherwise render the message_received template
-            if msg.author == request.user:
-                # Render the message_send template
-                template = render_to_string('chat/message_send.html', {'message': msg})
-            else:
-                # Check if the user can see the online status and the photo of the message author
-                visibility_online = is_user_attribute_visible(
-                    request_user=request.user,
-                    message_author=msg.author,
-                    attribute="online"
-                )
-                visibility_photo = is_user_attribute_visible(
-                    request_user=request.user,
-                    message_author=msg.author,
-                    attribute="photo"
-                )
-                # Render the message_received template
-                template = render_to_string(
-                    'chat/message_received.html', 
-                    {
-                        'message': msg, 
-                        'visibility_online': visibility_online, 
-                        'visibility_photo': visibility_photo
-                    }
-                )
-
-            # Add the template and the separator to the dictionary
-            content['template'] = str(template)
-            content['separator'] = get_message_separator(msg.date, messages_list[index+1].date) if index < len(messages_list)-1 else None
-            
-            # If the message is the last unviewed message, set the is_last_unviewed_message to True, otherwise set it to False
-            # Serves to highlight the last unviewed message
-            if last_unviewed_message is not None and last_unviewed_message == msg.id:
-                content['is_last_unviewed_message'] = True
-                last_unviewed_message_index = index
-            else:
-                content['is_last_unviewed_message'] = False
-
-            # Add the dictionary to the list
-            message_data_list.append(content)
-
-        # If the last unviewed message is not None and the index of the last unviewed message is greater than the messages per page, set the messages per page to the index of the last unviewed message plus 2
-        # Serves to guarantee that the last unviewed message will be in the first page
-        if last_unviewed_message is not None and last_unviewed_message_index > messages_per_page:
-            messages_per_page = last_unviewed_message_index + 2
-
-        # Paginate the messages
-        paginator = Paginator(message_data_list, messages_per_page)
-        try:
-            # Get the page of the messages
-            paginator.validate_number(page)
-            messages_list = paginator.get_page(page)
 
-            # Create a list of messages
-            paginated_messages = []
-            for msg in messages_list:
-                paginated_messages.append(msg)
 
-            # Return a json response with the messages and if the messages has next page
-            data = {"message_list":paginated_messages, "has_next":messages_list.has_next()}
-            return JsonResponse(data)
-        except (EmptyPage, PageNotAnInteger):
-            # If the page is not valid, return a json response with no messages
-            return JsonResponse({"message_list":None, "has_next":False})
+def render_chat(request, chat, another_user, another_user_is_friend):
+    '''
+    Function to render the template of a chat (the emojis are read from a file and the template tags use the sync ORM).
+    '''
 
+    context = {
+        'chat': chat,
+        'another_user': another_user,
+        'emojis': get_all_emojis(),
+        'another_user_is_friend': another_user_is_friend
+    }
+    return render(request, 'chat/chat.html', context=context)
 
 
-@login_required
-def chat(request, id):
+@async_login_required
+async def chat(request, id):
     '''
     View to show the requested chat.
 
@@ -214,36 +283,49 @@ def chat(request, id):
 
     Notes:
         - The chat is only shown if the user is in the chat.
+        - The view is async, only the template is rendered in a thread.
     '''
 
     # Get the chat
-    chat = get_object_or_404(Chat, id=id)
+    chat = await aget_chat_or_404(id)
 
     # Check if the user is in the chat
-    if not chat.user1 == request.user and not chat.user2 == request.user:
+    if not chat.user1_id == request.user.id and not chat.user2_id == request.user.id:
         messages.add_message(request, constants.ERROR, 'Você não tem permissão para acessar este chat.')
         return HttpResponseRedirect(reverse('chat:chats'))
     
     # Update the user chat visualization if the user is in the chat and the user has not viewed the chat
-    if chat.user1 == request.user and chat.user1_view == False:
+    if chat.user1_id == request.user.id and chat.user1_view == False:
         chat.user1_view = True
-        chat.save()
-    elif chat.user2 == request.user and chat.user2_view == False:
+        await chat.asave(update_fields=['user1_view'])
+    elif chat.user2_id == request.user.id and chat.user2_view == False:
         chat.user2_view = True
-        chat.save()
+        await chat.asave(update_fields=['user2_view'])
 
     # Get the another user in chat
     another_user = chat.get_another_user(request.user)
-    context = {
-        'chat': chat,
-        'another_user': another_user,
-        'emojis': get_all_emojis(),
-        'another_user_is_friend': request.user.is_friend(another_user)
-    }
-    return render(request, 'chat/chat.html', context=context)
+    another_user_is_friend = await request.user.friends.filter(id=another_user.id).aexists()
+    return await sync_to_async(render_chat)(request, chat, another_user, another_user_is_friend)
 
 
 
+def get_client_id(value):
+    '''
+    Function to get the idempotency key of a message generated by the client.
+
+    Args:
+        value (str|None): The client id sent by the client.
+
+    Returns:
+        uuid|None: The client id, or None if it is missing or invalid.
+    '''
+
+    try:
+        return uuid.UUID(str(value)) if value else None
+    except ValueError:
+        return None
+
+
 def is_user_connected_in_chat(user_id, chat_id):
     '''
     Function to check if a user is connected in a chat.
@@ -254,14 +336,17 @@ def is_user_connected_in_chat(user_id, chat_id):
     
     Returns:
         bool: True if the user is connected in the chat, False otherwise.
+
+    Notes:
+        - The chats the user is connected in are set by the ChatConsumer (set_UserInChat) in the database,
+          so the check works with any channel layer and for the consumers of all the processes.
     '''
 
-    group_name = f'user_{user_id}_chat_{chat_id}'
-    channel_layer = get_channel_layer()
-    return group_name in channel_layer.groups
+    in_chat = User.objects.filter(id=user_id).values_list('in_chat', flat=True).first()
+    return str(chat_id) in (in_chat or '').split('|')
 
-@login_required
-def new_chat_message(request, id):
+@async_login_required
+async def new_chat_message(request, id):
     '''
     View to create a new message in a chat.
 
@@ -270,78 +355,49 @@ def new_chat_message(request, id):
         id (uuid): The id of the chat.
 
     Returns:
-        HttpResponse: A http response with status 204 if the message was created, 404 if the chat was not found or 403 if the user is not in the chat.
+        HttpResponse: A http response with status 204 if the message was created, 400 (with the error) if the message is invalid, 404 if the chat was not found, 403 if the user is not in the chat or 429 (with the Retry-After header) if the user sent too many messages.
     
     Notes:
         - The user can only create a new message in a chat if he is in the chat.
+        - The messages are sent through the chat websocket (ChatConsumer.receive), this view is the fallback when it is not connected.
+        - If the client_id (idempotency key) was already used in the chat, the message is not created again.
+        - The view is async, the message is created (in a transaction) in a single thread hop.
     '''
 
     # Get the chat
-    chat = get_object_or_404(Chat, id=id)
+    chat = await aget_chat_or_404(id)
     # Check if the user is in the chat
-    if not chat.user1 == request.user and not chat.user2 == request.user:
+    if not chat.user1_id == request.user.id and not chat.user2_id == request.user.id:
         messages.add_message(request, constants.ERROR, 'Você não tem permissão para enviar mensagens neste chat.')
         return HttpResponseRedirect(reverse('chat:chats'))
 
-    # Get the another user in chat and check if he is connected in the chat
-    another_user = chat.get_another_user(request.user)
-    another_user_is_connected_in_chat = is_user_connected_in_chat(another_user.id, str(chat.id))
     if request.method == 'POST':
-        # Get the message type
-        message_type = request.POST.get('message_type')
-        match message_type:
-            case 'T':
-                # If the message type is text, create a new text message and a new chat message with the text message
-                message_text = request.POST.get('text')
-                text_message = TextMessage.objects.create(
-                    author=request.user,
-                    text=message_text
-                )
-                ChatMessage.objects.create(
-                    chat=chat,
-                    message=text_message,
-                    visualized= another_user_is_connected_in_chat
-                )
-            case 'I':
-                # If the message type is image, create a new image message and a new chat message with the image message
-                message_image = request.FILES.get('image')
-                image_message = ImageMessage.objects.create(
-                    author=request.user,
-                    image=message_image
-                )
-                ChatMessage.objects.create(
-                    chat=chat,
-                    message=image_message,
-                    visualized= another_user_is_connected_in_chat
-                )
-            case 'A':
-                # If the message type is audio, create a new text message and a new chat message with the text message
-                message_text = 'Áudio'
-                text_message = TextMessage.objects.create(
-                    author=request.user,
-                    text=message_text
-                )
-                ChatMessage.objects.create(
-                    chat=chat,
-                    message=text_message,
-                    visualized= another_user_is_connected_in_chat
-                )
-            case 'V':
-                # If the message type is video, create a new text message and a new chat message with the text message
-                message_text = 'Vídeo'
-                text_message = TextMessage.objects.create(
-                    author=request.user,
-                    text=message_text
-                )
-                ChatMessage.objects.create(
-                    chat=chat,
-                    message=text_message,
-                    visualized= another_user_is_connected_in_chat
-                )
-            case _:
-                # If the message type is invalid, return a http response with status 404
-                messages.add_message(request, constants.ERROR, 'Tipo de mensagem inválido.')
-                return HttpResponseRedirect(reverse('chat:chat', kwargs={'id': id}))
+        client_id = get_client_id(request.POST.get('client_id'))
+        # Verify if the user can send a new message (rate limit), otherwise return when he can send it again
+        # A message resent with the client id of a stored message does not take a token
+        if client_id is None or await chat.aget_message_by_client_id(client_id) is None:
+            retry_after = await sync_to_async(check_message_rate_limit, thread_sensitive=False)(request.user.id, chat.id)
+            if retry_after > 0:
+                return HttpResponse(status=429, headers={'Retry-After': str(math.ceil(retry_after))})
+
+        def create_message():
+            # If the another user is connected in the chat, the message is read by him too
+            another_user = chat.get_another_user(request.user)
+            return chat.new_message(
+                author=request.user,
+                message_type=request.POST.get('message_type'),
+                text=request.POST.get('text'),
+                image=request.FILES.get('image'),
+                mark_as_read=is_user_connected_in_chat(another_user.id, chat.id),
+                client_id=client_id,
+            )
+
+        try:
+            # Create the message (the same validation of the messages sent through the chat websocket)
+            await sync_to_async(create_message)()
+        except ValidationError as error:
+            # If the message is invalid, return the error message (the text is given back to the user)
+            return JsonResponse({'error': error.messages[0]}, status=400)
         return HttpResponse(status=204)
     return HttpResponse(status=200)
 
@@ -371,14 +427,17 @@ def remove_chat(request, id):
 
     localized_datetime = timezone.localtime(timezone.now(), timezone=timezone.get_current_timezone())
 
+    # The messages before the exit chat date are read, so the watermark of the user is moved to the last message
     if chat.user1 == request.user:
         chat.user1_view = False
         chat.user1_exit_chat_date = localized_datetime
-        chat.save()
+        chat.user1_last_read_seq = F('last_message_seq')
+        chat.save(update_fields=['user1_view', 'user1_exit_chat_date', 'user1_last_read_seq'])
     else:
         chat.user2_view = False
         chat.user2_exit_chat_date = localized_datetime
-        chat.save()
+        chat.user2_last_read_seq = F('last_message_seq')
+        chat.save(update_fields=['user2_view', 'user2_exit_chat_date', 'user2_last_read_seq'])
 
     if chat.user1_view == False and chat.user2_view == False:
         chat.delete()
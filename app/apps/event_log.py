@@ -0,0 +1,231 @@
+from django.core.cache import cache
+from django.conf import settings
+
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync, sync_to_async
+from urllib.parse import parse_qs
+import json
+
+
+def get_event_log_counter_key(user_id):
+    '''
+    Function to get the cache key of the last event id of the event log of a user
+
+    Parameters:
+        user_id (int): The id of the user
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"event_log_{user_id}_last_id"
+
+
+def get_event_log_event_key(user_id, event_id):
+    '''
+    Function to get the cache key of an event of the event log of a user
+
+    Parameters:
+        user_id (int): The id of the user
+        event_id (int): The id of the event
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"event_log_{user_id}_{event_id}"
+
+
+def get_event_log_group_key(user_id, group_name):
+    '''
+    Function to get the cache key of the id of the last event of a group of the event log of a user
+
+    Parameters:
+        user_id (int): The id of the user
+        group_name (str): The name of the group
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"event_log_{user_id}_{group_name}_last_id"
+
+
+def get_last_event_id(user_id):
+    '''
+    Function to get the id of the last event of the event log of a user
+
+    Parameters:
+        user_id (int): The id of the user
+
+    Returns:
+        int: The id of the last event (0 if the user has no events)
+    '''
+
+    return cache.get(get_event_log_counter_key(user_id), 0)
+
+
+def append_event(user_id, group_name, event):
+    '''
+    Function to append an event to the event log of a user
+
+    Parameters:
+        user_id (int): The id of the user
+        group_name (str): The name of the group the event is sent to
+        event (dict): The event sent to the group
+
+    Returns:
+        dict: The event with its id (event_id)
+
+    Notes:
+        - The event ids are sequential per user, so a client can resume from the last event id it received.
+        - Each event expires after settings.EVENT_LOG_TTL seconds and only the last settings.EVENT_LOG_MAX_LENGTH events are kept.
+        - Each event keeps the id of the previous event of its group, so the expiry of the events is checked per group.
+        - The previous event and the last id of the group are not updated atomically, so concurrent appends to a group may
+          leave them at an older event; get_missed_events gets the events of the group from the whole range of the log.
+    '''
+
+    counter_key = get_event_log_counter_key(user_id)
+    # The counter does not expire, otherwise the event ids would be reused
+    cache.add(counter_key, 0, timeout=None)
+    try:
+        event_id = cache.incr(counter_key)
+    except ValueError:
+        # The counter was evicted between the add and the incr
+        event_id = 1
+        cache.set(counter_key, event_id, timeout=None)
+
+    event = {**event, 'event_id': event_id}
+    group_key = get_event_log_group_key(user_id, group_name)
+    cache.set(
+        get_event_log_event_key(user_id, event_id),
+        {'group': group_name, 'previous': cache.get(group_key, 0), 'event': event},
+        settings.EVENT_LOG_TTL
+    )
+    # The last id of the group is set after its event, so a client never resumes from an event that is not in the log yet
+    cache.set(group_key, event_id, timeout=None)
+    # Trim the event that left the bounded log
+    if event_id > settings.EVENT_LOG_MAX_LENGTH:
+        cache.delete(get_event_log_event_key(user_id, event_id - settings.EVENT_LOG_MAX_LENGTH))
+
+    return event
+
+
+def send_user_event(user_id, group_name, event):
+    '''
+    Function to append an event to the event log of a user and send it to a group of the user
+
+    Parameters:
+        user_id (int): The id of the user
+        group_name (str): The name of the group of the user (e.g. user_1_navbar)
+        event (dict): The event sent to the group
+    '''
+
+    channel_layer = get_channel_layer()
+    async_to_sync(
+        channel_layer.group_send
+    )(
+        group_name,
+        append_event(user_id, group_name, event)
+    )
+
+
+def get_missed_events(user_id, resume_id, group_name):
+    '''
+    Function to get the events of a group sent after an event id
+
+    Parameters:
+        user_id (int): The id of the user
+        resume_id (int): The id of the last event received by the client
+        group_name (str): The name of the group of the events
+
+    Returns:
+        list|None: The events of the group after the resume id (oldest first), or None if the events are no longer in the log
+
+    Notes:
+        - All the events are got from the cache at once.
+        - The log interleaves the events of all the groups of the user, so only the events of the group must be in the log:
+          the last event of the group and the previous event of each event of the group after the resume id.
+        - The last id of the group is not trusted to find the events, since concurrent appends may leave it at an older event.
+        - None means the client must resynchronize its state (the log was trimmed, the events expired or the counter was reset).
+    '''
+
+    last_id = get_last_event_id(user_id)
+    if resume_id > last_id:
+        return None
+    if resume_id == last_id:
+        return []
+
+    # Only the last settings.EVENT_LOG_MAX_LENGTH events are in the log
+    first_id = max(resume_id, last_id - settings.EVENT_LOG_MAX_LENGTH) + 1
+    keys = {event_id: get_event_log_event_key(user_id, event_id) for event_id in range(first_id, last_id + 1)}
+    entries = cache.get_many(keys.values())
+    group_entries = {
+        event_id: entries[key] for event_id, key in keys.items()
+        if key in entries and entries[key]['group'] == group_name
+    }
+
+    # The last id of the group may be behind its last event (two events of the group appended at once),
+    # so the events of the group are got from the whole range and the last id only has to be in the log
+    group_last_id = cache.get(get_event_log_group_key(user_id, group_name), 0)
+    if group_last_id > resume_id and group_last_id not in group_entries:
+        return None
+
+    # If an event of the group after the resume id expired or was trimmed, the log does not cover the resume id
+    for entry in group_entries.values():
+        if entry['previous'] > resume_id and entry['previous'] not in group_entries:
+            return None
+
+    return [entry['event'] for event_id, entry in sorted(group_entries.items())]
+
+
+def get_resume_id(scope):
+    '''
+    Function to get the resume token (last event id received by the client) of a websocket connection
+
+    Parameters:
+        scope (dict): The scope of the websocket connection
+
+    Returns:
+        int|None: The resume id passed in the query string (?resume=<id>), or None if it is missing or invalid
+    '''
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        resume_id = int(query['resume'][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+    return resume_id if resume_id >= 0 else None
+
+
+class EventLogConsumerMixin:
+    '''
+    Mixin of the consumers that replay the events missed by the client while it was disconnected
+
+    Notes:
+        - The consumer must set self.user and self.group_name before calling replay_missed_events.
+        - The events are replayed through the same handlers of the live events.
+        - If the missed events are no longer in the log, the resync method is called.
+    '''
+
+    async def replay_missed_events(self):
+        resume_id = get_resume_id(self.scope)
+        if resume_id is None:
+            return
+
+        events = await sync_to_async(get_missed_events)(self.user.id, resume_id, self.group_name)
+        if events is None:
+            await self.resync()
+            return
+
+        # Replay the missed events in order
+        for event in events:
+            await self.dispatch(event)
+
+    async def resync(self):
+        # Tell the client to reload its state from the last event id on
+        last_event_id = await sync_to_async(get_last_event_id)(self.user.id)
+        await self.send(text_data=json.dumps({
+            'event_id': last_event_id,
+            'type': 'resync'
+        }))
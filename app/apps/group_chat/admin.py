@@ -1,3 +1,24 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import GroupChat, GroupChatMember, GroupChatMessage
+
+
+class GroupChatMemberInline(admin.TabularInline):
+    model = GroupChatMember
+    extra = 0
+    readonly_fields = ('last_read_seq', 'date')
+
+
+@admin.register(GroupChat)
+class GroupChatAdmin(admin.ModelAdmin):
+    list_display = ('name', 'creator', 'date', 'last_message_seq', 'id')
+    search_fields = ('name', 'creator__email')
+    readonly_fields = ('last_message_seq',)
+    inlines = (GroupChatMemberInline,)
+
+
+@admin.register(GroupChatMessage)
+class GroupChatMessageAdmin(admin.ModelAdmin):
+    list_display = ('group', 'message', 'seq')
+    search_fields = ('group__name', 'message__author__email')
+    readonly_fields = ('group', 'message', 'seq', 'client_id')
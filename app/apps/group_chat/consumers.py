@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+import functools, json
+
+from apps.chat.consumers import SendMessageConsumerMixin
+from apps.utils import invalidate_navbar_state
+from apps.loaders import load_group_chat_of_member, load_text_message, load_image_message
+from apps.rendering import get_message_template, render_async
+from apps.metrics import MetricsConsumerMixin
+from apps.tracing import TracingConsumerMixin
+from apps.query_inspector import QueryInspectorConsumerMixin
+from apps.traffic import TrafficRecorderConsumerMixin
+from .models import GroupChat
+
+User = get_user_model()
+
+
+@database_sync_to_async
+def set_UserInGroupChat(user, group_id, in_group):
+    '''
+    Function to set the user in or out of a group and move his watermark to the last message of the group
+    '''
+
+    # the user has viewed the messages of the group while he was connected in it
+    GroupChat(id=group_id).update_messages_visualization(user)
+
+    user_in_groupchat = User.objects.filter(id=user.id).values_list('in_groupchat', flat=True).first()
+    group_ids = [id for id in (user_in_groupchat or '').split('|') if id and id != group_id]
+    if in_group:
+        group_ids.append(group_id)
+    User.objects.filter(id=user.id).update(in_groupchat='|'.join(group_ids) or None)
+    # the groups the user is in are not counted in the navbar state
+    invalidate_navbar_state(user)
+
+
+@database_sync_to_async
+def create_GroupChatMessage(group_id, author, message_type, text, client_id):
+    '''
+    Function to create a new message in a group
+    '''
+
+    group = GroupChat.objects.get(id=group_id)
+    return group.new_message(
+        author=author,
+        message_type=message_type,
+        text=text,
+        client_id=client_id,
+    )
+
+
+
+class GroupChatConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, SendMessageConsumerMixin, AsyncWebsocketConsumer):
+    '''
+    Consumer to send the messages of a group to a member and receive the messages sent by him
+
+    Notes:
+        - The members connected in the group are hashed to the delivery shards of the group (a channel layer group per shard),
+          so a message is sent once per shard instead of once per member.
+        - The watermark of the member is moved on connect and disconnect instead of once per message received.
+        - The text messages sent by the member are received by the SendMessageConsumerMixin, as in the ChatConsumer.
+    '''
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.group = None
+        # if the user is a member of the group, add the user to the group and accept the connection
+        if self.user and self.user.is_authenticated:
+            self.group_id = str(self.scope['url_route']['kwargs']['group_id'])
+            self.group = await load_group_chat_of_member(self.group_id, self.user)
+        if self.group is None:
+            await self.close()
+            return
+
+        self.group_name = self.group.get_channel_group_name(self.group.get_delivery_shard(self.user))
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # set the user in the group (so his navbar does not show the messages of the group he is viewing)
+        await set_UserInGroupChat(self.user, self.group_id, True)
+        await self.accept()
+
+
+    async def disconnect(self, close_code):
+        # if the user is connected in the group, remove the user from the group and set the user out of the group
+        if getattr(self, 'group', None) is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await set_UserInGroupChat(self.user, self.group_id, False)
+
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if getattr(self, 'group', None) is None:
+            return
+
+        await self.receive_message(
+            text_data,
+            rate_limit_id=self.group_id,
+            get_message_by_client_id=self.group.aget_message_by_client_id,
+            create_message=functools.partial(create_GroupChatMessage, self.group_id, self.user),
+            message_id_key='group_message_id',
+            not_found_error='Grupo não encontrado.',
+        )
+
+
+    async def send_group_message_create(self, event):
+        if getattr(self, 'group', None) is None:
+            return
+
+        match event['group_message_type']:
+            case 'T':
+                # If the message is a text message, get the message
+                message = await load_text_message(event['group_message_id'])
+            case 'I':
+                # If the message is an image message, get the message
+                message = await load_image_message(event['group_message_id'])
+            case _:
+                message = None
+        if message is None:
+            return
+
+        # send the message to the member
+        await self.send(text_data=json.dumps({
+            'group_id': event['group_id'],
+            'group_message_id': event['group_message_id'],
+            'seq': event['group_message_seq'],
+            'template': await render_async(get_message_template, self.user, message),
+            'type': 'create'
+        }))
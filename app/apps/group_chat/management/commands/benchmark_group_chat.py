@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from channels.layers import get_channel_layer
+
+import time
+
+from apps.group_chat.models import GroupChat
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+
+class Command(BaseCommand):
+    '''
+    Command to measure the cost of sending a message to groups of different sizes.
+
+    For each size a group is created with that amount of members and some messages are sent to it,
+    then the queries, the channel layer group_sends and the time per message are printed,
+    as well as the queries to read the group (move the watermark) and to count the unviewed messages of a member.
+
+    Notes:
+        - Everything is created inside a transaction that is rolled back, so the database is not changed.
+          The fan-out of a message (its signal) is sent on commit, so its callbacks are run after each message and measured with it.
+        - The unread maintenance must not grow with the size of the group, and the fan-out only grows with the delivery shards
+          (one per settings.GROUP_CHAT_DELIVERY_SHARD_SIZE members, up to settings.GROUP_CHAT_DELIVERY_MAX_SHARDS).
+    '''
+
+    help = 'Measure the queries, channel layer sends and time to send a message to groups of different sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[2, 10, 100, 1000],
+            help='Sizes (amount of members) of the groups (default: 2 10 100 1000).',
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=20,
+            help='Amount of messages sent to each group (default: 20).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"membros":>8} {"shards":>7} {"queries/msg":>12} {"group_sends/msg":>16} {"ms/msg":>8} {"queries leitura":>16} {"queries não lidas":>18}')
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.stdout.write(self.benchmark(size, options['messages']))
+                    raise Rollback()
+            except Rollback:
+                pass
+
+    def benchmark(self, size, amount_of_messages):
+        # Create the members (the slug is set here because bulk_create does not send the pre_save signal) and the group
+        users = User.objects.bulk_create([
+            User(
+                username=f'benchmark_group_{size}_{index}',
+                slug=f'benchmark-group-{size}-{index}',
+                email=f'benchmark_group_{size}_{index}@example.com',
+            )
+            for index in range(size)
+        ])
+        group = GroupChat.objects.create(name=f'Benchmark {size}', creator=users[0])
+        group.add_members(*users)
+        author, reader = users[0], users[-1]
+
+        # Count the group_sends done by the signals of the new messages
+        channel_layer = get_channel_layer()
+        group_send = channel_layer.group_send
+        group_sends = []
+        async def counted_group_send(group_name, message):
+            group_sends.append(group_name)
+            return await group_send(group_name, message)
+        channel_layer.group_send = counted_group_send
+
+        try:
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as send_queries:
+                for index in range(amount_of_messages):
+                    with TestCase.captureOnCommitCallbacks(execute=True):
+                        group.new_message(author=author, message_type='T', text=f'Mensagem {index}')
+            elapsed = time.perf_counter() - start
+        finally:
+            channel_layer.group_send = group_send
+
+        # Read the group and count the unviewed messages of a member
+        with CaptureQueriesContext(connection) as read_queries:
+            group.update_messages_visualization(reader)
+        with CaptureQueriesContext(connection) as unread_queries:
+            group.get_amount_of_unviewed_messages(reader)
+
+        return (
+            f'{size:>8} {group.delivery_shards:>7} {len(send_queries) / amount_of_messages:>12.1f} {len(group_sends) / amount_of_messages:>16.1f} '
+            f'{elapsed * 1000 / amount_of_messages:>8.2f} {len(read_queries):>16} {len(unread_queries):>18}'
+        )
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.3 on 2026-10-19 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0011_chat_message_client_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupChat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Data de criação')),
+                ('last_message_seq', models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_group_chats', to=settings.AUTH_USER_MODEL, verbose_name='Criador')),
+            ],
+            options={
+                'verbose_name': 'Grupo',
+                'verbose_name_plural': 'Grupos',
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência')),
+                ('client_id', models.UUIDField(blank=True, editable=False, null=True, verbose_name='Id do cliente')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='group_chat.groupchat', verbose_name='Grupo')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chat.message', verbose_name='Mensagem')),
+            ],
+            options={
+                'verbose_name': 'Mensagem de grupo',
+                'verbose_name_plural': 'Mensagens de grupos',
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupChatMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_admin', models.BooleanField(default=False, verbose_name='Administrador')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Data de entrada')),
+                ('last_read_seq', models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='group_chat.groupchat', verbose_name='Grupo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_chat_memberships', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Membro do grupo',
+                'verbose_name_plural': 'Membros dos grupos',
+            },
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='members',
+            field=models.ManyToManyField(related_name='group_chats', through='group_chat.GroupChatMember', to=settings.AUTH_USER_MODEL, verbose_name='Membros'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupchatmessage',
+            constraint=models.UniqueConstraint(fields=('group', 'seq'), name='group_chat_message_seq_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupchatmessage',
+            constraint=models.UniqueConstraint(fields=('group', 'client_id'), name='group_chat_message_client_id_unique'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupchatmessage',
+            unique_together={('group', 'message')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupchatmember',
+            unique_together={('group', 'user')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group_chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupchat',
+            name='delivery_shards',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='Shards de entrega'),
+        ),
+    ]
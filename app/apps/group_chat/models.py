@@ -1,3 +1,346 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, OuterRef, Subquery
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.conf import settings
 
-# Create your models here.
+from apps.chat.models import Message, TextMessage, ImageMessage
+
+import uuid, math, zlib
+
+User = get_user_model()
+
+
+class GroupChat(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, verbose_name='Nome')
+    creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_group_chats', verbose_name='Criador')
+    members = models.ManyToManyField(User, through='GroupChatMember', related_name='group_chats', verbose_name='Membros')
+    date = models.DateTimeField(auto_now_add=True, verbose_name='Data de criação')
+
+    last_message_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem')
+    delivery_shards = models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='Shards de entrega')
+
+    class Meta:
+        verbose_name = "Grupo"
+        verbose_name_plural = "Grupos"
+
+    def __str__(self):
+        return f'{self.name}'
+
+
+    def get_delivery_shard(self, user):
+        '''
+        Get the delivery shard of a member, given by the hash of his id.
+
+        The amount of shards of a group only grows, so the shard of a connected member
+        is always one of the shards the messages are sent to.
+
+        Parameters:
+            user (User): The member of the group
+
+        Returns:
+            int: The delivery shard of the member (0 to delivery_shards - 1)
+        '''
+
+        return zlib.crc32(str(user.id).encode()) % self.delivery_shards
+
+
+    def get_channel_group_name(self, shard=0):
+        # The channel layer group of a shard of the conversation, a single group_send reaches all the connected members of the shard
+        return f"groupchat_{self.id}_{shard}"
+
+
+    def get_navbar_channel_group_name(self, shard=0):
+        # The channel layer group of the navbars of the members of a shard
+        return f"groupchat_{self.id}_navbar_{shard}"
+
+
+    def get_channel_group_names(self):
+        return [self.get_channel_group_name(shard) for shard in range(self.delivery_shards)]
+
+
+    def get_navbar_channel_group_names(self):
+        return [self.get_navbar_channel_group_name(shard) for shard in range(self.delivery_shards)]
+
+
+    def update_delivery_shards(self):
+        '''
+        Grow the amount of delivery shards of the group to one per settings.GROUP_CHAT_DELIVERY_SHARD_SIZE members
+        (up to settings.GROUP_CHAT_DELIVERY_MAX_SHARDS), so a group_send never reaches more than about a shard of members.
+
+        Notes:
+            - The amount of shards is never decreased, a member connected in a shard would stop receiving the messages.
+        '''
+
+        amount_of_members = GroupChatMember.objects.filter(group=self).count()
+        delivery_shards = min(
+            settings.GROUP_CHAT_DELIVERY_MAX_SHARDS,
+            max(1, math.ceil(amount_of_members / settings.GROUP_CHAT_DELIVERY_SHARD_SIZE))
+        )
+        if delivery_shards > self.delivery_shards:
+            GroupChat.objects.filter(pk=self.pk, delivery_shards__lt=delivery_shards).update(delivery_shards=delivery_shards)
+            self.delivery_shards = delivery_shards
+
+
+    def is_member(self, user):
+        return GroupChatMember.objects.filter(group=self, user=user).exists()
+
+
+    def add_members(self, *users, is_admin=False):
+        '''
+        Add users to the group with a single INSERT.
+
+        The messages sent before the user joined the group are not unviewed to him,
+        so the watermark of the new members starts at the last message of the group.
+
+        Parameters:
+            users (User): The users to be added (the members of the group are ignored)
+            is_admin (bool): Add the users as admins of the group
+        '''
+
+        from .signals import send_navbar_subscriptions
+        GroupChatMember.objects.bulk_create([
+            GroupChatMember(group=self, user=user, is_admin=is_admin, last_read_seq=self.last_message_seq)
+            for user in users
+        ], ignore_conflicts=True)
+        self.update_delivery_shards()
+        # The navbars connected of the new members receive the messages of the group (the bulk INSERT sends no post_save)
+        transaction.on_commit(lambda: send_navbar_subscriptions(self, users))
+
+
+    def remove_member(self, user):
+        from .signals import send_navbar_subscriptions
+        GroupChatMember.objects.filter(group=self, user=user).delete()
+        transaction.on_commit(lambda: send_navbar_subscriptions(self, [user], subscribe=False))
+
+
+    def get_last_read_seq(self, user):
+        last_read_seq = GroupChatMember.objects.filter(group=self, user=user).values_list('last_read_seq', flat=True).first()
+        if last_read_seq is None:
+            raise ValidationError('O usuário não pertence ao grupo.')
+        return last_read_seq
+
+
+    def allocate_message_seq(self, author):
+        '''
+        Allocate the next message sequence number of the group with a single UPDATE.
+
+        The author has read his own message, so only his watermark is moved to the new sequence number
+        (the watermarks of the another members are not touched, whatever the size of the group is).
+
+        Parameters:
+            author (User): The author of the new message
+
+        Returns:
+            int: The sequence number of the new message
+        '''
+
+        GroupChat.objects.filter(pk=self.pk).update(last_message_seq=F('last_message_seq') + 1)
+        # the delivery shards are refreshed too, so the message is sent to all the shards of the group
+        self.refresh_from_db(fields=['last_message_seq', 'delivery_shards'])
+        GroupChatMember.objects.filter(group=self, user=author).update(last_read_seq=self.last_message_seq)
+        return self.last_message_seq
+
+
+    def get_message_by_client_id(self, client_id):
+        '''
+        Get the message of the group sent with an idempotency key.
+
+        Parameters:
+            client_id (uuid): The idempotency key generated by the client
+
+        Returns:
+            GroupChatMessage|None: The group message, or None if no message was sent with the idempotency key
+        '''
+
+        return GroupChatMessage.objects.filter(group=self, client_id=client_id).first()
+
+
+    async def aget_message_by_client_id(self, client_id):
+        '''
+        Async version of get_message_by_client_id.
+        '''
+
+        return await GroupChatMessage.objects.filter(group=self, client_id=client_id).afirst()
+
+
+    def new_message(self, author, message_type, text=None, image=None, client_id=None):
+        '''
+        Create a new message of the author in the group.
+
+        Parameters:
+            author (User): The author of the message
+            message_type (str): The type of the message ('T' or 'I')
+            text (str|None): The text of a text message
+            image (File|None): The image of an image message
+            client_id (uuid|None): The idempotency key generated by the client
+
+        Returns:
+            tuple: The group message and True if it was created, False if a message with the same client_id already exists
+
+        Raises:
+            ValidationError: If the author is not a member of the group, the message type is invalid or the message is empty
+        '''
+
+        if not self.is_member(author):
+            raise ValidationError('Você não tem permissão para enviar mensagens neste grupo.')
+
+        # If the message was already sent with the same idempotency key, return it
+        if client_id is not None:
+            group_message = self.get_message_by_client_id(client_id)
+            if group_message is not None:
+                return group_message, False
+
+        match message_type:
+            case 'T':
+                if not isinstance(text, str) or not text.strip():
+                    raise ValidationError('A mensagem não pode ser vazia.')
+                message = TextMessage(author=author, text=text)
+            case 'I':
+                if not image:
+                    raise ValidationError('A imagem não pode ser vazia.')
+                message = ImageMessage(author=author, image=image)
+            case _:
+                raise ValidationError('Tipo de mensagem inválido.')
+
+        try:
+            with transaction.atomic():
+                message.save()
+                group_message = GroupChatMessage(group=self, message=message, client_id=client_id)
+                group_message.save()
+        except IntegrityError:
+            # The same message was sent concurrently, so the message of the first request is returned
+            if client_id is None:
+                raise
+            return GroupChatMessage.objects.get(group=self, client_id=client_id), False
+
+        return group_message, True
+
+
+    def update_messages_visualization(self, user):
+        from apps.utils import invalidate_navbar_state
+        # Move the watermark of the member to the last message of the group (a single row UPDATE)
+        GroupChatMember.objects.filter(group=self, user=user).update(
+            last_read_seq=Subquery(
+                GroupChat.objects.filter(pk=OuterRef('group_id')).values('last_message_seq')[:1]
+            )
+        )
+        invalidate_navbar_state(user)
+
+
+    def get_amount_of_unviewed_messages(self, user):
+        return max(0, self.last_message_seq - self.get_last_read_seq(user))
+
+
+    def get_messages(self, before_seq=None, after_seq=None, limit=None):
+        '''
+        Get the messages of the group, newest first.
+
+        Parameters:
+            before_seq (int|None): Get only the messages before this sequence number
+            after_seq (int|None): Get only the messages after this sequence number (the oldest ones first if limit is passed)
+            limit (int|None): The maximum amount of messages
+
+        Returns:
+            list: The text/image messages (with the seq attribute of the group message)
+        '''
+
+        messages = GroupChatMessage.objects.filter(group=self).select_related(
+            'message__author', 'message__textmessage', 'message__imagemessage'
+        )
+        if before_seq is not None:
+            messages = messages.filter(seq__lt=before_seq)
+        if after_seq is not None:
+            messages = messages.filter(seq__gt=after_seq)
+
+        # The messages after a sequence number are the next ones, so the oldest are taken first
+        if after_seq is not None and limit is not None:
+            messages = list(messages.order_by('seq')[:limit])
+            messages.reverse()
+        else:
+            messages = messages.order_by('-seq')
+            if limit is not None:
+                messages = messages[:limit]
+
+        messages_list = []
+        for group_message in messages:
+            message = group_message.get_message()
+            if message is None:
+                continue
+            message.seq = group_message.seq
+            messages_list.append(message)
+        return messages_list
+
+
+    def get_last_message(self):
+        group_message = GroupChatMessage.objects.filter(group=self).select_related(
+            'message__author', 'message__textmessage', 'message__imagemessage'
+        ).order_by('-seq').first()
+        return group_message.get_message() if group_message is not None else None
+
+
+
+class GroupChatMember(models.Model):
+    group = models.ForeignKey(GroupChat, on_delete=models.CASCADE, related_name='memberships', verbose_name='Grupo')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_chat_memberships', verbose_name='Usuário')
+    is_admin = models.BooleanField(default=False, verbose_name='Administrador')
+    date = models.DateTimeField(auto_now_add=True, verbose_name='Data de entrada')
+
+    last_read_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência da última mensagem lida')
+
+    class Meta:
+        verbose_name = "Membro do grupo"
+        verbose_name_plural = "Membros dos grupos"
+        unique_together = ('group', 'user')
+
+    def __str__(self):
+        return f'{self.user.email} -> {self.group}'
+
+    def get_amount_of_unviewed_messages(self):
+        return max(0, self.group.last_message_seq - self.last_read_seq)
+
+
+
+class GroupChatMessage(models.Model):
+    group = models.ForeignKey(GroupChat, on_delete=models.CASCADE, verbose_name='Grupo')
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, verbose_name='Mensagem')
+    seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='Sequência')
+    client_id = models.UUIDField(blank=True, null=True, editable=False, verbose_name='Id do cliente')
+
+    class Meta:
+        verbose_name = "Mensagem de grupo"
+        verbose_name_plural = "Mensagens de grupos"
+        unique_together = ('group', 'message')
+        constraints = [
+            # The sequence numbers of a group are unique (and the index is used to order and paginate the messages)
+            models.UniqueConstraint(fields=['group', 'seq'], name='group_chat_message_seq_unique'),
+            # The idempotency key generated by the client, so a message sent again (e.g. after a reconnect) is not duplicated
+            models.UniqueConstraint(fields=['group', 'client_id'], name='group_chat_message_client_id_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.message.author.email} - ({self.message.get_message_type_display()}) -> {self.group}'
+
+    def save(self, *args, **kwargs):
+        '''
+        Save the group message, allocating the next sequence number of the group to a new message.
+        '''
+
+        if self._state.adding and not self.seq:
+            with transaction.atomic():
+                self.seq = self.group.allocate_message_seq(self.message.author)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+    def is_author(self, user):
+        return self.message.author == user
+
+    def get_message(self):
+        if self.message.message_type == 'T':
+            return self.message.textmessage
+        elif self.message.message_type == 'I':
+            return self.message.imagemessage
+        else:
+            return None
@@ -0,0 +1,8 @@
+from django.urls import path
+from .consumers import GroupChatConsumer
+
+app_name = 'group_chat'
+
+websocket_urlpatterns = [
+    path('ws/group/<uuid:group_id>/', GroupChatConsumer.as_asgi()),
+]
@@ -1,2 +1,89 @@
+from django.db import transaction
 from django.db.models import signals
-from django.dispatch import receiver
\ No newline at end of file
+from django.dispatch import receiver
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+import asyncio
+
+from .models import GroupChatMessage
+
+
+async def group_send_to_shards(channel_layer, group_names, event):
+    '''
+    Function to send the same event to all the shards of a group concurrently (a single call to the event loop)
+    '''
+
+    await asyncio.gather(*[channel_layer.group_send(group_name, event) for group_name in group_names])
+
+
+def send_navbar_subscriptions(group, users, subscribe=True):
+    '''
+    Function to add (or remove) the navbars connected of the users to the navbar channel group of their delivery shard in a group
+
+    Notes:
+        - The navbars are added to the groups of the user when they connect, so the navbars connected when the user
+          joins or leaves a group are updated by this event.
+        - The sends to the navbars of the users are batched in a single call.
+    '''
+
+    channel_layer = get_channel_layer()
+    event_type = "navbar_groupchat_subscribe" if subscribe else "navbar_groupchat_unsubscribe"
+
+    async def send_subscriptions():
+        await asyncio.gather(*[
+            channel_layer.group_send(f"user_{user.id}_navbar", {
+                "type": event_type,
+                "group_name": group.get_navbar_channel_group_name(group.get_delivery_shard(user)),
+            })
+            for user in users
+        ])
+
+    async_to_sync(send_subscriptions)()
+
+
+@receiver(signals.post_save, sender=GroupChatMessage)
+def group_chat_message_post_save(sender, instance, created, **kwargs):
+    '''
+    Signal to send the new message to the group
+
+    Notes:
+        - The message is sent once to each delivery shard of the conversation (and of the navbars of the members),
+          instead of once per member, and the sends of the shards are batched in a single call.
+        - The unviewed messages of the members are given by the watermarks, so no member row is updated
+          (the unviewed messages of the members that are not online are only computed when they are requested).
+        - The cached navbar state of the members is not invalidated (it expires in settings.NAVBAR_STATE_CACHE_TIMEOUT),
+          the navbars connected are updated by the navbar event.
+        - The message is sent when the transaction that created it is committed, the consumers load it from another connection
+          (and a message rolled back is never sent).
+    '''
+
+    if not created:
+        return
+
+    channel_layer = get_channel_layer()
+    group = instance.group
+    group_names = group.get_channel_group_names()
+    navbar_group_names = group.get_navbar_channel_group_names()
+    message_event = {
+        "type": "send_group_message_create",
+        "group_id": str(instance.group_id),
+        "group_message_id": instance.message_id,
+        "group_message_type": instance.message.message_type,
+        "group_message_author_id": instance.message.author_id,
+        "group_message_seq": instance.seq,
+    }
+    navbar_event = {
+        "type": "navbar_groupchat_unviewed_messages",
+        "group_id": str(instance.group_id),
+        "author_id": instance.message.author_id,
+        "value": True,
+    }
+
+    def send_message():
+        # Send message to the members connected in the group
+        async_to_sync(group_send_to_shards)(channel_layer, group_names, message_event)
+        # Send message to the navbar of the members
+        async_to_sync(group_send_to_shards)(channel_layer, navbar_group_names, navbar_event)
+
+    transaction.on_commit(send_message)
@@ -0,0 +1,20 @@
+import factory
+from apps.user.tests.factories import UserFactory
+from apps.group_chat.models import GroupChat, GroupChatMember, GroupChatMessage
+
+
+class GroupChatFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = GroupChat
+
+    name = factory.Sequence(lambda n: f'Group {n}')
+    creator = factory.SubFactory(UserFactory)
+
+
+
+class GroupChatMemberFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = GroupChatMember
+
+    group = factory.SubFactory(GroupChatFactory)
+    user = factory.SubFactory(UserFactory)
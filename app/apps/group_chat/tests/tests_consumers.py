@@ -0,0 +1,185 @@
+from django.test import TransactionTestCase
+from django.core.cache import cache
+from django.db import connection
+
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync, sync_to_async
+import uuid
+
+from .factories import UserFactory, GroupChatFactory, GroupChatMessage
+from apps.group_chat.consumers import GroupChatConsumer
+from telezap_django.consumers import NavBarConsumer
+
+
+class GroupChatConsumerDeliveryTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='group_consumer_user1')
+        self.user2 = UserFactory(username='group_consumer_user2')
+        self.group = GroupChatFactory(name='Grupo', creator=self.user1)
+        self.group.add_members(self.user1, is_admin=True)
+        self.group.add_members(self.user2)
+
+
+    def send_message(self):
+        try:
+            return self.group.new_message(author=self.user1, message_type='T', text='Olá')
+        finally:
+            connection.close()
+
+
+    def test_member_receives_committed_message(self):
+        '''
+        Description:
+            This test verifies that a member connected in a group receives a message sent by another member,
+            loaded by the consumer from its own connection after the message is committed.
+
+        Pre-conditions:
+            - A member is connected in the group.
+            - Another member sends a text message to the group.
+
+        Post-conditions:
+            - The connected member must receive the rendered message, with its sequence number.
+        '''
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(GroupChatConsumer.as_asgi(), f'/ws/group/{self.group.id}/')
+            communicator.scope['user'] = self.user2
+            communicator.scope['url_route'] = {'kwargs': {'group_id': self.group.id}}
+            connected, _ = await communicator.connect()
+            # the message is created in another thread (and database connection) than the one of the consumer
+            group_message, _ = await sync_to_async(self.send_message, thread_sensitive=False)()
+            frame = await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+            return connected, group_message, frame
+
+        connected, group_message, frame = async_to_sync(connect_and_receive)()
+
+        self.assertTrue(connected)
+        self.assertEqual(frame['type'], 'create')
+        self.assertEqual(frame['group_id'], str(self.group.id))
+        self.assertEqual(frame['group_message_id'], group_message.message_id)
+        self.assertEqual(frame['seq'], group_message.seq)
+        self.assertIn('Olá', frame['template'])
+        self.assertTrue(GroupChatMessage.objects.filter(pk=group_message.pk).exists())
+
+
+    def test_member_sends_message(self):
+        '''
+        Description:
+            This test verifies that a member sends a text message through the group websocket and that a resent message is not duplicated.
+
+        Pre-conditions:
+            - A member is connected in the group.
+            - The member sends a text message with a client id, then resends it with the same client id, then sends an invalid frame.
+
+        Post-conditions:
+            - The first message must be acknowledged as created, with its sequence number.
+            - The resent message must be acknowledged as not created, with the same message.
+            - The invalid frame must be answered with a nack.
+            - Only one message must be created in the group.
+        '''
+
+        client_id = str(uuid.uuid4())
+
+        async def connect_and_send():
+            communicator = WebsocketCommunicator(GroupChatConsumer.as_asgi(), f'/ws/group/{self.group.id}/')
+            communicator.scope['user'] = self.user1
+            communicator.scope['url_route'] = {'kwargs': {'group_id': self.group.id}}
+            await communicator.connect()
+            frames = []
+            for frame in (
+                {'type': 'send_message', 'message_type': 'T', 'text': 'Olá', 'client_id': client_id},
+                {'type': 'send_message', 'message_type': 'T', 'text': 'Olá', 'client_id': client_id},
+                {'type': 'unknown'},
+            ):
+                await communicator.send_json_to(frame)
+                # the acks and nacks are answered to the sender only, the messages created are sent to the group too
+                while True:
+                    received = await communicator.receive_json_from(timeout=5)
+                    if received['type'] in ('ack', 'nack'):
+                        frames.append(received)
+                        break
+            await communicator.disconnect()
+            return frames
+
+        created, resent, invalid = async_to_sync(connect_and_send)()
+
+        self.assertEqual(created['type'], 'ack')
+        self.assertTrue(created['created'])
+        self.assertEqual(created['client_id'], client_id)
+        self.assertEqual(resent['type'], 'ack')
+        self.assertFalse(resent['created'])
+        self.assertEqual(resent['group_message_id'], created['group_message_id'])
+        self.assertEqual(resent['seq'], created['seq'])
+        self.assertEqual(invalid, {'client_id': None, 'error': 'Mensagem inválida.', 'retry_after': None, 'type': 'nack'})
+        self.assertEqual(GroupChatMessage.objects.filter(group=self.group).count(), 1)
+
+
+    def test_navbar_of_member_viewing_the_group(self):
+        '''
+        Description:
+            This test verifies that the navbar of a member connected in a group does not show the messages of the group as unviewed.
+
+        Pre-conditions:
+            - A member is connected in the group and in the navbar.
+            - Another member sends a text message to the group.
+
+        Post-conditions:
+            - The member must receive the message in the group.
+            - The navbar of the member must not receive the unviewed messages event.
+        '''
+
+        async def connect_and_receive():
+            navbar = WebsocketCommunicator(NavBarConsumer.as_asgi(), '/ws/navbar/')
+            navbar.scope['user'] = self.user2
+            await navbar.connect()
+            communicator = WebsocketCommunicator(GroupChatConsumer.as_asgi(), f'/ws/group/{self.group.id}/')
+            communicator.scope['user'] = self.user2
+            communicator.scope['url_route'] = {'kwargs': {'group_id': self.group.id}}
+            await communicator.connect()
+            await sync_to_async(self.send_message, thread_sensitive=False)()
+            frame = await communicator.receive_json_from(timeout=5)
+            navbar_received_nothing = await navbar.receive_nothing(timeout=0.5)
+            await communicator.disconnect()
+            await navbar.disconnect()
+            return frame, navbar_received_nothing
+
+        frame, navbar_received_nothing = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(frame['type'], 'create')
+        self.assertTrue(navbar_received_nothing)
+
+
+    def test_navbar_of_new_member(self):
+        '''
+        Description:
+            This test verifies that the navbar connected of a user receives the messages of a group he joins.
+
+        Pre-conditions:
+            - A user that is not a member of the group is connected in the navbar.
+            - The user is added to the group, then a member sends a text message to the group.
+
+        Post-conditions:
+            - The navbar of the user must receive the unviewed messages event of the group.
+        '''
+
+        user3 = UserFactory(username='group_consumer_user3')
+
+        async def connect_and_receive():
+            navbar = WebsocketCommunicator(NavBarConsumer.as_asgi(), '/ws/navbar/')
+            navbar.scope['user'] = user3
+            await navbar.connect()
+            await sync_to_async(self.group.add_members)(user3)
+            # wait the navbar to be added to the navbar channel group of the group
+            await navbar.receive_nothing(timeout=0.2)
+            await sync_to_async(self.send_message, thread_sensitive=False)()
+            frame = await navbar.receive_json_from(timeout=5)
+            await navbar.disconnect()
+            return frame
+
+        frame = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(frame['type'], 'navbar_groupchat_unviewed_messages')
+        self.assertEqual(frame['group_id'], str(self.group.id))
+        self.assertTrue(frame['value'])
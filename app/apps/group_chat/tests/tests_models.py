@@ -0,0 +1,210 @@
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.exceptions import ValidationError
+from django.db import connection
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from unittest import mock
+import uuid
+
+from .factories import (
+    UserFactory,
+    GroupChatFactory,
+    GroupChat,
+    GroupChatMember,
+    GroupChatMessage,
+)
+
+
+class GroupChatTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory(username='group_user1')
+        self.user2 = UserFactory(username='group_user2')
+        self.user3 = UserFactory(username='group_user3')
+        self.group = GroupChatFactory(name='Grupo 1', creator=self.user1)
+        self.group.add_members(self.user1, is_admin=True)
+        self.group.add_members(self.user2)
+
+
+    def test_group_chat_model_add_members_method(self):
+        '''
+        Description:
+            Tests the add_members method of the GroupChat model.
+
+        Pre-conditions:
+            - The group must have messages before the new member is added.
+
+        Post-conditions:
+            - The members already in the group must be ignored.
+            - The watermark of the new member must start at the last message of the group (no unviewed messages).
+        '''
+
+        self.group.new_message(author=self.user1, message_type='T', text='Olá')
+        self.group.add_members(self.user2, self.user3)
+
+        self.assertEqual(GroupChatMember.objects.filter(group=self.group).count(), 3)
+        self.assertTrue(self.group.is_member(self.user3))
+        self.assertFalse(GroupChatMember.objects.get(group=self.group, user=self.user2).is_admin)
+        self.assertEqual(self.group.get_amount_of_unviewed_messages(self.user3), 0)
+
+
+    def test_group_chat_model_new_message_method(self):
+        '''
+        Description:
+            Tests the new_message method of the GroupChat model.
+
+        Pre-conditions:
+            - The author must be a member of the group.
+
+        Post-conditions:
+            - The messages must have consecutive sequence numbers.
+            - A message sent again with the same client_id must not be duplicated.
+            - An empty message, an invalid message type or a message of a non member must raise a ValidationError.
+        '''
+
+        client_id = uuid.uuid4()
+        group_message1, created1 = self.group.new_message(author=self.user1, message_type='T', text='Olá', client_id=client_id)
+        group_message2, created2 = self.group.new_message(author=self.user1, message_type='T', text='Olá', client_id=client_id)
+        group_message3, created3 = self.group.new_message(author=self.user2, message_type='T', text='Oi')
+
+        self.assertTrue(created1)
+        self.assertFalse(created2)
+        self.assertTrue(created3)
+        self.assertEqual(group_message1, group_message2)
+        self.assertEqual([group_message1.seq, group_message3.seq], [1, 2])
+        self.assertEqual(GroupChatMessage.objects.filter(group=self.group).count(), 2)
+        self.assertEqual(GroupChat.objects.get(id=self.group.id).last_message_seq, 2)
+
+        with self.assertRaises(ValidationError):
+            self.group.new_message(author=self.user1, message_type='T', text='   ')
+        with self.assertRaises(ValidationError):
+            self.group.new_message(author=self.user1, message_type='X', text='Olá')
+        with self.assertRaises(ValidationError):
+            self.group.new_message(author=self.user3, message_type='T', text='Olá')
+
+
+    def test_group_chat_model_unviewed_messages(self):
+        '''
+        Description:
+            Tests the unviewed messages of the members, given by their watermarks.
+
+        Pre-conditions:
+            - The group must have two members.
+
+        Post-conditions:
+            - The messages of the author must not be unviewed to him.
+            - The messages must be unviewed to the another members until they visualize the group.
+        '''
+
+        for text in ['1', '2', '3']:
+            self.group.new_message(author=self.user1, message_type='T', text=text)
+        self.group.refresh_from_db()
+
+        self.assertEqual(self.group.get_amount_of_unviewed_messages(self.user1), 0)
+        self.assertEqual(self.group.get_amount_of_unviewed_messages(self.user2), 3)
+        self.assertTrue(self.user2.have_pending_group_messages())
+
+        self.group.update_messages_visualization(self.user2)
+        self.assertEqual(self.group.get_amount_of_unviewed_messages(self.user2), 0)
+        self.assertFalse(self.user2.have_pending_group_messages())
+
+        with self.assertRaises(ValidationError):
+            self.group.get_amount_of_unviewed_messages(self.user3)
+
+
+    def test_group_chat_model_get_messages_method(self):
+        '''
+        Description:
+            Tests the get_messages method of the GroupChat model.
+
+        Pre-conditions:
+            - The group must have messages.
+
+        Post-conditions:
+            - The messages must be returned newest first, with their sequence numbers.
+            - The before and after cursors must return the previous and next messages.
+        '''
+
+        for text in ['1', '2', '3', '4']:
+            self.group.new_message(author=self.user2, message_type='T', text=text)
+
+        self.assertEqual([message.seq for message in self.group.get_messages()], [4, 3, 2, 1])
+        self.assertEqual([message.text for message in self.group.get_messages(limit=2)], ['4', '3'])
+        self.assertEqual([message.seq for message in self.group.get_messages(before_seq=3)], [2, 1])
+        self.assertEqual([message.seq for message in self.group.get_messages(after_seq=1, limit=2)], [3, 2])
+        self.assertEqual(self.group.get_last_message().text, '4')
+
+
+    def test_group_chat_new_message_cost_does_not_grow_with_the_group(self):
+        '''
+        Description:
+            Tests that the fan-out and the unread maintenance of a new message do not grow with the size of the group.
+
+        Pre-conditions:
+            - There must be a small and a big group.
+
+        Post-conditions:
+            - Sending a message to both groups must make the same amount of queries and channel layer group_sends.
+            - Visualizing both groups must make the same amount of queries.
+        '''
+
+        def measure(size):
+            users = [UserFactory() for _ in range(size)]
+            group = GroupChatFactory(creator=users[0])
+            group.add_members(*users)
+            channel_layer = get_channel_layer()
+            with mock.patch.object(channel_layer, 'group_send', wraps=channel_layer.group_send) as group_send:
+                with CaptureQueriesContext(connection) as send_queries, self.captureOnCommitCallbacks(execute=True):
+                    group.new_message(author=users[0], message_type='T', text='Olá')
+            with CaptureQueriesContext(connection) as read_queries:
+                group.update_messages_visualization(users[-1])
+            return len(send_queries), group_send.call_count, len(read_queries)
+
+        small_group = measure(5)
+        big_group = measure(50)
+
+        self.assertEqual(small_group, big_group)
+        self.assertEqual(small_group[1], 2)
+
+
+    @override_settings(GROUP_CHAT_DELIVERY_SHARD_SIZE=2, GROUP_CHAT_DELIVERY_MAX_SHARDS=3)
+    def test_group_chat_delivery_shards(self):
+        '''
+        Description:
+            Tests the sharded delivery of the messages of a group.
+
+        Pre-conditions:
+            - The group must have more members than a delivery shard.
+
+        Post-conditions:
+            - The group must have one delivery shard per GROUP_CHAT_DELIVERY_SHARD_SIZE members, up to GROUP_CHAT_DELIVERY_MAX_SHARDS.
+            - The amount of shards must not decrease when a member leaves the group.
+            - A new message must be sent once per shard and reach a member connected in his shard.
+        '''
+
+        self.group.add_members(self.user3)
+        self.assertEqual(GroupChat.objects.get(id=self.group.id).delivery_shards, 2)
+        self.group.add_members(*[UserFactory() for _ in range(5)])
+        self.assertEqual(GroupChat.objects.get(id=self.group.id).delivery_shards, 3)
+        self.group.remove_member(self.user3)
+        self.group.update_delivery_shards()
+        self.assertEqual(GroupChat.objects.get(id=self.group.id).delivery_shards, 3)
+
+        group = GroupChat.objects.get(id=self.group.id)
+        shard = group.get_delivery_shard(self.user2)
+        self.assertIn(shard, range(3))
+        self.assertEqual(len(set(group.get_channel_group_names())), 3)
+
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(group.get_channel_group_name(shard), channel_name)
+        with mock.patch.object(channel_layer, 'group_send', wraps=channel_layer.group_send) as group_send:
+            with self.captureOnCommitCallbacks(execute=True):
+                group_message, _ = group.new_message(author=self.user1, message_type='T', text='Olá')
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        async_to_sync(channel_layer.group_discard)(group.get_channel_group_name(shard), channel_name)
+
+        self.assertEqual(group_send.call_count, 2 * 3)
+        self.assertEqual(event['type'], 'send_group_message_create')
+        self.assertEqual(event['group_message_seq'], group_message.seq)
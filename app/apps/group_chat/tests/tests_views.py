@@ -0,0 +1,200 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.conf import settings
+
+from apps.user.signals import user_logged_out_callback, user_logged_in_callback
+from .factories import (
+    UserFactory,
+    GroupChatFactory,
+    GroupChat,
+    GroupChatMessage,
+)
+import json
+
+
+# Desabilita os signals de login e logout para que os testes não sejam afetados
+user_logged_in.disconnect(user_logged_in_callback)
+user_logged_out.disconnect(user_logged_out_callback)
+
+
+class GroupChatViewsTest(TestCase):
+    def setUp(self):
+        self.user_data = {
+            'user1': {
+                'username': 'test_user1',
+                'password': 'user1@12345',
+            },
+            'user2': {
+                'username': 'test_user2',
+                'password': 'user2@12345',
+            },
+            'user3': {
+                'username': 'test_user3',
+                'password': 'user3@12345',
+            },
+        }
+        self.user1 = UserFactory(**self.user_data['user1'])
+        self.user2 = UserFactory(**self.user_data['user2'])
+        self.user3 = UserFactory(**self.user_data['user3'])
+        self.user1.friends.add(self.user2)
+        self.group = GroupChatFactory(name='Grupo 1', creator=self.user1)
+        self.group.add_members(self.user1, is_admin=True)
+        self.group.add_members(self.user2)
+
+
+    def test_create_group_view_success(self):
+        '''
+        Description:
+            This test verifies that the create_group view creates a group with the user and his friends
+
+        Pre-conditions:
+            - User is logged in
+            - User has a friend
+
+        Post-conditions:
+            - User is redirected to the new group
+            - The user is the admin of the group
+            - Only the friends of the user are added to the group
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        response = self.client.post(reverse('group_chat:create_group'), {
+            'name': 'Novo grupo',
+            'members': [self.user2.slug, self.user3.slug],
+        })
+        group = GroupChat.objects.get(name='Novo grupo')
+
+        self.assertRedirects(response, reverse('group_chat:group_chat', kwargs={'id': group.id}))
+        self.assertTrue(group.memberships.get(user=self.user1).is_admin)
+        self.assertTrue(group.is_member(self.user2))
+        self.assertFalse(group.is_member(self.user3))
+
+        self.client.logout()
+
+
+    @override_settings(GROUP_CHAT_HEADER_MEMBERS=1)
+    def test_group_chat_view_members_capped(self):
+        '''
+        Description:
+            This test verifies that the group view shows only the first members of the group and the amount of the another members
+
+        Pre-conditions:
+            - User is logged in
+            - User is a member of a group with more members than settings.GROUP_CHAT_HEADER_MEMBERS
+
+        Post-conditions:
+            - Only the first member of the group is in the context
+            - The amount of the another members is shown in the header
+        '''
+
+        self.group.add_members(self.user3)
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        response = self.client.get(reverse('group_chat:group_chat', kwargs={'id': self.group.id}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['members'], [self.user1])
+        self.assertEqual(response.context['other_members_count'], 2)
+        self.assertContains(response, 'e mais 2')
+
+        self.client.logout()
+
+
+    def test_group_chat_view_not_member(self):
+        '''
+        Description:
+            This test verifies that a user that is not a member of the group can not access it
+
+        Pre-conditions:
+            - User is logged in
+            - User is not a member of the group
+
+        Post-conditions:
+            - The group view redirects the user to the groups page
+            - The get_group_messages view returns status code 403
+        '''
+
+        self.client.login(username=self.user3.email, password=self.user_data['user3']['password'])
+
+        response = self.client.get(reverse('group_chat:group_chat', kwargs={'id': self.group.id}))
+        self.assertRedirects(response, reverse('group_chat:groups'))
+
+        response = self.client.get(reverse('group_chat:get_group_messages', kwargs={'id': self.group.id}))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.logout()
+
+
+    def test_get_group_messages_view_with_seq_cursors(self):
+        '''
+        Description:
+            This test verifies that the get_group_messages view works correctly with the before/after sequence number cursors
+
+        Pre-conditions:
+            - User is logged in
+            - The group has more messages than the pagination limit
+
+        Post-conditions:
+            - Without cursors the last messages are returned and the messages are visualized by the user
+            - The before cursor must return the previous messages (newest first)
+            - The after cursor must return the next messages (newest first)
+        '''
+
+        total_messages = settings.MESSAGES_PAGINATION + 5
+        for index in range(total_messages):
+            self.group.new_message(author=self.user2, message_type='T', text=f'Mensagem {index}')
+        url = reverse('group_chat:get_group_messages', kwargs={'id': self.group.id})
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        response = self.client.get(url)
+        data = json.loads(response.content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [message['seq'] for message in data['message_list']],
+            list(range(total_messages, total_messages - settings.MESSAGES_PAGINATION, -1))
+        )
+        self.assertEqual(data['has_next'], True)
+        self.assertEqual(data['last_message_seq'], total_messages)
+        self.assertEqual(self.group.get_last_read_seq(self.user1), total_messages)
+
+        response = self.client.get(url + '?before=4')
+        data = json.loads(response.content)
+        self.assertEqual([message['seq'] for message in data['message_list']], [3, 2, 1])
+        self.assertEqual(data['has_next'], False)
+
+        response = self.client.get(url + f'?after={total_messages - 2}')
+        data = json.loads(response.content)
+        self.assertEqual([message['seq'] for message in data['message_list']], [total_messages, total_messages - 1])
+
+        self.client.logout()
+
+
+    def test_new_group_message_view_success(self):
+        '''
+        Description:
+            This test verifies that the new_group_message view creates a message in the group
+
+        Pre-conditions:
+            - User is logged in
+            - User is a member of the group
+
+        Post-conditions:
+            - The view returns status code 204
+            - The message is created once, even if it is sent again with the same client_id
+        '''
+
+        self.client.login(username=self.user2.email, password=self.user_data['user2']['password'])
+
+        url = reverse('group_chat:new_group_message', kwargs={'id': self.group.id})
+        data = {'message_type': 'T', 'text': 'Olá', 'client_id': '3f0b8c4e-5f53-4c8e-9b1a-2d7c6f3a9e10'}
+        response1 = self.client.post(url, data)
+        response2 = self.client.post(url, data)
+
+        self.assertEqual(response1.status_code, 204)
+        self.assertEqual(response2.status_code, 204)
+        self.assertEqual(GroupChatMessage.objects.filter(group=self.group).count(), 1)
+
+        self.client.logout()
@@ -4,5 +4,10 @@ from . import views
 app_name = 'group_chat'
 
 urlpatterns = [
-
-]
\ No newline at end of file
+    path('', views.groups, name='groups'),
+    path('criar/', views.create_group, name='create_group'),
+    path('<uuid:id>/', views.group_chat, name='group_chat'),
+    path('<uuid:id>/leave/', views.leave_group, name='leave_group'),
+    path('<uuid:id>/messages/', views.get_group_messages, name='get_group_messages'),
+    path('<uuid:id>/message/', views.new_group_message, name='new_group_message'),
+]
@@ -1,3 +1,289 @@
-from django.shortcuts import render
+from django.contrib import messages
+from django.contrib.messages import constants
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth import get_user_model
 
-# Create your views here.
+import math
+
+from apps.chat.views import get_client_id
+from apps.rendering import get_message_template
+from apps.chat.ratelimit import check_message_rate_limit
+from apps.utils import get_all_emojis, get_message_separator
+from .models import GroupChat, GroupChatMember
+
+User = get_user_model()
+
+
+async def ais_user_connected_in_group_chat(user_id, group_id):
+    '''
+    Function to check if a user is connected in a group, using the async ORM.
+
+    Args:
+        user_id (int): The id of the user.
+        group_id (str|uuid): The id of the group.
+
+    Returns:
+        bool: True if the user is connected in the group, False otherwise.
+
+    Notes:
+        - The groups the user is connected in are set by the GroupChatConsumer (set_UserInGroupChat) in the database,
+          so the check works with any channel layer and for the consumers of all the processes.
+    '''
+
+    in_groupchat = await User.objects.filter(id=user_id).values_list('in_groupchat', flat=True).afirst()
+    return str(group_id) in (in_groupchat or '').split('|')
+
+
+@login_required
+def groups(request):
+    '''
+    View to list all groups of the user.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        render: The render of the template with the groups.
+
+    Context:
+        memberships (QuerySet): The memberships of the user, with the group.
+        membership:
+            - group (GroupChat): The group.
+            - get_amount_of_unviewed_messages (int): The amount of unviewed messages in the group.
+
+    Notes:
+        - The groups are listed with a single query, the unviewed messages are given by the watermark of the user.
+    '''
+
+    memberships = GroupChatMember.objects.filter(
+        user=request.user
+    ).select_related('group').order_by('-group__last_message_seq', 'group__name')
+
+    context = {
+        'memberships': memberships,
+    }
+    return render(request, 'group_chat/group_list.html', context=context)
+
+
+@login_required
+def create_group(request):
+    '''
+    View to create a new group with friends of the user.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        HttpResponseRedirect: Redirect the user to the new group, or to the groups page if the group is invalid.
+
+    Notes:
+        - The user is the admin of the new group.
+        - Only the friends of the user can be added to the group.
+        - If the method is GET the user will be redirected to the groups page.
+    '''
+
+    if request.method == 'POST':
+        name = request.POST.get('name', '').strip()
+        # Verify if the group has a name
+        if not name:
+            messages.add_message(request, constants.ERROR, 'O grupo deve ter um nome.')
+            return HttpResponseRedirect(reverse('group_chat:groups'))
+
+        # Create the group with the user as admin and the selected friends as members
+        group = GroupChat.objects.create(name=name[:100], creator=request.user)
+        group.add_members(request.user, is_admin=True)
+        group.add_members(*request.user.friends.filter(slug__in=request.POST.getlist('members')))
+        messages.add_message(request, constants.SUCCESS, f'Grupo {group.name} criado com sucesso!')
+        return HttpResponseRedirect(reverse('group_chat:group_chat', kwargs={'id': group.id}))
+
+    # Return the user to the groups page if the method is not POST
+    return HttpResponseRedirect(reverse('group_chat:groups'))
+
+
+@login_required
+def group_chat(request, id):
+    '''
+    View to show the requested group.
+
+    Args:
+        request (HttpRequest): The request object.
+        id (uuid): The id of the group.
+
+    Returns:
+        render: The render of the template with the group.
+
+    Context:
+        - group (GroupChat): The group.
+        - members (QuerySet): The first members of the group (up to settings.GROUP_CHAT_HEADER_MEMBERS).
+        - other_members_count (int): The amount of the another members of the group.
+        - emojis (list): A list of emojis.
+
+    Notes:
+        - The group is only shown if the user is a member of the group.
+        - The members are capped, so the header of a group with thousands of members does not load all of them.
+    '''
+
+    # Get the group
+    group = get_object_or_404(GroupChat, id=id)
+
+    # Check if the user is a member of the group
+    if not group.is_member(request.user):
+        messages.add_message(request, constants.ERROR, 'Você não tem permissão para acessar este grupo.')
+        return HttpResponseRedirect(reverse('group_chat:groups'))
+
+    # Get the first members of the group and the amount of the another ones
+    members = list(group.members.order_by('group_chat_memberships__date')[:settings.GROUP_CHAT_HEADER_MEMBERS])
+    other_members_count = max(0, group.memberships.count() - len(members))
+
+    context = {
+        'group': group,
+        'members': members,
+        'other_members_count': other_members_count,
+        'emojis': get_all_emojis(),
+    }
+    return render(request, 'group_chat/group_chat.html', context=context)
+
+
+@login_required
+def get_group_messages(request, id):
+    '''
+    View to get the messages of a group.
+
+    Args:
+        request (HttpRequest): The request object.
+        id (uuid): The id of the group.
+
+    Returns:
+        JsonResponse: A json response with the messages of the group.
+
+    Query parameters:
+        - before: Get the messages before this sequence number (cursor to load older messages).
+        - after: Get the messages after this sequence number (cursor to load missed messages, e.g. after a reconnect).
+
+    Context:
+        message_list (list): A list of dictionaries containing the message and the separator.
+        message dictionaries:
+            - template (str): The template of the message.
+            - separator (str): The separator of the message.
+            - seq (int): The sequence number of the message in the group.
+        has_next (bool): True if there are older (before) or newer (after) messages to load.
+        last_message_seq (int): The sequence number of the last message of the group.
+
+    Notes:
+        - Only settings.MESSAGES_PAGINATION messages are loaded, newest first.
+        - Without cursors the last messages are loaded and the messages of the group are visualized by the user.
+        - The user can only get the messages of a group if he is a member of the group.
+    '''
+
+    group = get_object_or_404(GroupChat, id=id)
+
+    # Check if the user is a member of the group
+    if not group.is_member(request.user):
+        return JsonResponse({"error": 'Você não tem permissão para receber as mensagens desse grupo.'}, status=403)
+
+    # Get the sequence number cursors
+    try:
+        before_seq = int(request.GET["before"]) if request.GET.get("before") else None
+        after_seq = int(request.GET["after"]) if request.GET.get("after") else None
+    except ValueError:
+        return JsonResponse({"message_list":None, "has_next":False, "last_message_seq":group.last_message_seq})
+
+    messages_per_page = settings.MESSAGES_PAGINATION
+    # Get one more message than the page to know if there are more messages (and to get the separator of the last one)
+    messages_list = group.get_messages(before_seq=before_seq, after_seq=after_seq, limit=messages_per_page + 1)
+    if not messages_list:
+        return JsonResponse({"message_list":None, "has_next":False, "last_message_seq":group.last_message_seq})
+
+    has_next = len(messages_list) > messages_per_page
+    if after_seq is not None:
+        # The newest message is the extra one, the separator of the oldest message is given by the client
+        page_messages = messages_list[-messages_per_page:]
+        separators_messages = page_messages + [None]
+    else:
+        page_messages = messages_list[:messages_per_page]
+        separators_messages = messages_list if has_next else messages_list + [None]
+
+    # The newest messages are visualized by the user
+    if before_seq is None:
+        group.update_messages_visualization(request.user)
+
+    message_data_list = []
+    for index, msg in enumerate(page_messages):
+        previous_msg = separators_messages[index+1]
+        message_data_list.append({
+            'template': str(get_message_template(request.user, msg)),
+            'separator': get_message_separator(msg.date, previous_msg.date) if previous_msg is not None else None,
+            'seq': msg.seq,
+        })
+
+    return JsonResponse({"message_list":message_data_list, "has_next":has_next, "last_message_seq":group.last_message_seq})
+
+
+@login_required
+def new_group_message(request, id):
+    '''
+    View to create a new message in a group.
+
+    Args:
+        request (HttpRequest): The request object.
+        id (uuid): The id of the group.
+
+    Returns:
+        HttpResponse: A http response with status 204 if the message was created, 400 (with the error) if the message is invalid, 404 if the group was not found or 429 (with the Retry-After header) if the user sent too many messages.
+
+    Notes:
+        - The user can only create a new message in a group if he is a member of the group.
+        - The text messages are sent through the group websocket (GroupChatConsumer.receive), this view is used by the images and as fallback.
+    '''
+
+    group = get_object_or_404(GroupChat, id=id)
+
+    if request.method == 'POST':
+        client_id = get_client_id(request.POST.get('client_id'))
+        # Verify if the user can send a new message (rate limit), otherwise return when he can send it again
+        # A message resent with the client id of a stored message does not take a token
+        if client_id is None or group.get_message_by_client_id(client_id) is None:
+            retry_after = check_message_rate_limit(request.user.id, group.id)
+            if retry_after > 0:
+                return HttpResponse(status=429, headers={'Retry-After': str(math.ceil(retry_after))})
+        try:
+            group.new_message(
+                author=request.user,
+                message_type=request.POST.get('message_type'),
+                text=request.POST.get('text'),
+                image=request.FILES.get('image'),
+                client_id=client_id,
+            )
+        except ValidationError as error:
+            # If the message is invalid, return the error message (the text is given back to the user)
+            return JsonResponse({'error': error.messages[0]}, status=400)
+        return HttpResponse(status=204)
+    return HttpResponse(status=200)
+
+
+@login_required
+def leave_group(request, id):
+    '''
+    View to leave a group.
+
+    Args:
+        request (HttpRequest): The request object.
+        id (uuid): The id of the group.
+
+    Returns:
+        HttpResponseRedirect: Redirect the user to the groups page.
+
+    Notes:
+        - If the method is GET the user will be redirected to the groups page.
+    '''
+
+    group = get_object_or_404(GroupChat, id=id)
+    if request.method == 'POST':
+        group.remove_member(request.user)
+        messages.add_message(request, constants.SUCCESS, f'Você saiu do grupo {group.name}.')
+    return HttpResponseRedirect(reverse('group_chat:groups'))
@@ -0,0 +1,124 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+import json, logging, queue, threading
+
+logger = logging.getLogger(__name__)
+
+_install_lock = threading.Lock()
+
+
+def install_execute_wrapper(execute_wrapper, dispatch_uid):
+    '''
+    Function to add a database execute wrapper to the connections of the process, the initialized ones and the next ones (connection_created signal)
+
+    Parameters:
+        execute_wrapper (function): The execute wrapper (see connection.execute_wrapper)
+        dispatch_uid (str): The id of the receiver of the signal, so the wrapper is installed once per process
+    '''
+
+    def add_execute_wrapper(connection, **kwargs):
+        if execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(execute_wrapper)
+
+    with _install_lock:
+        # weak=False, so the receiver (a closure) is not garbage collected
+        connection_created.connect(add_execute_wrapper, dispatch_uid=dispatch_uid, weak=False)
+        # the connections created before the signal was connected
+        for connection in connections.all(initialized_only=True):
+            add_execute_wrapper(connection)
+
+
+def get_view_name(request, default='none'):
+    '''
+    Function to get the view name of a request, resolved after the middlewares
+
+    Parameters:
+        request (HttpRequest): The request
+        default (str): The name of the requests not resolved to a view (e.g. 404)
+
+    Returns:
+        str: The view name (with the namespace) or the default
+    '''
+
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match is not None else default
+
+
+def write_json_lines(path, items):
+    '''
+    Function to append items to a file, a JSON line per item
+
+    Parameters:
+        path (str): The path of the file
+        items (list): The items (JSON serializable)
+    '''
+
+    with open(path, 'a') as file:
+        file.writelines(json.dumps(item) + '\n' for item in items)
+
+
+
+class BackgroundWriter:
+    '''
+    Writer of items in batches, in a background thread (so the event loop and the requests do not wait for it)
+
+    Notes:
+        - The subclasses write a batch in write_batch; the errors of a batch are logged and its items are dropped.
+        - If the queue of the items to write is full, the new items are dropped.
+    '''
+
+    def __init__(self, name, queue_size, batch_size=None):
+        self.name = name
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            pass
+
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            while self.batch_size is None or len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(items)
+            except Exception:
+                logger.exception('%s could not write %s items', self.name, len(items))
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+
+    def flush(self):
+        # wait for the items put until now to be written
+        self.queue.join()
+
+
+    def write_batch(self, items):
+        raise NotImplementedError
+
+
+
+class JSONLinesWriter(BackgroundWriter):
+    '''
+    Background writer of items to a file, a JSON line per item
+    '''
+
+    def __init__(self, path, name, queue_size, batch_size=None):
+        self.path = path
+        super().__init__(name, queue_size, batch_size)
+
+
+    def write_batch(self, items):
+        write_json_lines(self.path, items)
@@ -0,0 +1,150 @@
+from django.core.exceptions import ObjectDoesNotExist
+
+from apps.chat.models import Chat, TextMessage, ImageMessage
+from apps.group_chat.models import GroupChat
+from apps.notification.feed import get_feed_queryset, get_concrete_notification
+from apps.notification.models import FriendshipRequest, GroupRequest
+
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+import asyncio
+
+T = TypeVar('T')
+
+# The loads in flight of each event loop, by their keys (the loads are not cached after they are finished)
+_in_flight = {}
+
+
+async def coalesce(key, load: Callable[[], Awaitable[T]]) -> T:
+    '''
+    Function to run a load once for all the concurrent callers asking for the same key
+
+    Parameters:
+        key (tuple): The key of the load, e.g. ('chat', <id>)
+        load (callable): A coroutine function that runs the load (a single query)
+
+    Returns:
+        The result of the load
+
+    Notes:
+        - The callers arriving while the load is in flight await the same task, so they trigger one fetch.
+        - The result is not cached after the load is finished, so the next caller gets the row again.
+        - A caller cancelled while waiting does not cancel the load of the another callers.
+    '''
+
+    key = (asyncio.get_running_loop(), *key)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(load())
+        _in_flight[key] = task
+        # remove the load from the loads in flight when it is finished
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def aget_or_none(queryset, **kwargs):
+    '''
+    Function to get an object of a queryset with a single query
+
+    Parameters:
+        queryset (QuerySet): The queryset of the object
+        kwargs: The lookups of the object
+
+    Returns:
+        Model|None: The object, None if it does not exist
+    '''
+
+    try:
+        return await queryset.aget(**kwargs)
+    except ObjectDoesNotExist:
+        return None
+
+
+async def load_text_message(id) -> Optional[TextMessage]:
+    '''
+    Function to load a text message with its author
+
+    Parameters:
+        id (int): The id of the message
+
+    Returns:
+        TextMessage|None: The message, None if it does not exist
+    '''
+
+    return await coalesce(
+        ('text_message', str(id)),
+        lambda: aget_or_none(TextMessage.objects.select_related('author'), id=id)
+    )
+
+
+async def load_image_message(id) -> Optional[ImageMessage]:
+    '''
+    Function to load an image message with its author
+
+    Parameters:
+        id (int): The id of the message
+
+    Returns:
+        ImageMessage|None: The message, None if it does not exist
+    '''
+
+    return await coalesce(
+        ('image_message', str(id)),
+        lambda: aget_or_none(ImageMessage.objects.select_related('author'), id=id)
+    )
+
+
+async def load_chat(id) -> Optional[Chat]:
+    '''
+    Function to load a chat with its users
+
+    Parameters:
+        id (uuid|str): The id of the chat
+
+    Returns:
+        Chat|None: The chat, None if it does not exist
+    '''
+
+    return await coalesce(
+        ('chat', str(id)),
+        lambda: aget_or_none(Chat.objects.select_related('user1', 'user2'), id=id)
+    )
+
+
+async def load_group_chat_of_member(id, user) -> Optional[GroupChat]:
+    '''
+    Function to load a group of a member
+
+    Parameters:
+        id (uuid|str): The id of the group
+        user (User): The member of the group
+
+    Returns:
+        GroupChat|None: The group, None if it does not exist or the user is not a member of it
+    '''
+
+    return await coalesce(
+        ('group_chat_of_member', str(id), user.id),
+        lambda: GroupChat.objects.filter(id=id, memberships__user=user).afirst()
+    )
+
+
+async def load_feed_item(user, id) -> Optional[Union[FriendshipRequest, GroupRequest]]:
+    '''
+    Function to load a friendship or group request of the user's notification feed
+
+    Parameters:
+        user (User): The user who owns the feed
+        id (int): The id of the notification
+
+    Returns:
+        FriendshipRequest|GroupRequest|None: The request, None if it is not visible to the user
+
+    Notes:
+        - The concrete request is loaded in the same query as the notification (get_feed_queryset).
+    '''
+
+    async def load():
+        notification = await get_feed_queryset(user).filter(id=id).afirst()
+        return None if notification is None else get_concrete_notification(notification)
+
+    return await coalesce(('feed_item', user.id, str(id)), load)
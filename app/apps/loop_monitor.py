@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.utils import timezone
+
+from collections import deque
+import asyncio, logging, sys, threading, time, traceback
+
+logger = logging.getLogger(__name__)
+
+# The monitor of the event loop of the process (the ASGI server runs one event loop per process)
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+
+class LoopMonitor:
+    '''
+    Monitor of the lag of an event loop, sampling the stack of whatever blocked the loop past a threshold
+
+    Notes:
+        - A heartbeat task sleeps for settings.LOOP_MONITOR_INTERVAL seconds and records how late it was woken up (the lag).
+        - A watchdog thread verifies the last heartbeat; if the loop is blocked longer than settings.LOOP_MONITOR_THRESHOLD
+          seconds, it samples the stack of the thread of the loop (sys._current_frames), so the blocking call is in the sample.
+        - The stall is logged with its sample when the loop runs again. The last settings.LOOP_MONITOR_MAX_SAMPLES samples are kept.
+        - The overhead is a wake up of the loop and of the watchdog per interval, the stack is only sampled in a stall.
+    '''
+
+    def __init__(self, loop, interval, threshold, max_samples):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+        self.running = False
+        self.loop_thread_id = None
+        self.last_beat = time.monotonic()
+        self.stall_sample = None
+        self.beats = 0
+        self.stalls = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+
+    def start(self):
+        # must be called in the thread of the loop
+        self.running = True
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.heartbeat_task = self.loop.create_task(self.heartbeat())
+        self.watchdog_thread = threading.Thread(target=self.watchdog, name='loop-monitor', daemon=True)
+        self.watchdog_thread.start()
+
+
+    def stop(self):
+        self.running = False
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.heartbeat_task.cancel)
+
+
+    async def heartbeat(self):
+        while self.running:
+            expected_at = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected_at)
+            with self.lock:
+                self.last_beat = now
+                self.beats += 1
+                self.total_lag += lag
+                self.max_lag = max(self.max_lag, lag)
+                sample, self.stall_sample = self.stall_sample, None
+                if sample is not None:
+                    # the loop runs again, so the duration of the stall is known
+                    self.stalls += 1
+                    sample['lag'] = round(lag, 4)
+            if sample is not None:
+                logger.warning('Event loop blocked for %.3fs:\n%s', lag, sample['stack'])
+
+
+    def watchdog(self):
+        while self.running:
+            time.sleep(self.interval)
+            with self.lock:
+                blocked_for = time.monotonic() - self.last_beat - self.interval
+                if blocked_for <= self.threshold or self.stall_sample is not None:
+                    continue
+                # sample the stack of the loop thread once per stall, while it is still blocked
+                frame = sys._current_frames().get(self.loop_thread_id)
+                self.stall_sample = {
+                    'date': timezone.now().isoformat(),
+                    'lag': round(blocked_for, 4),
+                    'stack': ''.join(traceback.format_stack(frame)) if frame is not None else '',
+                }
+                self.samples.append(self.stall_sample)
+
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'running': self.running,
+                'interval': self.interval,
+                'threshold': self.threshold,
+                'beats': self.beats,
+                'stalls': self.stalls,
+                'mean_lag': round(self.total_lag / self.beats, 4) if self.beats else 0.0,
+                'max_lag': round(self.max_lag, 4),
+                'samples': [dict(sample) for sample in self.samples],
+            }
+
+
+
+def start_loop_monitor():
+    '''
+    Function to start the monitor of the running event loop (once per loop)
+
+    Returns:
+        LoopMonitor: The monitor of the running event loop
+    '''
+
+    global _monitor
+    loop = asyncio.get_running_loop()
+    monitor = _monitor
+    if monitor is not None and monitor.loop is loop and monitor.running:
+        return monitor
+    with _monitor_lock:
+        if _monitor is not None and _monitor.loop is loop and _monitor.running:
+            return _monitor
+        # the loop of the monitor was replaced (only in the tests, the ASGI server runs a single loop)
+        if _monitor is not None:
+            _monitor.stop()
+        _monitor = LoopMonitor(
+            loop,
+            interval=settings.LOOP_MONITOR_INTERVAL,
+            threshold=settings.LOOP_MONITOR_THRESHOLD,
+            max_samples=settings.LOOP_MONITOR_MAX_SAMPLES,
+        )
+        _monitor.start()
+    return _monitor
+
+
+def stop_loop_monitor():
+    '''
+    Function to stop the monitor of the event loop of the process
+    '''
+
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            _monitor.stop()
+        _monitor = None
+
+
+def get_loop_monitor_stats():
+    '''
+    Function to get the lag of the event loop of the process and the samples of the stalls
+
+    Returns:
+        dict: If the monitor is enabled and the stats of the monitor (empty if the monitor is not running)
+    '''
+
+    monitor = _monitor
+    return {
+        'enabled': settings.LOOP_MONITOR_ENABLED,
+        **(monitor.get_stats() if monitor is not None else {}),
+    }
+
+
+
+class LoopMonitorMiddleware:
+    '''
+    ASGI middleware to start the monitor of the event loop on the first connection, if settings.LOOP_MONITOR_ENABLED
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if settings.LOOP_MONITOR_ENABLED:
+            start_loop_monitor()
+        return await self.app(scope, receive, send)
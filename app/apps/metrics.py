@@ -0,0 +1,165 @@
+from channels.consumer import get_handler_name
+from channels.layers import get_channel_layer
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+from contextvars import ContextVar
+import functools, os, threading, time
+
+from apps.instrumentation import install_execute_wrapper
+
+
+# The metrics of the process. With the PROMETHEUS_MULTIPROC_DIR environment variable set (before the server starts),
+# the metrics of all the processes of the server are written in that directory and summed by the /metrics endpoint
+HTTP_REQUEST_DURATION = Histogram(
+    'telezap_http_request_duration_seconds',
+    'Latency of the HTTP requests, by view name',
+    ['view', 'method', 'status'],
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'telezap_http_request_queries',
+    'Database queries made by an HTTP request, by view name',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+HTTP_REQUEST_QUERIES_DURATION = Histogram(
+    'telezap_http_request_queries_duration_seconds',
+    'Time spent in the database queries of an HTTP request, by view name',
+    ['view'],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    'telezap_websocket_connections',
+    'Open websocket connections, by consumer',
+    ['consumer'],
+    multiprocess_mode='livesum',
+)
+WEBSOCKET_EVENTS = Counter(
+    'telezap_websocket_events',
+    'Events (websocket frames and channel layer messages) handled by the consumers, by consumer method',
+    ['consumer', 'handler'],
+)
+CHANNEL_LAYER_GROUP_SEND_DURATION = Histogram(
+    'telezap_channel_layer_group_send_duration_seconds',
+    'Latency of the group_sends of the channel layer',
+)
+CHANNEL_LAYER_GROUP_SEND_FAILURES = Counter(
+    'telezap_channel_layer_group_send_failures',
+    'Failed group_sends of the channel layer',
+)
+
+# The database queries of the HTTP request being handled (amount and seconds), shared with the threads of the request
+_request_queries = ContextVar('request_queries', default=None)
+_install_lock = threading.Lock()
+
+
+def get_metrics():
+    '''
+    Function to get the metrics in the Prometheus text format
+
+    Returns:
+        bytes: The metrics of the process, or of all the processes of the server in the multiprocess mode
+    '''
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def start_request_queries():
+    '''
+    Function to start counting the database queries of the HTTP request being handled
+
+    Returns:
+        dict: The amount of queries ('count') and the seconds spent on them ('seconds'), updated as the queries are made
+    '''
+
+    queries = {'count': 0, 'seconds': 0.0}
+    _request_queries.set(queries)
+    return queries
+
+
+def stop_request_queries():
+    '''
+    Function to stop counting the database queries of the HTTP request being handled
+    '''
+
+    _request_queries.set(None)
+
+
+def record_query(execute, sql, params, many, context):
+    '''
+    Database execute wrapper that counts the queries of the HTTP request being handled
+    '''
+
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries['count'] += 1
+        queries['seconds'] += time.perf_counter() - started_at
+
+
+def instrument_group_send(channel_layer):
+    '''
+    Function to record the latency and the failures of the group_sends of a channel layer
+
+    Parameters:
+        channel_layer (BaseChannelLayer): The channel layer (the instance is shared by the process, see get_channel_layer)
+    '''
+
+    if getattr(channel_layer, '_metrics_instrumented', False):
+        return
+    group_send = channel_layer.group_send
+
+    @functools.wraps(group_send)
+    async def instrumented_group_send(group, message):
+        started_at = time.perf_counter()
+        try:
+            return await group_send(group, message)
+        except Exception:
+            CHANNEL_LAYER_GROUP_SEND_FAILURES.inc()
+            raise
+        finally:
+            CHANNEL_LAYER_GROUP_SEND_DURATION.observe(time.perf_counter() - started_at)
+
+    channel_layer.group_send = instrumented_group_send
+    channel_layer._metrics_instrumented = True
+
+
+def install_metrics():
+    '''
+    Function to install the recorders of the metrics (database queries and channel layer), once per process
+    '''
+
+    install_execute_wrapper(record_query, 'metrics_query_recorder')
+    with _install_lock:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            instrument_group_send(channel_layer)
+
+
+
+class MetricsConsumerMixin:
+    '''
+    Mixin of the consumers that records the open websocket connections and the events handled by each consumer method
+    '''
+
+    async def dispatch(self, message):
+        WEBSOCKET_EVENTS.labels(type(self).__name__, get_handler_name(message)).inc()
+        await super().dispatch(message)
+
+    async def accept(self, *args, **kwargs):
+        await super().accept(*args, **kwargs)
+        if not getattr(self, '_metrics_connected', False):
+            self._metrics_connected = True
+            WEBSOCKET_CONNECTIONS.labels(type(self).__name__).inc()
+
+    async def websocket_disconnect(self, message):
+        if getattr(self, '_metrics_connected', False):
+            self._metrics_connected = False
+            WEBSOCKET_CONNECTIONS.labels(type(self).__name__).dec()
+        await super().websocket_disconnect(message)
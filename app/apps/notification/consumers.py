@@ -1,21 +1,23 @@
 import json
 from asgiref.sync import sync_to_async
 from asgiref.sync import async_to_sync
-from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 from django.middleware.csrf import get_token
-from django.contrib.sessions.models import Session
 
-from .models import FriendshipRequest, GroupRequest
-from .serializers import FriendshipRequestSerializer, GroupRequestSerializer
+from apps.loaders import load_feed_item
+from apps.rendering import render_async
+from apps.metrics import MetricsConsumerMixin
+from apps.tracing import TracingConsumerMixin
+from apps.query_inspector import QueryInspectorConsumerMixin
+from apps.traffic import TrafficRecorderConsumerMixin
+from .feed import serialize_feed_item
 
 User = get_user_model()
 
-class NotificationUpdateConsumer(AsyncWebsocketConsumer):
+class NotificationUpdateConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, AsyncWebsocketConsumer):
     '''
     Consumer that handles the notification update.
     '''
@@ -39,21 +41,12 @@ class NotificationUpdateConsumer(AsyncWebsocketConsumer):
 
     async def send_notification_update(self, event):
         if hasattr(self, 'user') and self.user.is_authenticated:
-            notification_id = event['notification_id']
-            notification_type = event['notification_type']
+            # Get the notification from the user's notification feed
+            notification = await load_feed_item(self.user, event['notification_id'])
 
-            # Verify if the notification is a friendship request or a group request
-            if notification_type == "FriendshipRequest":
-                notification = await self.get_FriendshipRequest(notification_id)
-            else:
-                notification = await self.get_GroupRequest(notification_id)
-
-            # Verify if the notification is a friendship request or a group request and get the group id
-            group_id = None if notification_type == "FriendshipRequest" else notification.group
-
-            # Verify if the request user is the author of the notification
-            request_user_is_autor = await sync_to_async(notification.is_author)(self.user)
-            if request_user_is_autor:
+            # Verify if the notification is still visible and if the request user is the author of the notification
+            if notification is not None and notification.is_author(self.user):
+                group_id = notification.group if notification.notification_type == 'G' else None
                 await self.send(text_data=json.dumps({
                     'id': notification.id,
                     'group_id': group_id,
@@ -65,80 +58,20 @@ class NotificationUpdateConsumer(AsyncWebsocketConsumer):
 
     async def send_notification_create(self, event):
         if hasattr(self, 'user') and self.user.is_authenticated:
-            print(event)
-
-            notification_id = event['notification_id']
-            notification_type = event['notification_type']
-
-            # Verify if the notification is a friendship request or a group request
-            if notification_type == "FriendshipRequest":
-                notification = await self.get_FriendshipRequest(notification_id)
-            else:
-                notification = await self.get_GroupRequest(notification_id)
-
-            notification_types = {
-                "FriendshipRequest": {
-                    "serializer": FriendshipRequestSerializer,
-                    "is_group": False,
-                },
-                "GroupRequest": {
-                    "serializer": GroupRequestSerializer,
-                    "is_group": True,
-                },
-            }
-
-            # Get the serializer and the is_group
-            serializer = notification_types[notification_type]['serializer'](notification)
-            is_group = notification_types[notification_type]['is_group']
-
-            # Verify if the request user is the author of the notification
-            request_user_is_author = event['is_author']
-            
-            templates = {
-                True : {
-                    "template": render_to_string('notification/notification_send.html', {'notification': notification, 'is_group':is_group}),
-                    "is_sent": True,
-                },
-                False : {
-                    "template": render_to_string('notification/notification_received.html', {'notification': notification, 'is_group':is_group}),
-                    "is_sent": False,
-                }
-            }
+            # Get the notification from the user's notification feed
+            notification = await load_feed_item(self.user, event['notification_id'])
+            if notification is None:
+                return
 
-            # Get the template and the is_sent
-            template = templates[request_user_is_author]['template']
-            is_sent = templates[request_user_is_author]['is_sent']
+            # Serialize the notification in the same format of the notification feed (rendered out of the event loop)
+            data = await render_async(serialize_feed_item, notification, self.user)
+            data['type'] = 'new'
+            await self.send(text_data=json.dumps(data))
 
+    async def send_notifications_remove(self, event):
+        if hasattr(self, 'user') and self.user.is_authenticated:
+            # Send all the notifications removed from the user's feed in a single message
             await self.send(text_data=json.dumps({
-                'type': 'new',
-                'notification': serializer.data,
-                'template': template,
-                'is_group': is_group,
-                'is_sent': is_sent,
+                'ids': event['notification_ids'],
+                'type': 'remove'
             }))
-    
-    @database_sync_to_async
-    def get_FriendshipRequest(self, id):
-        '''
-        Function that returns the friendship request object.
-        '''
-
-        qs = FriendshipRequest.objects.filter(id=id)
-        if qs.exists():
-            obj = qs.select_related('author','receiver').get(id=id)
-        else:
-            obj = None
-        return obj
-
-    @database_sync_to_async
-    def get_GroupRequest(self, id):
-        '''
-        Function that returns the group request object.
-        '''
-
-        qs = GroupRequest.objects.filter(id=id)
-        if qs.exists():
-            obj = qs.select_related('author','receiver').get(id=id)
-        else:
-            obj = None
-        return obj
\ No newline at end of file
@@ -0,0 +1,208 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from .models import Notification
+from .serializers import FriendshipRequestSerializer, GroupRequestSerializer
+
+from datetime import date
+import base64
+
+
+def get_page_size(page_size=None):
+    '''
+    Function to get a bounded page size for the notification feed
+
+    Parameters:
+        page_size (int|str|None): The page size requested by the client
+
+    Returns:
+        int: The page size between 1 and settings.NOTIFICATIONS_MAX_PAGINATION
+    '''
+
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        return settings.NOTIFICATIONS_PAGINATION
+
+    return max(1, min(page_size, settings.NOTIFICATIONS_MAX_PAGINATION))
+
+
+def encode_cursor(notification):
+    '''
+    Function to encode the keyset cursor of a notification
+
+    Parameters:
+        notification (Notification): The last notification of a page
+
+    Returns:
+        str: An opaque cursor with the date and the id of the notification
+    '''
+
+    raw = f"{notification.date.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    '''
+    Function to decode a keyset cursor of the notification feed
+
+    Parameters:
+        cursor (str): The cursor returned by encode_cursor
+
+    Returns:
+        tuple: The date and the id of the last notification of the previous page
+
+    Raises:
+        ValueError: If the cursor is not valid
+    '''
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        cursor_date, cursor_id = raw.split('|')
+        return date.fromisoformat(cursor_date), int(cursor_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError('Cursor inválido.') from error
+
+
+def get_feed_queryset(user, notification_type=None):
+    '''
+    Function to get the notifications visible to the user, newest first
+
+    Parameters:
+        user (User): The user who owns the feed
+        notification_type (str|None): 'A' to get only friendship requests, 'G' to get only group requests
+
+    Returns:
+        QuerySet: The notifications with the authors, receivers and the concrete request loaded in the same query
+    '''
+
+    queryset = Notification.objects.filter(
+        (Q(author=user) & Q(author_view=True)) |
+        (Q(receiver=user) & Q(receiver_view=True))
+    ).select_related(
+        'author', 'receiver', 'friendshiprequest', 'grouprequest'
+    ).order_by('-date', '-id')
+
+    if notification_type == 'A':
+        queryset = queryset.filter(friendshiprequest__isnull=False)
+    elif notification_type == 'G':
+        queryset = queryset.filter(grouprequest__isnull=False)
+
+    return queryset
+
+
+def get_concrete_notification(notification):
+    '''
+    Function to get the friendship or group request of a base notification loaded by get_feed_queryset
+
+    Parameters:
+        notification (Notification): The base notification
+
+    Returns:
+        FriendshipRequest|GroupRequest|None: The concrete request, None if the notification has no request
+    '''
+
+    for related_name in ('friendshiprequest', 'grouprequest'):
+        try:
+            return getattr(notification, related_name)
+        except ObjectDoesNotExist:
+            continue
+    return None
+
+
+def get_feed_page(user, cursor=None, page_size=None, notification_type=None):
+    '''
+    Function to get a page of the user's notification feed using keyset pagination
+
+    Parameters:
+        user (User): The user who owns the feed
+        cursor (str|None): The cursor of the previous page, None to get the first page
+        page_size (int|str|None): The amount of notifications of the page (bounded by get_page_size)
+        notification_type (str|None): 'A' to get only friendship requests, 'G' to get only group requests
+
+    Returns:
+        dict: The notifications of the page, if the feed has a next page and the cursor of the next page
+
+    Raises:
+        ValueError: If the cursor is not valid
+
+    Notes:
+        - The page is loaded with a single query, whatever the page size is.
+    '''
+
+    page_size = get_page_size(page_size)
+    queryset = get_feed_queryset(user, notification_type=notification_type)
+
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(date__lt=cursor_date) |
+            (Q(date=cursor_date) & Q(id__lt=cursor_id))
+        )
+
+    # Get one more notification than the page size to know if there is a next page
+    notifications = list(queryset[:page_size + 1])
+    has_next = len(notifications) > page_size
+    notifications = notifications[:page_size]
+
+    return {
+        'notifications': [
+            notification for notification in map(get_concrete_notification, notifications)
+            if notification is not None
+        ],
+        'has_next': has_next,
+        'next_cursor': encode_cursor(notifications[-1]) if has_next else None,
+    }
+
+
+def get_feed_item(user, notification_id):
+    '''
+    Function to get a single notification of the user's feed
+
+    Parameters:
+        user (User): The user who owns the feed
+        notification_id (int): The id of the notification
+
+    Returns:
+        FriendshipRequest|GroupRequest|None: The notification, None if it is not visible to the user
+    '''
+
+    notification = get_feed_queryset(user).filter(id=notification_id).first()
+    if notification is None:
+        return None
+    return get_concrete_notification(notification)
+
+
+def serialize_feed_item(notification, user):
+    '''
+    Function to serialize a notification of the feed to be sent to the client
+
+    Parameters:
+        notification (FriendshipRequest|GroupRequest): The notification loaded by the feed
+        user (User): The user who owns the feed
+
+    Returns:
+        dict: The notification data and the rendered template of the notification
+    '''
+
+    is_group = notification.notification_type == 'G'
+    is_sent = notification.author_id == user.id
+    serializer = GroupRequestSerializer if is_group else FriendshipRequestSerializer
+
+    if is_sent:
+        template = render_to_string('notification/notification_send.html', {'notification': notification, 'is_group': is_group})
+    else:
+        template = render_to_string('notification/notification_received.html', {'notification': notification, 'is_group': is_group})
+
+    return {
+        'notification': serializer(notification).data,
+        'id': notification.id,
+        'group_id': notification.group if is_group else None,
+        'status': notification.get_status_display(),
+        'finished': notification.is_finished(),
+        'is_group': is_group,
+        'is_sent': is_sent,
+        'template': template,
+    }
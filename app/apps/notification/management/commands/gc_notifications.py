@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from apps.notification.models import Notification
+
+
+class Command(BaseCommand):
+    '''
+    Command to delete the finished notifications older than the retention period and the notifications hidden to both users.
+
+    Notes:
+        - It is meant to be scheduled (e.g. cron), see the README.
+        - The notifications are deleted in chunks of settings.NOTIFICATIONS_GC_CHUNK_SIZE.
+    '''
+
+    help = 'Delete the finished notifications older than the retention period and the notifications hidden to both users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=None,
+            help='Days to keep the finished notifications (default: settings.NOTIFICATIONS_RETENTION_DAYS).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Amount of notifications deleted per chunk (default: settings.NOTIFICATIONS_GC_CHUNK_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        amount_deleted = Notification.collect_garbage(
+            retention_days=options['retention_days'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'{amount_deleted} notificações removidas.'))
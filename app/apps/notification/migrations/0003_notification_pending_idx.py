@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0002_alter_friendshiprequest_notification_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['receiver'], name='notification_pending_idx'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.conf import settings
+from django.db.models import Q, F, Case, When, Value
 from django.contrib.auth import get_user_model
 
+from datetime import date, timedelta
+
 User = get_user_model()
 
 class Notification(models.Model):
@@ -17,6 +21,12 @@ class Notification(models.Model):
     )
     status = models.CharField(max_length=1, choices=status_choices, default=status_choices[0], verbose_name='Status')
 
+    class Meta:
+        indexes = [
+            # Partial index to keep the pending notifications checks proportional to the pending notifications
+            models.Index(fields=['receiver'], condition=Q(status='P'), name='notification_pending_idx'),
+        ]
+
     def __str__(self):
         return f"{self.author.email} -> {self.receiver.email}"
 
@@ -26,6 +36,82 @@ class Notification(models.Model):
     def is_finished(self):
         return self.status != 'P'
 
+    @classmethod
+    def remove_finished_visibility(cls, user):
+        '''
+        Remove the visibility of all finished notifications of the user at once.
+
+        The visibility is updated with a single UPDATE and the notifications hidden to both users
+        are removed with a single DELETE, without calling save() (and the post_save signals) per notification.
+        A single notifications_visibility_removed signal is sent to the user at the end.
+
+        Parameters:
+            user (User): The user whose finished notifications will be hidden
+
+        Returns:
+            list: The ids of the notifications hidden to the user
+        '''
+
+        from .signals import notifications_visibility_removed
+
+        notifications = Notification.objects.filter(
+            (Q(author=user) & Q(author_view=True)) |
+            (Q(receiver=user) & Q(receiver_view=True))
+        ).exclude(status='P')
+        # Filter the notifications by type if the method is called from a subclass (FriendshipRequest or GroupRequest)
+        if cls is not Notification:
+            notifications = notifications.filter(**{f'{cls._meta.model_name}__isnull': False})
+
+        notification_ids = list(notifications.values_list('id', flat=True))
+        if not notification_ids:
+            return notification_ids
+
+        Notification.objects.filter(id__in=notification_ids).update(
+            author_view=Case(When(author=user, then=Value(False)), default=F('author_view')),
+            receiver_view=Case(When(receiver=user, then=Value(False)), default=F('receiver_view')),
+        )
+        Notification.objects.filter(id__in=notification_ids, author_view=False, receiver_view=False).delete()
+
+        notifications_visibility_removed.send(sender=cls, user=user, notification_ids=notification_ids)
+        return notification_ids
+
+    @classmethod
+    def collect_garbage(cls, retention_days=None, chunk_size=None):
+        '''
+        Delete the notifications hidden to both users and the finished notifications older than the retention period.
+
+        The notifications are deleted in chunks, so each DELETE locks a bounded amount of rows.
+
+        Parameters:
+            retention_days (int|None): Days to keep the finished notifications (default: settings.NOTIFICATIONS_RETENTION_DAYS)
+            chunk_size (int|None): Amount of notifications deleted per chunk (default: settings.NOTIFICATIONS_GC_CHUNK_SIZE)
+
+        Returns:
+            int: The amount of notifications deleted
+        '''
+
+        if retention_days is None:
+            retention_days = settings.NOTIFICATIONS_RETENTION_DAYS
+        if chunk_size is None:
+            chunk_size = settings.NOTIFICATIONS_GC_CHUNK_SIZE
+
+        expired_date = date.today() - timedelta(days=retention_days)
+        garbage = Notification.objects.filter(
+            (Q(author_view=False) & Q(receiver_view=False)) |
+            (~Q(status='P') & Q(date__lt=expired_date))
+        ).order_by('id')
+
+        amount_deleted = 0
+        while True:
+            notification_ids = list(garbage.values_list('id', flat=True)[:chunk_size])
+            if not notification_ids:
+                break
+            # Deleting the base notifications also deletes the friendship/group requests
+            Notification.objects.filter(id__in=notification_ids).delete()
+            amount_deleted += len(notification_ids)
+
+        return amount_deleted
+
 
 class FriendshipRequest(Notification):
     notification_type = models.CharField(max_length=1, default='A', editable=False, verbose_name='Tipo')
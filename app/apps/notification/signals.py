@@ -1,10 +1,15 @@
 from django.db.models.signals import post_save
 from django.db.models import signals
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import FriendshipRequest, GroupRequest
+from apps.utils import invalidate_navbar_state
+from apps.event_log import send_user_event
+
+# Sent by Notification.remove_finished_visibility after the visibility of the notifications is removed in bulk
+notifications_visibility_removed = Signal()
 
 @receiver(post_save, sender=FriendshipRequest)
 def friendship_request_updated(sender, instance, **kwargs):
@@ -12,6 +17,9 @@ def friendship_request_updated(sender, instance, **kwargs):
     Signal that handles the friendship request update.
     '''
 
+    # The notification changes the pending notifications of the receiver
+    invalidate_navbar_state(instance.receiver_id)
+
     # Verify if the friendship request is finished
     if instance.author_view == False and instance.receiver_view == False:
         instance.delete()
@@ -50,9 +58,8 @@ def friendship_request_updated(sender, instance, **kwargs):
             }
         )
 
-    async_to_sync(
-        channel_layer.group_send
-    )(
+    send_user_event(
+        instance.receiver.id,
         f"user_{instance.receiver.id}_navbar",
         {
             "type": "navbar_notification_pending_notifications", 
@@ -67,6 +74,9 @@ def group_request_updated(sender, instance, **kwargs):
     Signal that handles the group request update.
     '''
 
+    # The notification changes the pending notifications of the receiver
+    invalidate_navbar_state(instance.receiver_id)
+
     # Verify if the group request is finished
     if instance.author_view == False and instance.receiver_view == False:
         instance.delete()
@@ -108,12 +118,30 @@ def group_request_updated(sender, instance, **kwargs):
             }
         )
     
-    async_to_sync(
-        channel_layer.group_send
-    )(
+    send_user_event(
+        instance.receiver.id,
         f"user_{instance.receiver.id}_navbar",
         {
             "type": "navbar_notification_pending_notifications", 
             "value": kwargs['created']
         }
     )
+
+
+@receiver(notifications_visibility_removed)
+def notifications_visibility_removed_handler(sender, user, notification_ids, **kwargs):
+    '''
+    Signal that handles the bulk removal of the notifications visibility of a user.
+    '''
+
+    channel_layer = get_channel_layer()
+    # Send a single event with all the removed notifications to the user
+    async_to_sync(
+        channel_layer.group_send
+    )(
+        f"user_{user.id}_notifications",
+        {
+            "type": "send_notifications_remove",
+            "notification_ids": notification_ids,
+        }
+    )
@@ -0,0 +1,156 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from unittest import mock
+import asyncio, time
+
+from .factories import UserFactory
+from apps.notification.consumers import NotificationUpdateConsumer
+from apps.rendering import get_render_stats, reset_render_stats
+from apps.loop_monitor import start_loop_monitor, stop_loop_monitor
+
+
+# The longest time (seconds) a consumer handler can block the event loop
+LOOP_BLOCK_THRESHOLD = 0.1
+
+
+async def measure_loop_block(coroutine):
+    '''
+    Function to run a coroutine measuring the longest time the event loop was blocked meanwhile
+
+    Parameters:
+        coroutine (coroutine): The coroutine to run
+
+    Returns:
+        tuple: The result of the coroutine and the longest time (seconds) the event loop did not run the another tasks
+    '''
+
+    longest_block = 0
+    running = True
+
+    async def tick():
+        nonlocal longest_block
+        while running:
+            ticked_at = time.perf_counter()
+            await asyncio.sleep(0.005)
+            longest_block = max(longest_block, time.perf_counter() - ticked_at - 0.005)
+
+    ticker = asyncio.ensure_future(tick())
+    try:
+        result = await coroutine
+    finally:
+        running = False
+        await ticker
+    return result, longest_block
+
+
+class NotificationUpdateConsumerTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory(username='consumer_user1')
+        reset_render_stats()
+
+
+    @override_settings(RENDER_SLOW_THRESHOLD=0.2)
+    def test_send_notification_create_does_not_block_the_event_loop(self):
+        '''
+        Description:
+            This test verifies that the render of a new notification does not block the event loop of the consumers.
+
+        Pre-conditions:
+            - A user connected to the notifications websocket.
+            - A render of the notification slower than the threshold.
+
+        Post-conditions:
+            - The notification must be sent to the user.
+            - The event loop must not be blocked longer than LOOP_BLOCK_THRESHOLD while the handler renders.
+            - The render must be recorded in the instrumentation and logged as a slow render.
+        '''
+
+        def serialize_feed_item(notification, user):
+            time.sleep(0.5)
+            return {'id': 1, 'template': '<li></li>'}
+
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(NotificationUpdateConsumer.as_asgi(), '/ws/notifications/')
+            communicator.scope['user'] = self.user
+            await communicator.connect()
+            await get_channel_layer().group_send(f"user_{self.user.id}_notifications", {
+                'type': 'send_notification_create',
+                'notification_id': 1,
+            })
+            data, longest_block = await measure_loop_block(communicator.receive_json_from(timeout=5))
+            await communicator.disconnect()
+            return data, longest_block
+
+        with mock.patch('apps.notification.consumers.load_feed_item', new=mock.AsyncMock(return_value=mock.Mock())), \
+             mock.patch('apps.notification.consumers.serialize_feed_item', new=serialize_feed_item), \
+             self.assertLogs('apps.rendering', level='WARNING'):
+            data, longest_block = async_to_sync(connect_and_receive)()
+
+        self.assertEqual(data, {'id': 1, 'template': '<li></li>', 'type': 'new'})
+        self.assertLess(longest_block, LOOP_BLOCK_THRESHOLD)
+        stats = get_render_stats()
+        self.assertEqual(stats['renders'], 1)
+        self.assertEqual(stats['slow_renders'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreaterEqual(stats['max_render_seconds'], 0.5)
+
+
+
+@override_settings(LOOP_MONITOR_INTERVAL=0.01, LOOP_MONITOR_THRESHOLD=0.05)
+class LoopMonitorTest(TestCase):
+    def setUp(self):
+        self.staff_user = UserFactory(username='monitor_staff', password='Staff@123', is_staff=True)
+        self.user = UserFactory(username='monitor_user', password='User@123')
+
+
+    def tearDown(self):
+        stop_loop_monitor()
+
+
+    def test_loop_monitor_samples_blocking_call(self):
+        '''
+        Description:
+            This test verifies that the loop monitor detects a call that blocks the event loop and samples its stack.
+
+        Pre-conditions:
+            - The loop monitor is running.
+            - A coroutine blocks the event loop longer than the threshold.
+
+        Post-conditions:
+            - The stall must be counted once, with its duration as the lag.
+            - The stack sample must have the blocking call and be logged.
+            - The stats must be available to the staff only.
+        '''
+
+        def block_the_event_loop():
+            time.sleep(0.3)
+
+        async def run():
+            monitor = start_loop_monitor()
+            await asyncio.sleep(0.05)
+            block_the_event_loop()
+            await asyncio.sleep(0.05)
+            return monitor.get_stats()
+
+        with self.assertLogs('apps.loop_monitor', level='WARNING') as logs:
+            stats = async_to_sync(run)()
+
+        self.assertEqual(stats['stalls'], 1)
+        self.assertEqual(len(stats['samples']), 1)
+        self.assertGreaterEqual(stats['samples'][0]['lag'], 0.25)
+        self.assertIn('block_the_event_loop', stats['samples'][0]['stack'])
+        self.assertGreaterEqual(stats['max_lag'], 0.25)
+        self.assertIn('block_the_event_loop', logs.output[0])
+
+        self.client.login(username=self.user.email, password='User@123')
+        response = self.client.get(reverse('loop_monitor'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username=self.staff_user.email, password='Staff@123')
+        response = self.client.get(reverse('loop_monitor'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stalls'], 1)
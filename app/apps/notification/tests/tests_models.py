@@ -1,5 +1,9 @@
 from django.test import TestCase
+from django.core.management import call_command
 from .factories import UserFactory, NotificationFactory, FriendshipRequestFactory, GroupRequestFactory
+from apps.notification.models import Notification, FriendshipRequest
+from datetime import date, timedelta
+from io import StringIO
 from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError
 
@@ -105,6 +109,64 @@ class NotificationTest(TestCase):
         self.assertTrue(notification.receiver_view)
 
 
+    def test_notification_model_collect_garbage_method(self):
+        '''
+        Description:
+            Tests the collect_garbage method of the Notification model.
+
+        Pre-conditions:
+            - There must be pending, finished, expired and hidden notifications.
+
+        Post-conditions:
+            - The notifications hidden to both users must be deleted.
+            - The finished notifications older than the retention period must be deleted.
+            - The pending notifications and the recent finished notifications must be kept.
+            - The friendship/group requests of the deleted notifications must be deleted.
+        '''
+
+        expired_date = date.today() - timedelta(days=31)
+        pending = FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='P')
+        old_pending = FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='P')
+        finished = FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='A')
+        expired = [FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='R') for _ in range(3)]
+        hidden = GroupRequestFactory(author=self.user1, receiver=self.user2, status='A')
+        Notification.objects.filter(id__in=[old_pending.id] + [notification.id for notification in expired]).update(date=expired_date)
+        # Bypass the post_save signal, that deletes the notifications hidden to both users
+        Notification.objects.filter(id=hidden.id).update(author_view=False, receiver_view=False)
+
+        amount_deleted = Notification.collect_garbage(retention_days=30, chunk_size=2)
+
+        self.assertEqual(amount_deleted, 4)
+        self.assertCountEqual(
+            Notification.objects.values_list('id', flat=True),
+            [pending.id, old_pending.id, finished.id]
+        )
+        self.assertEqual(FriendshipRequest.objects.count(), 3)
+
+
+    def test_gc_notifications_command(self):
+        '''
+        Description:
+            Tests the gc_notifications management command.
+
+        Pre-conditions:
+            - There must be a finished notification older than the retention period.
+
+        Post-conditions:
+            - The expired notification must be deleted.
+            - The command must print the amount of notifications deleted.
+        '''
+
+        notification = FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='A')
+        Notification.objects.filter(id=notification.id).update(date=date.today() - timedelta(days=10))
+
+        out = StringIO()
+        call_command('gc_notifications', retention_days=5, stdout=out)
+
+        self.assertFalse(Notification.objects.filter(id=notification.id).exists())
+        self.assertIn('1 notificações removidas.', out.getvalue())
+
+
 class FriendshipRequestTest(TestCase):
     def setUp(self):
         self.user1_data = {
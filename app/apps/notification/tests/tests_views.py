@@ -1,6 +1,10 @@
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.messages import get_messages
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from apps.notification.feed import get_feed_page
 from .factories import UserFactory, FriendshipRequestFactory, GroupRequestFactory, FriendshipRequest, GroupRequest
 
 class NotificationsViewTests(TestCase):
@@ -393,7 +397,86 @@ class RemoveNotificationsVisibilityTests(TestCase):
         self.assertNotContains(response, self.user3.email)
 
 
-    #TODO: def test_remove_notifications_visibility_view_groups_reply
+    def test_remove_notifications_visibility_view_groups_reply(self):
+        '''
+        Description:
+            This test verifies the remove notifications visibility view response with the POST method and remove the visibility of a group request.
+
+        Preconditions:
+            - The user must be logged in the system.
+            - The user must be in the notifications view and must contain a finished group request.
+
+        Postconditions:
+            - The view must return the template notification/notifications.html.
+            - The view must return the status code 200.
+            - The finished group sent/request must have the author/receiver view as False.
+            - The pending group request must keep the receiver view as True.
+            - The friendship requests must not be changed.
+        '''
+
+        notification1 = GroupRequestFactory(author=self.user2, receiver=self.user1, status='A')
+        notification2 = GroupRequestFactory(author=self.user1, receiver=self.user3, status='R')
+        notification3 = GroupRequestFactory(author=self.user3, receiver=self.user1, status='P')
+        notification4 = FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='A')
+
+        self.client.login(username=self.user1.email, password=self.user1_data['password'])
+        response = self.client.post(
+            self.notifications_remove_url, 
+            {
+                'notification_type': notification1.notification_type
+            },
+            follow=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'notification/notifications.html')
+
+        notification1.refresh_from_db()
+        notification2.refresh_from_db()
+        notification3.refresh_from_db()
+        notification4.refresh_from_db()
+
+        self.assertFalse(notification1.receiver_view)
+        self.assertTrue(notification1.author_view)
+        self.assertFalse(notification2.author_view)
+        self.assertTrue(notification2.receiver_view)
+        self.assertTrue(notification3.receiver_view)
+        self.assertTrue(notification4.receiver_view)
+
+
+    def test_remove_notifications_visibility_bulk_queries(self):
+        '''
+        Description:
+            This test verifies that the visibility of the finished notifications is removed with a fixed number of queries.
+
+        Preconditions:
+            - The user must have finished friend requests, some of them already hidden to the other user.
+
+        Postconditions:
+            - The amount of queries must not depend on the amount of notifications.
+            - The notifications hidden to both users must be deleted.
+            - The notifications still visible to the other user must be kept.
+        '''
+
+        FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='A')
+        FriendshipRequestFactory(author=self.user1, receiver=self.user3, status='R', receiver_view=False)
+        with CaptureQueriesContext(connection) as few_notifications_queries:
+            FriendshipRequest.remove_finished_visibility(self.user1)
+
+        hidden_ids = [
+            FriendshipRequestFactory(author=self.user1, receiver=self.user3, status='R', receiver_view=False).id
+            for _ in range(10)
+        ]
+        visible_ids = [
+            FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='A').id
+            for _ in range(10)
+        ]
+        with CaptureQueriesContext(connection) as many_notifications_queries:
+            removed_ids = FriendshipRequest.remove_finished_visibility(self.user1)
+
+        self.assertEqual(len(few_notifications_queries), len(many_notifications_queries))
+        self.assertCountEqual(removed_ids, hidden_ids + visible_ids)
+        self.assertFalse(FriendshipRequest.objects.filter(id__in=hidden_ids).exists())
+        self.assertEqual(FriendshipRequest.objects.filter(id__in=visible_ids, author_view=True, receiver_view=False).count(), 10)
 
 
 class SendFriendRequestTest(TestCase):
@@ -578,3 +661,100 @@ class SendFriendRequestTest(TestCase):
 
         messages = [msg.message for msg in get_messages(response.wsgi_request)]
         self.assertIn(f"Você já enviou uma solicitação de amizade para esse usuário(a).", messages)
+
+
+
+class NotificationFeedViewTests(TestCase):
+    def setUp(self):
+        self.notification_feed_url = reverse('notification:notification_feed')
+        self.user1_data = {
+            'username': 'user1',
+            'password': 'User1@123'
+        }
+        self.user2_data = {
+            'username': 'user2',
+            'password': 'User2@123'
+        }
+        self.user1 = UserFactory(**self.user1_data)
+        self.user2 = UserFactory(**self.user2_data)
+
+
+    def test_notification_feed_view_pagination(self):
+        '''
+        Description:
+            This test verifies that the notification feed view returns the friendship and group requests of the user paginated by cursor.
+
+        Preconditions:
+            - The user must be logged in the system.
+            - The user must have friendship and group requests sent and received.
+
+        Postconditions:
+            - The view must return the status code 200.
+            - The notifications must be ordered from the newest to the oldest.
+            - The pages must not repeat notifications.
+            - The last page must not have a next cursor.
+        '''
+
+        notification1 = FriendshipRequestFactory(author=self.user1, receiver=self.user2)
+        notification2 = GroupRequestFactory(author=self.user2, receiver=self.user1)
+        notification3 = FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='A')
+        # Notification hidden to the user must not be in the feed
+        FriendshipRequestFactory(author=self.user1, receiver=self.user2, status='R', author_view=False)
+
+        self.client.login(username=self.user1.email, password=self.user1_data['password'])
+        response = self.client.get(self.notification_feed_url, {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([item['id'] for item in data['notifications']], [notification3.id, notification2.id])
+        self.assertTrue(data['has_next'])
+        self.assertTrue(data['notifications'][1]['is_group'])
+        self.assertFalse(data['notifications'][1]['is_sent'])
+
+        response = self.client.get(self.notification_feed_url, {'page_size': 2, 'cursor': data['next_cursor']})
+        data = response.json()
+        self.assertEqual([item['id'] for item in data['notifications']], [notification1.id])
+        self.assertTrue(data['notifications'][0]['is_sent'])
+        self.assertFalse(data['has_next'])
+        self.assertIsNone(data['next_cursor'])
+
+
+    def test_notification_feed_view_bounded_page_size_and_queries(self):
+        '''
+        Description:
+            This test verifies that the notification feed page size is bounded and the page is loaded with a fixed number of queries.
+
+        Preconditions:
+            - The user must have more notifications than the max page size.
+
+        Postconditions:
+            - The page must have settings.NOTIFICATIONS_MAX_PAGINATION notifications when a bigger page size is requested.
+            - The page must be loaded with a single query.
+        '''
+
+        for _ in range(settings.NOTIFICATIONS_MAX_PAGINATION + 1):
+            FriendshipRequestFactory(author=self.user2, receiver=self.user1)
+
+        with self.assertNumQueries(1):
+            feed = get_feed_page(self.user1, page_size=settings.NOTIFICATIONS_MAX_PAGINATION * 10)
+            for notification in feed['notifications']:
+                notification.author.email, notification.receiver.email
+
+        self.assertEqual(len(feed['notifications']), settings.NOTIFICATIONS_MAX_PAGINATION)
+        self.assertTrue(feed['has_next'])
+
+
+    def test_notification_feed_view_with_invalid_cursor(self):
+        '''
+        Description:
+            This test verifies the notification feed view response with an invalid cursor.
+
+        Preconditions:
+            - The user must be logged in the system.
+
+        Postconditions:
+            - The view must return the status code 400.
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user1_data['password'])
+        response = self.client.get(self.notification_feed_url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
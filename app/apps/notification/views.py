@@ -1,6 +1,6 @@
 
 from django.shortcuts import render, redirect, reverse
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
 from django.views.generic import (
     TemplateView, 
     ListView, 
@@ -18,6 +18,7 @@ from django.contrib.messages import constants
 from django.contrib.auth import get_user_model
 
 from .models import FriendshipRequest, GroupRequest
+from .feed import get_feed_page, serialize_feed_item
 from apps.chat.models import Chat
 import json
 
@@ -44,51 +45,46 @@ def notifications(request):
             List of group requests sent by the logged in user.
         - group_requests_received:
             List of group requests received by the logged in user.
+        - feed_has_next:
+            True if the notification feed has more notifications than the first page.
+        - feed_next_cursor:
+            The cursor to get the next page of the notification feed.
 
     Notes:
         - If the method is POST the view will search for a user with the email passed in the search form.
         - If the method is POST and the user is found, the user will be added to the context.
         - If the method is GET the view will render the notifications page.
+        - Only the first page of the notification feed is rendered, the next pages are loaded by the notification_feed view.
     '''
 
-    '''
-        self.META = {
-            "REQUEST_METHOD": self.method,
-            "QUERY_STRING": query_string,
-            "SCRIPT_NAME": self.script_name,
-            "PATH_INFO": self.path_info,
-            # WSGI-expecting code will need these for a while
-            "wsgi.multithread": True,
-            "wsgi.multiprocess": True,
-        }
-    '''
+    # Get the first page of the user's notification feed with a single query
+    feed = get_feed_page(request.user)
+
+    # Split the feed into friendship/group requests sent/received by the user
+    friend_requests_sent = []
+    friend_requests_received = []
+    group_requests_sent = []
+    group_requests_received = []
+    for notification in feed['notifications']:
+        is_sent = notification.author_id == request.user.id
+        if notification.notification_type == 'G':
+            if is_sent:
+                group_requests_sent.append(notification)
+            else:
+                group_requests_received.append(notification)
+        else:
+            if is_sent:
+                friend_requests_sent.append(notification)
+            else:
+                friend_requests_received.append(notification)
 
-    # Get friend requests sent by the user with your visualization as True ordered by date
-    friend_requests_sent = FriendshipRequest.objects.filter(
-        author=request.user, 
-        author_view=True
-    ).order_by('-date')
-    # Get friend requests received by the user with your visualization as True ordered by date
-    friend_requests_received = FriendshipRequest.objects.filter(
-        receiver=request.user, 
-        receiver_view=True
-    ).order_by('-date')
-    # Get group requests sent by the user with your visualization as True ordered by date
-    group_requests_sent = GroupRequest.objects.filter(
-        author=request.user, 
-        author_view=True
-    ).order_by('-date')
-    # Get group requests received by the user with your visualization as True ordered by date
-    group_requests_received = GroupRequest.objects.filter(
-        receiver=request.user, 
-        receiver_view=True
-    ).order_by('-date')
-    
     context = {
         'friend_requests_sent': friend_requests_sent,
         'friend_requests_received': friend_requests_received,
         'group_requests_sent': group_requests_sent,
         'group_requests_received': group_requests_received,
+        'feed_has_next': feed['has_next'],
+        'feed_next_cursor': feed['next_cursor'],
     }
 
     if request.method == "POST":
@@ -111,6 +107,44 @@ def notifications(request):
         return render(request, "notification/notifications.html", context=context)
 
 
+@login_required
+def notification_feed(request):
+    '''
+    View to get a page of the user's notification feed.
+
+    Args:
+        request (HttpRequest): The request object used to generate this response.
+
+    Returns:
+        JsonResponse: A json response with the notifications of the page.
+
+    Query parameters:
+        - cursor: The cursor of the previous page (next_cursor). If it is not passed, the first page is returned.
+        - page_size: The amount of notifications of the page, bounded by settings.NOTIFICATIONS_MAX_PAGINATION.
+        - type: 'A' to get only friendship requests, 'G' to get only group requests.
+
+    Notes:
+        - The notifications are ordered by date, newest first.
+        - The page is loaded with a fixed number of queries, whatever the page size is.
+        - If the cursor is not valid, a json response with status 400 is returned.
+    '''
+
+    try:
+        feed = get_feed_page(
+            request.user,
+            cursor=request.GET.get("cursor"),
+            page_size=request.GET.get("page_size"),
+            notification_type=request.GET.get("type"),
+        )
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    return JsonResponse({
+        "notifications": [serialize_feed_item(notification, request.user) for notification in feed['notifications']],
+        "has_next": feed['has_next'],
+        "next_cursor": feed['next_cursor'],
+    })
+
 
 @login_required
 def reply_notification_request(request):
@@ -208,26 +242,12 @@ def remove_notifications_visibility(request):
         notification_type = request.POST.get("notification_type")
         # Verify the type of notification
         if notification_type == "A":
-            # Update the visibility of friendship notifications from the user to False
-            friend_requests = FriendshipRequest.objects.filter(author=request.user).exclude(status='P')
-            for friend_request in friend_requests:
-                friend_request.author_view = False
-                friend_request.save()
-            friend_requests = FriendshipRequest.objects.filter(receiver=request.user).exclude(status='P')
-            for friend_request in friend_requests:
-                friend_request.receiver_view = False
-                friend_request.save()
+            # Update the visibility of the finished friendship notifications from the user to False at once
+            FriendshipRequest.remove_finished_visibility(request.user)
             messages.add_message(request, constants.SUCCESS, 'Notificações de amizade finalizadas removidas.')
         else:
-            # Update the visibility of group notifications from the user to False
-            group_requests = GroupRequest.objects.filter(author=request.user).exclude(status='P')
-            for group_request in group_requests:
-                group_request.author_view = False
-                group_request.save()
-            group_requests = GroupRequest.objects.filter(receiver=request.user).exclude(status='P')
-            for group_request in group_requests:
-                group_request.receiver_view = False
-                group_request.save()
+            # Update the visibility of the finished group notifications from the user to False at once
+            GroupRequest.remove_finished_visibility(request.user)
             messages.add_message(request, constants.SUCCESS, 'Notificações de grupo finalizadas removidas.')
         return HttpResponseRedirect(reverse("notification:notifications"))
 
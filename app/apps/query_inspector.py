@@ -0,0 +1,193 @@
+from django.conf import settings
+
+from channels.consumer import get_handler_name
+from contextvars import ContextVar
+import logging, random, re, threading, time, traceback
+
+from apps.instrumentation import install_execute_wrapper
+
+logger = logging.getLogger(__name__)
+
+# The inspection of the request or consumer event being handled (None if it was not sampled), shared with its threads
+_inspection = ContextVar('query_inspection', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# The frames of these paths are not in the stack summaries (only the code of the project is)
+_LIBRARY_PATHS = ('site-packages', 'dist-packages', '/lib/python', 'apps/query_inspector.py')
+
+
+
+class QueryInspection:
+    '''
+    The database queries of a sampled request or consumer event, by fingerprint
+
+    Notes:
+        - The stack is only summarized when a fingerprint reaches settings.QUERY_INSPECTOR_REPEATED_QUERIES queries
+          (the loop that made them is in the stack) and for the slow queries, so the inspection is cheap.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+        self.fingerprints = {}
+        self.slow_queries = []
+
+
+    def record(self, sql, seconds):
+        fingerprint = get_sql_fingerprint(sql)
+        with self.lock:
+            self.queries += 1
+            self.seconds += seconds
+            repeated = self.fingerprints.setdefault(fingerprint, {'count': 0, 'seconds': 0.0, 'stack': None})
+            repeated['count'] += 1
+            repeated['seconds'] += seconds
+            summarize_repeated = repeated['count'] == settings.QUERY_INSPECTOR_REPEATED_QUERIES
+        if summarize_repeated:
+            repeated['stack'] = get_stack_summary()
+        if seconds > settings.QUERY_INSPECTOR_SLOW_QUERY:
+            slow_query = {'sql': sql, 'seconds': seconds, 'stack': get_stack_summary()}
+            with self.lock:
+                self.slow_queries.append(slow_query)
+
+
+    def get_repeated_queries(self):
+        return {
+            fingerprint: repeated for fingerprint, repeated in self.fingerprints.items()
+            if repeated['count'] >= settings.QUERY_INSPECTOR_REPEATED_QUERIES
+        }
+
+
+    def report(self):
+        '''
+        Log the repeated (N+1) and slow queries of the inspection
+
+        Returns:
+            dict: The repeated queries (by fingerprint) and the slow queries
+        '''
+
+        repeated_queries = self.get_repeated_queries()
+        for fingerprint, repeated in repeated_queries.items():
+            logger.warning(
+                'N+1 in %s: %s identical queries (%.3fs of %s queries)\n%s\n%s',
+                self.name, repeated['count'], repeated['seconds'], self.queries, fingerprint, repeated['stack'],
+            )
+        for slow_query in self.slow_queries:
+            logger.warning(
+                'Slow query in %s: %.3fs\n%s\n%s',
+                self.name, slow_query['seconds'], slow_query['sql'], slow_query['stack'],
+            )
+        return {'repeated_queries': repeated_queries, 'slow_queries': self.slow_queries}
+
+
+
+def get_sql_fingerprint(sql):
+    '''
+    Function to get the fingerprint of a SQL statement (the statement without its values)
+
+    Parameters:
+        sql (str): The SQL statement (with or without the placeholders of the parameters)
+
+    Returns:
+        str: The statement with the literals replaced by ? and the lists of values (e.g. IN (...)) collapsed
+
+    Example:
+        >>> get_sql_fingerprint("SELECT * FROM user WHERE id IN (%s, %s) AND name = 'a' LIMIT 21")
+        'SELECT * FROM user WHERE id IN (...) AND name = ? LIMIT ?'
+    '''
+
+    fingerprint = _STRING_LITERAL.sub('?', sql)
+    fingerprint = _NUMBER_LITERAL.sub('?', fingerprint)
+    fingerprint = _PLACEHOLDER_LIST.sub('(...)', fingerprint)
+    fingerprint = fingerprint.replace('%s', '?')
+    return _WHITESPACE.sub(' ', fingerprint).strip()
+
+
+def get_stack_summary():
+    '''
+    Function to get the frames of the project code in the current stack
+
+    Returns:
+        str: The last settings.QUERY_INSPECTOR_STACK_DEPTH frames of the project code (oldest first), one per line
+    '''
+
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if not any(path in frame.filename for path in _LIBRARY_PATHS)
+    ]
+    return '\n'.join(
+        f"  {frame.filename}:{frame.lineno} in {frame.name}"
+        for frame in frames[-settings.QUERY_INSPECTOR_STACK_DEPTH:]
+    )
+
+
+def start_query_inspection(name):
+    '''
+    Function to inspect the database queries of the request or consumer event being handled, if it is sampled
+
+    Parameters:
+        name (str): The name of the view or of the consumer handler
+
+    Returns:
+        QueryInspection|None: The inspection, None if it was not sampled (settings.QUERY_INSPECTOR_SAMPLE_RATE) or the inspector is disabled
+    '''
+
+    if not settings.QUERY_INSPECTOR_ENABLED or random.random() >= settings.QUERY_INSPECTOR_SAMPLE_RATE:
+        return None
+    inspection = QueryInspection(name)
+    _inspection.set(inspection)
+    return inspection
+
+
+def stop_query_inspection():
+    '''
+    Function to stop the inspection of the database queries of the request or consumer event being handled
+    '''
+
+    _inspection.set(None)
+
+
+def inspect_query(execute, sql, params, many, context):
+    '''
+    Database execute wrapper that records the queries of the sampled request or consumer event being handled
+    '''
+
+    inspection = _inspection.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        inspection.record(sql, time.perf_counter() - started_at)
+
+
+def install_query_inspector():
+    '''
+    Function to install the inspector of the database queries, once per process
+    '''
+
+    install_execute_wrapper(inspect_query, 'query_inspector')
+
+
+
+class QueryInspectorConsumerMixin:
+    '''
+    Mixin of the consumers that inspects the database queries of a sample of the events handled, by consumer method
+    '''
+
+    async def dispatch(self, message):
+        inspection = start_query_inspection(f"{type(self).__name__}.{get_handler_name(message)}")
+        if inspection is None:
+            return await super().dispatch(message)
+        try:
+            await super().dispatch(message)
+        finally:
+            stop_query_inspection()
+            inspection.report()
@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.template.defaultfilters import truncatechars
+
+from channels.db import database_sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from apps.chat.templatetags.custom_tags import is_user_attribute_visible
+from apps.tracing import start_span
+from apps.utils import get_chat_dict
+import logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+# Executor of the renders of the consumers (created on the first render, per process)
+_executor = None
+_executor_lock = threading.Lock()
+
+# Instrumentation of the renders (per process)
+_stats = {
+    'renders': 0,
+    'slow_renders': 0,
+    'in_flight': 0,
+    'render_seconds': 0.0,
+    'max_render_seconds': 0.0,
+    'wait_seconds': 0.0,
+    'max_wait_seconds': 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def get_render_executor():
+    '''
+    Function to get the executor of the renders of the consumers
+
+    Returns:
+        ThreadPoolExecutor: The executor, with settings.RENDER_EXECUTOR_MAX_WORKERS threads
+    '''
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RENDER_EXECUTOR_MAX_WORKERS,
+                thread_name_prefix='render',
+            )
+    return _executor
+
+
+def get_render_stats():
+    '''
+    Function to get the instrumentation of the renders of the process
+
+    Returns:
+        dict: The amount of renders (finished, slow and running), the time spent rendering and waiting for a thread of the executor (total and max)
+    '''
+
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_render_stats():
+    '''
+    Function to reset the instrumentation of the renders of the process
+    '''
+
+    with _stats_lock:
+        for key, value in _stats.items():
+            _stats[key] = type(value)()
+
+
+def _record_render(name, wait_seconds, render_seconds):
+    '''
+    Function to record a finished render in the instrumentation
+
+    Parameters:
+        name (str): The name of the render function
+        wait_seconds (float): The time the render waited for a thread of the executor
+        render_seconds (float): The time spent rendering
+    '''
+
+    slow = render_seconds > settings.RENDER_SLOW_THRESHOLD
+    with _stats_lock:
+        _stats['renders'] += 1
+        _stats['slow_renders'] += slow
+        _stats['in_flight'] -= 1
+        _stats['render_seconds'] += render_seconds
+        _stats['max_render_seconds'] = max(_stats['max_render_seconds'], render_seconds)
+        _stats['wait_seconds'] += wait_seconds
+        _stats['max_wait_seconds'] = max(_stats['max_wait_seconds'], wait_seconds)
+
+    if slow:
+        logger.warning('Slow render %s: %.3fs rendering, %.3fs waiting for the executor', name, render_seconds, wait_seconds)
+
+
+async def render_async(function, *args, **kwargs):
+    '''
+    Function to run a render of a consumer in the render executor, out of the event loop
+
+    Parameters:
+        function (callable): The sync function that renders (it may use the ORM, e.g. the lazy relations used by a template)
+        args: The positional arguments of the function
+        kwargs: The keyword arguments of the function
+
+    Returns:
+        The result of the function
+
+    Notes:
+        - The executor is bounded, so the renders can not use all the threads (and database connections) of the process,
+          and the renders do not wait for the thread shared by the database queries of the consumers (database_sync_to_async).
+        - The renders slower than settings.RENDER_SLOW_THRESHOLD seconds are logged.
+    '''
+
+    name = getattr(function, '__qualname__', repr(function))
+    queued_at = time.perf_counter()
+
+    def render():
+        started_at = time.perf_counter()
+        with _stats_lock:
+            _stats['in_flight'] += 1
+        try:
+            with start_span('render', attributes={'render.function': name, 'render.wait_ms': round((started_at - queued_at) * 1000, 3)}):
+                return function(*args, **kwargs)
+        finally:
+            _record_render(name, started_at - queued_at, time.perf_counter() - started_at)
+
+    return await database_sync_to_async(render, thread_sensitive=False, executor=get_render_executor())()
+
+
+def get_message_template(request_user, msg):
+    '''
+    Function to render the template of a chat message to the user.
+
+    Parameters:
+        request_user (User): The user who will see the message.
+        msg (TextMessage|ImageMessage): The message.
+
+    Returns:
+        str: The message_send template if the user is the author of the message, the message_received template otherwise.
+    '''
+
+    # If the message is from the user, render the message_send template, otherwise render the message_received template
+    if msg.author == request_user:
+        # Render the message_send template
+        return render_to_string('chat/message_send.html', {'message': msg})
+
+    # Check if the user can see the online status and the photo of the message author
+    visibility_online = is_user_attribute_visible(
+        request_user=request_user,
+        message_author=msg.author,
+        attribute="online"
+    )
+    visibility_photo = is_user_attribute_visible(
+        request_user=request_user,
+        message_author=msg.author,
+        attribute="photo"
+    )
+    # Render the message_received template
+    return render_to_string(
+        'chat/message_received.html', 
+        {
+            'message': msg, 
+            'visibility_online': visibility_online, 
+            'visibility_photo': visibility_photo
+        }
+    )
+
+
+def get_message_templates(request_user, msgs):
+    '''
+    Function to render the templates of a list of chat messages to the user.
+
+    Parameters:
+        request_user (User): The user who will see the messages.
+        msgs (list): The messages (TextMessage|ImageMessage).
+
+    Returns:
+        list: The templates of the messages (see get_message_template).
+
+    Notes:
+        - It is called by the async views in a single thread hop, instead of one hop per message.
+    '''
+
+    return [str(get_message_template(request_user, msg)) for msg in msgs]
+
+
+def get_chat_list_template(request_user, chat):
+    '''
+    Function to render the template of a chat in the chat list of the user.
+
+    Parameters:
+        request_user (User): The user who will see the chat.
+        chat (Chat): The chat, with its users loaded.
+
+    Returns:
+        str: The chat_list_partial template of the chat.
+    '''
+
+    another_user = chat.get_another_user(request_user)
+    # Check if the user can see the online status and the photo of the another user
+    online_visibility = is_user_attribute_visible(
+        request_user=request_user,
+        message_author=another_user,
+        attribute="online"
+    )
+    photo_visibility = is_user_attribute_visible(
+        request_user=request_user,
+        message_author=another_user,
+        attribute="photo"
+    )
+    return str(render_to_string(
+        'chat/chat_list_partial.html',
+        {
+            'chat_dict': get_chat_dict(chat, request_user),
+            'online_visibility': online_visibility,
+            'photo_visibility': photo_visibility
+        }
+    ))
+
+
+def get_message_preview(msg, message_type):
+    '''
+    Function to get the preview of a chat message shown in the chat list.
+
+    Parameters:
+        msg (TextMessage|ImageMessage|None): The message.
+        message_type (str): The type of the message ('T', 'I', 'V' or 'A').
+
+    Returns:
+        str: The text of the message truncated to 50 characters, or the name of the message type.
+    '''
+
+    match message_type:
+        case 'T':
+            return truncatechars(msg.text, 50)
+        case 'I':
+            return 'Foto'
+        case 'V':
+            return 'Video'
+        case _:
+            return 'Audio'
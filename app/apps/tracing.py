@@ -0,0 +1,298 @@
+from django.conf import settings
+
+from channels.consumer import get_handler_name
+from channels.layers import get_channel_layer
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib import request as urllib_request
+import functools, json, secrets, threading, time
+
+from apps.instrumentation import BackgroundWriter, install_execute_wrapper, write_json_lines
+
+# The span being run (the spans started meanwhile are its children), copied to the threads of sync_to_async
+_current_span = ContextVar('current_span', default=None)
+_install_lock = threading.Lock()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+# The key of the trace context in the messages of the channel layer
+TRACE_CONTEXT_KEY = 'trace_context'
+
+
+
+class Span:
+    '''
+    A timed operation of a trace (W3C trace context ids, exported with the OTLP attribute names)
+    '''
+
+    def __init__(self, name, trace_id=None, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+        self.previous = None
+
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration_ms': round((self.end_time - self.start_time) * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+
+class SpanExporter(BackgroundWriter):
+    '''
+    Exporter of the finished spans, in a background thread (apps.instrumentation.BackgroundWriter)
+
+    Notes:
+        - settings.TRACING_EXPORTER is 'file' (a JSON line per span in settings.TRACING_FILE)
+          or 'otlp' (a POST of the spans in the OTLP/HTTP JSON format to settings.TRACING_OTLP_ENDPOINT).
+        - The spans are exported in batches of up to settings.TRACING_EXPORT_BATCH_SIZE spans; if the queue of
+          the spans to export is full (settings.TRACING_EXPORT_QUEUE_SIZE), the new spans are dropped.
+    '''
+
+    def __init__(self):
+        super().__init__('tracing-exporter', settings.TRACING_EXPORT_QUEUE_SIZE, settings.TRACING_EXPORT_BATCH_SIZE)
+
+
+    def export(self, span):
+        self.put(span.to_dict())
+
+
+    def write_batch(self, spans):
+        if settings.TRACING_EXPORTER == 'otlp':
+            body = json.dumps(get_otlp_payload(spans)).encode()
+            otlp_request = urllib_request.Request(
+                settings.TRACING_OTLP_ENDPOINT, data=body, headers={'Content-Type': 'application/json'}
+            )
+            urllib_request.urlopen(otlp_request, timeout=5).close()
+        else:
+            write_json_lines(settings.TRACING_FILE, spans)
+
+
+
+def get_otlp_payload(spans):
+    '''
+    Function to get the OTLP/HTTP JSON payload of exported spans
+
+    Parameters:
+        spans (list): The spans (Span.to_dict)
+
+    Returns:
+        dict: The resourceSpans payload of the OTLP trace service
+    '''
+
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'telezap_django'}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'apps.tracing'},
+            'spans': [{
+                'traceId': span['trace_id'],
+                'spanId': span['span_id'],
+                'parentSpanId': span['parent_id'] or '',
+                'name': span['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(int(span['start_time'] * 1e9)),
+                'endTimeUnixNano': str(int(span['end_time'] * 1e9)),
+                'attributes': [
+                    {'key': key, 'value': {'stringValue': str(value)}} for key, value in span['attributes'].items()
+                ],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {},
+            } for span in spans],
+        }],
+    }]}
+
+
+def get_exporter():
+    '''
+    Function to get the exporter of the spans of the process (created on the first span)
+
+    Returns:
+        SpanExporter: The exporter
+    '''
+
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = SpanExporter()
+    return _exporter
+
+
+def flush_spans():
+    '''
+    Function to wait for the finished spans of the process to be exported
+    '''
+
+    if _exporter is not None:
+        _exporter.flush()
+
+
+def get_current_span():
+    '''
+    Function to get the span being run
+
+    Returns:
+        Span|None: The span, None if there is no span being run (or the tracing is disabled)
+    '''
+
+    return _current_span.get()
+
+
+def begin_span(name, trace_context=None, attributes=None):
+    '''
+    Function to start a span, child of the span being run (or of the trace context of a message), and run it
+
+    Parameters:
+        name (str): The name of the span
+        trace_context (dict|None): The trace context extracted from a message of the channel layer (see get_trace_context)
+        attributes (dict|None): The attributes of the span
+
+    Returns:
+        Span|None: The span (it must be finished with end_span), None if settings.TRACING_ENABLED is False
+    '''
+
+    if not settings.TRACING_ENABLED:
+        return None
+
+    parent = _current_span.get()
+    if trace_context is not None:
+        span = Span(name, trace_context['trace_id'], trace_context['span_id'], attributes)
+        # the time between the message being sent and handled
+        span.attributes['messaging.delivery_latency_ms'] = round((span.start_time - trace_context['sent_at']) * 1000, 3)
+    elif parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        span = Span(name, attributes=attributes)
+
+    span.previous = parent
+    _current_span.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    '''
+    Function to finish a span started by begin_span and export it
+
+    Parameters:
+        span (Span|None): The span
+        error (BaseException|None): The exception raised in the span
+    '''
+
+    if span is None:
+        return
+    # the span that was being run before it is run again
+    _current_span.set(span.previous)
+    span.end_time = time.time()
+    if error is not None:
+        span.error = repr(error)
+    get_exporter().export(span)
+
+
+@contextmanager
+def start_span(name, trace_context=None, attributes=None):
+    '''
+    Context manager to run a span (see begin_span)
+
+    Yields:
+        Span|None: The span, None if settings.TRACING_ENABLED is False
+    '''
+
+    span = begin_span(name, trace_context, attributes)
+    try:
+        yield span
+    except BaseException as error:
+        end_span(span, error)
+        raise
+    else:
+        end_span(span)
+
+
+def get_trace_context(message):
+    '''
+    Function to get the trace context of a message of the channel layer
+
+    Parameters:
+        message (dict): The message
+
+    Returns:
+        dict|None: The trace id, the id of the span that sent the message and when it was sent, None if the message has no trace context
+    '''
+
+    trace_context = message.get(TRACE_CONTEXT_KEY)
+    if not isinstance(trace_context, dict) or not {'trace_id', 'span_id', 'sent_at'} <= trace_context.keys():
+        return None
+    return trace_context
+
+
+def trace_query(execute, sql, params, many, context):
+    '''
+    Database execute wrapper that runs the queries in a span, if there is a span being run
+    '''
+
+    if _current_span.get() is None:
+        return execute(sql, params, many, context)
+    with start_span('db.query', attributes={'db.statement': sql[:200], 'db.alias': context['connection'].alias}):
+        return execute(sql, params, many, context)
+
+
+def trace_group_send(channel_layer):
+    '''
+    Function to run the group_sends of a channel layer in a span and propagate the trace context in the messages
+
+    Parameters:
+        channel_layer (BaseChannelLayer): The channel layer (the instance is shared by the process, see get_channel_layer)
+    '''
+
+    if getattr(channel_layer, '_tracing_instrumented', False):
+        return
+    group_send = channel_layer.group_send
+
+    @functools.wraps(group_send)
+    async def traced_group_send(group, message):
+        if _current_span.get() is None:
+            return await group_send(group, message)
+        with start_span('channel_layer.group_send', attributes={'messaging.destination': group, 'messaging.type': message.get('type')}) as span:
+            # the message is copied, so the trace context is not saved in the event log of the user
+            message = {**message, TRACE_CONTEXT_KEY: {'trace_id': span.trace_id, 'span_id': span.span_id, 'sent_at': time.time()}}
+            return await group_send(group, message)
+
+    channel_layer.group_send = traced_group_send
+    channel_layer._tracing_instrumented = True
+
+
+def install_tracing():
+    '''
+    Function to install the tracing of the database queries and of the channel layer, once per process (if settings.TRACING_ENABLED)
+    '''
+
+    if not settings.TRACING_ENABLED:
+        return
+    install_execute_wrapper(trace_query, 'tracing_query_tracer')
+    with _install_lock:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            trace_group_send(channel_layer)
+
+
+
+class TracingConsumerMixin:
+    '''
+    Mixin of the consumers that runs each handler in a span, child of the span that sent the message (if it has a trace context)
+    '''
+
+    async def dispatch(self, message):
+        handler_name = get_handler_name(message)
+        with start_span(f"{type(self).__name__}.{handler_name}", trace_context=get_trace_context(message)):
+            await super().dispatch(message)
@@ -0,0 +1,213 @@
+from django.conf import settings
+
+from channels.consumer import get_handler_name
+import hashlib, hmac, json, secrets, threading, time
+
+from apps.instrumentation import JSONLinesWriter
+
+# The writer of the recording of the process (created on the first event)
+_writer = None
+_writer_lock = threading.Lock()
+
+# The kind of the entity of each URL keyword argument, by namespace (the entities are anonymized in the recording)
+URL_KWARG_KINDS = {
+    ('chat', 'id'): 'chat',
+    ('group_chat', 'id'): 'group',
+    ('user', 'slug'): 'user',
+    (None, 'chat_id'): 'chat',
+    (None, 'group_id'): 'group',
+    (None, 'call_id'): 'call',
+}
+
+# The recorded parameters: kept as they are, anonymized as an entity (kind) or masked (the length of the value is kept)
+SAFE_PARAMETERS = {'message_type', 'reply', 'notification_type', 'page', 'before', 'after', 'page_size', 'type'}
+ENTITY_PARAMETERS = {'notification_id': 'notification', 'email': 'user_email', 'slug': 'user', 'members': 'user'}
+MASKED_PARAMETERS = {'text', 'name'}
+
+# The recorded client ids (idempotency keys) are replaced by this marker, a new client id is generated on replay
+CLIENT_ID_MARKER = '{client_id}'
+
+# The namespaces of the views recorded (the authentication, admin, monitoring and static files are not)
+RECORDED_NAMESPACES = {'user', 'notification', 'chat', 'group_chat', 'videocall'}
+
+
+
+def get_traffic_writer():
+    '''
+    Function to get the writer of the recording of the process, in settings.TRAFFIC_RECORDING_FILE
+
+    Returns:
+        JSONLinesWriter: The writer (replaced if the file of the recording was changed)
+    '''
+
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.path != settings.TRAFFIC_RECORDING_FILE:
+            if _writer is not None:
+                _writer.flush()
+            _writer = JSONLinesWriter(settings.TRAFFIC_RECORDING_FILE, 'traffic-recorder', settings.TRAFFIC_RECORDING_QUEUE_SIZE)
+    return _writer
+
+
+def flush_traffic_recording():
+    '''
+    Function to wait for the recorded events of the process to be written
+    '''
+
+    if _writer is not None:
+        _writer.flush()
+
+
+def anonymize(kind, value):
+    '''
+    Function to anonymize an entity (the same entity always has the same token, it can not be reverted without the SECRET_KEY)
+
+    Parameters:
+        kind (str): The kind of the entity (e.g. chat, user)
+        value: The id of the entity
+
+    Returns:
+        str: The token of the entity, e.g. chat:3f2a9c01d4e5
+    '''
+
+    digest = hmac.new(settings.SECRET_KEY.encode(), f'{kind}:{value}'.encode(), hashlib.sha256).hexdigest()
+    return f'{kind}:{digest[:12]}'
+
+
+def anonymize_user(user):
+    '''
+    Function to anonymize the user of a request or websocket connection
+
+    Returns:
+        str|None: The token of the user, None if the user is anonymous
+    '''
+
+    if user is None or not user.is_authenticated:
+        return None
+    return anonymize('actor', user.id)
+
+
+def anonymize_path(path, namespace, kwargs):
+    '''
+    Function to replace the entities of the keyword arguments of a URL by their tokens (e.g. /chat/{chat:3f2a9c01d4e5}/messages/)
+
+    Returns:
+        str|None: The path, None if it has an argument whose entity is unknown
+    '''
+
+    for name, value in kwargs.items():
+        kind = URL_KWARG_KINDS.get((namespace, name)) or URL_KWARG_KINDS.get((None, name))
+        if kind is None:
+            return None
+        path = path.replace(str(value), '{' + anonymize(kind, value) + '}', 1)
+    return path
+
+
+def anonymize_parameters(parameters):
+    '''
+    Function to anonymize the parameters (query string or form) of a request
+
+    Parameters:
+        parameters (QueryDict): The parameters
+
+    Returns:
+        dict: The parameters recorded, each one with the list of its values
+    '''
+
+    anonymized = {}
+    for key, values in parameters.lists():
+        if key in SAFE_PARAMETERS:
+            anonymized[key] = values
+        elif key in ENTITY_PARAMETERS:
+            anonymized[key] = ['{' + anonymize(ENTITY_PARAMETERS[key], value) + '}' for value in values]
+        elif key in MASKED_PARAMETERS:
+            anonymized[key] = ['x' * len(value) for value in values]
+        elif key == 'client_id':
+            anonymized[key] = [CLIENT_ID_MARKER]
+    return anonymized
+
+
+def is_number(value):
+    '''
+    Function to check if a value of a websocket frame is a number (the booleans are not)
+    '''
+
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def anonymize_frame(data):
+    '''
+    Function to anonymize a websocket frame (JSON) sent by a client
+
+    Returns:
+        The frame with the strings masked (but its type and the message type), the numbers dropped (they may be ids,
+        but the safe parameters) and a marker in place of the client id; None if the frame is a number
+    '''
+
+    if isinstance(data, dict):
+        return {
+            key: (
+                CLIENT_ID_MARKER if key == 'client_id' and value is not None else
+                value if key in SAFE_PARAMETERS and (isinstance(value, str) or is_number(value)) else
+                anonymize_frame(value)
+            )
+            for key, value in data.items()
+            if key in SAFE_PARAMETERS or not is_number(value)
+        }
+    if isinstance(data, list):
+        return [anonymize_frame(value) for value in data if not is_number(value)]
+    if isinstance(data, str):
+        return 'x' * len(data)
+    if is_number(data):
+        return None
+    return data
+
+
+def record_event(event):
+    '''
+    Function to record an event (with its time), if settings.TRAFFIC_RECORDING_ENABLED
+    '''
+
+    if settings.TRAFFIC_RECORDING_ENABLED:
+        get_traffic_writer().put({'time': time.time(), **event})
+
+
+
+class TrafficRecorderConsumerMixin:
+    '''
+    Mixin of the consumers that records the websocket connections and the frames sent by the clients, anonymized, if settings.TRAFFIC_RECORDING_ENABLED
+
+    Notes:
+        - The events of a connection have its connection id, so they are replayed in order in the same connection.
+        - The query string (e.g. the resume token) is not recorded.
+    '''
+
+    async def dispatch(self, message):
+        if settings.TRAFFIC_RECORDING_ENABLED:
+            self.record_traffic(message)
+        await super().dispatch(message)
+
+
+    def record_traffic(self, message):
+        handler_name = get_handler_name(message)
+        if handler_name == 'websocket_connect':
+            path = anonymize_path(self.scope['path'], None, self.scope.get('url_route', {}).get('kwargs', {}))
+            self._traffic_connection = secrets.token_hex(8) if path is not None else None
+            if self._traffic_connection is not None:
+                record_event({
+                    'kind': 'websocket.connect',
+                    'connection': self._traffic_connection,
+                    'user': anonymize_user(self.scope.get('user')),
+                    'path': path,
+                })
+        elif getattr(self, '_traffic_connection', None) is None:
+            return
+        elif handler_name == 'websocket_receive' and message.get('text') is not None:
+            try:
+                frame = anonymize_frame(json.loads(message['text']))
+            except ValueError:
+                frame = 'x' * len(message['text'])
+            record_event({'kind': 'websocket.receive', 'connection': self._traffic_connection, 'frame': frame})
+        elif handler_name == 'websocket_disconnect':
+            record_event({'kind': 'websocket.disconnect', 'connection': self._traffic_connection})
+            self._traffic_connection = None
@@ -5,8 +5,8 @@ from django.template.defaultfilters import slugify
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.contrib.sessions.models import Session
 
+from importlib import import_module
 import string, emoji, os
 
 
@@ -105,7 +105,9 @@ class User(AbstractUser):
 
 
     def is_online(self):
-        if Session.objects.filter(session_key=self.session_id).exists():
+        # Check the session in the session engine (cache first, then the database)
+        SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+        if self.session_id and SessionStore().exists(self.session_id):
             return True
         else:
             User.objects.filter(email=self.email).update(session_id=None)
@@ -121,9 +123,9 @@ class User(AbstractUser):
         return user_has_pending_notifications(self)
 
 
-    #TODO: Implementar
     def have_pending_group_messages(self):
-        return False
+        from apps.utils import user_has_pending_group_messages
+        return user_has_pending_group_messages(self)
 
 
     def user_has_unviewed_chat_messages(self):
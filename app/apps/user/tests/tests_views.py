@@ -3,9 +3,15 @@ from django.urls import reverse
 from django.contrib.messages import get_messages
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.db.models.signals import pre_save
+from django.core.cache import cache
+from django.contrib.sessions.models import Session
+from django.test import override_settings
 
 from apps.user.signals import user_logged_out_callback, user_logged_in_callback
 from .factories import UserFactory, User
+from apps.notification.tests.factories import FriendshipRequestFactory
+from apps.chat.tests.factories import ChatFactory, ChatMessageTextFactory, TextMessageFactory
+from apps.utils import get_navbar_state
 import os
 
 
@@ -584,4 +590,167 @@ class ProfileViewTests(TestCase):
 
         messages = [msg.message for msg in get_messages(response.wsgi_request)]
         self.assertIn('Erro na alteração das configurações!', messages)
-        self.assertIn(f'Faça uma escolha válida. {new_wrong_email_config} não é uma das escolhas disponíveis.', messages)
\ No newline at end of file
+        self.assertIn(f'Faça uma escolha válida. {new_wrong_email_config} não é uma das escolhas disponíveis.', messages)
+
+
+class NavbarStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.password = 'Test@Password123'
+        self.user1 = UserFactory(username='user1', password=self.password)
+        self.user2 = UserFactory(username='user2', password=self.password)
+        self.profile_url = reverse('user:profile', kwargs={'slug': 'user1'})
+
+
+    def test_navbar_state_single_query_and_cache(self):
+        '''
+        Description:
+            This test verifies that the navbar state is computed with a single query and then cached.
+
+        Pre-conditions:
+            - A user with a pending notification and an unviewed chat message.
+
+        Post-conditions:
+            - The navbar state must be computed with a single query.
+            - The second call must not run any query.
+        '''
+
+        FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='P')
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user2))
+        # The chat message signal already computes the navbar state of the chat users
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            navbar_state = get_navbar_state(self.user1)
+        with self.assertNumQueries(0):
+            get_navbar_state(self.user1)
+
+        self.assertTrue(navbar_state['has_pending_notifications'])
+        self.assertTrue(navbar_state['has_unviewed_chat_messages'])
+        self.assertFalse(navbar_state['has_pending_group_messages'])
+
+
+    def test_navbar_state_invalidation(self):
+        '''
+        Description:
+            This test verifies that the cached navbar state is invalidated by notification and message writes.
+
+        Pre-conditions:
+            - A user without pending notifications and unviewed chat messages, with the navbar state cached.
+
+        Post-conditions:
+            - After a friendship request is received, the navbar state must have pending notifications.
+            - After a chat message is received, the navbar state must have unviewed chat messages.
+            - After the messages are viewed, the navbar state must not have unviewed chat messages.
+        '''
+
+        chat = ChatFactory(user1=self.user1, user2=self.user2)
+        navbar_state = get_navbar_state(self.user1)
+        self.assertFalse(navbar_state['has_pending_notifications'])
+        self.assertFalse(navbar_state['has_unviewed_chat_messages'])
+
+        FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='P')
+        self.assertTrue(get_navbar_state(self.user1)['has_pending_notifications'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatMessageTextFactory(chat=chat, message=TextMessageFactory(author=self.user2))
+        self.assertTrue(get_navbar_state(self.user1)['has_unviewed_chat_messages'])
+
+        chat.update_messages_visualization(self.user1)
+        self.assertFalse(get_navbar_state(self.user1)['has_unviewed_chat_messages'])
+
+
+    def test_navbar_state_in_page(self):
+        '''
+        Description:
+            This test verifies that the navbar of a page uses the navbar state of the logged in user.
+
+        Pre-conditions:
+            - A logged in user with a pending notification.
+
+        Post-conditions:
+            - The notifications item of the navbar must blink.
+        '''
+
+        FriendshipRequestFactory(author=self.user2, receiver=self.user1, status='P')
+        self.client.login(username=self.user1.email, password=self.password)
+        response = self.client.get(self.profile_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span id="nav-notifications" class=" blinking-text ">', count=1)
+        self.assertContains(response, '<span id="nav-chats" class="">', count=1)
+
+
+class ThrottledSessionTests(TestCase):
+    def setUp(self):
+        self.password = 'Test@Password123'
+        self.user = UserFactory(username='testuser', password=self.password)
+        self.profile_url = reverse('user:profile', kwargs={'slug': 'testuser'})
+        self.client.login(username=self.user.email, password=self.password)
+
+
+    def test_session_is_not_saved_every_request(self):
+        '''
+        Description:
+            This test verifies that the session is not saved in every request while the refresh interval has not elapsed.
+
+        Pre-conditions:
+            - A logged in user whose session was refreshed in the first request.
+
+        Post-conditions:
+            - The next requests must not change the session expiry date in the database.
+        '''
+
+        self.client.get(self.profile_url)
+        expire_date = Session.objects.get(session_key=self.client.session.session_key).expire_date
+
+        self.client.get(self.profile_url)
+        self.client.get(self.profile_url)
+
+        self.assertEqual(Session.objects.get(session_key=self.client.session.session_key).expire_date, expire_date)
+
+
+    @override_settings(SESSION_REFRESH_FRACTION=0.1)
+    def test_session_is_refreshed_after_refresh_interval(self):
+        '''
+        Description:
+            This test verifies that the session expiry is refreshed when the refresh interval has elapsed.
+
+        Pre-conditions:
+            - A logged in user whose session was refreshed longer ago than the refresh interval.
+
+        Post-conditions:
+            - The next request must refresh the session expiry date in the database.
+        '''
+
+        session = self.client.session
+        session['_session_refreshed_at'] = 0
+        session.save()
+        expire_date = Session.objects.get(session_key=session.session_key).expire_date
+
+        self.client.get(self.profile_url)
+
+        self.assertGreater(self.client.session['_session_refreshed_at'], 0)
+        self.assertGreater(Session.objects.get(session_key=session.session_key).expire_date, expire_date)
+
+
+    def test_user_is_online_with_cached_session(self):
+        '''
+        Description:
+            This test verifies that the user presence is derived from the session engine.
+
+        Pre-conditions:
+            - A logged in user with the session id saved.
+
+        Post-conditions:
+            - The user must be online while the session exists.
+            - The user must be offline after the session is deleted.
+        '''
+
+        self.user.session_id = self.client.session.session_key
+        self.user.save()
+        self.assertTrue(self.user.is_online())
+
+        self.client.session.delete()
+        self.assertFalse(self.user.is_online())
@@ -1,13 +1,19 @@
 from emoji_data_python import emoji_data
-from django.db.models import Q, Subquery, OuterRef
+from django.db.models import Q, F, Exists, Case, When, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.files import File
+from django.core.cache import cache
 from django.conf import settings
+from django.contrib.auth import get_user_model, get_user
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
 
-from apps.chat.models import ChatMessage, Chat
-from apps.notification.models import FriendshipRequest, GroupRequest
+from apps.chat.models import Chat, ChatMessage, TextMessage, ImageMessage
+from apps.group_chat.models import GroupChatMember, GroupChatMessage
+from apps.notification.models import Notification
 
 from datetime import datetime, timedelta
-import os, json
+import os, json, functools
 from pathlib import Path
 
 
@@ -26,6 +32,34 @@ def get_all_emojis():
     return emojis_categories
 
 
+def user_can_access_media(user, path):
+    '''
+    Function to check if the user can access a media file
+
+    Parameters:
+        user (User): The authenticated user
+        path (str): The path of the file, relative to MEDIA_ROOT (normalized)
+
+    Returns:
+        bool: True if the file is a profile photo or an image sent to a chat or group of the user, False otherwise
+
+    Notes:
+        - The profile photos are shown to any authenticated user (chats, notifications and the user search).
+        - The message of the image is found by the index of the image field, so the check is two indexed queries at most.
+    '''
+
+    if path.startswith(f"{get_user_model()._meta.get_field('photo').upload_to}/"):
+        return True
+    if not path.startswith(ImageMessage._meta.get_field('image').upload_to):
+        return False
+
+    messages = ImageMessage.objects.filter(image=path).values('pk')
+    return (
+        ChatMessage.objects.filter(Q(chat__user1=user) | Q(chat__user2=user), message__in=messages).exists() or
+        GroupChatMessage.objects.filter(message__in=messages, group__memberships__user=user).exists()
+    )
+
+
 def user_has_pending_notifications(user):
     '''
     Function to check if the user has pending notifications
@@ -37,42 +71,196 @@ def user_has_pending_notifications(user):
         bool: True if the user has pending notifications, False otherwise
     '''
 
-    return FriendshipRequest.objects.filter(receiver=user, status='P').exists() or GroupRequest.objects.filter(receiver=user, status='P').exists()
+    # A single query in the base table, using the partial index of the pending notifications
+    return Notification.objects.filter(receiver=user, status='P').exists()
 
 
-def user_has_unviewed_chat_messages(user):
+def get_unviewed_chats(user):
     '''
-    Function to check if the user has unviewed chat messages
+    Function to get the chats visible to the user with unviewed messages
 
     Parameters:
         user (User): The user to be checked
 
     Returns:
-        bool: True if the user has unviewed chat messages, False otherwise
+        QuerySet: The chats where the last message sequence is after the watermark (last read sequence) of the user
+
+    Notes:
+        - The chats the user is connected in are excluded.
     '''
 
     # get all user chats where the user is the user1 and user1_view is True or the user is the user2 and user2_view is True
-    all_user_chats = Chat.objects.filter(
-        (Q(user1=user) & Q(user1_view=True)) |
-        (Q(user2=user) & Q(user2_view=True))
+    # and the last message of the chat is after the watermark of the user
+    unviewed_chats = Chat.objects.filter(
+        (Q(user1=user) & Q(user1_view=True) & Q(last_message_seq__gt=F('user1_last_read_seq'))) |
+        (Q(user2=user) & Q(user2_view=True) & Q(last_message_seq__gt=F('user2_last_read_seq')))
     )
 
     # if the user is in a chat, exclude the chat from the query
     if user.in_chat:
-        all_user_chats = all_user_chats.exclude(pk__in=user.in_chat.split('|'))
+        unviewed_chats = unviewed_chats.exclude(pk__in=user.in_chat.split('|'))
 
-    # get all chat messages where the chat is in the all_user_chats query and the message author is not the user
-    subquery = ChatMessage.objects.filter(
-        chat=OuterRef('pk'),
-        visualized=False,
-    ).exclude(
-        message__author=user
-    ).values('chat')
+    return unviewed_chats
+
+
+def user_has_unviewed_chat_messages(user):
+    '''
+    Function to check if the user has unviewed chat messages
+
+    Parameters:
+        user (User): The user to be checked
+
+    Returns:
+        bool: True if the user has unviewed chat messages, False otherwise
+    '''
 
-    # return True if the query returns any result, False otherwise
-    return all_user_chats.filter(
-        pk__in=Subquery(subquery)
-    ).exists()
+    # return True if any chat visible to the user has messages after the watermark of the user
+    return get_unviewed_chats(user).exists()
+
+
+def get_unviewed_group_chats(user):
+    '''
+    Function to get the group memberships of the user with unviewed messages
+
+    Parameters:
+        user (User): The user to be checked
+
+    Returns:
+        QuerySet: The memberships where the last message sequence of the group is after the watermark (last read sequence) of the user
+
+    Notes:
+        - The groups the user is connected in are excluded.
+    '''
+
+    unviewed_group_chats = GroupChatMember.objects.filter(
+        user=user,
+        group__last_message_seq__gt=F('last_read_seq')
+    )
+
+    # if the user is in a group, exclude the group from the query
+    if user.in_groupchat:
+        unviewed_group_chats = unviewed_group_chats.exclude(group_id__in=user.in_groupchat.split('|'))
+
+    return unviewed_group_chats
+
+
+def user_has_pending_group_messages(user):
+    '''
+    Function to check if the user has unviewed group messages
+
+    Parameters:
+        user (User): The user to be checked
+
+    Returns:
+        bool: True if the user has unviewed group messages, False otherwise
+    '''
+
+    # return True if any group of the user has messages after the watermark of the user
+    return get_unviewed_group_chats(user).exists()
+
+
+def get_navbar_state_cache_key(user_id):
+    '''
+    Function to get the cache key of the navbar state of a user
+
+    Parameters:
+        user_id (int): The id of the user
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"navbar_state_{user_id}"
+
+
+def get_navbar_state(user):
+    '''
+    Function to get the navbar state (unviewed chat messages, pending group messages and pending notifications) of the user
+
+    Parameters:
+        user (User): The user to be checked
+
+    Returns:
+        dict: The navbar state of the user
+
+    Notes:
+        - The state is computed with a single query and cached for settings.NAVBAR_STATE_CACHE_TIMEOUT seconds.
+        - The cache is invalidated by invalidate_navbar_state when messages, chats or notifications of the user change.
+    '''
+
+    cache_key = get_navbar_state_cache_key(user.id)
+    navbar_state = cache.get(cache_key)
+    if navbar_state is not None:
+        return navbar_state
+
+    unviewed_chats = get_unviewed_chats(user)
+    unviewed_group_chats = get_unviewed_group_chats(user)
+    pending_notifications = Notification.objects.filter(receiver=user, status='P')
+
+    # Get all the navbar state in a single query
+    navbar_state = get_user_model().objects.filter(pk=user.pk).annotate(
+        has_unviewed_chat_messages=Exists(unviewed_chats),
+        has_pending_group_messages=Exists(unviewed_group_chats),
+        has_pending_notifications=Exists(pending_notifications),
+    ).values(
+        'has_unviewed_chat_messages',
+        'has_pending_group_messages',
+        'has_pending_notifications',
+    ).first() or {
+        'has_unviewed_chat_messages': False,
+        'has_pending_group_messages': False,
+        'has_pending_notifications': False,
+    }
+
+    cache.set(cache_key, navbar_state, settings.NAVBAR_STATE_CACHE_TIMEOUT)
+    return navbar_state
+
+
+def invalidate_navbar_state(*users):
+    '''
+    Function to invalidate the cached navbar state of users
+
+    Parameters:
+        users (User|int): The users (or the ids of the users) whose navbar state changed
+    '''
+
+    cache.delete_many([
+        get_navbar_state_cache_key(getattr(user, 'id', user)) for user in users
+    ])
+
+
+async def ainvalidate_navbar_state(*users):
+    '''
+    Async version of invalidate_navbar_state
+    '''
+
+    await cache.adelete_many([
+        get_navbar_state_cache_key(getattr(user, 'id', user)) for user in users
+    ])
+
+
+def async_login_required(view):
+    '''
+    Decorator of the async views that requires the user to be logged in (the login_required of Django 4.2 only decorates sync views)
+
+    Parameters:
+        view (coroutine function): The async view
+
+    Returns:
+        coroutine function: The decorated view, which redirects the anonymous users to the login page
+
+    Notes:
+        - The user is loaded from the session once, in a thread, and replaces the lazy request.user,
+          so the view can use request.user without touching the database.
+    '''
+
+    @functools.wraps(view)
+    async def _wrapper_view(request, *args, **kwargs):
+        request.user = await sync_to_async(get_user)(request)
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return _wrapper_view
 
 
 def date_is_today(date):
@@ -162,4 +350,85 @@ def get_chat_dict(chat, user):
         chat_dict['has_unread_messages'] = False
         chat_dict['last_message_date_is_today'] = False
 
-    return chat_dict
\ No newline at end of file
+    return chat_dict
+
+
+def annotate_chat_list(chats, user):
+    '''
+    Function to annotate the chats of the chat list of a user with the amount of messages and the last message
+
+    Parameters:
+        chats (QuerySet): The chats of the user
+        user (User): The user
+
+    Returns:
+        QuerySet: The chats with the amount of messages (amount_of_messages) and the id, type and date of the last message
+        (last_message_id, last_message_type, last_message_date), after the exit chat date of the user
+
+    Notes:
+        - The annotations are subqueries of the chats query, instead of queries per chat.
+    '''
+
+    chats = chats.annotate(
+        init_messages_date=Case(
+            When(user1=user, then=F('user1_exit_chat_date')),
+            default=F('user2_exit_chat_date'),
+        )
+    )
+    # The messages of each chat after the exit chat date of the user (all the messages if he did not remove the chat)
+    chat_messages = ChatMessage.objects.filter(
+        chat=OuterRef('pk'),
+        message__date__gte=Coalesce(OuterRef('init_messages_date'), F('message__date')),
+    )
+    last_chat_message = chat_messages.order_by('-seq')
+    return chats.annotate(
+        amount_of_messages=Coalesce(
+            Subquery(chat_messages.order_by().values('chat').annotate(count=Count('pk')).values('count')),
+            0
+        ),
+        last_message_id=Subquery(last_chat_message.values('message_id')[:1]),
+        last_message_type=Subquery(last_chat_message.values('message__message_type')[:1]),
+        last_message_date=Subquery(last_chat_message.values('message__date')[:1]),
+    )
+
+
+async def aget_chat_dicts(chats, user):
+    '''
+    Async version of get_chat_dict for the chats of the chat list of a user (the users of the chats must be loaded with select_related)
+
+    Notes:
+        - The amount of messages and the last message of the chats are annotated to the chats query (see annotate_chat_list)
+          and the last messages are loaded with a query per message type, so the queries do not grow with the amount of chats.
+    '''
+
+    chats = [chat async for chat in annotate_chat_list(chats, user)]
+
+    # Load the last messages of the chats (the audio and video messages have no content)
+    last_messages = dict()
+    for message_type, message_model in (('T', TextMessage), ('I', ImageMessage)):
+        message_ids = [chat.last_message_id for chat in chats if chat.last_message_type == message_type]
+        if message_ids:
+            async for message in message_model.objects.select_related('author').filter(id__in=message_ids):
+                last_messages[message.id] = message
+
+    chat_dicts = []
+    for chat in chats:
+        chat_dict = dict()
+        chat_dict['chat'] = chat
+        chat_dict['another_user'] = chat.get_another_user(user)
+        chat_dict['amount_of_messages'] = chat.amount_of_messages
+        chat_dict['amount_of_unviewed_messages'] = chat.get_amount_of_unviewed_messages(user)
+        # If the chat has messages, get the last message and its date
+        if chat.amount_of_messages > 0:
+            chat_dict['last_message'] = last_messages.get(chat.last_message_id)
+            chat_dict['last_message_date'] = chat.last_message_date
+            chat_dict['has_unread_messages'] = chat.have_unviewed_message(user)
+            chat_dict['last_message_date_is_today'] = date_is_today(chat.last_message_date)
+        else: # If the chat has no messages, set the last message and its date to None
+            chat_dict['last_message'] = None
+            chat_dict['last_message_date'] = None
+            chat_dict['has_unread_messages'] = False
+            chat_dict['last_message_date_is_today'] = False
+        chat_dicts.append(chat_dict)
+
+    return chat_dicts
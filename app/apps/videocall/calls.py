@@ -0,0 +1,170 @@
+from django.core.cache import cache
+from django.conf import settings
+
+import uuid
+
+
+def get_call_key(call_id):
+    '''
+    Function to get the cache key of the state of a call
+
+    Parameters:
+        call_id (str): The id of the call
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"videocall_{call_id}"
+
+
+def get_call_participant_key(call_id, user_id):
+    '''
+    Function to get the cache key of the channel name of a participant connected in a call
+
+    Parameters:
+        call_id (str): The id of the call
+        user_id (int): The id of the participant
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"videocall_{call_id}_{user_id}"
+
+
+def get_user_call_key(user_id):
+    '''
+    Function to get the cache key of the call a user is in (a user can only be in one call)
+
+    Parameters:
+        user_id (int): The id of the user
+
+    Returns:
+        str: The cache key
+    '''
+
+    return f"videocall_user_{user_id}"
+
+
+def start_call(caller_id, callee_id):
+    '''
+    Function to start a call between two users, ringing for settings.VIDEOCALL_RING_TIMEOUT seconds
+
+    Parameters:
+        caller_id (int): The id of the user who is calling
+        callee_id (int): The id of the user who is called
+
+    Returns:
+        str|None: The id of the call, or None if one of the users is already in a call
+    '''
+
+    call_id = str(uuid.uuid4())
+    timeout = settings.VIDEOCALL_RING_TIMEOUT
+
+    # cache.add is atomic, so a user can not be put in two calls at the same time
+    if not cache.add(get_user_call_key(caller_id), call_id, timeout=timeout):
+        return None
+    if not cache.add(get_user_call_key(callee_id), call_id, timeout=timeout):
+        cache.delete(get_user_call_key(caller_id))
+        return None
+
+    cache.set(get_call_key(call_id), {
+        'caller_id': caller_id,
+        'callee_id': callee_id,
+        'status': 'ringing',
+    }, timeout=timeout)
+    return call_id
+
+
+def get_call(call_id):
+    '''
+    Function to get the state of a call
+
+    Parameters:
+        call_id (str): The id of the call
+
+    Returns:
+        dict|None: The state of the call (caller_id, callee_id and status), or None if the call does not exist
+    '''
+
+    return cache.get(get_call_key(call_id))
+
+
+def get_call_peer_id(call, user_id):
+    '''
+    Function to get the id of the another participant of a call
+
+    Parameters:
+        call (dict): The state of the call
+        user_id (int): The id of a participant
+
+    Returns:
+        int|None: The id of the another participant, or None if the user is not a participant of the call
+    '''
+
+    if call['caller_id'] == user_id:
+        return call['callee_id']
+    if call['callee_id'] == user_id:
+        return call['caller_id']
+    return None
+
+
+def join_call(call_id, user_id, channel_name):
+    '''
+    Function to connect a participant in a call
+
+    Parameters:
+        call_id (str): The id of the call
+        user_id (int): The id of the participant
+        channel_name (str): The channel name of the consumer of the participant
+
+    Returns:
+        tuple: The state of the call (None if the call does not exist or the user is not a participant of it)
+            and the channel name of the another participant (None if he is not connected yet)
+
+    Notes:
+        - The channel name is saved before the channel name of the another participant is read,
+          so if both connect at the same time at least one of them gets the channel name of the another.
+        - When both participants are connected the call is active and lasts up to settings.VIDEOCALL_MAX_DURATION seconds.
+    '''
+
+    call = get_call(call_id)
+    if call is None:
+        return None, None
+    peer_id = get_call_peer_id(call, user_id)
+    if peer_id is None:
+        return None, None
+
+    cache.set(get_call_participant_key(call_id, user_id), channel_name, timeout=settings.VIDEOCALL_MAX_DURATION)
+    peer_channel_name = cache.get(get_call_participant_key(call_id, peer_id))
+
+    if peer_channel_name is not None and call['status'] != 'active':
+        call['status'] = 'active'
+        timeout = settings.VIDEOCALL_MAX_DURATION
+        cache.set_many({
+            get_call_key(call_id): call,
+            get_user_call_key(call['caller_id']): call_id,
+            get_user_call_key(call['callee_id']): call_id,
+        }, timeout=timeout)
+    return call, peer_channel_name
+
+
+def end_call(call_id):
+    '''
+    Function to end a call, removing its state
+
+    Parameters:
+        call_id (str): The id of the call
+    '''
+
+    call = get_call(call_id)
+    if call is None:
+        return
+
+    participant_ids = [call['caller_id'], call['callee_id']]
+    keys = [get_call_key(call_id)] + [get_call_participant_key(call_id, user_id) for user_id in participant_ids]
+    # the users may be already in another call, so only the keys of this call are removed
+    user_call_keys = [get_user_call_key(user_id) for user_id in participant_ids]
+    keys += [key for key, value in cache.get_many(user_call_keys).items() if value == call_id]
+    cache.delete_many(keys)
@@ -0,0 +1,139 @@
+from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
+import json
+
+from apps.metrics import MetricsConsumerMixin
+from apps.tracing import TracingConsumerMixin
+from apps.query_inspector import QueryInspectorConsumerMixin
+from apps.traffic import TrafficRecorderConsumerMixin
+from .calls import join_call, end_call
+
+
+# The signaling messages relayed to the another participant, and the fields of each one
+SIGNAL_FIELDS = {
+    'offer': ('sdp',),
+    'answer': ('sdp',),
+    'candidate': ('candidate',),
+}
+
+
+
+class CallConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, AsyncWebsocketConsumer):
+    '''
+    Consumer to relay the WebRTC signaling (SDP offers and answers and ICE candidates) between the participants of a call
+
+    Notes:
+        - The state of the call is in the cache (apps.videocall.calls), the database is not used.
+        - The messages are sent point to point to the channel of the another participant (channel_layer.send),
+          so relaying a message costs no cache or database access.
+        - When both participants are connected, both receive {'type': 'peer_joined', 'initiator': <bool>}
+          and the initiator (the caller) sends the offer.
+        - The call is ended when a participant hangs up ({'type': 'hangup'}) or disconnects.
+    '''
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.call = None
+        self.peer_channel_name = None
+        # if the user is a participant of the call, save his channel in the call and accept the connection
+        if self.user and self.user.is_authenticated:
+            self.call_id = str(self.scope['url_route']['kwargs']['call_id'])
+            self.call, peer_channel_name = await sync_to_async(join_call)(self.call_id, self.user.id, self.channel_name)
+        if self.call is None:
+            await self.close()
+            return
+
+        await self.accept()
+        # if the another participant is already connected, tell him the channel of the user
+        if peer_channel_name is not None:
+            await self.channel_layer.send(peer_channel_name, {
+                'type': 'call.peer_joined',
+                'channel_name': self.channel_name,
+            })
+            await self.set_peer(peer_channel_name)
+
+
+    async def disconnect(self, close_code):
+        await self.hangup()
+
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if getattr(self, 'call', None) is None:
+            return
+
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            await self.send_error('Mensagem inválida.')
+            return
+
+        if data.get('type') == 'hangup':
+            await self.hangup()
+            await self.close()
+            return
+
+        fields = SIGNAL_FIELDS.get(data.get('type'))
+        if fields is None:
+            await self.send_error('Mensagem inválida.')
+            return
+        if self.peer_channel_name is None:
+            await self.send_error('O outro participante ainda não está conectado.')
+            return
+
+        # relay only the fields of the signaling message to the another participant
+        await self.channel_layer.send(self.peer_channel_name, {
+            'type': 'call.signal',
+            'signal': {'type': data['type'], **{field: data.get(field) for field in fields}},
+        })
+
+
+    async def set_peer(self, peer_channel_name):
+        # the user is told once that the another participant is connected (both may get the channel of the another)
+        if self.peer_channel_name == peer_channel_name:
+            return
+        self.peer_channel_name = peer_channel_name
+        await self.send(text_data=json.dumps({
+            'type': 'peer_joined',
+            'initiator': self.call['caller_id'] == self.user.id,
+        }))
+
+
+    async def hangup(self):
+        # end the call and tell the another participant
+        if getattr(self, 'call', None) is None:
+            return
+        self.call = None
+        await sync_to_async(end_call)(self.call_id)
+        if self.peer_channel_name is not None:
+            await self.channel_layer.send(self.peer_channel_name, {'type': 'call.hangup'})
+
+
+    async def send_error(self, error):
+        await self.send(text_data=json.dumps({
+            'error': error,
+            'type': 'error'
+        }))
+
+
+    async def call_peer_joined(self, event):
+        if getattr(self, 'call', None) is None:
+            return
+        await self.set_peer(event['channel_name'])
+
+
+    async def call_signal(self, event):
+        if getattr(self, 'call', None) is None:
+            return
+        await self.send(text_data=json.dumps(event['signal']))
+
+
+    async def call_hangup(self, event):
+        if getattr(self, 'call', None) is None:
+            return
+        # the call was ended by the another participant
+        self.call = None
+        self.peer_channel_name = None
+        await self.send(text_data=json.dumps({'type': 'hangup'}))
+        await self.close()
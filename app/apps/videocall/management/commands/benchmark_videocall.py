@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from channels.testing import WebsocketCommunicator
+
+import asyncio, json, statistics, time
+
+from apps.videocall.calls import start_call
+from apps.videocall.consumers import CallConsumer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    '''
+    Command to measure the latency of the signaling relay of the video calls with many concurrent calls.
+
+    For each call two participants are connected to the CallConsumer and the caller sends ICE candidates to the callee,
+    all the calls at the same time, then the latency percentiles and the throughput of the relay are printed.
+
+    Notes:
+        - The consumers run in this process with the configured channel layer and cache (no server is needed).
+        - The participants are not saved in the database, the relay does not use it.
+    '''
+
+    help = 'Measure the latency of the video call signaling relay with many concurrent calls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--calls',
+            type=int,
+            default=100,
+            help='Amount of concurrent calls (default: 100).',
+        )
+        parser.add_argument(
+            '--candidates',
+            type=int,
+            default=20,
+            help='Amount of ICE candidates sent in each call (default: 20).',
+        )
+
+    def handle(self, *args, **options):
+        latencies, elapsed = asyncio.run(self.benchmark(options['calls'], options['candidates']))
+        latencies.sort()
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f'Chamadas: {options["calls"]} | candidatos por chamada: {options["candidates"]}')
+        self.stdout.write(f'Mensagens retransmitidas: {len(latencies)} em {elapsed:.2f}s ({len(latencies) / elapsed:.0f} msg/s)')
+        self.stdout.write(
+            f'Latência (ms): média {statistics.mean(latencies) * 1000:.2f} | p50 {percentile(0.5):.2f} | '
+            f'p95 {percentile(0.95):.2f} | p99 {percentile(0.99):.2f} | máx {latencies[-1] * 1000:.2f}'
+        )
+
+    async def connect(self, user, call_id):
+        communicator = WebsocketCommunicator(CallConsumer.as_asgi(), f'/ws/videocall/{call_id}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'call_id': call_id}}
+        connected, _ = await communicator.connect(timeout=10)
+        if not connected:
+            raise RuntimeError(f'Não foi possível conectar na chamada {call_id}.')
+        return communicator
+
+    async def run_call(self, index, amount_of_candidates):
+        # The participants only need an id, the consumer does not use the database
+        caller, callee = User(id=-2 * index - 1), User(id=-2 * index - 2)
+        call_id = start_call(caller.id, callee.id)
+        caller_communicator = await self.connect(caller, call_id)
+        callee_communicator = await self.connect(callee, call_id)
+        await caller_communicator.receive_json_from(timeout=10)
+        await callee_communicator.receive_json_from(timeout=10)
+
+        latencies = []
+        for candidate in range(amount_of_candidates):
+            await caller_communicator.send_json_to({
+                'type': 'candidate',
+                'candidate': {'candidate': f'candidate:{candidate}', 'sent_at': time.perf_counter()},
+            })
+            data = await callee_communicator.receive_json_from(timeout=10)
+            latencies.append(time.perf_counter() - data['candidate']['sent_at'])
+
+        await caller_communicator.send_json_to({'type': 'hangup'})
+        await callee_communicator.receive_json_from(timeout=10)
+        await caller_communicator.disconnect()
+        await callee_communicator.disconnect()
+        return latencies
+
+    async def benchmark(self, amount_of_calls, amount_of_candidates):
+        start = time.perf_counter()
+        results = await asyncio.gather(*[self.run_call(index, amount_of_candidates) for index in range(amount_of_calls)])
+        elapsed = time.perf_counter() - start
+        return [latency for latencies in results for latency in latencies], elapsed
@@ -0,0 +1,8 @@
+from django.urls import path
+from .consumers import CallConsumer
+
+app_name = 'videocall'
+
+websocket_urlpatterns = [
+    path('ws/videocall/<uuid:call_id>/', CallConsumer.as_asgi()),
+]
@@ -0,0 +1,144 @@
+from django.test import TestCase
+from django.core.cache import cache
+
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync
+from unittest import mock
+
+from apps.user.tests.factories import UserFactory
+from apps.videocall.calls import start_call, get_call, end_call, get_user_call_key
+from apps.videocall.consumers import CallConsumer
+
+
+async def connect_to_call(user, call_id):
+    communicator = WebsocketCommunicator(CallConsumer.as_asgi(), f'/ws/videocall/{call_id}/')
+    communicator.scope['user'] = user
+    communicator.scope['url_route'] = {'kwargs': {'call_id': call_id}}
+    connected, _ = await communicator.connect()
+    return communicator, connected
+
+
+class CallStateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='call_user1')
+        self.user2 = UserFactory(username='call_user2')
+        self.user3 = UserFactory(username='call_user3')
+
+
+    def test_start_and_end_call(self):
+        '''
+        Description:
+            This test verifies the state of the calls in the cache.
+
+        Pre-conditions:
+            - Three users.
+
+        Post-conditions:
+            - A new call must be ringing.
+            - A user already in a call must not be called or call.
+            - Ending a call must remove its state and free the users.
+        '''
+
+        call_id = start_call(self.user1.id, self.user2.id)
+
+        self.assertEqual(get_call(call_id), {'caller_id': self.user1.id, 'callee_id': self.user2.id, 'status': 'ringing'})
+        self.assertIsNone(start_call(self.user3.id, self.user2.id))
+        self.assertIsNone(start_call(self.user1.id, self.user3.id))
+        self.assertIsNone(cache.get(get_user_call_key(self.user3.id)))
+
+        end_call(call_id)
+
+        self.assertIsNone(get_call(call_id))
+        self.assertIsNotNone(start_call(self.user3.id, self.user2.id))
+
+
+
+class CallConsumerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = UserFactory(username='call_user1')
+        self.user2 = UserFactory(username='call_user2')
+        self.user3 = UserFactory(username='call_user3')
+        self.call_id = start_call(self.user1.id, self.user2.id)
+
+
+    def test_relay_signaling_messages(self):
+        '''
+        Description:
+            This test verifies that the signaling messages are relayed between the participants of a call.
+
+        Pre-conditions:
+            - A call between two users.
+
+        Post-conditions:
+            - Both participants must be told that the another is connected, and only the caller is the initiator.
+            - The call must be active.
+            - The offer, the answer and the candidates must be relayed with only their fields, without using the cache.
+            - A hangup must be sent to the another participant and end the call.
+        '''
+
+        async def call():
+            caller, caller_connected = await connect_to_call(self.user1, self.call_id)
+            callee, callee_connected = await connect_to_call(self.user2, self.call_id)
+            joined = [await caller.receive_json_from(), await callee.receive_json_from()]
+            status = get_call(self.call_id)['status']
+
+            with mock.patch('apps.videocall.calls.cache') as cache_mock:
+                await caller.send_json_to({'type': 'offer', 'sdp': 'v=0 offer', 'extra': 'x'})
+                offer = await callee.receive_json_from()
+                await callee.send_json_to({'type': 'answer', 'sdp': 'v=0 answer'})
+                answer = await caller.receive_json_from()
+                await callee.send_json_to({'type': 'candidate', 'candidate': {'candidate': 'candidate:1'}})
+                candidate = await caller.receive_json_from()
+
+            await caller.send_json_to({'type': 'hangup'})
+            hangup = await callee.receive_json_from()
+            await caller.disconnect()
+            await callee.disconnect()
+            return caller_connected, callee_connected, joined, status, cache_mock, [offer, answer, candidate], hangup
+
+        caller_connected, callee_connected, joined, status, cache_mock, signals, hangup = async_to_sync(call)()
+
+        self.assertTrue(caller_connected)
+        self.assertTrue(callee_connected)
+        self.assertEqual(joined, [
+            {'type': 'peer_joined', 'initiator': True},
+            {'type': 'peer_joined', 'initiator': False},
+        ])
+        self.assertEqual(status, 'active')
+        self.assertEqual(cache_mock.method_calls, [])
+        self.assertEqual(signals, [
+            {'type': 'offer', 'sdp': 'v=0 offer'},
+            {'type': 'answer', 'sdp': 'v=0 answer'},
+            {'type': 'candidate', 'candidate': {'candidate': 'candidate:1'}},
+        ])
+        self.assertEqual(hangup, {'type': 'hangup'})
+        self.assertIsNone(get_call(self.call_id))
+
+
+    def test_not_participant_and_peer_not_connected(self):
+        '''
+        Description:
+            This test verifies that only the participants can connect in a call and the messages need the another participant.
+
+        Pre-conditions:
+            - A call between two users.
+
+        Post-conditions:
+            - A user that is not a participant of the call must not connect.
+            - A message sent before the another participant is connected must be answered with an error.
+        '''
+
+        async def call():
+            _, intruder_connected = await connect_to_call(self.user3, self.call_id)
+            caller, _ = await connect_to_call(self.user1, self.call_id)
+            await caller.send_json_to({'type': 'candidate', 'candidate': {'candidate': 'candidate:1'}})
+            error = await caller.receive_json_from()
+            await caller.disconnect()
+            return intruder_connected, error
+
+        intruder_connected, error = async_to_sync(call)()
+
+        self.assertFalse(intruder_connected)
+        self.assertEqual(error, {'type': 'error', 'error': 'O outro participante ainda não está conectado.'})
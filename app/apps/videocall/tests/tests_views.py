@@ -0,0 +1,94 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.core.cache import cache
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+
+from apps.user.signals import user_logged_out_callback, user_logged_in_callback
+from apps.user.tests.factories import UserFactory
+from apps.videocall.calls import get_user_call_key, get_call, start_call
+
+
+# Desabilita os signals de login e logout para que os testes não sejam afetados
+user_logged_in.disconnect(user_logged_in_callback)
+user_logged_out.disconnect(user_logged_out_callback)
+
+
+class NewCallViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user_data = {
+            'user1': {
+                'username': 'test_user1',
+                'password': 'user1@12345',
+            },
+            'user2': {
+                'username': 'test_user2',
+                'password': 'user2@12345',
+            },
+            'user3': {
+                'username': 'test_user3',
+                'password': 'user3@12345',
+            },
+        }
+        self.user1 = UserFactory(**self.user_data['user1'])
+        self.user2 = UserFactory(**self.user_data['user2'])
+        self.user3 = UserFactory(**self.user_data['user3'])
+        self.user1.friends.add(self.user2)
+
+
+    def test_new_call_view_success(self):
+        '''
+        Description:
+            This test verifies that the new_call view starts a call with a friend
+
+        Pre-conditions:
+            - User is logged in
+            - User has a friend
+
+        Post-conditions:
+            - User is redirected to the call
+            - The call is ringing
+            - The call view shows the friend to both participants
+        '''
+
+        self.client.login(username=self.user1.email, password=self.user_data['user1']['password'])
+
+        response = self.client.post(reverse('videocall:new_call', kwargs={'slug': self.user2.slug}))
+        call_id = cache.get(get_user_call_key(self.user1.id))
+
+        self.assertRedirects(response, reverse('videocall:call', kwargs={'id': call_id}))
+        self.assertEqual(get_call(call_id)['status'], 'ringing')
+
+        response = self.client.get(reverse('videocall:call', kwargs={'id': call_id}))
+        self.assertTemplateUsed(response, 'videocall/call.html')
+        self.assertEqual(response.context['another_user'], self.user2)
+        self.assertTrue(response.context['is_caller'])
+
+        self.client.logout()
+
+
+    def test_new_call_view_not_friend(self):
+        '''
+        Description:
+            This test verifies that a user can not call a user that is not his friend or see a call he is not in
+
+        Pre-conditions:
+            - User is logged in
+            - User is not a friend of the another user
+
+        Post-conditions:
+            - User is redirected to the chats page and no call is started
+            - The call view of another call redirects the user to the chats page
+        '''
+
+        self.client.login(username=self.user3.email, password=self.user_data['user3']['password'])
+
+        response = self.client.post(reverse('videocall:new_call', kwargs={'slug': self.user2.slug}))
+        self.assertRedirects(response, reverse('chat:chats'))
+        self.assertIsNone(cache.get(get_user_call_key(self.user3.id)))
+
+        call_id = start_call(self.user1.id, self.user2.id)
+        response = self.client.get(reverse('videocall:call', kwargs={'id': call_id}))
+        self.assertRedirects(response, reverse('chat:chats'))
+
+        self.client.logout()
@@ -4,5 +4,6 @@ from . import views
 app_name = 'videocall'
 
 urlpatterns = [
-
-]
\ No newline at end of file
+    path('ligar/<slug:slug>/', views.new_call, name='new_call'),
+    path('<uuid:id>/', views.call, name='call'),
+]
@@ -1,3 +1,97 @@
-from django.shortcuts import render
+from django.contrib import messages
+from django.contrib.messages import constants
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.conf import settings
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 
-# Create your views here.
+from .calls import start_call, get_call, get_call_peer_id
+
+User = get_user_model()
+
+
+@login_required
+def new_call(request, slug):
+    '''
+    View to call a friend.
+
+    Args:
+        request (HttpRequest): The request object.
+        slug (str): The slug of the friend.
+
+    Returns:
+        HttpResponseRedirect: Redirect the user to the call, or to the chats page if the friend can not be called.
+
+    Notes:
+        - The friend is called through his navbar websocket, the call rings for settings.VIDEOCALL_RING_TIMEOUT seconds.
+        - A user can only be in one call at a time.
+        - If the method is GET the user will be redirected to the chats page.
+    '''
+
+    if request.method != 'POST':
+        return HttpResponseRedirect(reverse('chat:chats'))
+
+    callee = get_object_or_404(User, slug=slug)
+    # Only the friends of the user can be called
+    if not request.user.is_friend(callee):
+        messages.add_message(request, constants.ERROR, f'"{callee}" não está na sua lista de amigos.')
+        return HttpResponseRedirect(reverse('chat:chats'))
+
+    call_id = start_call(request.user.id, callee.id)
+    if call_id is None:
+        messages.add_message(request, constants.ERROR, 'Você ou o usuário já está em uma chamada.')
+        return HttpResponseRedirect(reverse('chat:chats'))
+
+    # Ring the navbar of the friend (the call is not saved in the event log, an expired call is not replayed)
+    async_to_sync(get_channel_layer().group_send)(
+        f"user_{callee.id}_navbar",
+        {
+            "type": "navbar_videocall_incoming",
+            "caller": request.user.username,
+            "call_url": reverse('videocall:call', kwargs={'id': call_id}),
+        }
+    )
+    return HttpResponseRedirect(reverse('videocall:call', kwargs={'id': call_id}))
+
+
+@login_required
+def call(request, id):
+    '''
+    View to show a call.
+
+    Args:
+        request (HttpRequest): The request object.
+        id (uuid): The id of the call.
+
+    Returns:
+        render: The render of the template with the call.
+
+    Context:
+        - call_id (str): The id of the call.
+        - another_user (User): The another participant of the call.
+        - is_caller (bool): True if the user is the caller.
+        - ice_servers (list): The WebRTC ICE servers.
+        - ring_timeout (int): The seconds the call rings before it is not answered.
+
+    Notes:
+        - The call is only shown if it exists (it is not expired or ended) and the user is a participant of it.
+    '''
+
+    call = get_call(str(id))
+    peer_id = get_call_peer_id(call, request.user.id) if call is not None else None
+    if peer_id is None:
+        messages.add_message(request, constants.ERROR, 'Chamada encerrada ou não encontrada.')
+        return HttpResponseRedirect(reverse('chat:chats'))
+
+    context = {
+        'call_id': str(id),
+        'another_user': get_object_or_404(User, id=peer_id),
+        'is_caller': call['caller_id'] == request.user.id,
+        'ice_servers': settings.VIDEOCALL_ICE_SERVERS,
+        'ring_timeout': settings.VIDEOCALL_RING_TIMEOUT,
+    }
+    return render(request, 'videocall/call.html', context=context)
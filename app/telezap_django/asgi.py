@@ -15,20 +15,36 @@ from django.core.asgi import get_asgi_application
 
 from apps.notification.routing import websocket_urlpatterns as notification_websocket_urlpatterns
 from apps.chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns
-# TODO: from apps.group_chat.routing import websocket_urlpatterns as group_chat_websocket_urlpatterns
-# TODO: from apps.videocall.routing import websocket_urlpatterns as videocall_websocket_urlpatterns
+from apps.group_chat.routing import websocket_urlpatterns as group_chat_websocket_urlpatterns
+from apps.videocall.routing import websocket_urlpatterns as videocall_websocket_urlpatterns
 from telezap_django.routing import websocket_urlpatterns as navbar_websocket_urlpatterns 
+from apps.loop_monitor import LoopMonitorMiddleware
+from apps.metrics import install_metrics
+from apps.tracing import install_tracing
+from apps.query_inspector import install_query_inspector
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'telezap_django.settings')
 
 
-application = ProtocolTypeRouter({
+# The monitor of the event loop is started by the first connection, if settings.LOOP_MONITOR_ENABLED
+application = LoopMonitorMiddleware(ProtocolTypeRouter({
   'http': get_asgi_application(),
   'websocket': AuthMiddlewareStack(
         URLRouter(
             notification_websocket_urlpatterns + 
             chat_websocket_urlpatterns + 
+            group_chat_websocket_urlpatterns + 
+            videocall_websocket_urlpatterns + 
             navbar_websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+}))
+
+# To record the database queries of the requests and the group_sends of the channel layer in the metrics
+install_metrics()
+
+# To trace the database queries and the group_sends of the channel layer (propagating the trace context), if settings.TRACING_ENABLED
+install_tracing()
+
+# To detect the repeated (N+1) and slow database queries of a sample of the requests and consumer events
+install_query_inspector()
@@ -5,16 +5,62 @@ from django.contrib.auth import get_user_model
 from asgiref.sync import sync_to_async
 import json
 
+from apps.event_log import EventLogConsumerMixin, get_last_event_id
+from apps.metrics import MetricsConsumerMixin
+from apps.tracing import TracingConsumerMixin
+from apps.query_inspector import QueryInspectorConsumerMixin
+from apps.traffic import TrafficRecorderConsumerMixin
+from apps.utils import get_navbar_state
+from apps.group_chat.views import ais_user_connected_in_group_chat
+
 User = get_user_model()
 
-class NavBarConsumer(AsyncWebsocketConsumer):
+@database_sync_to_async
+def get_GroupChatNavbarGroupNames(user):
+    '''
+    Function to get the channel layer groups of the navbar of the groups of the user (the delivery shard of the user in each group)
+    '''
+
+    from apps.group_chat.models import GroupChat
+    return [
+        group.get_navbar_channel_group_name(group.get_delivery_shard(user))
+        for group in GroupChat.objects.filter(memberships__user=user).only('id', 'delivery_shards')
+    ]
+
+
+@database_sync_to_async
+def get_NavbarState(user):
+    '''
+    Function to get the navbar state of the user
+    '''
+
+    return get_navbar_state(user)
+
+
+class NavBarConsumer(MetricsConsumerMixin, TracingConsumerMixin, QueryInspectorConsumerMixin, TrafficRecorderConsumerMixin, EventLogConsumerMixin, AsyncWebsocketConsumer):
+    '''
+    Consumer to send the navbar updates to the user
+
+    Notes:
+        - The events missed since the resume token (?resume=<event_id>) are replayed on connect.
+        - If the missed events are no longer in the event log, the current navbar state is sent instead.
+        - The navbar is added to (removed from) the navbar channel group of a group when the user joins (leaves) it,
+          and the messages of the group the user is viewing are not shown.
+    '''
+
     async def connect(self):
         self.user = self.scope['user']
         # if the user is authenticated, add the user to the group and accept the connection
         if self.user and self.user.is_authenticated:
             self.group_name = f"user_{self.user.id}_navbar"
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            # add the user to the navbar group of each of his groups, so a group message is sent once to all the members
+            self.groupchat_group_names = await get_GroupChatNavbarGroupNames(self.user)
+            for groupchat_group_name in self.groupchat_group_names:
+                await self.channel_layer.group_add(groupchat_group_name, self.channel_name)
             await self.accept()
+            # replay the events missed while the client was disconnected
+            await self.replay_missed_events()
         else:
             await self.close()
 
@@ -22,13 +68,16 @@ class NavBarConsumer(AsyncWebsocketConsumer):
         # if the user is authenticated, remove the user from the group
         if hasattr(self, 'user') and self.user and self.user.is_authenticated:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            for groupchat_group_name in getattr(self, 'groupchat_group_names', []):
+                await self.channel_layer.group_discard(groupchat_group_name, self.channel_name)
 
 
     async def navbar_chat_unviewed_messages(self, event):
         if hasattr(self, 'user') and self.user and self.user.is_authenticated:
             await self.send(text_data=json.dumps({
                 'type': 'navbar_chat_unviewed_messages',
-                'value': event['value']
+                'value': event['value'],
+                'event_id': event.get('event_id'),
             }))
 
 
@@ -36,13 +85,58 @@ class NavBarConsumer(AsyncWebsocketConsumer):
         if hasattr(self, 'user') and self.user and self.user.is_authenticated:
             await self.send(text_data=json.dumps({
                 'type': 'navbar_notification_pending_notifications',
-                'value': event['value']
+                'value': event['value'],
+                'event_id': event.get('event_id'),
             }))
 
 
     async def navbar_groupchat_unviewed_messages(self, event):
         if hasattr(self, 'user') and self.user and self.user.is_authenticated:
+            # the messages of the user and of the group he is viewing are not unviewed to him
+            if event.get('author_id') == self.user.id or await ais_user_connected_in_group_chat(self.user.id, event.get('group_id')):
+                return
             await self.send(text_data=json.dumps({
                 'type': 'navbar_groupchat_unviewed_messages',
-                'value': event['value']
-            }))
\ No newline at end of file
+                'value': event['value'],
+                'group_id': event.get('group_id'),
+                'event_id': event.get('event_id'),
+            }))
+
+
+    async def navbar_groupchat_subscribe(self, event):
+        # the user joined a group, so the navbar receives the messages of the group
+        if event['group_name'] not in self.groupchat_group_names:
+            await self.channel_layer.group_add(event['group_name'], self.channel_name)
+            self.groupchat_group_names.append(event['group_name'])
+
+
+    async def navbar_groupchat_unsubscribe(self, event):
+        # the user left a group
+        if event['group_name'] in self.groupchat_group_names:
+            await self.channel_layer.group_discard(event['group_name'], self.channel_name)
+            self.groupchat_group_names.remove(event['group_name'])
+
+
+    async def navbar_videocall_incoming(self, event):
+        if hasattr(self, 'user') and self.user and self.user.is_authenticated:
+            await self.send(text_data=json.dumps({
+                'type': 'navbar_videocall_incoming',
+                'caller': event['caller'],
+                'call_url': event['call_url'],
+            }))
+
+
+    async def resync(self):
+        # send the current navbar state, which replaces all the missed navbar events
+        last_event_id = await sync_to_async(get_last_event_id)(self.user.id)
+        navbar_state = await get_NavbarState(self.user)
+        for event_type, state_key in (
+            ('navbar_chat_unviewed_messages', 'has_unviewed_chat_messages'),
+            ('navbar_notification_pending_notifications', 'has_pending_notifications'),
+            ('navbar_groupchat_unviewed_messages', 'has_pending_group_messages'),
+        ):
+            await self.send(text_data=json.dumps({
+                'type': event_type,
+                'value': navbar_state[state_key],
+                'event_id': last_event_id,
+            }))
@@ -0,0 +1,58 @@
+from django.utils.functional import SimpleLazyObject
+
+from apps.utils import get_navbar_state
+from apps.event_log import get_last_event_id
+
+
+def navbar_state(request):
+    '''
+    Context processor to add the navbar state of the logged in user to the templates.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        dict: The navbar state of the user (empty if the user is not logged in).
+
+    Context:
+        - navbar_state:
+            - has_unviewed_chat_messages: True if the user has unviewed chat messages.
+            - has_pending_group_messages: True if the user has pending group messages.
+            - has_pending_notifications: True if the user has pending notifications.
+
+    Notes:
+        - The state is lazy, so it is only computed if the template uses it, and at most once per request.
+    '''
+
+    if not request.user.is_authenticated:
+        return {}
+
+    return {
+        'navbar_state': SimpleLazyObject(lambda: get_navbar_state(request.user)),
+    }
+
+
+def last_event_id(request):
+    '''
+    Context processor to add the id of the last event of the event log of the logged in user to the templates.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        dict: The last event id of the user (empty if the user is not logged in).
+
+    Context:
+        - last_event_id:
+            The resume token of the websockets of the page, so the events sent after the page is rendered are replayed on connect.
+
+    Notes:
+        - The id is lazy, so it is only got from the cache if the template uses it.
+    '''
+
+    if not request.user.is_authenticated:
+        return {}
+
+    return {
+        'last_event_id': SimpleLazyObject(lambda: get_last_event_id(request.user.id)),
+    }
@@ -1,15 +1,13 @@
 from django.conf import settings
 from django.middleware.csrf import get_token
+from django.utils.deprecation import MiddlewareMixin
 
-class DisableCSRFMiddlewareInNgrok:
+class DisableCSRFMiddlewareInNgrok(MiddlewareMixin):
     '''
     Middleware to disable CSRF check in ngrok 
     '''
 
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
+    def process_request(self, request):
         if settings.DEBUG and 'ngrok-free.app' in request.META.get('HTTP_HOST', ''):
             csrf_trusted_origins = settings.CSRF_TRUSTED_ORIGINS
             if 'ngrok-free.app' not in csrf_trusted_origins:
@@ -20,6 +18,3 @@ class DisableCSRFMiddlewareInNgrok:
         else:
             # Ensure CSRF token is still set for other requests
             get_token(request)  
-
-        response = self.get_response(request)
-        return response
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from apps.instrumentation import get_view_name
+from apps.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUEST_QUERIES,
+    HTTP_REQUEST_QUERIES_DURATION,
+    start_request_queries,
+    stop_request_queries,
+)
+from apps.query_inspector import start_query_inspection, stop_query_inspection
+from apps.tracing import begin_span, end_span
+from apps.traffic import RECORDED_NAMESPACES, anonymize_parameters, anonymize_path, anonymize_user, record_event
+
+import time
+
+class ObservabilityMiddleware(MiddlewareMixin):
+    '''
+    Middleware to record the metrics, the trace, the query inspection and the traffic (anonymized) of the HTTP requests
+
+    Notes:
+        - It must be the first middleware, so the latency of the another middlewares is recorded too.
+        - Metrics (apps.metrics): the latency and the database queries (amount and time) of the requests, by view name.
+          The queries are counted by the execute wrapper of install_metrics, in the threads of the request too.
+          The requests not resolved to a view (e.g. 404) are recorded with the view name 'none'.
+        - Tracing (apps.tracing, if settings.TRACING_ENABLED): each request runs in the root span of a trace, named by the view name.
+          The spans of the request (database queries, renders, group_sends of the signals) are children of this span,
+          and the trace context is sent with the group_sends, so the handlers of the consumers are in the same trace.
+        - Query inspection (apps.query_inspector): the repeated (N+1) and slow database queries of a sample
+          (settings.QUERY_INSPECTOR_SAMPLE_RATE) of the requests are logged with the view name and a summary of the stack that made them.
+        - Traffic recording (apps.traffic, if settings.TRAFFIC_RECORDING_ENABLED): the requests of the views of the apps are recorded
+          to be replayed (replay_traffic), with the user and the entities replaced by tokens and the texts masked.
+        - The view is resolved after the middlewares, so the view name is read when the response is returned.
+        - It supports sync and async requests (MiddlewareMixin); it is one middleware so the async requests hop to a thread once for all of them.
+    '''
+
+    def process_request(self, request):
+        request._metrics_started_at = time.perf_counter()
+        request._metrics_queries = start_request_queries()
+        request._tracing_span = begin_span('http.request', attributes={
+            'http.method': request.method,
+            'http.target': request.path,
+        })
+        request._query_inspection = start_query_inspection(None)
+
+    def process_exception(self, request, exception):
+        span = getattr(request, '_tracing_span', None)
+        if span is not None:
+            span.error = repr(exception)
+
+    def process_response(self, request, response):
+        started_at = getattr(request, '_metrics_started_at', None)
+        if started_at is None:
+            return response
+        request._metrics_started_at = None
+        view = get_view_name(request)
+
+        if settings.TRAFFIC_RECORDING_ENABLED:
+            self.record_traffic(request, response, started_at)
+
+        inspection = request._query_inspection
+        if inspection is not None:
+            stop_query_inspection()
+            inspection.name = get_view_name(request, default=request.path)
+            inspection.report()
+
+        span = request._tracing_span
+        if span is not None:
+            request._tracing_span = None
+            span.name = f"{request.method} {view}"
+            span.attributes['http.route'] = view
+            span.attributes['http.status_code'] = response.status_code
+            end_span(span)
+
+        stop_request_queries()
+        HTTP_REQUEST_DURATION.labels(view, request.method, response.status_code).observe(time.perf_counter() - started_at)
+        HTTP_REQUEST_QUERIES.labels(view).observe(request._metrics_queries['count'])
+        HTTP_REQUEST_QUERIES_DURATION.labels(view).observe(request._metrics_queries['seconds'])
+        return response
+
+    def record_traffic(self, request, response, started_at):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None or resolver_match.namespace not in RECORDED_NAMESPACES:
+            return
+
+        path = anonymize_path(request.path, resolver_match.namespace, resolver_match.kwargs)
+        if path is not None:
+            record_event({
+                'kind': 'http',
+                'user': anonymize_user(getattr(request, 'user', None)),
+                'method': request.method,
+                'view': resolver_match.view_name,
+                'path': path,
+                'query': anonymize_parameters(request.GET),
+                'data': anonymize_parameters(request.POST) if request.method == 'POST' else {},
+                'status': response.status_code,
+                'duration': time.perf_counter() - started_at,
+            })
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+import time
+
+class ThrottledSessionMiddleware(MiddlewareMixin):
+    '''
+    Middleware to refresh the session expiry (sliding expiry) only when a fraction of SESSION_COOKIE_AGE has elapsed
+
+    Notes:
+        - It must be placed after the SessionMiddleware.
+        - Modifying the session makes the SessionMiddleware save it and set the cookie again with a new expiry,
+          so the session is written once per SESSION_REFRESH_FRACTION * SESSION_COOKIE_AGE seconds instead of once per request.
+        - Anonymous requests without session are ignored, so no session is created for them.
+        - It supports sync and async requests (MiddlewareMixin), so the async views are not run in a thread because of it.
+    '''
+
+    SESSION_REFRESHED_AT_KEY = '_session_refreshed_at'
+
+    def process_request(self, request):
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key and not session.is_empty():
+            now = int(time.time())
+            refresh_interval = settings.SESSION_COOKIE_AGE * settings.SESSION_REFRESH_FRACTION
+            refreshed_at = session.get(self.SESSION_REFRESHED_AT_KEY, 0)
+            # Refresh the session expiry if the refresh interval has elapsed
+            if now - refreshed_at >= refresh_interval:
+                session[self.SESSION_REFRESHED_AT_KEY] = now
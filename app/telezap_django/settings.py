@@ -14,10 +14,89 @@ ALLOWED_HOSTS = config('DJANGO_ALLOWED_HOSTS', cast=str).split(" ")
 
 # To save session for 12 hours
 SESSION_COOKIE_AGE = 43200
-SESSION_SAVE_EVERY_REQUEST = True
+# To keep the sessions in the cache, persisted in the database (write-through)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# To refresh the session expiry only when 10% of SESSION_COOKIE_AGE has elapsed (ThrottledSessionMiddleware)
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_FRACTION = 0.1
 
 # To paginate messages in chat
 MESSAGES_PAGINATION = 10
+# The maximum amount of messages of the first load of a chat (the unviewed messages are loaded to highlight the first one)
+MESSAGES_MAX_FIRST_LOAD = 100
+
+# To rate limit the messages sent by a user (token bucket: rate in tokens per second and capacity as the burst),
+# in all his chats ('user') and in each chat ('chat')
+CHAT_MESSAGES_RATE_LIMITS = {
+    'user': {'rate': 2, 'capacity': 20},
+    'chat': {'rate': 1, 'capacity': 10},
+}
+
+# To shard the delivery of the group chat messages: a group has one channel layer group per
+# GROUP_CHAT_DELIVERY_SHARD_SIZE members, up to GROUP_CHAT_DELIVERY_MAX_SHARDS
+GROUP_CHAT_DELIVERY_SHARD_SIZE = 500
+GROUP_CHAT_DELIVERY_MAX_SHARDS = 16
+
+# To show at most GROUP_CHAT_HEADER_MEMBERS members in the header of a group (and the amount of the another members)
+GROUP_CHAT_HEADER_MEMBERS = 10
+
+# To expire the video calls not answered (seconds) and the video calls in progress (seconds)
+VIDEOCALL_RING_TIMEOUT = 60
+VIDEOCALL_MAX_DURATION = 60 * 60 * 4
+
+# To connect the participants of the video calls (WebRTC ICE servers)
+VIDEOCALL_ICE_SERVERS = [
+    {'urls': 'stun:stun.l.google.com:19302'},
+]
+
+# To paginate the notification feed
+NOTIFICATIONS_PAGINATION = 20
+NOTIFICATIONS_MAX_PAGINATION = 100
+
+# To garbage collect finished notifications (manage.py gc_notifications)
+NOTIFICATIONS_RETENTION_DAYS = 30
+NOTIFICATIONS_GC_CHUNK_SIZE = 500
+
+# To cache the navbar state (seconds)
+NAVBAR_STATE_CACHE_TIMEOUT = 30
+
+# To replay the websocket events missed while the client was disconnected (per user event log, TTL in seconds)
+EVENT_LOG_TTL = 300
+EVENT_LOG_MAX_LENGTH = 200
+
+# To render the templates of the consumers out of the event loop (threads of the executor, each one with its own database connection)
+# and log the renders slower than the threshold (seconds)
+RENDER_EXECUTOR_MAX_WORKERS = config('RENDER_EXECUTOR_MAX_WORKERS', cast=int, default=4)
+RENDER_SLOW_THRESHOLD = 0.1
+
+# To monitor the lag of the event loop of the ASGI process (apps.loop_monitor): a heartbeat per interval (seconds),
+# and the stack of the loop is sampled and logged when it is blocked longer than the threshold (seconds)
+LOOP_MONITOR_ENABLED = config('LOOP_MONITOR_ENABLED', cast=bool, default=False)
+LOOP_MONITOR_INTERVAL = 0.1
+LOOP_MONITOR_THRESHOLD = 0.25
+LOOP_MONITOR_MAX_SAMPLES = 50
+
+# To trace the messages from the request to the handlers of the consumers (apps.tracing): the spans are exported
+# in batches to a file (a JSON line per span) or to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces)
+TRACING_ENABLED = config('TRACING_ENABLED', cast=bool, default=False)
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='file')
+TRACING_FILE = config('TRACING_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+TRACING_OTLP_ENDPOINT = config('TRACING_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces')
+TRACING_EXPORT_BATCH_SIZE = 100
+TRACING_EXPORT_QUEUE_SIZE = 10000
+
+# To detect the repeated (N+1) and slow database queries of a sample of the requests and consumer events (apps.query_inspector),
+# logged with the view or consumer handler and the last frames of the stack that made them
+QUERY_INSPECTOR_ENABLED = config('QUERY_INSPECTOR_ENABLED', cast=bool, default=True)
+QUERY_INSPECTOR_SAMPLE_RATE = config('QUERY_INSPECTOR_SAMPLE_RATE', cast=float, default=0.05) if 'test' not in sys.argv else 0 # To run tests without sampling
+QUERY_INSPECTOR_REPEATED_QUERIES = 5
+QUERY_INSPECTOR_SLOW_QUERY = 0.1
+QUERY_INSPECTOR_STACK_DEPTH = 5
+
+# To record the HTTP requests and the websocket frames of the users, anonymized, to replay them (apps.traffic, replay_traffic command)
+TRAFFIC_RECORDING_ENABLED = config('TRAFFIC_RECORDING_ENABLED', cast=bool, default=False)
+TRAFFIC_RECORDING_FILE = config('TRAFFIC_RECORDING_FILE', default=str(BASE_DIR / 'traffic.jsonl'))
+TRAFFIC_RECORDING_QUEUE_SIZE = 10000
 
 INSTALLED_APPS = [
     # internal apps
@@ -49,8 +128,10 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'telezap_django.middlewares.ObservabilityMiddleware.ObservabilityMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'telezap_django.middlewares.ThrottledSessionMiddleware.ThrottledSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -74,6 +155,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'telezap_django.context_processors.navbar_state',
+                'telezap_django.context_processors.last_event_id',
             ],
         },
     },
@@ -142,6 +225,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
 MEDIAFILES_DIRS = [
     os.path.join(BASE_DIR, 'mediafiles')
 ]
+# To serve the media files after authorizing the user (telezap_django.views.media): with MEDIA_ACCEL_REDIRECT nginx transfers the file
+# from its internal location (ngix/nginx.conf), otherwise Django streams it (development)
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', cast=bool, default=not DEBUG)
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 7 # The names of the media files are unique, so the browser can keep them
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -163,6 +251,14 @@ if DEBUG:
             'BACKEND': 'channels.layers.InMemoryChannelLayer',
         },
     }
+    # To cache locally
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # To not cull the state of the video calls and the event logs (the default is 300 entries)
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
     # To use debug_toolbar
     MIDDLEWARE += [
         'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -187,4 +283,11 @@ else:
                 "hosts": [("localhost", 6379)],
             },
         },
+    }
+    # To cache in production
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://localhost:6379/1",
+        },
     }
\ No newline at end of file
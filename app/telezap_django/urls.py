@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib.auth.views import (
     LoginView, 
     LogoutView, 
@@ -11,6 +10,7 @@ from django.contrib.auth.views import (
     PasswordResetCompleteView
 )
 from apps.user.views import SignupView
+from telezap_django import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,7 +26,10 @@ urlpatterns = [
     path('recuperar-senha/email-enviado/', PasswordResetDoneView.as_view(), name='password_reset_done'),
     path('recuperar-senha/<uidb64>/<token>/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('recuperar-senha/sucesso/', PasswordResetCompleteView.as_view(), name='password_reset_complete'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('monitoramento/loop/', views.loop_monitor, name='loop_monitor'),
+    path('metrics', views.metrics, name='metrics'),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.media, name='media'),
+]
 
 if (settings.DEBUG):
     urlpatterns = [
@@ -0,0 +1,86 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.static import serve
+
+from apps.loop_monitor import get_loop_monitor_stats
+from apps.metrics import get_metrics
+from apps.utils import user_can_access_media
+from prometheus_client import CONTENT_TYPE_LATEST
+from urllib.parse import quote
+import mimetypes, posixpath
+
+
+@staff_member_required
+def loop_monitor(request):
+    '''
+    View to get the lag of the event loop of the process and the stack samples of the stalls.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        JsonResponse: The stats of the monitor of the event loop (see apps.loop_monitor.get_loop_monitor_stats).
+
+    Notes:
+        - Only the staff can access the view, the other users are redirected to the admin login.
+        - The stats are of the process that answers the request (each ASGI process monitors its own event loop).
+    '''
+
+    return JsonResponse(get_loop_monitor_stats())
+
+
+def metrics(request):
+    '''
+    View to get the metrics of the HTTP requests, database queries, channel layer and websockets in the Prometheus text format.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        HttpResponse: The metrics (see apps.metrics).
+
+    Notes:
+        - With the PROMETHEUS_MULTIPROC_DIR environment variable the metrics of all the processes of the server are summed.
+        - It is not authenticated, so it must only be reachable by the metrics collector (e.g. blocked in the reverse proxy).
+    '''
+
+    return HttpResponse(get_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+
+@login_required
+def media(request, path):
+    '''
+    View to serve a media file to the users that can access it (the profile photos and the images of their chats and groups).
+
+    Args:
+        request (HttpRequest): The request object.
+        path (str): The path of the file, relative to MEDIA_ROOT.
+
+    Returns:
+        HttpResponse: An empty response with the X-Accel-Redirect header to the internal location of nginx, or the file (development).
+
+    Raises:
+        Http404: If the file does not exist or the user can not access it (the existence of the file is not revealed).
+
+    Notes:
+        - With settings.MEDIA_ACCEL_REDIRECT nginx transfers the file, so the process only authorizes the request
+          (nginx keeps the Content-Type and Cache-Control headers of the response).
+        - The response can only be cached by the browser of the user (private), for settings.MEDIA_CACHE_MAX_AGE seconds.
+    '''
+
+    path = posixpath.normpath(path).lstrip('/')
+    if path.startswith('..') or not user_can_access_media(request.user, path):
+        raise Http404()
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = quote(f'{settings.MEDIA_ACCEL_REDIRECT_LOCATION}{path}')
+    else:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, private=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    patch_vary_headers(response, ['Cookie'])
+    return response
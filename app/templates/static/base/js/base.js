@@ -1,4 +1,20 @@
 
+// Function to get the id of the last event of the user when the page was rendered (resume token of the websockets)
+function getLastEventId() {
+  const lastEventId = parseInt(document.body.getAttribute('data-last-event-id'));
+  return isNaN(lastEventId) ? null : lastEventId;
+}
+
+
+// Function to get the query string to resume the websocket from the last event received
+function getResumeQuery(lastEventId) {
+  return lastEventId === null ? '' : `?resume=${lastEventId}`;
+}
+
+
+// Id of the last navbar event received, to replay the events missed while disconnected
+let navbarLastEventId = null;
+
 // Function to connect to the websocket
 function navbarWebSocketConnect() {
   // Verify if the protocol is https or http and set the websocket protocol accordingly
@@ -6,7 +22,10 @@ function navbarWebSocketConnect() {
   if (window.location.protocol === 'https:') {
       websocketProtocol = "wss://";
   }
-  const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/navbar/');
+  if (navbarLastEventId === null) {
+      navbarLastEventId = getLastEventId();
+  }
+  const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/navbar/' + getResumeQuery(navbarLastEventId));
 
   // When the websocket is connected, log it to the console
   socket.onopen = function(event) {
@@ -17,7 +36,7 @@ function navbarWebSocketConnect() {
   socket.onclose = function(event) {
       setTimeout(function() {
           console.error("WebSocket (navbar) connection closed unexpectedly, trying to reconnect in 2 seconds...");
-          connect()
+          navbarWebSocketConnect()
       }, 2000);
   };
 
@@ -27,10 +46,31 @@ function navbarWebSocketConnect() {
       const type = data['type'];
       const value = data['value'];
 
+      // Ignore the events already received (replayed and sent live at the same time)
+      if (data['event_id'] != null) {
+          if (navbarLastEventId !== null && data['event_id'] < navbarLastEventId) {
+              return;
+          }
+          navbarLastEventId = data['event_id'];
+      }
+
+      // Ask the user to answer an incoming video call
+      if (type == 'navbar_videocall_incoming') {
+          if (confirm(`${data['caller']} está te ligando. Atender?`)) {
+              window.location.href = data['call_url'];
+          }
+          return;
+      }
+
       const elements = {
           'navbar_chat_unviewed_messages': "nav-chats",
           'navbar_notification_pending_notifications': "nav-notifications",
-          'navbar_groupchat_unviewed_messages': "nav-group",
+          'navbar_groupchat_unviewed_messages': "nav-groups",
+      }
+
+      // The messages of the group the user is viewing are not unviewed
+      if (data['group_id'] && window.location.pathname.includes(data['group_id'])) {
+          return;
       }
 
       const element = document.getElementById(elements[type]);
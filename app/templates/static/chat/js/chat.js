@@ -1,7 +1,17 @@
-// Variables to control the load of messages
-let page=1;
+// Variables to control the load of messages (the older messages are loaded before the sequence number of the oldest message loaded)
+let oldestSeq = null;
 let has_next=false;
+let loadingMoreMessages = false;
 var oldMsgDate = null;
+// Variables to control the sequence of the messages (to detect missed messages)
+let lastSeq = 0;
+let firstPageLoaded = false;
+let loadingMissedMessages = false;
+// Id of the last chat event received, to replay the events missed while disconnected
+let lastEventId = null;
+// The chat websocket and the text messages sent but not acknowledged yet (client_id -> text)
+let chatSocket = null;
+let pendingMessages = {};
 
 // Function to preview the image before sending
 function imagePreview() {
@@ -65,13 +75,101 @@ function autoResizeTextArea() {
         if (event.keyCode === 13 && !event.shiftKey) {
             // Prevent the default action of the Enter key (new line)
             event.preventDefault();
-            // Submit the form
-            const form = document.getElementById('text-form');
-            form.submit();
-            // Clear the textarea
-            textarea.value = '';
+            // Send the message
+            sendTextMessage();
         }
     });
+
+    // Send the message through the websocket instead of submitting the form
+    const form = document.getElementById('text-form');
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        sendTextMessage();
+    });
+}
+
+
+// Function to send the text message of the textarea with a new idempotency key (client_id)
+function sendTextMessage() {
+    const textarea = document.getElementById('autoresizing-textarea');
+    const text = textarea.value;
+    if (!text.trim()) {
+        return;
+    }
+    const clientId = crypto.randomUUID();
+    pendingMessages[clientId] = text;
+    // Clear the textarea
+    textarea.value = '';
+    textarea.style.height = 'auto';
+    sendPendingMessage(clientId);
+}
+
+
+// Function to send a pending message through the websocket, or through the new_chat_message view if it is not connected
+function sendPendingMessage(clientId) {
+    if (chatSocket !== null && chatSocket.readyState === WebSocket.OPEN) {
+        chatSocket.send(JSON.stringify({
+            'type': 'send_message',
+            'client_id': clientId,
+            'message_type': 'T',
+            'text': pendingMessages[clientId],
+        }));
+        return;
+    }
+
+    const form = document.getElementById('text-form');
+    const formData = new FormData(form);
+    formData.set('text', pendingMessages[clientId]);
+    formData.set('client_id', clientId);
+    fetch(form.getAttribute('action'), {method: 'POST', body: formData})
+    .then((response) => {
+        // The message was created (or already existed), otherwise it is sent again when the websocket reconnects
+        if (response.status == 204) {
+            delete pendingMessages[clientId];
+        // If the user sent too many messages, send it again after the time required by the server
+        } else if (response.status == 429) {
+            retryPendingMessage(clientId, parseFloat(response.headers.get('Retry-After')));
+        // If the message is invalid, handle the error as the nack of the websocket
+        } else if (response.status == 400) {
+            response.json().then(data => handleMessageReply({'type': 'nack', 'client_id': clientId, 'error': data.error}));
+        }
+    })
+    .catch(() => {
+        console.error("The message could not be sent, it will be sent again when the websocket reconnects.");
+    });
+}
+
+
+// Function to send a pending message again after some seconds (backpressure of the rate limit)
+function retryPendingMessage(clientId, retryAfter) {
+    const delay = (isNaN(retryAfter) ? 1 : retryAfter) * 1000;
+    setTimeout(() => {
+        if (pendingMessages[clientId] !== undefined) {
+            sendPendingMessage(clientId);
+        }
+    }, delay);
+}
+
+
+// Function to handle the reply (ack/nack) of a message sent through the websocket
+function handleMessageReply(data) {
+    // If the user sent too many messages, keep the message pending and send it again after the time required by the server
+    if (data.type == 'nack' && data.retry_after) {
+        console.warn(data.error);
+        retryPendingMessage(data.client_id, data.retry_after);
+        return;
+    }
+    const text = pendingMessages[data.client_id];
+    delete pendingMessages[data.client_id];
+    // If the message is invalid, give the text back to the user
+    if (data.type == 'nack') {
+        console.error("The message was not sent: " + data.error);
+        if (text !== undefined) {
+            const textarea = document.getElementById('autoresizing-textarea');
+            textarea.value = text;
+        }
+        alert(data.error);
+    }
 }
 
 
@@ -105,11 +203,19 @@ function connect() {
     if (window.location.protocol === 'https:') {
         websocketProtocol = "wss://";
     }
-    const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/chat/' + chatId + '/');
+    if (lastEventId === null) {
+        lastEventId = getLastEventId();
+    }
+    const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/chat/' + chatId + '/' + getResumeQuery(lastEventId));
+    chatSocket = socket;
 
-    // When the websocket is connected, log it to the console
+    // When the websocket is connected, log it to the console (the missed messages are replayed by the server)
+    // and send again the messages not acknowledged before the disconnection (the client_id avoids duplicates)
     socket.onopen = function(event) {
         console.log('WebSocket (chat) is connected.');
+        for (const clientId of Object.keys(pendingMessages)) {
+            sendPendingMessage(clientId);
+        }
     };
 
     // When the websocket is closed, try to reconnect in 2 seconds
@@ -125,13 +231,35 @@ function connect() {
         const data = JSON.parse(e.data);
         const emptyChat = document.getElementById('empty-chat');
 
+        if (data.event_id != null) {
+            lastEventId = Math.max(lastEventId || 0, data.event_id);
+        }
+
+        // If the message is the reply of a message sent by the user, handle it
+        if (data.type == 'ack' || data.type == 'nack') {
+            handleMessageReply(data);
+            return;
+        }
+        // If the missed events are no longer available, load the missed messages
+        if (data.type == 'resync') {
+            if (firstPageLoaded) {
+                loadMissedMessages();
+            }
+            return;
+        }
         // If the message is an update, update the chat list
         if (data.type == 'create') {
-            const targetElement = document.getElementById('message-list');
-            const li = document.createElement('li');
-            li.setAttribute("class", "d-flex justify-content-between mb-4");
-            li.innerHTML = data.template;
-            targetElement.appendChild(li);
+            // If the message was already received (or will be received in the first page), ignore it
+            if (!firstPageLoaded || data.seq <= lastSeq) {
+                return;
+            }
+            // If there is a gap in the sequence, load the missed messages (the new message included)
+            if (data.seq > lastSeq + 1) {
+                loadMissedMessages();
+                return;
+            }
+            appendNewMessage(data.template);
+            lastSeq = data.seq;
             emptyChat.setAttribute('style', 'display: none;');
         }
         scrollMessages();
@@ -147,6 +275,53 @@ function getMessagesUrl() {
 };
 
 
+// Function to append a new message to the end of the message list
+function appendNewMessage(template) {
+    const targetElement = document.getElementById('message-list');
+    const li = document.createElement('li');
+    li.setAttribute("class", "d-flex justify-content-between mb-4");
+    li.innerHTML = template;
+    targetElement.appendChild(li);
+}
+
+
+// Function to load the messages after the last received message (e.g. after a reconnect or a gap in the sequence)
+function loadMissedMessages() {
+    if (loadingMissedMessages) {
+        return;
+    }
+    loadingMissedMessages = true;
+
+    fetch(getMessagesUrl() + `?after=${lastSeq}`)
+    .then((response) => {
+        return response.json();
+    })
+    .then((data) => {
+        loadingMissedMessages = false;
+        if (!data["message_list"]) {
+            return;
+        }
+        // The messages are ordered from the newest to the oldest, so they are appended in the reverse order
+        const messageList = data["message_list"];
+        for (let i = messageList.length - 1; i >= 0; i--) {
+            if (messageList[i]["seq"] > lastSeq) {
+                appendNewMessage(messageList[i]["template"]);
+                lastSeq = messageList[i]["seq"];
+            }
+        }
+        document.getElementById('empty-chat').setAttribute('style', 'display: none;');
+        scrollMessages();
+        // If there are more missed messages, load them
+        if (data["has_next"] === true) {
+            loadMissedMessages();
+        }
+    })
+    .catch(() => {
+        loadingMissedMessages = false;
+    });
+}
+
+
 // Function to append the messages to the message list
 function appendMessages(messageList) {
     const scrollArea = document.getElementById('messages');
@@ -181,7 +356,13 @@ function appendMessages(messageList) {
 
 // Function to load more messages and append them to the message list
 function loadMoreMessages() {
-    const get_messages_url = getMessagesUrl() + `?page=${page}`;
+    // If there are no older messages or they are already being loaded, return
+    if (!has_next || loadingMoreMessages || oldestSeq === null) {
+        return;
+    }
+    loadingMoreMessages = true;
+
+    const get_messages_url = getMessagesUrl() + `?before=${oldestSeq}`;
     const loadingMessagesElem = document.getElementById('loading-messages');
     loadingMessagesElem.setAttribute('style', 'display: block;');
     const emptyChat = document.getElementById('empty-chat');
@@ -191,24 +372,19 @@ function loadMoreMessages() {
         return response.json();
     })
     .then((data) => {
-        // If there are no more messages, return
-        if (!data["message_list"]) {
-            return;
-        } else {
-            // If the last loaded messages has_next is true, append the messages to the message list
-            if (has_next) {
-                appendMessages(data["message_list"]);
-            }
-        }
-        // If there are more messages, update the page and has_next variables
-        if (data["has_next"] === true) {
-            page++;
-            has_next = true;
-        } else {
-            has_next = false;
+        loadingMoreMessages = false;
+        // If there are older messages, append them to the message list and keep the sequence number of the oldest one
+        if (data["message_list"]) {
+            appendMessages(data["message_list"]);
+            oldestSeq = data["message_list"][data["message_list"].length - 1]["seq"];
         }
+        has_next = data["has_next"] === true;
         loadingMessagesElem.setAttribute('style', 'display: none;');
         emptyChat.setAttribute('style', 'display: none;');
+    })
+    .catch(() => {
+        loadingMoreMessages = false;
+        loadingMessagesElem.setAttribute('style', 'display: none;');
     });
 }
 
@@ -282,16 +458,17 @@ document.addEventListener("DOMContentLoaded", function() {
     .then((response) => {
         return response.json();
     }).then((data) => {
+        // The last message of the chat, to detect the messages missed from now on
+        lastSeq = Math.max(lastSeq, data["last_message_seq"] || 0);
+        firstPageLoaded = true;
         // If there are no messages, show the empty chat message
         if (!data["message_list"]) {
             loadingMessagesElem.setAttribute('style', 'display: none;');
             emptyChat.setAttribute('style', 'display: block;');
         } else { // If there are messages, append them to the message list
-            if (data["has_next"] === true) {
-                page++;
-                has_next = true;
-            }
+            has_next = data["has_next"] === true;
             appendMessages(data["message_list"]);
+            oldestSeq = data["message_list"][data["message_list"].length - 1]["seq"];
             setTimeout(scrollMessages, 500);
             setTimeout(showLoadMoreMessagesButton, 500);
             setTimeout(() => {
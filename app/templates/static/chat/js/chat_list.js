@@ -12,13 +12,16 @@ function emojiNotItalic(string) {
 
   
 document.addEventListener("DOMContentLoaded", function() {
+    // Id of the last chat list event received, to replay the events missed while disconnected
+    let lastEventId = getLastEventId();
+
     function connect() {
         // Verify if the protocol is https or http and set the websocket protocol accordingly
         var websocketProtocol = "ws://";
         if (window.location.protocol === 'https:') {
             websocketProtocol = "wss://";
         }
-        const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/chats/');
+        const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/chats/' + getResumeQuery(lastEventId));
         
         // When the websocket is connected, log it to the console
         socket.onopen = function(event) {
@@ -37,6 +40,20 @@ document.addEventListener("DOMContentLoaded", function() {
         socket.onmessage = function(e) {
             const data = JSON.parse(e.data);
 
+            // If the missed events are no longer available, load the chats that changed
+            if (data.type == 'resync') {
+                lastEventId = data.event_id;
+                loadChatListUpdates();
+                return;
+            }
+            // Ignore the events already received (replayed and sent live at the same time)
+            if (data.event_id != null) {
+                if (lastEventId !== null && data.event_id <= lastEventId) {
+                    return;
+                }
+                lastEventId = data.event_id;
+            }
+
             // If the message is an update, update the chat list
             if (data.type == 'update') {
                 // Update the chat list
@@ -55,6 +72,12 @@ document.addEventListener("DOMContentLoaded", function() {
                 // Update the chat author
                 const chatAuthorElement = document.getElementById(`chat-${data.chat_id}-author`);
                 chatAuthorElement.innerText = data.chat_message_author + ': ';
+
+                // Update the last message of the chat, sent to the updates of the chat list
+                const chatElement = document.getElementById(`chat-${data.chat_id}`);
+                if (chatElement && data.chat_message_seq != null) {
+                    chatElement.setAttribute('data-last-message-seq', data.chat_message_seq);
+                }
             // If the message is a new chat, add it to the chat list
             } else if (data.type == 'create') {
                 // Create a new chat list element
@@ -73,5 +96,44 @@ document.addEventListener("DOMContentLoaded", function() {
         };
     };
 
+    // Function to load the chats that changed while the chat list was disconnected (new chats, new messages and removed chats)
+    function loadChatListUpdates() {
+        const chatListElement = document.getElementById('chat-list');
+        // Send the last message of each chat of the chat list, only the chats that changed are returned
+        const params = new URLSearchParams();
+        chatListElement.querySelectorAll('a[data-last-message-seq]').forEach(function(chatElement) {
+            params.append('chat', chatElement.id.replace('chat-', '') + ':' + chatElement.getAttribute('data-last-message-seq'));
+        });
+
+        fetch(chatListElement.getAttribute('data-updates-url') + '?' + params.toString())
+        .then(response => response.json())
+        .then(data => {
+            // Replace the chats that changed and add the new ones
+            data.chats.forEach(function(chat) {
+                const fragment = document.createRange().createContextualFragment(chat.template).querySelector('a');
+                const chatElement = document.getElementById(`chat-${chat.chat_id}`);
+                if (chatElement) {
+                    chatElement.replaceWith(fragment);
+                } else {
+                    chatListElement.prepend(fragment);
+                }
+            });
+            // Remove the chats that are no longer in the chat list
+            chatListElement.querySelectorAll('a[data-last-message-seq]').forEach(function(chatElement) {
+                if (!data.chat_ids.includes(chatElement.id.replace('chat-', ''))) {
+                    chatElement.remove();
+                }
+            });
+            // Remove the empty chat list element if there are chats
+            const emptyChatListElement = document.getElementById('empty-chat-list');
+            if (emptyChatListElement && data.chat_ids.length > 0) {
+                emptyChatListElement.remove();
+            }
+        })
+        .catch(error => {
+            console.error(error);
+        });
+    };
+
     connect();
 });
@@ -0,0 +1,313 @@
+// Variables to control the sequence of the messages (to load older messages and detect missed messages)
+let firstSeq = null;
+let lastSeq = 0;
+let hasOlderMessages = false;
+let firstPageLoaded = false;
+let loadingMissedMessages = false;
+// The group websocket and the text messages sent but not acknowledged yet (client_id -> text)
+let groupSocket = null;
+let pendingMessages = {};
+
+
+// Function to get the url to get the messages
+function getMessagesUrl() {
+    return document.getElementById('messages').getAttribute('data-get-messages-url');
+}
+
+
+// Function to scroll the messages to the bottom
+function scrollMessages() {
+    const scrollArea = document.getElementById('messages');
+    scrollArea.scrollTop = scrollArea.scrollHeight;
+}
+
+
+// Function to create the element of a message
+function createMessageElement(template) {
+    const li = document.createElement('li');
+    li.setAttribute("class", "d-flex justify-content-between mb-4");
+    li.innerHTML = template;
+    return li;
+}
+
+
+// Function to append a new message to the end of the message list
+function appendNewMessage(template) {
+    document.getElementById('message-list').appendChild(createMessageElement(template));
+    document.getElementById('empty-chat').setAttribute('style', 'display: none;');
+}
+
+
+// Function to prepend the messages (newest first) to the message list
+function prependMessages(messageList) {
+    const scrollArea = document.getElementById('messages');
+    const currentScrollHeight = scrollArea.scrollHeight;
+    const spanClassName = "d-flex justify-content-center badge rounded-pill text-bg-secondary text-center mt-1 mb-2";
+    const messageListUlElem = document.getElementById('message-list');
+
+    for (const message of messageList) {
+        messageListUlElem.prepend(createMessageElement(message['template']));
+        // If the message has a separator, add it to the message list
+        if (message['separator']) {
+            const msgSeparator = document.createElement("span");
+            msgSeparator.setAttribute("class", spanClassName);
+            msgSeparator.innerText = message['separator'];
+            messageListUlElem.prepend(msgSeparator);
+        }
+        firstSeq = firstSeq === null ? message['seq'] : Math.min(firstSeq, message['seq']);
+    }
+
+    // Fix the scroll position after prepending the messages
+    scrollArea.scrollTop += scrollArea.scrollHeight - currentScrollHeight;
+}
+
+
+// Function to load the last messages of the group
+function loadFirstPage() {
+    const loadingMessagesElem = document.getElementById('loading-messages');
+    loadingMessagesElem.setAttribute('style', 'display: block;');
+
+    fetch(getMessagesUrl())
+    .then((response) => response.json())
+    .then((data) => {
+        lastSeq = Math.max(lastSeq, data["last_message_seq"] || 0);
+        firstPageLoaded = true;
+        if (!data["message_list"]) {
+            document.getElementById('empty-chat').setAttribute('style', 'display: block;');
+        } else {
+            hasOlderMessages = data["has_next"] === true;
+            prependMessages(data["message_list"]);
+            setTimeout(scrollMessages, 500);
+        }
+        loadingMessagesElem.setAttribute('style', 'display: none;');
+    });
+}
+
+
+// Function to load the messages before the first loaded message when the user scrolls to the top
+function loadOlderMessagesOnScroll() {
+    const scrollArea = document.getElementById('messages');
+    scrollArea.addEventListener("scroll", function () {
+        if (scrollArea.scrollTop !== 0 || !hasOlderMessages || firstSeq === null) {
+            return;
+        }
+        hasOlderMessages = false;
+        fetch(getMessagesUrl() + `?before=${firstSeq}`)
+        .then((response) => response.json())
+        .then((data) => {
+            if (data["message_list"]) {
+                prependMessages(data["message_list"]);
+            }
+            hasOlderMessages = data["has_next"] === true;
+        });
+    });
+}
+
+
+// Function to load the messages after the last received message (e.g. after a reconnect or a gap in the sequence)
+function loadMissedMessages() {
+    if (loadingMissedMessages) {
+        return;
+    }
+    loadingMissedMessages = true;
+
+    fetch(getMessagesUrl() + `?after=${lastSeq}`)
+    .then((response) => response.json())
+    .then((data) => {
+        loadingMissedMessages = false;
+        if (!data["message_list"]) {
+            return;
+        }
+        // The messages are ordered from the newest to the oldest, so they are appended in the reverse order
+        const messageList = data["message_list"];
+        for (let i = messageList.length - 1; i >= 0; i--) {
+            if (messageList[i]["seq"] > lastSeq) {
+                appendNewMessage(messageList[i]["template"]);
+                lastSeq = messageList[i]["seq"];
+            }
+        }
+        scrollMessages();
+        if (data["has_next"] === true) {
+            loadMissedMessages();
+        }
+    })
+    .catch(() => {
+        loadingMissedMessages = false;
+    });
+}
+
+
+// Function to send the text message of the textarea with a new idempotency key (client_id)
+function sendTextMessage() {
+    const textarea = document.getElementById('autoresizing-textarea');
+    const text = textarea.value;
+    if (!text.trim()) {
+        return;
+    }
+    const clientId = crypto.randomUUID();
+    pendingMessages[clientId] = text;
+    textarea.value = '';
+    textarea.style.height = 'auto';
+    sendPendingMessage(clientId);
+}
+
+
+// Function to send a pending message through the websocket, or through the new_group_message view if it is not connected
+function sendPendingMessage(clientId) {
+    if (groupSocket !== null && groupSocket.readyState === WebSocket.OPEN) {
+        groupSocket.send(JSON.stringify({
+            'type': 'send_message',
+            'client_id': clientId,
+            'message_type': 'T',
+            'text': pendingMessages[clientId],
+        }));
+        return;
+    }
+
+    const form = document.getElementById('text-form');
+    const formData = new FormData(form);
+    formData.set('text', pendingMessages[clientId]);
+    formData.set('client_id', clientId);
+    fetch(form.getAttribute('action'), {method: 'POST', body: formData})
+    .then((response) => {
+        if (response.status == 204) {
+            delete pendingMessages[clientId];
+        } else if (response.status == 429) {
+            retryPendingMessage(clientId, parseFloat(response.headers.get('Retry-After')));
+        // If the message is invalid, handle the error as the nack of the websocket
+        } else if (response.status == 400) {
+            response.json().then(data => handleMessageReply({'type': 'nack', 'client_id': clientId, 'error': data.error}));
+        }
+    })
+    .catch(() => {
+        console.error("The message could not be sent, it will be sent again when the websocket reconnects.");
+    });
+}
+
+
+// Function to send a pending message again after some seconds (backpressure of the rate limit)
+function retryPendingMessage(clientId, retryAfter) {
+    const delay = (isNaN(retryAfter) ? 1 : retryAfter) * 1000;
+    setTimeout(() => {
+        if (pendingMessages[clientId] !== undefined) {
+            sendPendingMessage(clientId);
+        }
+    }, delay);
+}
+
+
+// Function to handle the reply (ack/nack) of a message sent through the websocket
+function handleMessageReply(data) {
+    if (data.type == 'nack' && data.retry_after) {
+        console.warn(data.error);
+        retryPendingMessage(data.client_id, data.retry_after);
+        return;
+    }
+    const text = pendingMessages[data.client_id];
+    delete pendingMessages[data.client_id];
+    // If the message is invalid, give the text back to the user
+    if (data.type == 'nack') {
+        console.error("The message was not sent: " + data.error);
+        if (text !== undefined) {
+            document.getElementById('autoresizing-textarea').value = text;
+        }
+        alert(data.error);
+    }
+}
+
+
+// Function to connect to the websocket
+function connect() {
+    const groupId = document.getElementById('messages').getAttribute('data-group-id');
+    // Verify if the protocol is https or http and set the websocket protocol accordingly
+    var websocketProtocol = "ws://";
+    if (window.location.protocol === 'https:') {
+        websocketProtocol = "wss://";
+    }
+    const socket = new WebSocket(websocketProtocol + window.location.host + '/ws/group/' + groupId + '/');
+    groupSocket = socket;
+
+    // When the websocket is connected, load the messages missed while disconnected and send the pending messages again
+    socket.onopen = function(event) {
+        console.log('WebSocket (group) is connected.');
+        if (firstPageLoaded) {
+            loadMissedMessages();
+        }
+        for (const clientId of Object.keys(pendingMessages)) {
+            sendPendingMessage(clientId);
+        }
+    };
+
+    // When the websocket is closed, try to reconnect in 2 seconds
+    socket.onclose = function(event) {
+        setTimeout(function() {
+            console.error("WebSocket (group) connection closed unexpectedly, trying to reconnect in 2 seconds...");
+            connect();
+        }, 2000);
+    };
+
+    // When the websocket receives a message, append it to the message list
+    socket.onmessage = function(e) {
+        const data = JSON.parse(e.data);
+
+        if (data.type == 'ack' || data.type == 'nack') {
+            handleMessageReply(data);
+            return;
+        }
+        if (data.type == 'create') {
+            // If the message was already received (or will be received in the first page), ignore it
+            if (!firstPageLoaded || data.seq <= lastSeq) {
+                return;
+            }
+            // If there is a gap in the sequence, load the missed messages (the new message included)
+            if (data.seq > lastSeq + 1) {
+                loadMissedMessages();
+                return;
+            }
+            appendNewMessage(data.template);
+            lastSeq = data.seq;
+            scrollMessages();
+        }
+    };
+}
+
+
+// Function to send the message with the Enter key or the submit button and resize the textarea
+function activeTextForm() {
+    const textarea = document.getElementById('autoresizing-textarea');
+    textarea.addEventListener('input', function () {
+        this.style.height = 'auto';
+        this.style.height = (this.scrollHeight) + 'px';
+    });
+    textarea.addEventListener('keydown', function (event) {
+        if (event.keyCode === 13 && !event.shiftKey) {
+            event.preventDefault();
+            sendTextMessage();
+        }
+    });
+    document.getElementById('text-form').addEventListener('submit', function (event) {
+        event.preventDefault();
+        sendTextMessage();
+    });
+}
+
+
+// Function to insert the emoji in the textarea when the user clicks on it
+function activeEmojis() {
+    const textarea = document.getElementById('autoresizing-textarea');
+    document.querySelectorAll('.emoji-icon').forEach(emoji => {
+        emoji.addEventListener('click', () => {
+            textarea.value += emoji.innerHTML.trim();
+            textarea.dispatchEvent(new Event('input', {bubbles: true, cancelable: true}));
+        });
+    });
+}
+
+
+document.addEventListener("DOMContentLoaded", function() {
+    connect();
+    activeTextForm();
+    activeEmojis();
+    loadFirstPage();
+    loadOlderMessagesOnScroll();
+});
@@ -13,6 +13,79 @@ function generateCSRFInputAsString() {
     return csrfInputString;
 }
 
+// Function to get the notification list element of a notification (friend/group and send/received)
+function getNotificationListElement(data) {
+    const elementMap = {
+        group_send: 'group-send-notifications',
+        group_received: 'group-received-notifications',
+        friend_send: 'friend-send-notifications',
+        friend_received: 'friend-received-notifications'
+    };
+
+    let targetElementId;
+
+    // If the notification is a group notification, set the target element id to the group notification list
+    if (data.is_group) {
+        targetElementId = data.is_sent ? 'group_send' : 'group_received';
+    } else {
+        targetElementId = data.is_sent ? 'friend_send' : 'friend_received';
+    }
+
+    const targetElement = document.getElementById(elementMap[targetElementId]);
+
+    // Remove the empty notification list element if it exists
+    if (targetElement.getElementsByClassName('m-2').length > 0) {
+        targetElement.getElementsByClassName('m-2')[0].remove();
+    }
+
+    return targetElement;
+}
+
+// Function to create a notification list element from the notification template
+function createNotificationElement(template) {
+    const elem = document.createElement('div');
+    // Add CSRF token to the form of the notification 
+    const regex = /<form action="\/notificacoes\/reply\/" method="POST">/g;
+    elem.innerHTML = '<hr>' + template.replaceAll(
+        regex,
+        '<form action="/notificacoes/reply/" method="POST">' + '\n' + generateCSRFInputAsString()
+    );
+    return elem;
+}
+
+// Function to load the next page of the notification feed and append it to the notification lists
+function loadMoreNotifications() {
+    const loadMoreButton = document.getElementById('load-more-notifications-btn');
+    if (!loadMoreButton) {
+        return;
+    }
+
+    loadMoreButton.addEventListener('click', () => {
+        const feedUrl = loadMoreButton.getAttribute('data-feed-url');
+        const cursor = loadMoreButton.getAttribute('data-next-cursor');
+        loadMoreButton.setAttribute('disabled', 'disabled');
+
+        fetch(feedUrl + '?cursor=' + encodeURIComponent(cursor))
+        .then((response) => {
+            return response.json();
+        })
+        .then((data) => {
+            // The feed is ordered from the newest to the oldest notification, so the page is appended to the lists
+            data.notifications.forEach((notification) => {
+                getNotificationListElement(notification).appendChild(createNotificationElement(notification.template));
+            });
+
+            // If there are no more notifications, remove the load more button
+            if (data.has_next) {
+                loadMoreButton.setAttribute('data-next-cursor', data.next_cursor);
+                loadMoreButton.removeAttribute('disabled');
+            } else {
+                document.getElementById('load-more-notifications').remove();
+            }
+        });
+    });
+}
+
 document.addEventListener("DOMContentLoaded", function() {
     function connect() {
         // Verify if the protocol is https or http and set the websocket protocol accordingly
@@ -53,43 +126,19 @@ document.addEventListener("DOMContentLoaded", function() {
                     document.getElementById("friend-finished-remove-form").setAttribute('style', 'display: visible;');
                 }
             } else if (data.type == 'new') { // If the message is a new notification, add it to the notification list
-                const elementMap = {
-                    group_send: 'group-send-notifications',
-                    group_received: 'group-received-notifications',
-                    friend_send: 'friend-send-notifications',
-                    friend_received: 'friend-received-notifications'
-                };
-
-                let targetElementId;
-
-                // If the notification is a group notification, set the target element id to the group notification list
-                if (data.is_group) {
-                    targetElementId = data.is_sent ? 'group_send' : 'group_received';
-                } else {
-                    targetElementId = data.is_sent ? 'friend_send' : 'friend_received';
-                }
-
-                const targetElement = document.getElementById(elementMap[targetElementId]);
-
-                // Remove the empty notification list element if it exists
-                if (targetElement.getElementsByClassName('m-2').length > 0) {
-                    targetElement.getElementsByClassName('m-2')[0].remove();
-                }
-
-                // Create a new notification list element and add it to the notification list
-                const elem = document.createElement('div');
-                // Add CSRF token to the form of the notification 
-                const regex = /<form action="\/notificacoes\/reply\/" method="POST">/g;
-                const template = data.template.replaceAll(
-                    regex,
-                    '<form action="/notificacoes/reply/" method="POST">' + '\n' + generateCSRFInputAsString()
-                );
-                elem.innerHTML = '<hr>' + template;
-
-                targetElement.prepend(elem);
+                const targetElement = getNotificationListElement(data);
+                targetElement.prepend(createNotificationElement(data.template));
+            } else if (data.type == 'remove') { // If the message is a removal, remove the notifications from the notification lists
+                data.ids.forEach((id) => {
+                    const notificationElement = document.getElementById(`notification-${id}`);
+                    if (notificationElement) {
+                        notificationElement.remove();
+                    }
+                });
             }
         };
     };
 
     connect();
+    loadMoreNotifications();
 });
@@ -0,0 +1,149 @@
+// The websocket of the signaling, the WebRTC connection and the local camera/microphone
+let callSocket = null;
+let peerConnection = null;
+let localStream = null;
+let callEnded = false;
+
+
+// Function to show the status of the call
+function setCallStatus(text) {
+    document.getElementById('call-status').innerText = text;
+}
+
+
+// Function to end the call and go back to the chats
+function endCall(text) {
+    if (callEnded) {
+        return;
+    }
+    callEnded = true;
+    setCallStatus(text);
+    if (peerConnection !== null) {
+        peerConnection.close();
+    }
+    if (localStream !== null) {
+        localStream.getTracks().forEach(track => track.stop());
+    }
+    if (callSocket !== null && callSocket.readyState === WebSocket.OPEN) {
+        callSocket.send(JSON.stringify({'type': 'hangup'}));
+    }
+    setTimeout(() => {
+        window.location.href = document.getElementById('call').getAttribute('data-end-url');
+    }, 2000);
+}
+
+
+// Function to send a signaling message to the another participant
+function sendSignal(data) {
+    if (callSocket !== null && callSocket.readyState === WebSocket.OPEN) {
+        callSocket.send(JSON.stringify(data));
+    }
+}
+
+
+// Function to create the WebRTC connection with the local camera/microphone
+function createPeerConnection() {
+    const iceServers = JSON.parse(document.getElementById('ice-servers').textContent);
+    peerConnection = new RTCPeerConnection({iceServers: iceServers});
+
+    localStream.getTracks().forEach(track => peerConnection.addTrack(track, localStream));
+
+    // Send the ICE candidates to the another participant
+    peerConnection.onicecandidate = function(event) {
+        if (event.candidate) {
+            sendSignal({'type': 'candidate', 'candidate': event.candidate.toJSON()});
+        }
+    };
+
+    // Show the video of the another participant
+    peerConnection.ontrack = function(event) {
+        document.getElementById('remote-video').srcObject = event.streams[0];
+        setCallStatus('Em chamada');
+    };
+}
+
+
+// Function to handle the signaling messages received
+async function handleSignal(data) {
+    switch (data.type) {
+        case 'peer_joined':
+            setCallStatus('Conectando...');
+            // The caller sends the offer
+            if (data.initiator) {
+                const offer = await peerConnection.createOffer();
+                await peerConnection.setLocalDescription(offer);
+                sendSignal({'type': 'offer', 'sdp': peerConnection.localDescription.sdp});
+            }
+            break;
+        case 'offer':
+            await peerConnection.setRemoteDescription({'type': 'offer', 'sdp': data.sdp});
+            const answer = await peerConnection.createAnswer();
+            await peerConnection.setLocalDescription(answer);
+            sendSignal({'type': 'answer', 'sdp': peerConnection.localDescription.sdp});
+            break;
+        case 'answer':
+            await peerConnection.setRemoteDescription({'type': 'answer', 'sdp': data.sdp});
+            break;
+        case 'candidate':
+            await peerConnection.addIceCandidate(data.candidate);
+            break;
+        case 'hangup':
+            endCall('Chamada encerrada.');
+            break;
+        case 'error':
+            console.error(data.error);
+            break;
+    }
+}
+
+
+// Function to connect to the signaling websocket
+function connect() {
+    const callElem = document.getElementById('call');
+    const callId = callElem.getAttribute('data-call-id');
+    // Verify if the protocol is https or http and set the websocket protocol accordingly
+    var websocketProtocol = "ws://";
+    if (window.location.protocol === 'https:') {
+        websocketProtocol = "wss://";
+    }
+    callSocket = new WebSocket(websocketProtocol + window.location.host + '/ws/videocall/' + callId + '/');
+
+    callSocket.onopen = function(event) {
+        console.log('WebSocket (videocall) is connected.');
+    };
+
+    // The call is ended when the signaling websocket is closed (the call state is removed by the server)
+    callSocket.onclose = function(event) {
+        endCall('Chamada encerrada.');
+    };
+
+    callSocket.onmessage = function(e) {
+        handleSignal(JSON.parse(e.data));
+    };
+
+    // If the call is not answered, end it
+    if (callElem.getAttribute('data-is-caller') === 'true') {
+        const ringTimeout = parseInt(callElem.getAttribute('data-ring-timeout')) * 1000;
+        setTimeout(() => {
+            if (document.getElementById('remote-video').srcObject === null) {
+                endCall('Sem resposta.');
+            }
+        }, ringTimeout);
+    }
+}
+
+
+document.addEventListener("DOMContentLoaded", function() {
+    document.getElementById('hangup-btn').addEventListener('click', () => endCall('Chamada encerrada.'));
+
+    navigator.mediaDevices.getUserMedia({video: true, audio: true})
+    .then((stream) => {
+        localStream = stream;
+        document.getElementById('local-video').srcObject = stream;
+        createPeerConnection();
+        connect();
+    })
+    .catch(() => {
+        endCall('Não foi possível acessar a câmera ou o microfone.');
+    });
+});